@@ -0,0 +1,121 @@
+# admision.py
+"""
+Control de admisión y timeout por petición.
+
+Si la base de datos se pone lenta, las corrutinas se acumulan esperando
+conexiones y la latencia crece sin límite. Este middleware acota cuántas
+peticiones están en vuelo, cuántas pueden esperar turno y cuánto dura cada
+una; lo que no cabe se rechaza rápido con 503 (o 504 si expira).
+
+Variables de entorno:
+    ADMISION_MAX_CONCURRENTES   peticiones en vuelo (0 = desactivado)
+    ADMISION_MAX_EN_COLA        peticiones esperando turno (por defecto 2x)
+    ADMISION_ESPERA_MAX_S       espera máxima en cola (por defecto 2 s)
+    ADMISION_TIMEOUT_S          duración máxima de una petición (0 = sin límite)
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+
+class ControlAdmisionMiddleware:
+    def __init__(
+        self,
+        app,
+        max_concurrentes: int,
+        max_en_cola: Optional[int] = None,
+        espera_max_s: float = 2.0,
+        timeout_s: float = 0.0,
+        # Los streams (SSE) duran lo que dure el cliente: no ocupan turno ni tienen timeout
+        excluir: Tuple[str, ...] = ("/static", "/health", "/api/stock/alertas/stream"),
+    ):
+        self.app = app
+        self.max_concurrentes = max_concurrentes
+        self.max_en_cola = max_en_cola if max_en_cola is not None else 2 * max_concurrentes
+        self.espera_max_s = espera_max_s
+        self.timeout_s = timeout_s
+        self.excluir = excluir
+
+        self._semaforo = asyncio.Semaphore(max_concurrentes) if max_concurrentes > 0 else None
+        self.en_vuelo = 0
+        self.en_cola = 0
+        metricas["max_concurrentes"] = max_concurrentes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.excluir):
+            await self.app(scope, receive, send)
+            return
+
+        if self._semaforo is not None:
+            if self._semaforo.locked() and self.en_cola >= self.max_en_cola:
+                metricas["rechazadas"] += 1
+                await _responder(send, 503, "Servidor saturado, intenta de nuevo")
+                return
+            self.en_cola += 1
+            try:
+                await asyncio.wait_for(self._semaforo.acquire(), self.espera_max_s)
+            except asyncio.TimeoutError:
+                metricas["rechazadas"] += 1
+                await _responder(send, 503, "Servidor saturado, intenta de nuevo")
+                return
+            finally:
+                self.en_cola -= 1
+
+        self.en_vuelo += 1
+        metricas["en_vuelo_max"] = max(metricas["en_vuelo_max"], self.en_vuelo)
+        iniciada = {"valor": False}
+
+        async def send_vigilado(mensaje):
+            if mensaje["type"] == "http.response.start":
+                iniciada["valor"] = True
+            await send(mensaje)
+
+        try:
+            if self.timeout_s > 0:
+                await asyncio.wait_for(self.app(scope, receive, send_vigilado), self.timeout_s)
+            else:
+                await self.app(scope, receive, send_vigilado)
+        except asyncio.TimeoutError:
+            metricas["timeouts"] += 1
+            # Si la respuesta ya empezó no podemos cambiar el status; solo cortamos
+            if not iniciada["valor"]:
+                await _responder(send, 504, "La petición tardó demasiado")
+        finally:
+            self.en_vuelo -= 1
+            if self._semaforo is not None:
+                self._semaforo.release()
+
+
+async def _responder(send, status: int, detalle: str) -> None:
+    cuerpo = json.dumps({"detail": detalle}).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(cuerpo)).encode())]
+    if status == 503:
+        headers.append((b"retry-after", b"1"))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+metricas: Dict[str, int] = {
+    "max_concurrentes": 0,
+    "en_vuelo_max": 0,
+    "rechazadas": 0,
+    "timeouts": 0,
+}
+
+
+def config_desde_entorno() -> Optional[Dict[str, float]]:
+    """Parámetros del middleware según el entorno, o None si está apagado."""
+    max_concurrentes = int(os.getenv("ADMISION_MAX_CONCURRENTES", "0"))
+    timeout_s = float(os.getenv("ADMISION_TIMEOUT_S", "0"))
+    if max_concurrentes <= 0 and timeout_s <= 0:
+        return None
+    en_cola = os.getenv("ADMISION_MAX_EN_COLA")
+    return {
+        "max_concurrentes": max_concurrentes,
+        "max_en_cola": int(en_cola) if en_cola else None,
+        "espera_max_s": float(os.getenv("ADMISION_ESPERA_MAX_S", "2")),
+        "timeout_s": timeout_s,
+    }
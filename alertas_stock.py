@@ -0,0 +1,272 @@
+# alertas_stock.py
+"""
+Alertas de stock bajo, evaluadas en forma incremental.
+
+Cada producto puede tener un mínimo propio, y cada categoría uno para todos
+sus productos (manda el del producto). El motor guarda en memoria los
+umbrales, la cantidad de cada producto y el conjunto de los que están en su
+mínimo o por debajo. crud.py le pasa, después del commit, cada producto cuyo
+stock cambió. Evaluarlo es O(1): dos búsquedas en dicts y, si cruza el
+umbral, entrar o salir del conjunto y publicar el evento.
+
+Los eventos (bajo / actualizado / repuesto / quitado) van a los suscriptores
+del stream SSE y a un buffer con los últimos. Así, un cliente que se
+reconecta con Last-Event-ID recibe lo que se perdió. El id que ve el
+cliente es "<época>-<n>": n es un contador de este proceso y la época
+cambia en cada arranque. Un id de otra época (otro worker, un reinicio),
+uno que este proceso todavía no emitió o uno que ya salió del buffer
+obligan a mandar de nuevo el `estado` completo.
+
+Como el catálogo, cada worker tiene su propia copia: lo que escribe otro
+proceso se ve tras `cargar` (periódica con ALERTAS_STOCK_RESYNC_S). La
+recarga solo publica los cambios reales.
+
+Variables de entorno:
+    ALERTAS_STOCK            0 = desactivado
+    ALERTAS_STOCK_RESYNC_S   recarga completa periódica (por defecto 300, 0 = nunca)
+    ALERTAS_STOCK_EVENTOS    eventos guardados para reconexiones (por defecto 1000)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Producto, UmbralStock
+
+ACTIVO = os.getenv("ALERTAS_STOCK", "1") != "0"
+RESYNC_S = float(os.getenv("ALERTAS_STOCK_RESYNC_S", "300"))
+EVENTOS = int(os.getenv("ALERTAS_STOCK_EVENTOS", "1000"))
+
+# Eventos en cola por suscriptor; si se llena (cliente lento) se lo desconecta
+COLA_SUSCRIPTOR = 256
+
+# (id, tipo, datos)
+Evento = Tuple[int, str, Dict[str, Any]]
+
+
+def _ahora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class AlertasStock:
+    def __init__(self, eventos: int = EVENTOS):
+        self.listo = False
+        self.umbral_producto: Dict[int, int] = {}
+        self.umbral_categoria: Dict[int, int] = {}
+        # id -> (nombre, categoria_id, cantidad)
+        self._productos: Dict[int, Tuple[str, Optional[int], int]] = {}
+        self._por_categoria: Dict[Optional[int], Set[int]] = {}
+        # Productos en su mínimo o por debajo: id -> alerta
+        self.bajo: Dict[int, Dict[str, Any]] = {}
+
+        self._eventos: Deque[Evento] = deque(maxlen=eventos)
+        self.ultimo_evento = 0
+        # Distingue los ids de este proceso de los de otro worker o arranque
+        self.epoca = uuid.uuid4().hex[:8]
+        self._suscriptores: Set[asyncio.Queue] = set()
+        self.evaluaciones = 0
+        self.desconectados = 0
+
+    # -------------------- carga --------------------
+
+    async def cargar(self, db: AsyncSession) -> None:
+        umbrales = (await db.execute(
+            select(UmbralStock.producto_id, UmbralStock.categoria_id, UmbralStock.minimo)
+        )).all()
+        productos = (await db.execute(
+            select(Producto.id, Producto.nombre, Producto.categoria_id, Producto.cantidad)
+        )).all()
+
+        self.umbral_producto = {p: m for p, c, m in umbrales if p is not None}
+        self.umbral_categoria = {c: m for p, c, m in umbrales if c is not None}
+        self._productos = {}
+        self._por_categoria = {}
+        for producto_id, nombre, categoria_id, cantidad in productos:
+            self._guardar(producto_id, nombre, categoria_id, cantidad)
+            self._evaluar(producto_id)
+        for producto_id in [p for p in self.bajo if p not in self._productos]:
+            self._publicar("quitado", self.bajo.pop(producto_id))
+        self.listo = True
+
+    # ------------- escrituras (desde crud.py) -------------
+
+    def aplicar_producto(self, obj: Producto) -> None:
+        if not self.listo:
+            return
+        self._guardar(obj.id, obj.nombre, obj.categoria_id, obj.cantidad)
+        self._evaluar(obj.id)
+
+    def quitar_producto(self, producto_id: int) -> None:
+        if not self.listo:
+            return
+        _, categoria_id, _ = self._productos.pop(producto_id, (None, None, 0))
+        self._por_categoria.get(categoria_id, set()).discard(producto_id)
+        self.umbral_producto.pop(producto_id, None)
+        if producto_id in self.bajo:
+            self._publicar("quitado", self.bajo.pop(producto_id))
+
+    def quitar_categoria(self, categoria_id: int) -> None:
+        """Sus productos se borran con ella (borrar_categoria es en cascada)."""
+        if not self.listo:
+            return
+        for producto_id in list(self._por_categoria.get(categoria_id, ())):
+            self.quitar_producto(producto_id)
+        self._por_categoria.pop(categoria_id, None)
+        self.umbral_categoria.pop(categoria_id, None)
+
+    def fijar_umbral(
+        self,
+        producto_id: Optional[int] = None,
+        categoria_id: Optional[int] = None,
+        minimo: Optional[int] = None,
+    ) -> None:
+        """Alta, cambio o baja (minimo=None) de un umbral; reevalúa solo a los afectados."""
+        if not self.listo:
+            return
+        if producto_id is not None:
+            destino, clave, afectados = self.umbral_producto, producto_id, (producto_id,)
+        else:
+            destino, clave = self.umbral_categoria, categoria_id
+            afectados = tuple(self._por_categoria.get(categoria_id, ()))
+        if minimo is None:
+            destino.pop(clave, None)
+        else:
+            destino[clave] = minimo
+        for pid in afectados:
+            if pid in self._productos:
+                self._evaluar(pid)
+
+    # -------------------- evaluación --------------------
+
+    def _guardar(self, producto_id: int, nombre: str, categoria_id: Optional[int], cantidad: int) -> None:
+        previo = self._productos.get(producto_id)
+        if previo is not None and previo[1] != categoria_id:
+            self._por_categoria.get(previo[1], set()).discard(producto_id)
+        self._productos[producto_id] = (nombre, categoria_id, cantidad)
+        self._por_categoria.setdefault(categoria_id, set()).add(producto_id)
+
+    def umbral_de(self, producto_id: int, categoria_id: Optional[int]) -> Tuple[Optional[int], Optional[str]]:
+        """(mínimo, origen) del producto: el propio o el de su categoría."""
+        minimo = self.umbral_producto.get(producto_id)
+        if minimo is not None:
+            return minimo, "producto"
+        minimo = self.umbral_categoria.get(categoria_id)
+        if minimo is not None:
+            return minimo, "categoria"
+        return None, None
+
+    def _evaluar(self, producto_id: int) -> None:
+        self.evaluaciones += 1
+        nombre, categoria_id, cantidad = self._productos[producto_id]
+        minimo, origen = self.umbral_de(producto_id, categoria_id)
+        previa = self.bajo.get(producto_id)
+
+        if minimo is not None and cantidad <= minimo:
+            actual = {
+                "producto_id": producto_id,
+                "nombre": nombre,
+                "categoria_id": categoria_id,
+                "cantidad": cantidad,
+                "minimo": minimo,
+                "origen": origen,
+                "desde": previa["desde"] if previa else _ahora(),
+            }
+            if previa is None:
+                self.bajo[producto_id] = actual
+                self._publicar("bajo", actual)
+            elif actual != previa:
+                self.bajo[producto_id] = actual
+                self._publicar("actualizado", actual)
+        elif previa is not None:
+            del self.bajo[producto_id]
+            self._publicar("repuesto", {**previa, "cantidad": cantidad, "minimo": minimo, "origen": origen})
+
+    # -------------------- consultas --------------------
+
+    def listar(self, categoria_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Los que están bajo su mínimo, los más faltantes primero."""
+        alertas = self.bajo.values()
+        if categoria_id is not None:
+            alertas = [a for a in alertas if a["categoria_id"] == categoria_id]
+        return sorted(alertas, key=lambda a: (a["cantidad"] - a["minimo"], a["producto_id"]))
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "activo": ACTIVO,
+            "listo": self.listo,
+            "productos": len(self._productos),
+            "umbrales_producto": len(self.umbral_producto),
+            "umbrales_categoria": len(self.umbral_categoria),
+            "bajo_minimo": len(self.bajo),
+            "evaluaciones": self.evaluaciones,
+            "ultimo_evento": self.id_evento(self.ultimo_evento),
+            "suscriptores": len(self._suscriptores),
+            "desconectados": self.desconectados,
+        }
+
+    # -------------------- eventos --------------------
+
+    def _publicar(self, tipo: str, datos: Dict[str, Any]) -> None:
+        self.ultimo_evento += 1
+        evento = (self.ultimo_evento, tipo, dict(datos))
+        self._eventos.append(evento)
+        for cola in list(self._suscriptores):
+            try:
+                cola.put_nowait(evento)
+            except asyncio.QueueFull:
+                # Cliente lento: se lo corta; al reconectar recupera con Last-Event-ID
+                self._suscriptores.discard(cola)
+                self.desconectados += 1
+
+    async def suscribir(self, despues_de: Optional[int] = None, latido_s: float = 15.0) -> AsyncIterator[Optional[Evento]]:
+        """
+        Eventos a medida que ocurren; None cada `latido_s` sin novedades. Con
+        `despues_de` primero repite los del buffer posteriores a ese id.
+        """
+        cola: asyncio.Queue = asyncio.Queue(maxsize=COLA_SUSCRIPTOR)
+        # Sin await entre repetir el buffer y suscribirse: no se pierde ni se duplica nada
+        perdidos = [e for e in self._eventos if despues_de is not None and e[0] > despues_de]
+        self._suscriptores.add(cola)
+        try:
+            for evento in perdidos:
+                yield evento
+            while cola in self._suscriptores or not cola.empty():
+                try:
+                    yield await asyncio.wait_for(cola.get(), latido_s)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._suscriptores.discard(cola)
+
+    def buffer_cubre(self, despues_de: int) -> bool:
+        """¿Están en el buffer todos los eventos posteriores a `despues_de`?"""
+        if despues_de > self.ultimo_evento:
+            # Un id que este proceso no emitió: no se sabe qué le falta
+            return False
+        if despues_de == self.ultimo_evento:
+            return True
+        return bool(self._eventos) and self._eventos[0][0] <= despues_de + 1
+
+    def id_evento(self, numero: int) -> str:
+        return f"{self.epoca}-{numero}"
+
+    def reanudar(self, last_event_id: Optional[str]) -> Optional[int]:
+        """
+        Desde qué evento seguir para un cliente que vuelve con `last_event_id`,
+        o None si hay que mandarle el `estado` completo.
+        """
+        epoca, _, numero = (last_event_id or "").partition("-")
+        if epoca != self.epoca or not numero.isdigit():
+            return None
+        despues_de = int(numero)
+        return despues_de if self.buffer_cubre(despues_de) else None
+
+
+alertas_stock = AlertasStock()
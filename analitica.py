@@ -0,0 +1,528 @@
+# analitica.py
+"""
+Motor de análisis en proceso: foto columnar de las ventas en NumPy.
+
+Guarda una fila por compra (tabla + meses archivados) en arreglos de ancho
+fijo: id, día, mes, cliente, producto, cantidad y total. La categoría del
+producto y el tipo de cliente se resuelven con arreglos de búsqueda
+indexados por id (un gather vectorizado), así cambiar un producto de
+categoría no obliga a rehacer la foto.
+
+Las consultas (agrupar / pivotar / filtrar) son operaciones vectorizadas:
+máscaras booleanas para los filtros, np.ravel_multi_index para combinar
+las dimensiones en una clave y np.bincount para sumar por grupo.
+
+Refresco incremental, antes de cada consulta:
+- compras nuevas: las de id mayor al último visto (una consulta por rango);
+- compras con id menor que confirmaron tarde (en Postgres los ids se
+  reservan antes del commit): los huecos de ids se releen durante
+  SYNC_MARGEN_S segundos, como en /api/sync, y se insertan sin duplicar;
+- compras editadas o borradas: crud.py anota sus ids tras el commit
+  (`anotar_compras`) y se releen solo esas;
+- dimensiones (productos, clientes, categorías): se recargan cuando crud.py
+  cambia nombres, categoría de un producto o tipo de un cliente
+  (`anotar_dimensiones`), o cuando llega una compra con un id desconocido.
+  Una venta sola no las recarga.
+
+Como el catálogo, cada worker tiene su foto: lo que edite o borre otro
+proceso se ve tras la recarga completa (ANALITICA_RECARGA_S). Las compras
+nuevas de cualquier proceso se ven en el siguiente refresco, salvo una que
+confirme más de SYNC_MARGEN_S después de otra con id mayor: esa espera a
+la recarga completa.
+
+Variables de entorno:
+    ANALITICA=0            desactiva el motor (también si falta NumPy)
+    ANALITICA_RECARGA_S    cada cuánto se rehace la foto completa (por defecto 600)
+    SYNC_MARGEN_S          cuánto se siguen releyendo los huecos de ids (por defecto 5)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from archivo_compras import archivo_compras, np
+from models import Categoria, Cliente, Compra, Producto
+
+ACTIVO = os.getenv("ANALITICA", "1") != "0" and np is not None
+RECARGA_S = float(os.getenv("ANALITICA_RECARGA_S", "600"))
+MARGEN_S = float(os.getenv("SYNC_MARGEN_S", "5"))
+
+# Filas por lote al leer la tabla
+LOTE = 50_000
+# Hasta este número de grupos posibles se suma con un bincount denso
+GRUPOS_DENSOS = 1 << 22
+# Tamaño máximo de una tabla pivote (filas x columnas)
+MAX_CELDAS = 250_000
+# Huecos de ids que se vigilan como máximo (los más altos)
+MAX_HUECOS = 1_000
+
+DIMENSIONES = ("anio", "mes", "dia", "categoria", "tipo_cliente", "cliente", "producto")
+MEDIDAS = ("total", "unidades", "compras", "ticket_promedio")
+
+# Columna -> tipo
+COLUMNAS = {
+    "id": "<i8",
+    "dia": "<i4",        # días desde 1970-01-01 (UTC)
+    "mes": "<i2",        # meses desde 1970-01
+    "cliente_id": "<i4",
+    "producto_id": "<i4",
+    "cantidad": "<i4",
+    "total": "<f8",
+    "vivo": "?",
+}
+
+
+def _epoch_sql(dialecto: str):
+    if dialecto == "postgresql":
+        return cast(func.extract("epoch", Compra.fecha), Integer)
+    return cast(func.strftime("%s", Compra.fecha), Integer)
+
+
+def _dia(texto: str, fin: bool = False) -> int:
+    """'AAAA-MM' o 'AAAA-MM-DD' -> día (epoch). Con `fin`, el último día del período."""
+    try:
+        if len(texto) == 7:
+            momento = np.datetime64(texto, "M")
+            return int(((momento + 1).astype("datetime64[D]") - 1 if fin else momento.astype("datetime64[D]")).astype(int))
+        return int(np.datetime64(texto, "D").astype(int))
+    except ValueError:
+        raise ValueError(f"Fecha inválida: {texto!r} (se espera AAAA-MM o AAAA-MM-DD)")
+
+
+class SnapshotVentas:
+    def __init__(self):
+        self.n = 0
+        self._cols: Dict[str, Any] = {}
+        self.ultimo_id = 0
+        self._pendientes: Set[int] = set()
+        self._recargar = True
+        self._cargado_en = 0.0
+        self._huecos: Dict[int, float] = {}
+        self._dims_sucias = True
+        self._lock = asyncio.Lock()
+        # Dimensiones
+        self.categoria_de_producto = None
+        self.tipo_de_cliente = None
+        self.tipos: List[Optional[str]] = [None]
+        self.nombres: Dict[str, Dict[int, str]] = {"categoria": {}, "cliente": {}, "producto": {}}
+        self.metricas = {
+            "recargas": 0, "refrescos": 0, "agregadas": 0, "tardias": 0,
+            "releidas": 0, "dimensiones": 0, "consultas": 0,
+        }
+
+    # ---------- columnas ----------
+
+    def col(self, nombre: str):
+        if not self._cols:
+            return np.zeros(0, dtype=COLUMNAS[nombre])
+        return self._cols[nombre][: self.n]
+
+    def _reservar(self, extra: int) -> None:
+        capacidad = len(self._cols["id"]) if self._cols else 0
+        if self.n + extra <= capacidad:
+            return
+        nueva = max(self.n + extra, int(capacidad * 1.5), 1024)
+        columnas = {}
+        for nombre, tipo in COLUMNAS.items():
+            columnas[nombre] = np.zeros(nueva, dtype=tipo)
+            if self._cols:
+                columnas[nombre][: self.n] = self._cols[nombre][: self.n]
+        self._cols = columnas
+
+    def _agregar(self, partes: Dict[str, Any]) -> None:
+        filas = len(partes["id"])
+        if not filas:
+            return
+        self._reservar(filas)
+        for nombre in COLUMNAS:
+            self._cols[nombre][self.n: self.n + filas] = partes[nombre]
+        self.n += filas
+
+    def _insertar(self, partes: Dict[str, Any]) -> int:
+        """Agrega filas con id menor al último visto, sin duplicar, y reordena por id."""
+        ids = np.asarray(partes["id"])
+        posiciones = np.searchsorted(self.col("id"), ids)
+        dentro = posiciones < self.n
+        nuevas = np.ones(len(ids), dtype=bool)
+        nuevas[dentro] = self.col("id")[posiciones[dentro]] != ids[dentro]
+        if not nuevas.any():
+            return 0
+        self._agregar({nombre: np.asarray(partes[nombre])[nuevas] if nombre != "vivo" else True for nombre in COLUMNAS})
+        orden = np.argsort(self.col("id"), kind="stable")
+        for nombre in COLUMNAS:
+            self._cols[nombre][: self.n] = self.col(nombre)[orden]
+        return int(nuevas.sum())
+
+    def _vigilar_huecos(self, desde: int, hasta: int) -> None:
+        """Anota los ids de (desde, hasta] que faltan en la foto."""
+        inicio = max(desde + 1, hasta - MAX_HUECOS + 1)
+        if inicio > hasta:
+            return
+        ids = self.col("id")
+        faltan = np.setdiff1d(np.arange(inicio, hasta + 1), ids[np.searchsorted(ids, inicio):], assume_unique=True)
+        ahora = time.monotonic()
+        for i in faltan.tolist():
+            self._huecos.setdefault(i, ahora)
+        if len(self._huecos) > MAX_HUECOS:
+            for i in sorted(self._huecos)[: len(self._huecos) - MAX_HUECOS]:
+                del self._huecos[i]
+
+    def _dimensiones_cubren(self, partes: Dict[str, Any]) -> bool:
+        return (
+            int(np.max(partes["producto_id"])) < len(self.categoria_de_producto)
+            and int(np.max(partes["cliente_id"])) < len(self.tipo_de_cliente)
+        )
+
+    @staticmethod
+    def _partes(ids, epochs, clientes, productos, cantidades, totales) -> Dict[str, Any]:
+        dia = np.floor_divide(np.asarray(epochs, dtype=np.int64), 86400)
+        return {
+            "id": ids,
+            "dia": dia,
+            "mes": dia.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64),
+            "cliente_id": clientes,
+            "producto_id": productos,
+            "cantidad": cantidades,
+            "total": totales,
+            "vivo": True,
+        }
+
+    def _partes_filas(self, filas: Sequence[Tuple]) -> Dict[str, Any]:
+        """Filas de `_consulta_compras` -> columnas."""
+        return self._partes(*(np.array(columna) for columna in zip(*filas)))
+
+    def _consulta_compras(self, dialecto: str):
+        return select(
+            Compra.id,
+            _epoch_sql(dialecto),
+            Compra.cliente_id,
+            Compra.producto_id,
+            Compra.cantidad,
+            Compra.total,
+        )
+
+    # ---------- carga y refresco ----------
+
+    async def _cargar_dimensiones(self, db: AsyncSession) -> None:
+        self._dims_sucias = False
+        productos = (await db.execute(select(Producto.id, Producto.categoria_id, Producto.nombre))).all()
+        clientes = (await db.execute(select(Cliente.id, Cliente.tipo_cliente, Cliente.nombre))).all()
+        categorias = (await db.execute(select(Categoria.id, Categoria.nombre))).all()
+
+        # Incluye ids que solo quedan en compras viejas (0 = sin categoría / sin tipo)
+        maximo_p = max([p[0] for p in productos] + [int(self.col("producto_id").max()) if self.n else 0])
+        maximo_c = max([c[0] for c in clientes] + [int(self.col("cliente_id").max()) if self.n else 0])
+        categoria_de = np.zeros(maximo_p + 1, dtype=np.int32)
+        for pid, cid, _ in productos:
+            categoria_de[pid] = cid or 0
+        tipos: List[Optional[str]] = [None]
+        codigos = {None: 0}
+        tipo_de = np.zeros(maximo_c + 1, dtype=np.int16)
+        for cid, tipo, _ in clientes:
+            tipo = (tipo or "").strip().lower() or None
+            if tipo not in codigos:
+                codigos[tipo] = len(tipos)
+                tipos.append(tipo)
+            tipo_de[cid] = codigos[tipo]
+
+        self.categoria_de_producto, self.tipo_de_cliente, self.tipos = categoria_de, tipo_de, tipos
+        self.nombres = {
+            "producto": {p[0]: p[2] for p in productos},
+            "cliente": {c[0]: c[2] for c in clientes},
+            "categoria": {c[0]: c[1] for c in categorias},
+        }
+        self.metricas["dimensiones"] += 1
+
+    async def cargar(self, db: AsyncSession) -> None:
+        """Rehace la foto completa: meses archivados + tabla."""
+        self.n, self._cols = 0, {}
+        self._pendientes.clear()
+        self._huecos.clear()
+        for mes in archivo_compras.meses():
+            m = archivo_compras.abrir(mes)
+            if m is None or not m.filas:
+                continue
+            self._agregar(self._partes(m["id"], m["fecha"], m["cliente_id"], m["producto_id"], m["cantidad"], m["total"]))
+
+        stmt = self._consulta_compras(db.bind.dialect.name).order_by(Compra.id)
+        resultado = await db.stream(stmt.execution_options(yield_per=LOTE))
+        async for lote in resultado.partitions(LOTE):
+            self._agregar(self._partes_filas(lote))
+
+        if self.n:
+            # Archivo y tabla pueden solaparse (archivo a medio terminar): gana la tabla
+            ids = self.col("id")
+            if np.any(ids[1:] <= ids[:-1]):
+                inverso = np.arange(self.n)[::-1]
+                _, ultimos = np.unique(ids[::-1], return_index=True)
+                orden = inverso[ultimos]
+                for nombre in COLUMNAS:
+                    self._cols[nombre] = np.ascontiguousarray(self.col(nombre)[orden])
+                self.n = len(orden)
+            self.ultimo_id = int(self.col("id")[-1])
+            self._vigilar_huecos(0, self.ultimo_id)
+        else:
+            self.ultimo_id = 0
+        await self._cargar_dimensiones(db)
+        self._recargar = False
+        self._cargado_en = time.monotonic()
+        self.metricas["recargas"] += 1
+
+    async def refrescar(self, db: AsyncSession) -> None:
+        async with self._lock:
+            if self._recargar or time.monotonic() - self._cargado_en > RECARGA_S:
+                await self.cargar(db)
+                return
+            self.metricas["refrescos"] += 1
+            consulta = self._consulta_compras(db.bind.dialect.name)
+
+            # Compras nuevas
+            filas = (await db.execute(consulta.where(Compra.id > self.ultimo_id).order_by(Compra.id))).all()
+            if filas:
+                partes = self._partes_filas(filas)
+                self._agregar(partes)
+                self._vigilar_huecos(self.ultimo_id, filas[-1][0])
+                self.ultimo_id = filas[-1][0]
+                self.metricas["agregadas"] += len(filas)
+                # Producto o cliente creado por otro worker: todavía no está en las búsquedas
+                if not self._dimensiones_cubren(partes):
+                    self._dims_sucias = True
+
+            # Huecos de ids: compras que confirmaron después que otras con id mayor
+            if self._huecos:
+                filas = (await db.execute(consulta.where(Compra.id.in_(sorted(self._huecos))))).all()
+                if filas:
+                    partes = self._partes_filas(filas)
+                    self.metricas["tardias"] += self._insertar(partes)
+                    for fila in filas:
+                        self._huecos.pop(fila[0], None)
+                    if not self._dimensiones_cubren(partes):
+                        self._dims_sucias = True
+                limite = time.monotonic() - MARGEN_S
+                self._huecos = {i: visto for i, visto in self._huecos.items() if visto > limite}
+
+            # Compras editadas o borradas desde el último refresco
+            if self._pendientes:
+                ids, self._pendientes = sorted(self._pendientes), set()
+                filas = (await db.execute(consulta.where(Compra.id.in_(ids)))).all()
+                posiciones = np.searchsorted(self.col("id"), ids)
+                dentro = posiciones < self.n
+                presentes = np.zeros(len(ids), dtype=bool)
+                presentes[dentro] = self.col("id")[posiciones[dentro]] == np.asarray(ids)[dentro]
+                self.col("vivo")[posiciones[presentes]] = False
+                if filas:
+                    partes = self._partes_filas(filas)
+                    pos = np.searchsorted(self.col("id"), partes["id"])
+                    conocidas = pos < self.n
+                    conocidas[conocidas] = self.col("id")[pos[conocidas]] == partes["id"][conocidas]
+                    for nombre in COLUMNAS:
+                        valores = partes[nombre]
+                        self.col(nombre)[pos[conocidas]] = valores[conocidas] if nombre != "vivo" else True
+                    # Una compra que todavía no estaba en la foto (confirmó tarde)
+                    if not conocidas.all():
+                        self.metricas["tardias"] += self._insertar(
+                            {nombre: partes[nombre][~conocidas] if nombre != "vivo" else True for nombre in COLUMNAS}
+                        )
+                    if not self._dimensiones_cubren(partes):
+                        self._dims_sucias = True
+                self.metricas["releidas"] += len(ids)
+
+            if self._dims_sucias:
+                await self._cargar_dimensiones(db)
+
+    def anotar_compras(self, *ids: int) -> None:
+        """crud.py: estas compras cambiaron o se borraron (después del commit)."""
+        self._pendientes.update(ids)
+
+    def anotar_dimensiones(self) -> None:
+        """crud.py: cambió un nombre, la categoría de un producto o el tipo de un cliente."""
+        self._dims_sucias = True
+
+    def invalidar(self) -> None:
+        """La próxima consulta rehace la foto completa."""
+        self._recargar = True
+
+    # ---------- consultas ----------
+
+    def _codigos(self, dimension: str, mascara):
+        if dimension == "anio":
+            return self.col("mes")[mascara] // 12 + 1970
+        if dimension == "mes":
+            return self.col("mes")[mascara].astype(np.int64)
+        if dimension == "dia":
+            return self.col("dia")[mascara]
+        if dimension == "cliente":
+            return self.col("cliente_id")[mascara]
+        if dimension == "producto":
+            return self.col("producto_id")[mascara]
+        if dimension == "categoria":
+            return self.categoria_de_producto[self.col("producto_id")[mascara]]
+        if dimension == "tipo_cliente":
+            return self.tipo_de_cliente[self.col("cliente_id")[mascara]]
+        raise ValueError(f"Dimensión desconocida: {dimension!r} (válidas: {', '.join(DIMENSIONES)})")
+
+    def _etiqueta(self, dimension: str, codigo: int) -> Any:
+        if dimension == "mes":
+            return str(np.datetime64(codigo, "M"))
+        if dimension == "dia":
+            return str(np.datetime64(codigo, "D"))
+        if dimension == "tipo_cliente":
+            return self.tipos[codigo]
+        return codigo
+
+    def _mascara(self, filtros: Dict[str, Any]):
+        mascara = self.col("vivo").copy()
+        if filtros.get("desde"):
+            mascara &= self.col("dia") >= _dia(filtros["desde"])
+        if filtros.get("hasta"):
+            mascara &= self.col("dia") <= _dia(filtros["hasta"], fin=True)
+        if filtros.get("cliente_id") is not None:
+            mascara &= self.col("cliente_id") == filtros["cliente_id"]
+        if filtros.get("producto_id") is not None:
+            mascara &= self.col("producto_id") == filtros["producto_id"]
+        if filtros.get("categoria_id") is not None:
+            mascara &= self.categoria_de_producto[self.col("producto_id")] == filtros["categoria_id"]
+        if filtros.get("tipo_cliente"):
+            tipo = filtros["tipo_cliente"].strip().lower()
+            codigo = self.tipos.index(tipo) if tipo in self.tipos else -1
+            mascara &= self.tipo_de_cliente[self.col("cliente_id")] == codigo
+        return mascara
+
+    def agrupar(
+        self,
+        por: Sequence[str] = (),
+        medidas: Sequence[str] = ("total", "unidades", "compras"),
+        filtros: Optional[Dict[str, Any]] = None,
+        orden: Optional[str] = None,
+        limite: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Una fila por combinación de `por` con las `medidas` pedidas."""
+        for medida in medidas:
+            if medida not in MEDIDAS:
+                raise ValueError(f"Medida desconocida: {medida!r} (válidas: {', '.join(MEDIDAS)})")
+        self.metricas["consultas"] += 1
+        mascara = self._mascara(filtros or {})
+        cantidad = self.col("cantidad")[mascara]
+        total = self.col("total")[mascara]
+
+        if por:
+            codigos = [self._codigos(d, mascara) for d in por]
+            minimos = [int(c.min()) if len(c) else 0 for c in codigos]
+            tamanos = [int(c.max()) - m + 1 if len(c) else 1 for c, m in zip(codigos, minimos)]
+            clave = np.ravel_multi_index([c - m for c, m in zip(codigos, minimos)], tamanos)
+            if int(np.prod(tamanos, dtype=np.float64)) <= GRUPOS_DENSOS:
+                largo = int(np.prod(tamanos))
+                compras = np.bincount(clave, minlength=largo)
+                grupos = np.flatnonzero(compras)
+                compras = compras[grupos]
+                sumas = {
+                    "unidades": np.bincount(clave, weights=cantidad, minlength=largo)[grupos],
+                    "total": np.bincount(clave, weights=total, minlength=largo)[grupos],
+                }
+            else:
+                grupos, inverso = np.unique(clave, return_inverse=True)
+                compras = np.bincount(inverso)
+                sumas = {
+                    "unidades": np.bincount(inverso, weights=cantidad),
+                    "total": np.bincount(inverso, weights=total),
+                }
+            valores_dim = [v + m for v, m in zip(np.unravel_index(grupos, tamanos), minimos)]
+        else:
+            compras = np.array([len(total)])
+            sumas = {"unidades": np.array([cantidad.sum()]), "total": np.array([total.sum()])}
+            valores_dim = []
+
+        columnas = {
+            "compras": compras,
+            "unidades": sumas["unidades"],
+            "total": sumas["total"],
+        }
+        if "ticket_promedio" in medidas:
+            columnas["ticket_promedio"] = np.divide(
+                sumas["total"], compras, out=np.zeros(len(compras)), where=compras > 0
+            )
+        indices = np.arange(len(compras))
+        if orden:
+            if orden not in columnas:
+                raise ValueError(f"No se puede ordenar por {orden!r}")
+            indices = np.argsort(-columnas[orden], kind="stable")
+        if limite:
+            indices = indices[:limite]
+
+        filas = []
+        for i in indices:
+            fila: Dict[str, Any] = {}
+            for dimension, valores in zip(por, valores_dim):
+                codigo = int(valores[i])
+                fila[dimension] = self._etiqueta(dimension, codigo)
+                if dimension in self.nombres:
+                    fila[f"{dimension}_nombre"] = self.nombres[dimension].get(codigo)
+            for medida in medidas:
+                valor = columnas[medida][i]
+                fila[medida] = int(valor) if medida in ("compras", "unidades") else round(float(valor), 2)
+            filas.append(fila)
+        return filas
+
+    def pivotar(
+        self,
+        filas: str,
+        columnas: str,
+        medida: str = "total",
+        filtros: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Tabla `filas` x `columnas` de una medida (0 donde no hay ventas)."""
+        grupos = self.agrupar((filas, columnas), (medida,), filtros)
+        etiquetas_f = sorted({g[filas] for g in grupos}, key=_orden_etiqueta)
+        etiquetas_c = sorted({g[columnas] for g in grupos}, key=_orden_etiqueta)
+        if len(etiquetas_f) * len(etiquetas_c) > MAX_CELDAS:
+            raise ValueError(
+                f"La tabla tendría {len(etiquetas_f)} x {len(etiquetas_c)} celdas: agrega filtros"
+            )
+        pos_f = {e: i for i, e in enumerate(etiquetas_f)}
+        pos_c = {e: i for i, e in enumerate(etiquetas_c)}
+        matriz = np.zeros((len(etiquetas_f), len(etiquetas_c)))
+        if grupos:
+            matriz[
+                [pos_f[g[filas]] for g in grupos],
+                [pos_c[g[columnas]] for g in grupos],
+            ] = [g[medida] for g in grupos]
+        resultado = {
+            "filas": filas,
+            "columnas": columnas,
+            "medida": medida,
+            "etiquetas_filas": etiquetas_f,
+            "etiquetas_columnas": etiquetas_c,
+            "valores": matriz.round(2).tolist(),
+            "totales_filas": matriz.sum(axis=1).round(2).tolist(),
+            "totales_columnas": matriz.sum(axis=0).round(2).tolist(),
+        }
+        for eje, dimension, etiquetas in (("filas", filas, etiquetas_f), ("columnas", columnas, etiquetas_c)):
+            if dimension in self.nombres:
+                resultado[f"nombres_{eje}"] = [self.nombres[dimension].get(e) for e in etiquetas]
+        return resultado
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            **self.metricas,
+            "activo": ACTIVO,
+            "filas": self.n,
+            "vivas": int(self.col("vivo").sum()) if self.n else 0,
+            "ultimo_id": self.ultimo_id,
+            "pendientes": len(self._pendientes),
+            "huecos": len(self._huecos),
+            "bytes": sum(a.nbytes for a in self._cols.values()),
+            "edad_s": round(time.monotonic() - self._cargado_en, 1) if self._cargado_en else None,
+        }
+
+
+def _orden_etiqueta(valor: Any) -> Tuple[int, Any]:
+    # None (sin tipo / sin categoría) al final; el resto en su orden natural
+    return (1, "") if valor is None else (0, valor)
+
+
+snapshot_ventas = SnapshotVentas()
@@ -0,0 +1,378 @@
+# archivo_compras.py
+"""
+Archivo frío de compras: meses cerrados en archivos columnares.
+
+Cada mes archivado es una carpeta AAAA-MM/ dentro de COMPRAS_ARCHIVO_DIR
+con un archivo binario por columna: ancho fijo, little-endian, una
+posición por compra y ordenados por id. Se suma un meta.json con la
+cantidad de filas y los tipos:
+
+    id.bin  fecha.bin (epoch UTC, s)  cliente_id.bin  producto_id.bin
+    venta_id.bin (-1 = sin venta)  cantidad.bin  precio_unitario_aplicado.bin  total.bin
+
+Para leer se hace mmap de cada archivo y np.frombuffer encima: el arreglo
+es una vista de las páginas del archivo (sin copiar ni parsear nada) y el
+sistema operativo decide qué queda en memoria. estadisticas.py lee así los
+meses viejos.
+
+`archivar_mes` exporta un mes de la tabla a una carpeta AAAA-MM.pendiente,
+lo borra de la tabla en una sola transacción y recién después del commit
+publica la carpeta (rename). Los lectores solo ven carpetas publicadas, así
+que ninguna compra está a la vez en la tabla y en el archivo. Si el proceso
+se corta entre el commit y el rename, `recuperar` publica la carpeta
+pendiente (el borrado se confirmó) o la descarta (no se confirmó); se
+corre al arrancar y antes de archivar. Repetir un mes junta lo ya archivado
+con lo nuevo: no duplica filas.
+
+Las filas de `multimedia` de esas compras se guardan en multimedia.json
+dentro del mes y se borran en la misma transacción.
+
+NumPy es opcional: sin él no se archiva y las estadísticas usan solo la
+base de datos.
+
+Variables de entorno:
+    COMPRAS_ARCHIVO_DIR   carpeta del archivo (por defecto archivo/compras)
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import mmap
+import os
+import re
+import shutil
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache_consultas import marcar_cambio
+from models import Compra, Multimedia
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+DIRECTORIO = os.getenv("COMPRAS_ARCHIVO_DIR", os.path.join("archivo", "compras"))
+
+# Columna -> tipo (ancho fijo, little-endian)
+COLUMNAS: Dict[str, str] = {
+    "id": "<i8",
+    "fecha": "<i8",
+    "cliente_id": "<i4",
+    "producto_id": "<i4",
+    "venta_id": "<i4",
+    "cantidad": "<i4",
+    "precio_unitario_aplicado": "<f8",
+    "total": "<f8",
+}
+
+# Filas por DELETE al sacar el mes de la tabla (todas en la misma transacción)
+LOTE_BORRADO = 5000
+
+PENDIENTE = ".pendiente"
+_NOMBRE_MES = re.compile(r"^\d{4}-\d{2}$")
+
+
+def _utc(momento: datetime) -> datetime:
+    return momento if momento.tzinfo else momento.replace(tzinfo=timezone.utc)
+
+
+def rango_mes(mes: str) -> Tuple[datetime, datetime]:
+    """'2024-01' -> [2024-01-01, 2024-02-01) en UTC."""
+    try:
+        inicio = datetime.strptime(mes, "%Y-%m").replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise ValueError(f"Mes inválido: {mes!r} (se espera AAAA-MM)")
+    fin = inicio.replace(year=inicio.year + inicio.month // 12, month=inicio.month % 12 + 1)
+    return inicio, fin
+
+
+def mes_cerrado(mes: str) -> bool:
+    hoy = datetime.now(timezone.utc).date()
+    return rango_mes(mes)[1].date() <= date(hoy.year, hoy.month, 1)
+
+
+# ======================================================
+# ================= MES ARCHIVADO ======================
+# ======================================================
+
+class MesArchivado:
+    """Columnas de un mes como vistas NumPy sobre archivos mapeados en memoria."""
+
+    def __init__(self, carpeta: str):
+        with open(os.path.join(carpeta, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.filas: int = self.meta["filas"]
+        self._mapas: List[mmap.mmap] = []
+        self.columnas: Dict[str, Any] = {}
+        for columna, tipo in self.meta["columnas"].items():
+            with open(os.path.join(carpeta, f"{columna}.bin"), "rb") as f:
+                # El mmap sigue vivo aunque se cierre el archivo
+                mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapas.append(mapa)
+            self.columnas[columna] = np.frombuffer(mapa, dtype=np.dtype(tipo))
+
+    def __getitem__(self, columna: str):
+        return self.columnas[columna]
+
+    def cerrar(self) -> None:
+        self.columnas = {}
+        for mapa in self._mapas:
+            try:
+                mapa.close()
+            except BufferError:
+                # Alguien todavía usa una vista: se libera cuando la suelte
+                pass
+        self._mapas = []
+
+
+class ArchivoCompras:
+    def __init__(self, directorio: str = DIRECTORIO):
+        self.directorio = directorio
+        # mes -> (mtime de meta.json, mes abierto)
+        self._abiertos: Dict[str, Tuple[float, MesArchivado]] = {}
+
+    @property
+    def disponible(self) -> bool:
+        return np is not None
+
+    def meses(self) -> List[str]:
+        if not os.path.isdir(self.directorio):
+            return []
+        return sorted(
+            nombre for nombre in os.listdir(self.directorio)
+            if _NOMBRE_MES.match(nombre) and os.path.isfile(os.path.join(self.directorio, nombre, "meta.json"))
+        )
+
+    def pendientes(self) -> List[str]:
+        """Meses escritos cuyo borrado de la tabla todavía no se resolvió."""
+        if not os.path.isdir(self.directorio):
+            return []
+        return sorted(
+            nombre[: -len(PENDIENTE)] for nombre in os.listdir(self.directorio)
+            if nombre.endswith(PENDIENTE) and _NOMBRE_MES.match(nombre[: -len(PENDIENTE)])
+        )
+
+    def abrir(self, mes: str) -> Optional[MesArchivado]:
+        meta = os.path.join(self.directorio, mes, "meta.json")
+        try:
+            mtime = os.path.getmtime(meta)
+        except OSError:
+            return None
+        abierto = self._abiertos.get(mes)
+        if abierto is None or abierto[0] != mtime:
+            if abierto is not None:
+                abierto[1].cerrar()
+            abierto = (mtime, MesArchivado(os.path.join(self.directorio, mes)))
+            self._abiertos[mes] = abierto
+        return abierto[1]
+
+    def escribir(self, mes: str, columnas: Dict[str, Any], multimedia: Optional[List[Dict[str, Any]]] = None) -> None:
+        """
+        Escribe el mes completo en AAAA-MM.pendiente; nadie lo lee hasta
+        `publicar`.
+        """
+        os.makedirs(self.directorio, exist_ok=True)
+        temporal = os.path.join(self.directorio, mes + PENDIENTE)
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+
+        filas = len(columnas["id"])
+        for columna, tipo in COLUMNAS.items():
+            with open(os.path.join(temporal, f"{columna}.bin"), "wb") as f:
+                f.write(np.ascontiguousarray(columnas[columna], dtype=np.dtype(tipo)).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        meta = {
+            "mes": mes,
+            "filas": filas,
+            "columnas": COLUMNAS,
+            "id_min": int(columnas["id"].min()),
+            "id_max": int(columnas["id"].max()),
+            "total": float(columnas["total"].sum()),
+        }
+        if multimedia:
+            with open(os.path.join(temporal, "multimedia.json"), "w", encoding="utf-8") as f:
+                json.dump(multimedia, f, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+        with open(os.path.join(temporal, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def multimedia(self, mes: str) -> List[Dict[str, Any]]:
+        """Filas de `multimedia` de las compras archivadas del mes."""
+        ruta = os.path.join(self.directorio, mes, "multimedia.json")
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def descartar(self, mes: str) -> None:
+        shutil.rmtree(os.path.join(self.directorio, mes + PENDIENTE), ignore_errors=True)
+
+    def publicar(self, mes: str) -> None:
+        """Pone AAAA-MM.pendiente en lugar de AAAA-MM (después del commit del borrado)."""
+        final = os.path.join(self.directorio, mes)
+        temporal = final + PENDIENTE
+
+        # Se cierran los mapas viejos antes de reemplazar la carpeta
+        abierto = self._abiertos.pop(mes, None)
+        if abierto is not None:
+            abierto[1].cerrar()
+        if os.path.isdir(final):
+            viejo = final + ".old"
+            shutil.rmtree(viejo, ignore_errors=True)
+            os.replace(final, viejo)
+            os.replace(temporal, final)
+            shutil.rmtree(viejo, ignore_errors=True)
+        else:
+            os.replace(temporal, final)
+
+    def estado(self) -> Dict[str, Any]:
+        meses = []
+        for mes in self.meses():
+            with open(os.path.join(self.directorio, mes, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            meses.append({"mes": mes, "filas": meta["filas"], "total": meta["total"]})
+        return {
+            "disponible": self.disponible,
+            "directorio": self.directorio,
+            "meses": meses,
+            "filas": sum(m["filas"] for m in meses),
+        }
+
+
+archivo_compras = ArchivoCompras()
+
+
+# ======================================================
+# ==================== EXPORTAR ========================
+# ======================================================
+
+def _a_columnas(filas) -> Dict[str, Any]:
+    return {
+        "id": np.array([f.id for f in filas], dtype=COLUMNAS["id"]),
+        "fecha": np.array([int(_utc(f.fecha).timestamp()) for f in filas], dtype=COLUMNAS["fecha"]),
+        "cliente_id": np.array([f.cliente_id for f in filas], dtype=COLUMNAS["cliente_id"]),
+        "producto_id": np.array([f.producto_id for f in filas], dtype=COLUMNAS["producto_id"]),
+        "venta_id": np.array([-1 if f.venta_id is None else f.venta_id for f in filas], dtype=COLUMNAS["venta_id"]),
+        "cantidad": np.array([f.cantidad for f in filas], dtype=COLUMNAS["cantidad"]),
+        "precio_unitario_aplicado": np.array(
+            [f.precio_unitario_aplicado for f in filas], dtype=COLUMNAS["precio_unitario_aplicado"]
+        ),
+        "total": np.array([f.total for f in filas], dtype=COLUMNAS["total"]),
+    }
+
+
+async def _alguna_en_tabla(db: AsyncSession, ids) -> bool:
+    ids = [int(i) for i in ids]
+    for i in range(0, len(ids), LOTE_BORRADO):
+        q = await db.execute(select(func.count()).where(Compra.id.in_(ids[i:i + LOTE_BORRADO])))
+        if q.scalar():
+            return True
+    return False
+
+
+async def recuperar(db: AsyncSession, mes: Optional[str] = None) -> List[str]:
+    """
+    Resuelve carpetas pendientes que dejó un archivado cortado. El borrado es
+    una sola transacción: si ninguna de sus compras sigue en la tabla se
+    confirmó y se publica; si no, se descarta. Devuelve los meses publicados.
+    """
+    publicados = []
+    for pendiente in archivo_compras.pendientes():
+        if mes is not None and pendiente != mes:
+            continue
+        carpeta = os.path.join(archivo_compras.directorio, pendiente + PENDIENTE)
+        try:
+            escrito = MesArchivado(carpeta)
+            ids = np.array(escrito["id"])
+            escrito.cerrar()
+        except (OSError, ValueError, KeyError):
+            # Se cortó mientras se escribía: el borrado ni empezó
+            archivo_compras.descartar(pendiente)
+            continue
+        if await _alguna_en_tabla(db, ids):
+            archivo_compras.descartar(pendiente)
+        else:
+            await asyncio.to_thread(archivo_compras.publicar, pendiente)
+            publicados.append(pendiente)
+    if publicados:
+        marcar_cambio("compras", "ventas", "multimedia")
+    return publicados
+
+
+async def archivar_mes(db: AsyncSession, mes: str) -> Dict[str, Any]:
+    """
+    Pasa las compras de `mes` (cerrado) al archivo columnar y las borra de
+    la tabla. Las ventas (cabeceras) se conservan; sus líneas archivadas
+    dejan de verse en /compras.
+    """
+    if np is None:
+        raise RuntimeError("NumPy no está instalado: no se puede archivar")
+    if not mes_cerrado(mes):
+        raise ValueError("Solo se pueden archivar meses ya cerrados")
+    inicio, fin = rango_mes(mes)
+    await recuperar(db, mes)
+
+    q = await db.execute(
+        select(
+            Compra.id,
+            Compra.fecha,
+            Compra.cliente_id,
+            Compra.producto_id,
+            Compra.venta_id,
+            Compra.cantidad,
+            Compra.precio_unitario_aplicado,
+            Compra.total,
+        )
+        .where(Compra.fecha >= inicio, Compra.fecha < fin)
+        .order_by(Compra.id)
+    )
+    filas = q.all()
+    anterior = archivo_compras.abrir(mes)
+    if not filas:
+        return {"mes": mes, "archivadas": 0, "filas_mes": anterior.filas if anterior else 0}
+
+    nuevas = _a_columnas(filas)
+    if anterior is not None:
+        # Reintento: se suman solo las que no estaban ya archivadas
+        ya = np.isin(nuevas["id"], anterior["id"])
+        combinadas = {c: np.concatenate([anterior[c], nuevas[c][~ya]]) for c in COLUMNAS}
+        orden = np.argsort(combinadas["id"], kind="stable")
+        nuevas = {c: v[orden] for c, v in combinadas.items()}
+
+    ids = [f.id for f in filas]
+    multimedia = archivo_compras.multimedia(mes)
+    for i in range(0, len(ids), LOTE_BORRADO):
+        q = await db.execute(
+            select(Multimedia.__table__).where(
+                Multimedia.model_type == "Compra", Multimedia.model_id.in_(ids[i:i + LOTE_BORRADO])
+            )
+        )
+        multimedia.extend(dict(fila._mapping) for fila in q)
+    await asyncio.to_thread(archivo_compras.escribir, mes, nuevas, multimedia)
+
+    # Con el archivo ya escrito (fsync), se saca el mes de la tabla en una
+    # sola transacción; la carpeta se publica recién después del commit
+    try:
+        for i in range(0, len(ids), LOTE_BORRADO):
+            lote = ids[i:i + LOTE_BORRADO]
+            await db.execute(
+                delete(Multimedia).where(Multimedia.model_type == "Compra", Multimedia.model_id.in_(lote))
+            )
+            await db.execute(delete(Compra).where(Compra.id.in_(lote)))
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        archivo_compras.descartar(mes)
+        raise
+    await asyncio.to_thread(archivo_compras.publicar, mes)
+    marcar_cambio("compras", "ventas", "multimedia")
+    return {"mes": mes, "archivadas": len(ids), "filas_mes": len(nuevas["id"])}
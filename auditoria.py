@@ -0,0 +1,199 @@
+# auditoria.py
+"""
+Historial de eliminados (auditoría de borrados): un solo punto de entrada.
+
+Cada borrado en crud.py llama una vez a `auditoria.registrar(db, obj)`. El
+snapshot sale de las columnas del modelo (sin dicts escritos a mano) y
+se guarda de una de dos formas:
+
+- transaccional (por defecto): la fila del historial se agrega a la misma
+  sesión y se confirma con el borrado (outbox transaccional: o quedan las
+  dos cosas o ninguna).
+- lote: las filas se juntan en memoria después del commit y una tarea de
+  fondo las escribe con un solo INSERT cada AUDITORIA_INTERVALO_S segundos
+  o al llegar a AUDITORIA_LOTE filas. Escribe menos, pero lo que esté en la
+  cola se pierde si el proceso muere antes de vaciarla.
+
+Los borrados en cascada (muchas filas) usan `registrar_select`, que copia
+el snapshot con INSERT ... SELECT sin cargar los objetos.
+
+Variables de entorno:
+    AUDITORIA_MODO         transaccional | lote
+    AUDITORIA_LOTE         filas por INSERT en modo lote (por defecto 500)
+    AUDITORIA_INTERVALO_S  espera máxima entre escrituras (por defecto 1)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, event, func, insert, inspect, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from cache_consultas import marcar_cambio
+from models import HistorialEliminados
+
+# Columnas que nunca van al historial
+EXCLUIDAS = {"contrasena"}
+
+_PENDIENTES = "auditoria_pendientes"
+
+
+# ======================================================
+# ==================== SNAPSHOTS =======================
+# ======================================================
+
+@lru_cache(maxsize=None)
+def _columnas(clase) -> Tuple[str, ...]:
+    return tuple(c.key for c in inspect(clase).column_attrs if c.key not in EXCLUIDAS)
+
+
+def _valor(valor: Any) -> Any:
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return valor
+
+
+def snapshot(obj) -> Dict[str, Any]:
+    """
+    Columnas del objeto como dict apto para JSON. Lee el estado ya cargado
+    (no dispara consultas): un atributo expirado sale como None.
+    """
+    estado = obj.__dict__
+    return {clave: _valor(estado.get(clave)) for clave in _columnas(type(obj))}
+
+
+def snapshot_sql(clase, dialecto: str):
+    """El mismo snapshot como expresión SQL (jsonb_build_object / json_object)."""
+    if dialecto == "postgresql":
+        construir, fecha = func.jsonb_build_object, (lambda columna: columna)
+    else:
+        # SQLite guarda "AAAA-MM-DD HH:MM:SS": se deja igual que isoformat()
+        construir, fecha = func.json_object, (lambda columna: func.replace(columna, " ", "T"))
+    partes = []
+    for clave in _columnas(clase):
+        columna = getattr(clase, clave)
+        if isinstance(columna.type, DateTime):
+            columna = fecha(columna)
+        partes += [literal(clave), columna]
+    return construir(*partes)
+
+
+# ======================================================
+# ===================== ESCRITOR =======================
+# ======================================================
+
+class Auditoria:
+    def __init__(self, modo: str = "transaccional", lote: int = 500, intervalo_s: float = 1.0):
+        if modo not in ("transaccional", "lote"):
+            raise ValueError(f"AUDITORIA_MODO inválido: {modo!r}")
+        self.modo = modo
+        self.lote = lote
+        self.intervalo_s = intervalo_s
+        self._cola: List[Dict[str, Any]] = []
+        self._hay_lote: Optional[asyncio.Event] = None
+        self.metricas = {"registradas": 0, "escritas": 0, "inserts": 0, "errores": 0}
+
+    def registrar(self, db: AsyncSession, obj, datos: Optional[Dict[str, Any]] = None) -> None:
+        """Anota el borrado de `obj`. Se llama antes del commit que lo borra."""
+        fila = {
+            "tabla": obj.__tablename__,
+            "registro_id": obj.id,
+            "datos": datos if datos is not None else snapshot(obj),
+        }
+        self.metricas["registradas"] += 1
+        if self.modo == "transaccional":
+            db.add(HistorialEliminados(**fila))
+        else:
+            # Pasa a la cola recién en el commit: un rollback no deja rastro
+            fila["eliminado_en"] = datetime.now(timezone.utc)
+            db.sync_session.info.setdefault(_PENDIENTES, []).append(fila)
+
+    async def registrar_select(self, db: AsyncSession, clase, filtro) -> None:
+        """Snapshot de todas las filas de `clase` que cumplen `filtro`, en una sentencia."""
+        await db.execute(
+            insert(HistorialEliminados).from_select(
+                ["tabla", "registro_id", "datos"],
+                select(
+                    literal(clase.__tablename__),
+                    clase.id,
+                    snapshot_sql(clase, db.bind.dialect.name),
+                ).where(filtro),
+            )
+        )
+
+    # ---------- modo lote ----------
+
+    def _encolar(self, filas: List[Dict[str, Any]]) -> None:
+        self._cola.extend(filas)
+        if self._hay_lote is not None and len(self._cola) >= self.lote:
+            self._hay_lote.set()
+
+    async def vaciar(self) -> int:
+        """Escribe lo que haya en la cola; devuelve cuántas filas escribió."""
+        # Importado aquí: database.py arma el engine al importarse
+        from database import AsyncSessionLocal
+
+        escritas = 0
+        while self._cola:
+            filas, self._cola = self._cola[: self.lote], self._cola[self.lote:]
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(HistorialEliminados), filas)
+                    await db.commit()
+            except Exception as e:
+                # Se devuelven a la cola y se reintenta en la próxima vuelta
+                self._cola[:0] = filas
+                self.metricas["errores"] += 1
+                print("⚠ Error al escribir el historial de eliminados:", e)
+                break
+            escritas += len(filas)
+            self.metricas["escritas"] += len(filas)
+            self.metricas["inserts"] += 1
+        if escritas:
+            marcar_cambio("historial_eliminados")
+        return escritas
+
+    async def ejecutar(self) -> None:
+        """Tarea de fondo del modo lote."""
+        self._hay_lote = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._hay_lote.wait(), timeout=self.intervalo_s)
+            except asyncio.TimeoutError:
+                pass
+            self._hay_lote.clear()
+            await self.vaciar()
+
+    def estado(self) -> Dict[str, Any]:
+        return {**self.metricas, "modo": self.modo, "en_cola": len(self._cola)}
+
+
+def config_desde_entorno() -> Dict[str, Any]:
+    return {
+        "modo": os.getenv("AUDITORIA_MODO", "transaccional"),
+        "lote": int(os.getenv("AUDITORIA_LOTE", "500")),
+        "intervalo_s": float(os.getenv("AUDITORIA_INTERVALO_S", "1")),
+    }
+
+
+auditoria = Auditoria(**config_desde_entorno())
+
+
+@event.listens_for(Session, "after_commit")
+def _al_confirmar(session: Session) -> None:
+    filas = session.info.pop(_PENDIENTES, None)
+    if filas:
+        auditoria._encolar(filas)
+
+
+@event.listens_for(Session, "after_rollback")
+def _al_deshacer(session: Session) -> None:
+    session.info.pop(_PENDIENTES, None)
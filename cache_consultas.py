@@ -0,0 +1,230 @@
+# cache_consultas.py
+"""
+Caché en memoria para los crud.listar_*.
+
+La clave es el nombre de la función más sus filtros normalizados. Cada tabla
+tiene un contador de versión que crud.py incrementa tras cada
+create/update/delete; una entrada solo es válida si las versiones de las
+tablas que leyó no han cambiado. Además hay TTL (acota lo desactualizado
+que puede estar un worker respecto a los demás) y expulsión LRU.
+
+Variables de entorno:
+    CACHE_CONSULTAS=0      desactiva la caché
+    CACHE_MAX_ENTRADAS     entradas máximas (LRU), por defecto 256
+    CACHE_TTL_S            vida de una entrada, por defecto 30 s
+    CACHE_MAX_FILAS        resultados más grandes no se guardan, por defecto 5000
+
+Una petición puede saltarse la caché con `Cache-Control: no-cache`.
+
+Con `esquema=` se guardan las filas ya pasadas al esquema de respuesta
+(pydantic), no las instancias ORM: esas quedan ligadas a la sesión que las
+cargó y no se deben compartir entre peticiones. Cada llamada recibe copias
+(model_copy, superficial): cambiar un campo de una fila no toca la
+entrada. Sin esquema se guarda lo que devuelva la función tal cual; quien
+lo reciba no debe modificarlo.
+"""
+from __future__ import annotations
+
+import functools
+import inspect
+import os
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Hashable, Iterator, Optional, Tuple
+
+# Versión por tabla; solo crece. Los números solo valen dentro de este
+# proceso: `generacion` los distingue de los de otro worker o reinicio.
+versiones: Dict[str, int] = defaultdict(int)
+generacion = uuid.uuid4().hex
+
+_omitir: ContextVar[bool] = ContextVar("omitir_cache_consultas", default=False)
+
+
+def marcar_cambio(*tablas: str) -> None:
+    """Invalida todo lo cacheado que dependa de `tablas`."""
+    for tabla in tablas:
+        versiones[tabla] += 1
+
+
+def version_de(*tablas: str) -> Tuple[int, ...]:
+    return tuple(versiones[t] for t in tablas)
+
+
+@contextmanager
+def sin_cache() -> Iterator[None]:
+    """Dentro del bloque, los listar_* van siempre a la base de datos."""
+    token = _omitir.set(True)
+    try:
+        yield
+    finally:
+        _omitir.reset(token)
+
+
+# ======================================================
+# ====================== CACHÉ =========================
+# ======================================================
+
+class CacheConsultas:
+    def __init__(self, max_entradas: int = 256, ttl_s: float = 30.0, max_filas: int = 5000):
+        self.max_entradas = max_entradas
+        self.ttl_s = ttl_s
+        self.max_filas = max_filas
+        # clave -> (versiones, expira_en, valor)
+        self._entradas: "OrderedDict[Hashable, Tuple[Tuple[int, ...], float, Any]]" = OrderedDict()
+        self.metricas = {
+            "aciertos": 0,
+            "fallos": 0,
+            "invalidadas": 0,
+            "expiradas": 0,
+            "expulsadas": 0,
+            "omitidas": 0,
+            "demasiado_grandes": 0,
+        }
+
+    def obtener(self, clave: Hashable, version: Tuple[int, ...]) -> Tuple[bool, Any]:
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            self.metricas["fallos"] += 1
+            return False, None
+
+        version_guardada, expira_en, valor = entrada
+        if version_guardada != version:
+            del self._entradas[clave]
+            self.metricas["invalidadas"] += 1
+            self.metricas["fallos"] += 1
+            return False, None
+        if time.monotonic() >= expira_en:
+            del self._entradas[clave]
+            self.metricas["expiradas"] += 1
+            self.metricas["fallos"] += 1
+            return False, None
+
+        self._entradas.move_to_end(clave)
+        self.metricas["aciertos"] += 1
+        return True, valor
+
+    def guardar(self, clave: Hashable, version: Tuple[int, ...], valor: Any) -> None:
+        if len(valor) > self.max_filas:
+            self.metricas["demasiado_grandes"] += 1
+            return
+        self._entradas[clave] = (version, time.monotonic() + self.ttl_s, valor)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+            self.metricas["expulsadas"] += 1
+
+    def vaciar(self) -> None:
+        self._entradas.clear()
+
+    def estado(self) -> Dict[str, Any]:
+        consultas = self.metricas["aciertos"] + self.metricas["fallos"]
+        return {
+            **self.metricas,
+            "entradas": len(self._entradas),
+            "tasa_aciertos": round(self.metricas["aciertos"] / consultas, 4) if consultas else None,
+            "versiones": dict(versiones),
+        }
+
+
+ACTIVA = os.getenv("CACHE_CONSULTAS", "1") != "0"
+
+cache = CacheConsultas(
+    max_entradas=int(os.getenv("CACHE_MAX_ENTRADAS", "256")),
+    ttl_s=float(os.getenv("CACHE_TTL_S", "30")),
+    max_filas=int(os.getenv("CACHE_MAX_FILAS", "5000")),
+)
+
+
+def _normalizar(valor: Any) -> Any:
+    if isinstance(valor, str):
+        valor = valor.strip()
+        return valor or None
+    return valor
+
+
+def cacheado(*tablas: str, esquema: Optional[type] = None):
+    """
+    Decora un `async def listar_x(db, **filtros)` para cachear su resultado
+    (una lista de filas o un dict de resumen).
+    `tablas` son todas las tablas que la consulta lee (incluidas las de los
+    joinedload/selectinload). Con `esquema` cada fila se valida contra él
+    antes de guardarla, y se devuelve eso también cuando no había entrada.
+    """
+
+    def decorador(func):
+        firma = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def envoltura(db, *args, **kwargs):
+            if not ACTIVA or _omitir.get():
+                cache.metricas["omitidas"] += 1
+                return await func(db, *args, **kwargs)
+
+            ligados = firma.bind(db, *args, **kwargs)
+            ligados.apply_defaults()
+            filtros = tuple(
+                sorted(
+                    (nombre, _normalizar(valor))
+                    for nombre, valor in ligados.arguments.items()
+                    if nombre != "db" and _normalizar(valor) is not None
+                )
+            )
+            clave = (func.__name__, filtros)
+            # La versión se toma ANTES de consultar: si una escritura llega en
+            # medio, lo que guardemos ya nace invalidado.
+            version = version_de(*tablas)
+
+            encontrado, valor = cache.obtener(clave, version)
+            if encontrado:
+                # Los resúmenes (dict) se devuelven tal cual, como copia
+                if isinstance(valor, dict):
+                    return dict(valor)
+                return [fila.model_copy() for fila in valor] if esquema is not None else list(valor)
+
+            resultado = await func(db, *args, **kwargs)
+            if isinstance(resultado, dict):
+                cache.guardar(clave, version, dict(resultado))
+                return resultado
+            if esquema is not None:
+                resultado = [esquema.model_validate(fila) for fila in resultado]
+                cache.guardar(clave, version, tuple(resultado))
+                return [fila.model_copy() for fila in resultado]
+            cache.guardar(clave, version, tuple(resultado))
+            return resultado
+
+        envoltura.tablas = tablas
+        return envoltura
+
+    return decorador
+
+
+# ======================================================
+# ============ OMITIR CACHÉ POR PETICIÓN ===============
+# ======================================================
+
+class OmitirCacheMiddleware:
+    """Activa `sin_cache()` si la petición trae Cache-Control/Pragma no-cache."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and _pide_sin_cache(scope.get("headers", [])):
+            with sin_cache():
+                await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+def _pide_sin_cache(headers) -> bool:
+    for nombre, valor in headers:
+        if nombre in (b"cache-control", b"pragma") and b"no-cache" in valor.lower():
+            return True
+    return False
+
+
+def estado() -> Dict[str, Optional[Any]]:
+    return {"activa": ACTIVA, **cache.estado()}
@@ -0,0 +1,333 @@
+# catalogo.py
+"""
+Catálogo en memoria de productos y categorías (modelo de lectura).
+
+Se carga completo al arrancar y crud.py le aplica cada escritura después
+del commit, así las lecturas calientes (detalle de producto y listado con
+filtros de categoría/precio/stock) no tocan la base de datos.
+
+Cada worker tiene su propia copia: las escrituras hechas por otro proceso
+solo se ven tras `verificar(reparar=True)`, que corre cada CATALOGO_RESYNC_S
+segundos. Con varios workers, una lectura puede quedar hasta ese intervalo
+atrasada respecto de lo que escribió otro worker. CATALOGO_MEMORIA=0 lo
+desactiva y todo va a la base.
+
+Variables de entorno:
+    CATALOGO_MEMORIA    0 = sin catálogo en memoria
+    CATALOGO_RESYNC_S   verificación y reparación periódica (por defecto 300, 0 = nunca)
+"""
+from __future__ import annotations
+
+import os
+import uuid
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Categoria, Producto
+
+
+class ProductoRegistro:
+    __slots__ = (
+        "id",
+        "nombre",
+        "descripcion",
+        "cantidad",
+        "valor_unitario",
+        "valor_mayorista",
+        "categoria_id",
+        "imagen_url",
+        "creado_en",
+        "actualizado_en",
+    )
+
+    def __init__(self, **campos: Any):
+        for campo in self.__slots__:
+            setattr(self, campo, campos.get(campo))
+
+    @classmethod
+    def desde_orm(cls, obj: Producto) -> "ProductoRegistro":
+        return cls(**{campo: getattr(obj, campo) for campo in cls.__slots__})
+
+    def como_tupla(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, campo) for campo in self.__slots__)
+
+
+class CategoriaRegistro:
+    __slots__ = ("id", "nombre", "codigo", "imagen_url", "creado_en", "actualizado_en")
+
+    def __init__(self, **campos: Any):
+        for campo in self.__slots__:
+            setattr(self, campo, campos.get(campo))
+
+    @classmethod
+    def desde_orm(cls, obj: Categoria) -> "CategoriaRegistro":
+        return cls(**{campo: getattr(obj, campo) for campo in cls.__slots__})
+
+    def como_tupla(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, campo) for campo in self.__slots__)
+
+
+class Catalogo:
+    def __init__(self):
+        self.listo = False
+        # Cambia en cada carga/reparación completa (forma parte de los ETag)
+        self.generacion = ""
+        # Crece con cada escritura aplicada
+        self.version = 0
+        # ("producto" | "categoria", id) -> versión de su última escritura
+        self._escrito_en: Dict[Tuple[str, int], int] = {}
+        # Versión al empezar de cada verificar() en curso
+        self._verificando: List[int] = []
+        # Último cambio aplicado, para Last-Modified
+        self.ultima_modificacion_productos: Optional[datetime] = None
+        self.ultima_modificacion_categorias: Optional[datetime] = None
+        self.productos: Dict[int, ProductoRegistro] = {}
+        self.categorias: Dict[int, CategoriaRegistro] = {}
+        # Índices secundarios
+        self._por_categoria: Dict[Optional[int], Set[int]] = {}
+        self._por_precio: List[Tuple[float, int]] = []  # ordenado (valor_unitario, id)
+        self._por_stock: List[Tuple[int, int]] = []  # ordenado (cantidad, id)
+
+    # -------------------- carga --------------------
+
+    async def cargar(self, db: AsyncSession) -> None:
+        categorias = (await db.execute(select(Categoria))).scalars().all()
+        productos = (await db.execute(select(Producto))).scalars().all()
+
+        self.categorias = {c.id: CategoriaRegistro.desde_orm(c) for c in categorias}
+        self.productos = {p.id: ProductoRegistro.desde_orm(p) for p in productos}
+        self._reindexar()
+        self.listo = True
+
+    def _reindexar(self) -> None:
+        self.generacion = uuid.uuid4().hex
+        self.ultima_modificacion_productos = max(
+            (p.actualizado_en for p in self.productos.values() if p.actualizado_en), default=None
+        )
+        self.ultima_modificacion_categorias = max(
+            (c.actualizado_en for c in self.categorias.values() if c.actualizado_en), default=None
+        )
+        self._por_categoria = {}
+        for p in self.productos.values():
+            self._por_categoria.setdefault(p.categoria_id, set()).add(p.id)
+        self._por_precio = sorted((p.valor_unitario, p.id) for p in self.productos.values())
+        self._por_stock = sorted((p.cantidad, p.id) for p in self.productos.values())
+
+    # ------------- escrituras (desde crud.py) -------------
+
+    def aplicar_producto(self, obj: Producto) -> None:
+        if not self.listo:
+            return
+        self.version += 1
+        self._escrito_en[("producto", obj.id)] = self.version
+        self._quitar_de_indices(obj.id)
+        registro = ProductoRegistro.desde_orm(obj)
+        self.productos[registro.id] = registro
+        self._por_categoria.setdefault(registro.categoria_id, set()).add(registro.id)
+        insort(self._por_precio, (registro.valor_unitario, registro.id))
+        insort(self._por_stock, (registro.cantidad, registro.id))
+        self.ultima_modificacion_productos = _mas_reciente(self.ultima_modificacion_productos, registro.actualizado_en)
+
+    def quitar_producto(self, producto_id: int) -> None:
+        if not self.listo:
+            return
+        self.version += 1
+        self._escrito_en[("producto", producto_id)] = self.version
+        self._quitar_de_indices(producto_id)
+        self.productos.pop(producto_id, None)
+        # Un borrado no deja actualizado_en: usamos la hora actual
+        self.ultima_modificacion_productos = _ahora()
+
+    def aplicar_categoria(self, obj: Categoria) -> None:
+        if self.listo:
+            self.version += 1
+            self._escrito_en[("categoria", obj.id)] = self.version
+            registro = CategoriaRegistro.desde_orm(obj)
+            self.categorias[obj.id] = registro
+            self.ultima_modificacion_categorias = _mas_reciente(
+                self.ultima_modificacion_categorias, registro.actualizado_en
+            )
+
+    def quitar_categoria(self, categoria_id: int) -> None:
+        """Quita la categoría y sus productos (borrar_categoria es en cascada)."""
+        if not self.listo:
+            return
+        for producto_id in list(self._por_categoria.get(categoria_id, ())):
+            self.quitar_producto(producto_id)
+        self.version += 1
+        self._escrito_en[("categoria", categoria_id)] = self.version
+        self._por_categoria.pop(categoria_id, None)
+        self.categorias.pop(categoria_id, None)
+        self.ultima_modificacion_categorias = _ahora()
+
+    def _quitar_de_indices(self, producto_id: int) -> None:
+        anterior = self.productos.get(producto_id)
+        if anterior is None:
+            return
+        ids = self._por_categoria.get(anterior.categoria_id)
+        if ids is not None:
+            ids.discard(producto_id)
+        _quitar_ordenado(self._por_precio, (anterior.valor_unitario, producto_id))
+        _quitar_ordenado(self._por_stock, (anterior.cantidad, producto_id))
+
+    # -------------------- lecturas --------------------
+
+    def obtener_producto(self, producto_id: int) -> Optional[ProductoRegistro]:
+        return self.productos.get(producto_id)
+
+    def obtener_categoria(self, categoria_id: int) -> Optional[CategoriaRegistro]:
+        return self.categorias.get(categoria_id)
+
+    def validador(self) -> Tuple[str, int]:
+        """Identifica el estado actual del catálogo (para ETag)."""
+        return (self.generacion, self.version)
+
+    def listar_productos(
+        self,
+        nombre: Optional[str] = None,
+        categoria_id: Optional[int] = None,
+        precio_min: Optional[float] = None,
+        precio_max: Optional[float] = None,
+        stock_min: Optional[int] = None,
+        stock_max: Optional[int] = None,
+    ) -> List[ProductoRegistro]:
+        candidatos: List[Set[int]] = []
+        if categoria_id is not None:
+            candidatos.append(self._por_categoria.get(categoria_id, set()))
+        if precio_min is not None or precio_max is not None:
+            candidatos.append(_rango(self._por_precio, precio_min, precio_max))
+        if stock_min is not None or stock_max is not None:
+            candidatos.append(_rango(self._por_stock, stock_min, stock_max))
+
+        if candidatos:
+            # Intersectamos empezando por el conjunto más pequeño
+            candidatos.sort(key=len)
+            ids: Iterable[int] = set(candidatos[0]).intersection(*candidatos[1:])
+        else:
+            ids = self.productos.keys()
+
+        registros = (self.productos[i] for i in ids)
+        if nombre:
+            buscado = nombre.casefold()
+            registros = (p for p in registros if buscado in p.nombre.casefold())
+        return sorted(registros, key=lambda p: p.id)
+
+    def listar_categorias(
+        self,
+        nombre: Optional[str] = None,
+        codigo: Optional[str] = None,
+    ) -> List[CategoriaRegistro]:
+        registros: Iterable[CategoriaRegistro] = self.categorias.values()
+        if nombre:
+            buscado = nombre.casefold()
+            registros = (c for c in registros if buscado in c.nombre.casefold())
+        if codigo:
+            buscado_codigo = codigo.casefold()
+            registros = (c for c in registros if c.codigo and buscado_codigo in c.codigo.casefold())
+        return sorted(registros, key=lambda c: c.id)
+
+    # ----------------- consistencia -----------------
+
+    async def verificar(self, db: AsyncSession, reparar: bool = False) -> Dict[str, Any]:
+        """
+        Compara el catálogo contra la base de datos. Con `reparar=True`
+        recarga todo si hay diferencias, salvo los ids que crud.py escribió
+        mientras se leía la base: esos ya tienen algo más nuevo que la
+        lectura y quedan como están.
+        """
+        inicio = self.version
+        self._verificando.append(inicio)
+        try:
+            categorias = (await db.execute(select(Categoria))).scalars().all()
+            productos = (await db.execute(select(Producto))).scalars().all()
+        finally:
+            self._verificando.remove(inicio)
+
+        escritos = {"producto": set(), "categoria": set()}
+        for (tabla, i), version in self._escrito_en.items():
+            if version > inicio:
+                escritos[tabla].add(i)
+        en_db = {
+            "productos": {p.id: ProductoRegistro.desde_orm(p) for p in productos if p.id not in escritos["producto"]},
+            "categorias": {c.id: CategoriaRegistro.desde_orm(c) for c in categorias if c.id not in escritos["categoria"]},
+        }
+        en_memoria = {
+            "productos": {i: r for i, r in self.productos.items() if i not in escritos["producto"]},
+            "categorias": {i: r for i, r in self.categorias.items() if i not in escritos["categoria"]},
+        }
+        informe: Dict[str, Any] = {
+            tabla: _diferencias(
+                {i: r.como_tupla() for i, r in en_db[tabla].items()},
+                {i: r.como_tupla() for i, r in en_memoria[tabla].items()},
+            )
+            for tabla in en_db
+        }
+        consistente = not any(v for tabla in informe.values() for v in tabla.values())
+        informe["consistente"] = consistente
+        informe["omitidos"] = {tabla: sorted(ids) for tabla, ids in escritos.items()}
+
+        if reparar and not consistente:
+            # Lo leído de la base, más lo escrito durante la lectura tal como está en memoria
+            self.productos = {**en_db["productos"], **{i: self.productos[i] for i in escritos["producto"] if i in self.productos}}
+            self.categorias = {**en_db["categorias"], **{i: self.categorias[i] for i in escritos["categoria"] if i in self.categorias}}
+            self._reindexar()
+            self.listo = True
+            informe["reparado"] = True
+        # Solo hace falta lo escrito desde que empezó la verificación más vieja en curso
+        desde = min(self._verificando, default=self.version)
+        self._escrito_en = {clave: v for clave, v in self._escrito_en.items() if v > desde}
+        return informe
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "listo": self.listo,
+            "productos": len(self.productos),
+            "categorias": len(self.categorias),
+        }
+
+
+def _ahora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _utc(momento: datetime) -> datetime:
+    # SQLite devuelve fechas sin zona; las guardamos como UTC
+    return momento if momento.tzinfo else momento.replace(tzinfo=timezone.utc)
+
+
+def _mas_reciente(actual: Optional[datetime], nuevo: Optional[datetime]) -> Optional[datetime]:
+    if nuevo is None:
+        return actual
+    if actual is None:
+        return nuevo
+    return max(_utc(actual), _utc(nuevo))
+
+
+def _quitar_ordenado(lista: List[Tuple[Any, int]], clave: Tuple[Any, int]) -> None:
+    i = bisect_left(lista, clave)
+    if i < len(lista) and lista[i] == clave:
+        del lista[i]
+
+
+def _rango(lista: List[Tuple[Any, int]], minimo: Optional[float], maximo: Optional[float]) -> Set[int]:
+    inicio = 0 if minimo is None else bisect_left(lista, (minimo, float("-inf")))
+    fin = len(lista) if maximo is None else bisect_right(lista, (maximo, float("inf")))
+    return {producto_id for _, producto_id in lista[inicio:fin]}
+
+
+def _diferencias(en_db: Dict[int, Tuple], en_memoria: Dict[int, Tuple]) -> Dict[str, List[int]]:
+    return {
+        "faltantes": sorted(set(en_db) - set(en_memoria)),
+        "sobrantes": sorted(set(en_memoria) - set(en_db)),
+        "distintos": sorted(i for i in set(en_db) & set(en_memoria) if en_db[i] != en_memoria[i]),
+    }
+
+
+ACTIVO = os.getenv("CATALOGO_MEMORIA", "1") != "0"
+RESYNC_S = float(os.getenv("CATALOGO_RESYNC_S", "300"))
+
+catalogo = Catalogo()
@@ -0,0 +1,315 @@
+# compresion.py
+"""
+Compresión HTTP: utilidades compartidas (páginas, estáticos) y middleware
+para las respuestas de la API.
+
+brotli y zstandard son opcionales: sin ellos solo se ofrece gzip.
+
+Variables de entorno (middleware):
+    COMPRESION=0               lo desactiva
+    COMPRESION_MIN_BYTES       cuerpos más chicos se envían tal cual (por defecto 1024)
+    COMPRESION_HILO_BYTES      desde este tamaño se comprime en un hilo (por defecto 256 KiB)
+"""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# Extensión de los archivos precomprimidos en disco
+EXTENSIONES = {"br": ".br", "gzip": ".gz"}
+
+# Tipos que vale la pena comprimir (el resto ya viene comprimido: png, woff2…)
+COMPRIMIBLES = (".css", ".js", ".html", ".svg", ".json", ".txt", ".map")
+
+
+def codificaciones_aceptadas(accept_encoding: str) -> List[str]:
+    """Codificaciones con q > 0 de Accept-Encoding, de mayor a menor preferencia."""
+    aceptadas: List[Tuple[float, str]] = []
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        q = 1.0
+        if parametros.strip().startswith("q="):
+            try:
+                q = float(parametros.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if nombre and q > 0:
+            aceptadas.append((q, nombre))
+    # A igual q, brotli antes que gzip
+    return [nombre for _, nombre in sorted(aceptadas, key=lambda a: (-a[0], a[1] != "br"))]
+
+
+def elegir_codificacion(accept_encoding: str, disponibles) -> str:
+    """La mejor de `disponibles` que acepte el cliente, o "identity"."""
+    for codificacion in codificaciones_aceptadas(accept_encoding):
+        if codificacion in disponibles:
+            return codificacion
+        if codificacion == "*":
+            for preferida in ("br", "gzip"):
+                if preferida in disponibles:
+                    return preferida
+    return "identity"
+
+
+def precomprimir(datos: bytes) -> Dict[str, bytes]:
+    """identity + gzip/br al nivel máximo (para contenido que se comprime una sola vez)."""
+    variantes = {"identity": datos, "gzip": gzip.compress(datos, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variantes["br"] = brotli.compress(datos, quality=11)
+    return variantes
+
+
+# ======================================================
+# ============ COMPRESIÓN INCREMENTAL ==================
+# ======================================================
+
+# Niveles para contenido dinámico: ratio razonable sin gastar mucha CPU
+NIVELES = {"br": 4, "zstd": 3, "gzip": 6}
+
+
+def codificaciones_dinamicas() -> Tuple[str, ...]:
+    disponibles = []
+    if brotli is not None:
+        disponibles.append("br")
+    if zstandard is not None:
+        disponibles.append("zstd")
+    disponibles.append("gzip")
+    return tuple(disponibles)
+
+
+class Compresor:
+    """Interfaz común para comprimir por partes con gzip, brotli o zstd."""
+
+    def __init__(self, codificacion: str):
+        self.codificacion = codificacion
+        nivel = NIVELES[codificacion]
+        if codificacion == "br":
+            self._c = brotli.Compressor(quality=nivel)
+        elif codificacion == "zstd":
+            self._c = zstandard.ZstdCompressor(level=nivel).compressobj()
+        else:
+            # wbits=31: formato gzip (cabecera + crc)
+            self._c = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+
+    def parte(self, datos: bytes, vaciar: bool = False) -> bytes:
+        """Comprime `datos`; con `vaciar` fuerza a emitir lo pendiente (streaming)."""
+        if self.codificacion == "br":
+            salida = self._c.process(datos)
+            return salida + self._c.flush() if vaciar else salida
+        salida = self._c.compress(datos)
+        if vaciar:
+            if self.codificacion == "zstd":
+                salida += self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            else:
+                salida += self._c.flush(zlib.Z_SYNC_FLUSH)
+        return salida
+
+    def fin(self) -> bytes:
+        if self.codificacion == "br":
+            return self._c.finish()
+        return self._c.flush()
+
+
+def comprimir(datos: bytes, codificacion: str) -> bytes:
+    compresor = Compresor(codificacion)
+    return compresor.parte(datos) + compresor.fin()
+
+
+# ======================================================
+# ================== MIDDLEWARE ========================
+# ======================================================
+
+TIPOS_COMPRIMIBLES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+
+def _encabezado(headers: List[Tuple[bytes, bytes]], nombre: bytes) -> Optional[bytes]:
+    for clave, valor in headers:
+        if clave.lower() == nombre:
+            return valor
+    return None
+
+
+class CompresionMiddleware:
+    """
+    Comprime las respuestas según Accept-Encoding (br, zstd o gzip).
+
+    - Cuerpo completo (un solo mensaje): solo si supera `min_bytes`; si
+      además supera `hilo_bytes` se comprime con asyncio.to_thread para no
+      frenar el event loop.
+    - Streaming (varios mensajes): se comprime parte por parte y se vacía el
+      compresor en cada una para que el cliente reciba los datos sin esperar.
+    - No toca respuestas que ya traen Content-Encoding (páginas y estáticos
+      precomprimidos) ni 204/304/HEAD.
+    """
+
+    def __init__(self, app, min_bytes: int = 1024, hilo_bytes: int = 256 * 1024):
+        self.app = app
+        self.min_bytes = min_bytes
+        self.hilo_bytes = hilo_bytes
+        self.disponibles = codificaciones_dinamicas()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        accept = _encabezado(scope.get("headers", []), b"accept-encoding")
+        codificacion = elegir_codificacion(accept.decode("latin-1") if accept else "", self.disponibles)
+        if codificacion == "identity":
+            await self.app(scope, receive, send)
+            return
+
+        inicio: Dict[str, Any] = {}
+        estado = {"modo": None}  # None | "tal_cual" | "completo" | "streaming"
+        compresor: Optional[Compresor] = None
+
+        async def send_comprimido(mensaje):
+            nonlocal compresor
+            if mensaje["type"] == "http.response.start":
+                # Se retiene hasta ver el primer trozo del cuerpo
+                inicio.update(mensaje)
+                return
+            if mensaje["type"] != "http.response.body":
+                await send(mensaje)
+                return
+
+            cuerpo = mensaje.get("body", b"")
+            mas = mensaje.get("more_body", False)
+
+            if estado["modo"] is None:
+                if not self._comprimible(inicio) or (not mas and len(cuerpo) < self.min_bytes):
+                    estado["modo"] = "tal_cual"
+                    if self._comprimible(inicio):
+                        metricas["pequenas"] += 1
+                    await send(inicio)
+                    await send(mensaje)
+                    return
+
+                if not mas:
+                    estado["modo"] = "completo"
+                    if len(cuerpo) >= self.hilo_bytes:
+                        metricas["en_hilo"] += 1
+                        comprimido = await asyncio.to_thread(comprimir, cuerpo, codificacion)
+                    else:
+                        comprimido = comprimir(cuerpo, codificacion)
+                    _contar(codificacion, len(cuerpo), len(comprimido))
+                    await send(self._cabeceras(inicio, codificacion, len(comprimido)))
+                    await send({"type": "http.response.body", "body": comprimido})
+                    return
+
+                estado["modo"] = "streaming"
+                metricas["streaming"] += 1
+                compresor = Compresor(codificacion)
+                await send(self._cabeceras(inicio, codificacion, None))
+
+            if estado["modo"] == "tal_cual":
+                await send(mensaje)
+                return
+
+            # streaming
+            if len(cuerpo) >= self.hilo_bytes:
+                metricas["en_hilo"] += 1
+                salida = await asyncio.to_thread(compresor.parte, cuerpo, True)
+            else:
+                salida = compresor.parte(cuerpo, vaciar=True)
+            if not mas:
+                salida += compresor.fin()
+            _contar(codificacion, len(cuerpo), len(salida), respuesta=not mas)
+            await send({"type": "http.response.body", "body": salida, "more_body": mas})
+
+        await self.app(scope, receive, send_comprimido)
+
+    @staticmethod
+    def _comprimible(inicio: Dict[str, Any]) -> bool:
+        if inicio.get("status") in (204, 206, 304):
+            return False
+        headers = inicio.get("headers", [])
+        if _encabezado(headers, b"content-encoding") is not None:
+            return False
+        tipo = (_encabezado(headers, b"content-type") or b"").decode("latin-1").lower()
+        return tipo.startswith(TIPOS_COMPRIMIBLES)
+
+    @staticmethod
+    def _cabeceras(inicio: Dict[str, Any], codificacion: str, longitud: Optional[int]) -> Dict[str, Any]:
+        headers = []
+        vary = None
+        for clave, valor in inicio.get("headers", []):
+            nombre = clave.lower()
+            if nombre == b"content-length":
+                continue
+            if nombre == b"etag" and not valor.startswith(b"W/"):
+                # Los bytes cambian: el ETag fuerte pasa a débil
+                valor = b"W/" + valor
+            if nombre == b"vary":
+                vary = valor
+                continue
+            headers.append((clave, valor))
+        headers.append((b"content-encoding", codificacion.encode()))
+        if longitud is not None:
+            headers.append((b"content-length", str(longitud).encode()))
+        if vary is None:
+            vary = b"Accept-Encoding"
+        elif b"accept-encoding" not in vary.lower():
+            vary += b", Accept-Encoding"
+        headers.append((b"vary", vary))
+        return {**inicio, "headers": headers}
+
+
+metricas: Dict[str, Any] = {
+    "comprimidas": 0,
+    "pequenas": 0,
+    "streaming": 0,
+    "en_hilo": 0,
+    "bytes_entrada": 0,
+    "bytes_salida": 0,
+    "por_codificacion": {},
+}
+
+
+def _contar(codificacion: str, entrada: int, salida: int, respuesta: bool = True) -> None:
+    if respuesta:
+        metricas["comprimidas"] += 1
+    metricas["bytes_entrada"] += entrada
+    metricas["bytes_salida"] += salida
+    por = metricas["por_codificacion"].setdefault(codificacion, {"entrada": 0, "salida": 0})
+    por["entrada"] += entrada
+    por["salida"] += salida
+
+
+def estado() -> Dict[str, Any]:
+    entrada, salida = metricas["bytes_entrada"], metricas["bytes_salida"]
+    return {
+        **metricas,
+        "ratio": round(entrada / salida, 2) if salida else None,
+        "disponibles": codificaciones_dinamicas(),
+    }
+
+
+def config_desde_entorno() -> Optional[Dict[str, int]]:
+    """Parámetros del middleware según el entorno, o None si está apagado."""
+    if os.getenv("COMPRESION", "1") == "0":
+        return None
+    return {
+        "min_bytes": int(os.getenv("COMPRESION_MIN_BYTES", "1024")),
+        "hilo_bytes": int(os.getenv("COMPRESION_HILO_BYTES", str(256 * 1024))),
+    }
@@ -0,0 +1,99 @@
+# condicional.py
+"""
+GET condicionales (ETag / Last-Modified) para las rutas de la API.
+
+Cada ruta calcula primero un "validador" barato (versión de tabla, agregados
+como count/sum(id), el último id del diario `cambios`, o el registro del
+catálogo en memoria). Si el cliente ya tiene esa versión (If-None-Match o
+If-Modified-Since) se responde 304 sin ejecutar la consulta completa ni
+serializar nada.
+
+Last-Modified solo tiene resolución de segundos: no se manda mientras la
+última modificación sea del segundo en curso (otra escritura en ese mismo
+segundo tendría la misma fecha), y If-Modified-Since solo se responde con
+una fecha ya cerrada.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response
+
+# Datos de catálogo: el navegador puede mostrar la copia vieja mientras revalida
+CATALOGO_SWR_S = int(os.getenv("CATALOGO_SWR_S", "60"))
+CACHE_CATALOGO = f"public, max-age=0, stale-while-revalidate={CATALOGO_SWR_S}"
+# Ventas: siempre revalidar y solo en la caché del navegador
+CACHE_PRIVADO = "private, no-cache"
+
+
+def calcular_etag(*partes: Any) -> str:
+    """ETag débil: la misma versión puede viajar comprimida o no."""
+    resumen = hashlib.blake2b(repr(partes).encode(), digest_size=16).hexdigest()
+    return f'W/"{resumen}"'
+
+
+def _utc(momento: datetime) -> datetime:
+    momento = momento if momento.tzinfo else momento.replace(tzinfo=timezone.utc)
+    # HTTP solo tiene resolución de segundos
+    return momento.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def _coincide_etag(cabecera: str, etag: str) -> bool:
+    if cabecera.strip() == "*":
+        return True
+    # Comparación débil: W/"x" equivale a "x"
+    propio = etag.removeprefix("W/")
+    return any(candidato.strip().removeprefix("W/") == propio for candidato in cabecera.split(","))
+
+
+def _fecha_cerrada(momento: Optional[datetime]) -> bool:
+    """True si el segundo de `momento` ya pasó: nada más puede caer en él."""
+    return momento is not None and _utc(momento) < _utc(datetime.now(timezone.utc))
+
+
+def no_modificado(request: Request, etag: str, ultima_modificacion: Optional[datetime] = None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Si viene If-None-Match, If-Modified-Since se ignora (RFC 9110)
+        return _coincide_etag(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and _fecha_cerrada(ultima_modificacion):
+        try:
+            desde = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return _utc(ultima_modificacion) <= _utc(desde)
+    return False
+
+
+def cabeceras(etag: str, ultima_modificacion: Optional[datetime], cache_control: str) -> Dict[str, str]:
+    resultado = {"ETag": etag, "Cache-Control": cache_control}
+    if _fecha_cerrada(ultima_modificacion):
+        resultado["Last-Modified"] = format_datetime(_utc(ultima_modificacion), usegmt=True)
+    return resultado
+
+
+def condicional(
+    request: Request,
+    response: Response,
+    validador: Any,
+    ultima_modificacion: Optional[datetime] = None,
+    cache_control: str = CACHE_PRIVADO,
+) -> Optional[Response]:
+    """
+    Devuelve un 304 listo si el cliente ya tiene esta versión; si no, deja
+    ETag/Last-Modified/Cache-Control en `response` y devuelve None para que
+    la ruta siga con la consulta completa.
+    """
+    # Accept entra en el ETag: JSON y msgpack son representaciones distintas
+    etag = calcular_etag(request.url.path, request.url.query, request.headers.get("accept", ""), validador)
+    encabezados = cabeceras(etag, ultima_modificacion, cache_control)
+    if no_modificado(request, etag, ultima_modificacion):
+        return Response(status_code=304, headers={**encabezados, "Vary": "Accept"})
+    response.headers.update(encabezados)
+    return None
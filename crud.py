@@ -1,8 +1,14 @@
 # crud.py
-from typing import List, Optional, Dict, Any
+import asyncio
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Dict, Any, Tuple, Callable
 
 from fastapi import HTTPException, status
-from sqlalchemy import select
+from pydantic import ValidationError
+from sqlalchemy import select, func, insert, update, delete, exists, bindparam, literal, literal_column, and_
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload
 
@@ -13,31 +19,112 @@ from models import (
     Producto,
     Compra,
     HistorialEliminados,
+    Cambio,
+    Venta,
+    UmbralStock,
+    RfmCliente,
 )
 import schemas
+from cache_consultas import cacheado, marcar_cambio
+from catalogo import catalogo
+from alertas_stock import alertas_stock
+from pronosticos import ACTIVO as PRONOSTICOS_ACTIVO, pronosticos
+import segmentacion
+from auditoria import auditoria
+from analitica import snapshot_ventas
+from sketches import sketches_ventas
+from retencion import archivo_historial, fila_a_dict
 
 
 # ======================================================
 # ===============   HELPER GENÉRICO   ==================
 # ======================================================
 
-async def _registrar_eliminado(
+async def _registrar_en_diario(
     db: AsyncSession,
     tabla: str,
     registro_id: int,
-    datos: Dict[str, Any],
+    operacion: str,
 ) -> None:
     """
-    Crea un registro en HistorialEliminados con un snapshot del objeto borrado.
+    Anota el cambio en el diario de sincronización (tabla `cambios`).
+    Igual que el historial, se confirma con el commit de la operación.
     """
-    log = HistorialEliminados(
-        tabla=tabla,
-        registro_id=registro_id,
-        datos=datos,
+    db.add(Cambio(tabla=tabla, registro_id=registro_id, operacion=operacion))
+
+
+async def _ultimo_cambio(db: AsyncSession, tabla: str) -> Tuple[int, Optional[datetime]]:
+    """
+    Id y hora de la última entrada de `tabla` en el diario. Cubre borrados y
+    cambios de otros workers, que los agregados de las filas no ven.
+    """
+    fila = (await db.execute(
+        select(Cambio.id, Cambio.creado_en)
+        .where(Cambio.tabla == tabla)
+        .order_by(Cambio.id.desc())
+        .limit(1)
+    )).one_or_none()
+    return (fila.id, fila.creado_en) if fila else (0, None)
+
+
+def _mas_reciente(*momentos: Optional[datetime]) -> Optional[datetime]:
+    presentes = [m if m.tzinfo else m.replace(tzinfo=timezone.utc) for m in momentos if m is not None]
+    return max(presentes, default=None)
+
+
+def _registrar_cambio(*tablas: str) -> None:
+    """
+    Se llama justo después de cada commit que escribe en `tablas`:
+    invalida lo que las cachés en memoria tengan de ellas.
+    """
+    marcar_cambio(*tablas)
+
+
+async def _sumar_a_segmento(
+    db: AsyncSession, cliente_id: int, visitas: int, monto: float, compra_nueva: bool = True
+) -> bool:
+    """
+    Aplica la venta (o su corrección, con valores negativos) a la fila RFM
+    del cliente, antes del commit y en la misma transacción. Si cambia de
+    frecuente a no frecuente o al revés, actualiza la marca del cliente y la
+    de su usuario. Devuelve True si cambió la marca.
+    """
+    frecuente = await segmentacion.segmentacion.sumar(db, cliente_id, visitas, monto, compra_nueva)
+    if frecuente is None:
+        return False
+    r = await db.execute(
+        update(Cliente)
+        .where(Cliente.id == cliente_id, Cliente.cliente_frecuente != frecuente)
+        .values(cliente_frecuente=frecuente)
+        .returning(Cliente.usuario_id)
     )
-    db.add(log)
-    # NO commit aquí solo – el commit final se hace en la función que borra
-    # para que todo quede en una sola transacción.
+    fila = r.one_or_none()
+    if fila is None:
+        return False
+    await _registrar_en_diario(db, "clientes", cliente_id, "update")
+    if fila.usuario_id is not None:
+        # Frecuente si lo es alguno de sus clientes
+        await db.execute(
+            update(Usuario)
+            .where(Usuario.id == fila.usuario_id)
+            .values(cliente_frecuente=exists().where(
+                Cliente.usuario_id == Usuario.id, Cliente.cliente_frecuente.is_(True)
+            ))
+        )
+    if frecuente:
+        segmentacion.segmentacion.ascendidos += 1
+    else:
+        segmentacion.segmentacion.descendidos += 1
+    return True
+
+
+def _rechazar_frecuente_manual(data) -> None:
+    """Con la segmentación activa cliente_frecuente es derivado: no se acepta en la entrada."""
+    if segmentacion.ACTIVO and "cliente_frecuente" in data.model_fields_set:
+        raise HTTPException(
+            status_code=422,
+            detail="cliente_frecuente lo calcula la segmentación RFM; no se puede enviar (SEGMENTACION=0 lo vuelve manual)",
+        )
 
 
 # ======================================================
@@ -45,6 +132,7 @@ async def _registrar_eliminado(
 # ======================================================
 
 async def crear_usuario(db: AsyncSession, data: schemas.UsuarioCreate) -> Usuario:
+    _rechazar_frecuente_manual(data)
     # Validar correo y cédula únicos
     q = await db.execute(select(Usuario).where(Usuario.correo == data.correo))
     if q.scalar_one_or_none():
@@ -63,6 +151,7 @@ async def crear_usuario(db: AsyncSession, data: schemas.UsuarioCreate) -> Usuari
     obj = Usuario(**data.model_dump())
     db.add(obj)
     await db.commit()
+    _registrar_cambio("usuarios")
     await db.refresh(obj) # 🔄 Línea AÑADIDA para refrescar el objeto después del commit
 
     # Load multimedia to avoid lazy loading issues during serialization
@@ -72,6 +161,7 @@ async def crear_usuario(db: AsyncSession, data: schemas.UsuarioCreate) -> Usuari
     return obj
 
 
+@cacheado("usuarios", esquema=schemas.UsuarioRead)
 async def listar_usuarios(
     db: AsyncSession,
     nombre: Optional[str] = None,
@@ -111,6 +201,7 @@ async def obtener_usuario(db: AsyncSession, usuario_id: int) -> Usuario:
 async def actualizar_usuario(
     db: AsyncSession, usuario_id: int, data: schemas.UsuarioUpdate
 ) -> Usuario:
+    _rechazar_frecuente_manual(data)
     obj = await obtener_usuario(db, usuario_id)
     update_data = data.model_dump(exclude_unset=True)
 
@@ -145,6 +236,7 @@ async def actualizar_usuario(
         setattr(obj, field, value)
 
     await db.commit()
+    _registrar_cambio("usuarios")
     await db.refresh(obj) # 🔄 Línea AÑADIDA para refrescar el objeto después del commit
 
     # Load multimedia to avoid lazy loading issues during serialization
@@ -164,21 +256,10 @@ async def borrar_usuario(db: AsyncSession, usuario_id: int) -> None:
             detail="No se puede eliminar el usuario porque tiene clientes asociados",
         )
 
-    datos = {
-        "id": obj.id,
-        "nombre": obj.nombre,
-        "correo": obj.correo,
-        "rol": obj.rol,
-        "cedula": obj.cedula,
-        "tipo": obj.tipo,
-        "cliente_frecuente": obj.cliente_frecuente,
-        "creado_en": obj.creado_en.isoformat() if obj.creado_en else None,
-        "actualizado_en": obj.actualizado_en.isoformat() if obj.actualizado_en else None,
-    }
-
-    await _registrar_eliminado(db, "usuarios", obj.id, datos)
+    auditoria.registrar(db, obj)
     await db.delete(obj)
     await db.commit()
+    _registrar_cambio("usuarios", "historial_eliminados")
 
 
 # ======================================================
@@ -186,6 +267,7 @@ async def borrar_usuario(db: AsyncSession, usuario_id: int) -> None:
 # ======================================================
 
 async def crear_cliente(db: AsyncSession, data: schemas.ClienteCreate) -> Cliente:
+    _rechazar_frecuente_manual(data)
     # Validar cédula única
     q = await db.execute(select(Cliente).where(Cliente.cedula == data.cedula))
     if q.scalar_one_or_none():
@@ -197,7 +279,14 @@ async def crear_cliente(db: AsyncSession, data: schemas.ClienteCreate) -> Client
 
     obj = Cliente(**data.model_dump())
     db.add(obj)
+    await db.flush()  # asigna obj.id para el diario
+    await _registrar_en_diario(db, "clientes", obj.id, "insert")
+    if segmentacion.ACTIVO:
+        # Con su fila RFM, sus ventas se segmentan sin esperar al cálculo nocturno
+        db.add(RfmCliente(cliente_id=obj.id))
     await db.commit()
+    _registrar_cambio("clientes", "rfm_clientes")
+    snapshot_ventas.anotar_dimensiones()
     await db.refresh(obj) # 🔄 Refresco después del commit
 
     # Load multimedia to avoid lazy loading issues during serialization
@@ -207,12 +296,14 @@ async def crear_cliente(db: AsyncSession, data: schemas.ClienteCreate) -> Client
     return obj
 
 
+@cacheado("clientes", "usuarios", "multimedia", "rfm_clientes", esquema=schemas.ClienteRead)
 async def listar_clientes(
     db: AsyncSession,
     nombre: Optional[str] = None,
     cedula: Optional[str] = None,
     tipo_cliente: Optional[str] = None,
     cliente_frecuente: Optional[bool] = None,
+    segmento: Optional[str] = None,
 ) -> List[Cliente]:
     stmt = select(Cliente).options(joinedload(Cliente.usuario), selectinload(Cliente.multimedia))
 
@@ -224,6 +315,8 @@ async def listar_clientes(
         stmt = stmt.where(Cliente.tipo_cliente == tipo_cliente)
     if cliente_frecuente is not None:
         stmt = stmt.where(Cliente.cliente_frecuente == cliente_frecuente)
+    if segmento:
+        stmt = stmt.where(Cliente.id.in_(select(RfmCliente.cliente_id).where(RfmCliente.segmento == segmento)))
 
     q = await db.execute(stmt)
     return q.scalars().all()
@@ -244,6 +337,7 @@ async def obtener_cliente(db: AsyncSession, cliente_id: int) -> Cliente:
 async def actualizar_cliente(
     db: AsyncSession, cliente_id: int, data: schemas.ClienteUpdate
 ) -> Cliente:
+    _rechazar_frecuente_manual(data)
     obj = await obtener_cliente(db, cliente_id)
     update_data = data.model_dump(exclude_unset=True)
 
@@ -263,10 +357,19 @@ async def actualizar_cliente(
     if "usuario_id" in update_data and update_data["usuario_id"] is not None:
         await obtener_usuario(db, update_data["usuario_id"])
 
+    # La foto de ventas solo depende del nombre y del tipo
+    cambia_dimension = any(
+        getattr(obj, campo) != update_data[campo]
+        for campo in ("nombre", "tipo_cliente") if campo in update_data
+    )
     for field, value in update_data.items():
         setattr(obj, field, value)
 
+    await _registrar_en_diario(db, "clientes", cliente_id, "update")
     await db.commit()
+    _registrar_cambio("clientes")
+    if cambia_dimension:
+        snapshot_ventas.anotar_dimensiones()
     # ❌ LÍNEA ELIMINADA: await db.refresh(obj)
 
     # Return a fresh object with all relationships loaded to avoid lazy loading issues
@@ -297,19 +400,45 @@ async def borrar_cliente(db: AsyncSession, cliente_id: int) -> None:
             "No se puede eliminar el cliente porque tiene compras registradas",
         )
 
-    datos = {
-        "id": obj.id,
-        "nombre": obj.nombre,
-        "cedula": obj.cedula,
-        "tipo_cliente": obj.tipo_cliente,
-        "cliente_frecuente": obj.cliente_frecuente,
-        "usuario_id": obj.usuario_id,
-        "creado_en": obj.creado_en.isoformat() if obj.creado_en else None,
-    }
-
-    await _registrar_eliminado(db, "clientes", obj.id, datos)
+    auditoria.registrar(db, obj)
+    await _registrar_en_diario(db, "clientes", obj.id, "delete")
+    # SQLite no aplica el ON DELETE CASCADE si no se activan las claves foráneas
+    await db.execute(delete(RfmCliente).where(RfmCliente.cliente_id == obj.id))
     await db.delete(obj)
     await db.commit()
+    _registrar_cambio("clientes", "historial_eliminados", "rfm_clientes")
+    snapshot_ventas.anotar_dimensiones()
+
+
+# ======================================================
+# =============== SEGMENTACIÓN (RFM) ===================
+# ======================================================
+
+@cacheado("rfm_clientes", "clientes")
+async def resumen_segmentos(db: AsyncSession) -> Dict[str, Any]:
+    """Clientes por segmento y por cliente_frecuente (para la gráfica)."""
+    q = await db.execute(
+        select(RfmCliente.segmento, func.count())
+        .join(Cliente, Cliente.id == RfmCliente.cliente_id)
+        .group_by(RfmCliente.segmento)
+    )
+    segmentos = dict(q.all())
+    q = await db.execute(select(Cliente.cliente_frecuente, func.count()).group_by(Cliente.cliente_frecuente))
+    marcas = dict(q.all())
+    return {
+        "segmentos": segmentos,
+        "frecuentes": marcas.get(True, 0),
+        "no_frecuentes": marcas.get(False, 0),
+        "calculado_en": segmentacion.segmentacion.calculado_en,
+    }
+
+
+async def obtener_rfm(db: AsyncSession, cliente_id: int) -> RfmCliente:
+    obj = await db.get(RfmCliente, cliente_id)
+    if obj is None:
+        await obtener_cliente(db, cliente_id)
+        raise HTTPException(404, "El cliente todavía no tiene segmentación")
+    return obj
 
 
 # ======================================================
@@ -329,25 +458,58 @@ async def crear_categoria(db: AsyncSession, data: schemas.CategoriaCreate) -> Ca
 
     obj = Categoria(**data.model_dump())
     db.add(obj)
+    await db.flush()
+    await _registrar_en_diario(db, "categorias", obj.id, "insert")
     await db.commit()
+    _registrar_cambio("categorias")
+    snapshot_ventas.anotar_dimensiones()
     await db.refresh(obj)
+    catalogo.aplicar_categoria(obj)
     return obj
 
 
+@cacheado("categorias", esquema=schemas.CategoriaRead)
 async def listar_categorias(
     db: AsyncSession,
     nombre: Optional[str] = None,
     codigo: Optional[str] = None,
 ) -> List[Categoria]:
-    stmt = select(Categoria)
+    stmt = _filtrar_categorias(select(Categoria), nombre=nombre, codigo=codigo)
+    q = await db.execute(stmt)
+    return q.scalars().all()
+
 
+def _filtrar_categorias(stmt, nombre: Optional[str] = None, codigo: Optional[str] = None):
     if nombre:
         stmt = stmt.where(Categoria.nombre.ilike(f"%{nombre}%"))
     if codigo:
         stmt = stmt.where(Categoria.codigo.ilike(f"%{codigo}%"))
+    return stmt
 
-    q = await db.execute(stmt)
-    return q.scalars().all()
+
+async def validador_categorias(db: AsyncSession, **filtros) -> Tuple[Any, ...]:
+    """
+    (count, suma de ids, último cambio en el diario, última modificación) de
+    las categorías filtradas: cambia si se crea, borra o edita alguna, sin
+    traer las filas. El último elemento va en Last-Modified.
+    """
+    stmt = _filtrar_categorias(
+        select(func.count(Categoria.id), func.sum(Categoria.id), func.max(Categoria.actualizado_en)),
+        **filtros,
+    )
+    cantidad, suma, actualizado_en = (await db.execute(stmt)).one()
+    cambio_id, cambio_en = await _ultimo_cambio(db, "categorias")
+    return (cantidad, suma, cambio_id, _mas_reciente(actualizado_en, cambio_en))
+
+
+async def validador_categoria(db: AsyncSession, categoria_id: int) -> Tuple[Any, ...]:
+    q = await db.execute(
+        select(Categoria.id, Categoria.actualizado_en).where(Categoria.id == categoria_id)
+    )
+    fila = q.one_or_none()
+    if not fila:
+        raise HTTPException(404, "Categoría no encontrada")
+    return tuple(fila)
 
 
 async def obtener_categoria(db: AsyncSession, categoria_id: int) -> Categoria:
@@ -359,6 +521,14 @@ async def obtener_categoria(db: AsyncSession, categoria_id: int) -> Categoria:
     return obj
 
 
+async def _categoria_o_404(db: AsyncSession, categoria_id: int) -> Categoria:
+    """Solo la fila, sin sus productos: para validar que existe o para borrarla."""
+    obj = await db.get(Categoria, categoria_id)
+    if not obj:
+        raise HTTPException(404, "Categoría no encontrada")
+    return obj
+
+
 async def actualizar_categoria(
     db: AsyncSession, categoria_id: int, data: schemas.CategoriaUpdate
 ) -> Categoria:
@@ -395,49 +565,91 @@ async def actualizar_categoria(
     for field, value in update_data.items():
         setattr(obj, field, value)
 
+    await _registrar_en_diario(db, "categorias", categoria_id, "update")
     await db.commit()
+    _registrar_cambio("categorias")
+    snapshot_ventas.anotar_dimensiones()
     await db.refresh(obj)
+    catalogo.aplicar_categoria(obj)
     return obj
 
 
-async def borrar_categoria(db: AsyncSession, categoria_id: int) -> None:
-    obj = await obtener_categoria(db, categoria_id)
-    
-    # 🚀 NUEVA LÓGICA: Eliminar en cascada los productos asociados.
+# Productos por transacción al borrar una categoría en cascada
+CASCADA_LOTE = int(os.getenv("CASCADA_LOTE", "1000"))
 
-    # Convertir a lista para poder iterar y borrar sin problemas de mutación
-    productos_a_eliminar = list(obj.productos)
-    
-    for producto in productos_a_eliminar:
-        # Registrar producto en historial (usamos la misma lógica que en borrar_producto)
-        datos_producto = {
-            "id": producto.id,
-            "nombre": producto.nombre,
-            "descripcion": producto.descripcion,
-            "cantidad": producto.cantidad,
-            "valor_unitario": producto.valor_unitario,
-            "valor_mayorista": producto.valor_mayorista,
-            "categoria_id": producto.categoria_id,
-            "creado_en": producto.creado_en.isoformat() if producto.creado_en else None,
-            "actualizado_en": producto.actualizado_en.isoformat() if producto.actualizado_en else None,
-        }
-        await _registrar_eliminado(db, "productos", producto.id, datos_producto)
-        
-        # Eliminar producto de la sesión
-        await db.delete(producto)
-        
-    # Registrar y eliminar la categoría
-    datos_categoria = {
-        "id": obj.id,
-        "nombre": obj.nombre,
-        "codigo": obj.codigo,
-        "creado_en": obj.creado_en.isoformat() if obj.creado_en else None,
-        "actualizado_en": obj.actualizado_en.isoformat() if obj.actualizado_en else None,
-    }
 
-    await _registrar_eliminado(db, "categorias", obj.id, datos_categoria)
-    await db.delete(obj)
-    await db.commit() # Commit de toda la transacción
+async def _borrar_productos(db: AsyncSession, ids: List[int]) -> None:
+    """Historial, diario y DELETE de un lote de productos: tres sentencias."""
+    filtro = Producto.id.in_(ids)
+    await auditoria.registrar_select(db, Producto, filtro)
+    await db.execute(
+        insert(Cambio).from_select(
+            ["tabla", "registro_id", "operacion"],
+            select(literal("productos"), Producto.id, literal("delete")).where(filtro),
+        )
+    )
+    await db.execute(delete(Producto).where(filtro))
+
+
+async def borrar_categoria(
+    db: AsyncSession,
+    categoria_id: int,
+    al_avanzar: Optional[Callable[[int, int], None]] = None,
+) -> None:
+    """
+    Borra la categoría y sus productos con SQL por conjuntos. Hasta
+    CASCADA_LOTE productos va todo en una transacción; con más, cada lote
+    se confirma por separado (locks cortos) y la categoría se borra con el
+    último, así que si algo falla a mitad se puede reintentar.
+    `al_avanzar(borrados, total)` recibe el progreso después de cada lote.
+    """
+    obj = await _categoria_o_404(db, categoria_id)
+
+    # Igual que borrar_producto: no se borran productos con compras
+    con_compras = await db.execute(
+        select(Compra.producto_id)
+        .join(Producto, Producto.id == Compra.producto_id)
+        .where(Producto.categoria_id == categoria_id)
+        .limit(1)
+    )
+    if con_compras.first() is not None:
+        raise HTTPException(
+            400,
+            "No se puede eliminar la categoría porque tiene productos con compras registradas",
+        )
+
+    total = await db.scalar(select(func.count(Producto.id)).where(Producto.categoria_id == categoria_id))
+    borrados = 0
+    while True:
+        q = await db.execute(
+            select(Producto.id)
+            .where(Producto.categoria_id == categoria_id)
+            .order_by(Producto.id)
+            .limit(CASCADA_LOTE)
+        )
+        ids = list(q.scalars().all())
+        if ids:
+            await _borrar_productos(db, ids)
+            borrados += len(ids)
+        if len(ids) < CASCADA_LOTE:
+            # Último lote: la categoría cae en la misma transacción
+            auditoria.registrar(db, obj)
+            await _registrar_en_diario(db, "categorias", categoria_id, "delete")
+            await db.execute(delete(Categoria).where(Categoria.id == categoria_id))
+        await db.commit()
+        _registrar_cambio("productos", "historial_eliminados")
+        for producto_id in ids:
+            catalogo.quitar_producto(producto_id)
+            alertas_stock.quitar_producto(producto_id)
+        if al_avanzar is not None:
+            al_avanzar(borrados, max(total, borrados))
+        if len(ids) < CASCADA_LOTE:
+            break
+
+    _registrar_cambio("categorias")
+    snapshot_ventas.anotar_dimensiones()
+    catalogo.quitar_categoria(categoria_id)
+    alertas_stock.quitar_categoria(categoria_id)
 
 
 # ======================================================
@@ -447,15 +659,22 @@ async def borrar_categoria(db: AsyncSession, categoria_id: int) -> None:
 async def crear_producto(db: AsyncSession, data: schemas.ProductoCreate) -> Producto:
     # Si viene categoría, validar que exista
     if data.categoria_id is not None:
-        await obtener_categoria(db, data.categoria_id) # Llamada a obtener_categoria no cargada
+        await _categoria_o_404(db, data.categoria_id)
 
     obj = Producto(**data.model_dump())
     db.add(obj)
+    await db.flush()
+    await _registrar_en_diario(db, "productos", obj.id, "insert")
     await db.commit()
+    _registrar_cambio("productos")
+    snapshot_ventas.anotar_dimensiones()
     await db.refresh(obj)
+    catalogo.aplicar_producto(obj)
+    alertas_stock.aplicar_producto(obj)
     return obj
 
 
+@cacheado("productos", "categorias", esquema=schemas.ProductoRead)
 async def listar_productos(
     db: AsyncSession,
     nombre: Optional[str] = None,
@@ -465,8 +684,28 @@ async def listar_productos(
     stock_min: Optional[int] = None,
     stock_max: Optional[int] = None,
 ) -> List[Producto]:
-    stmt = select(Producto).options(joinedload(Producto.categoria))
+    stmt = _filtrar_productos(
+        select(Producto).options(joinedload(Producto.categoria)),
+        nombre=nombre,
+        categoria_id=categoria_id,
+        precio_min=precio_min,
+        precio_max=precio_max,
+        stock_min=stock_min,
+        stock_max=stock_max,
+    )
+    q = await db.execute(stmt)
+    return q.scalars().all()
 
+
+def _filtrar_productos(
+    stmt,
+    nombre: Optional[str] = None,
+    categoria_id: Optional[int] = None,
+    precio_min: Optional[float] = None,
+    precio_max: Optional[float] = None,
+    stock_min: Optional[int] = None,
+    stock_max: Optional[int] = None,
+):
     if nombre:
         stmt = stmt.where(Producto.nombre.ilike(f"%{nombre}%"))
     if categoria_id is not None:
@@ -479,9 +718,28 @@ async def listar_productos(
         stmt = stmt.where(Producto.cantidad >= stock_min)
     if stock_max is not None:
         stmt = stmt.where(Producto.cantidad <= stock_max)
+    return stmt
 
-    q = await db.execute(stmt)
-    return q.scalars().all()
+
+async def validador_productos(db: AsyncSession, **filtros) -> Tuple[Any, ...]:
+    """Como `validador_categorias`, para los productos filtrados."""
+    stmt = _filtrar_productos(
+        select(func.count(Producto.id), func.sum(Producto.id), func.max(Producto.actualizado_en)),
+        **filtros,
+    )
+    cantidad, suma, actualizado_en = (await db.execute(stmt)).one()
+    cambio_id, cambio_en = await _ultimo_cambio(db, "productos")
+    return (cantidad, suma, cambio_id, _mas_reciente(actualizado_en, cambio_en))
+
+
+async def validador_producto(db: AsyncSession, producto_id: int) -> Tuple[Any, ...]:
+    q = await db.execute(
+        select(Producto.id, Producto.cantidad, Producto.actualizado_en).where(Producto.id == producto_id)
+    )
+    fila = q.one_or_none()
+    if not fila:
+        raise HTTPException(404, "Producto no encontrado")
+    return tuple(fila)
 
 
 async def obtener_producto(db: AsyncSession, producto_id: int) -> Producto:
@@ -503,13 +761,24 @@ async def actualizar_producto(
     update_data = data.model_dump(exclude_unset=True)
 
     if "categoria_id" in update_data and update_data["categoria_id"] is not None:
-        await obtener_categoria(db, update_data["categoria_id"])
+        await _categoria_o_404(db, update_data["categoria_id"])
 
+    # La foto de ventas solo depende del nombre y de la categoría
+    cambia_dimension = any(
+        getattr(obj, campo) != update_data[campo]
+        for campo in ("nombre", "categoria_id") if campo in update_data
+    )
     for field, value in update_data.items():
         setattr(obj, field, value)
 
+    await _registrar_en_diario(db, "productos", producto_id, "update")
     await db.commit()
+    _registrar_cambio("productos")
+    if cambia_dimension:
+        snapshot_ventas.anotar_dimensiones()
     await db.refresh(obj)
+    catalogo.aplicar_producto(obj)
+    alertas_stock.aplicar_producto(obj)
     return obj
 
 
@@ -533,21 +802,109 @@ async def borrar_producto(db: AsyncSession, producto_id: int) -> None:
             "No se puede eliminar el producto porque tiene compras registradas",
         )
 
-    datos = {
-        "id": obj.id,
-        "nombre": obj.nombre,
-        "descripcion": obj.descripcion,
-        "cantidad": obj.cantidad,
-        "valor_unitario": obj.valor_unitario,
-        "valor_mayorista": obj.valor_mayorista,
-        "categoria_id": obj.categoria_id,
-        "creado_en": obj.creado_en.isoformat() if obj.creado_en else None,
-        "actualizado_en": obj.actualizado_en.isoformat() if obj.actualizado_en else None,
-    }
-
-    await _registrar_eliminado(db, "productos", obj.id, datos)
+    auditoria.registrar(db, obj)
+    await _registrar_en_diario(db, "productos", obj.id, "delete")
     await db.delete(obj)
     await db.commit()
+    _registrar_cambio("productos", "historial_eliminados")
+    snapshot_ventas.anotar_dimensiones()
+    catalogo.quitar_producto(producto_id)
+    alertas_stock.quitar_producto(producto_id)
+
+
+# ======================================================
+# ================= UMBRALES DE STOCK ==================
+# ======================================================
+
+async def listar_umbrales_stock(db: AsyncSession) -> List[UmbralStock]:
+    q = await db.execute(select(UmbralStock).order_by(UmbralStock.id))
+    return q.scalars().all()
+
+
+async def fijar_umbral_stock(
+    db: AsyncSession,
+    minimo: int,
+    producto_id: Optional[int] = None,
+    categoria_id: Optional[int] = None,
+) -> UmbralStock:
+    """Crea o cambia el mínimo de un producto o de una categoría."""
+    if producto_id is not None:
+        await obtener_producto(db, producto_id)
+        columna, clave = UmbralStock.producto_id, producto_id
+    else:
+        await _categoria_o_404(db, categoria_id)
+        columna, clave = UmbralStock.categoria_id, categoria_id
+
+    obj = (await db.execute(select(UmbralStock).where(columna == clave))).scalar_one_or_none()
+    if obj is None:
+        obj = UmbralStock(producto_id=producto_id, categoria_id=categoria_id, minimo=minimo)
+        db.add(obj)
+    else:
+        obj.minimo = minimo
+    await db.commit()
+    _registrar_cambio("umbrales_stock")
+    await db.refresh(obj)
+    alertas_stock.fijar_umbral(producto_id=producto_id, categoria_id=categoria_id, minimo=minimo)
+    return obj
+
+
+async def borrar_umbral_stock(
+    db: AsyncSession,
+    producto_id: Optional[int] = None,
+    categoria_id: Optional[int] = None,
+) -> None:
+    columna, clave = (
+        (UmbralStock.producto_id, producto_id) if producto_id is not None
+        else (UmbralStock.categoria_id, categoria_id)
+    )
+    r = await db.execute(delete(UmbralStock).where(columna == clave))
+    if not r.rowcount:
+        raise HTTPException(404, "Umbral no encontrado")
+    await db.commit()
+    _registrar_cambio("umbrales_stock")
+    alertas_stock.fijar_umbral(producto_id=producto_id, categoria_id=categoria_id, minimo=None)
+
+
+# ======================================================
+# ============= PRONÓSTICOS Y REPOSICIÓN ===============
+# ======================================================
+
+async def _pronosticos_listos(db: AsyncSession):
+    # Una fila: un recalcular recién terminado se ve sin esperar al sondeo
+    if PRONOSTICOS_ACTIVO:
+        await pronosticos.recargar_si_cambio(db)
+    if not pronosticos.listo:
+        raise HTTPException(503, "Pronósticos desactivados o sin cargar (PRONOSTICOS)")
+    return pronosticos
+
+
+async def obtener_reposicion(db: AsyncSession, producto_id: int) -> Dict[str, Any]:
+    """Pronóstico del producto con días de stock y cantidad a pedir según el stock actual."""
+    motor = await _pronosticos_listos(db)
+    producto = catalogo.obtener_producto(producto_id) if catalogo.listo else None
+    if producto is None:
+        producto = await obtener_producto(db, producto_id)
+    r = motor.reposicion(producto.id, producto.cantidad)
+    if r is None:
+        raise HTTPException(404, "El producto todavía no tiene pronóstico")
+    return {**r, "nombre": producto.nombre, "categoria_id": producto.categoria_id}
+
+
+async def listar_reposicion(
+    db: AsyncSession, categoria_id: Optional[int] = None, limite: int = 100
+) -> List[Dict[str, Any]]:
+    """Productos que llegaron a su punto de reorden, los que se acaban antes primero."""
+    motor = await _pronosticos_listos(db)
+    if catalogo.listo:
+        datos = {p.id: (p.nombre, p.categoria_id, p.cantidad) for p in catalogo.productos.values()}
+    else:
+        q = await db.execute(select(Producto.id, Producto.nombre, Producto.categoria_id, Producto.cantidad))
+        datos = {f[0]: tuple(f[1:]) for f in q.all()}
+    stock = ((i, categoria, cantidad) for i, (_, categoria, cantidad) in datos.items())
+    return [
+        {**r, "nombre": datos[r["producto_id"]][0], "categoria_id": datos[r["producto_id"]][1]}
+        for r in motor.a_reponer(stock, categoria_id)[:limite]
+    ]
 
 
 # ======================================================
@@ -572,12 +929,144 @@ async def crear_compra(db: AsyncSession, data: schemas.CompraCreate) -> Compra:
 
     # Actualizar stock del producto
     producto.cantidad -= data.cantidad
+    await _registrar_en_diario(db, "productos", producto.id, "update")
+    ascendido = await _sumar_a_segmento(db, cliente.id, 1, data.total)
 
     await db.commit()
+    _registrar_cambio("compras", "productos", "rfm_clientes", *(("clientes", "usuarios") if ascendido else ()))
+    # actualizado_en del producto se recalcula en la BD (onupdate)
+    await db.refresh(producto)
+    catalogo.aplicar_producto(producto)
+    alertas_stock.aplicar_producto(producto)
+    sketches_ventas.registrar(obj.id, obj.cliente_id, obj.producto_id, producto.categoria_id, obj.cantidad, obj.total)
     await db.refresh(obj, ["cliente", "producto"])
     return obj
 
 
+# Filas por consulta IN (...): lejos del límite de parámetros de Postgres/SQLite
+LOTE_IDS = 5000
+
+
+async def _ids_existentes(db: AsyncSession, columna, ids) -> set:
+    encontrados = set()
+    ids = sorted(ids)
+    for i in range(0, len(ids), LOTE_IDS):
+        q = await db.execute(select(columna).where(columna.in_(ids[i:i + LOTE_IDS])))
+        encontrados.update(q.scalars().all())
+    return encontrados
+
+
+async def crear_compras_bulk(db: AsyncSession, filas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Registra muchas ventas en una sola transacción (ventas en cola de un
+    terminal que vuelve a estar en línea).
+
+    - Clientes y productos se validan con una consulta por lote, no por fila.
+    - Los productos se bloquean (FOR UPDATE, en orden de id) y el stock se
+      va descontando en memoria en el orden de las filas.
+    - Una fila inválida (datos, cliente/producto inexistente, stock) se
+      reporta en `errores` y no frena a las demás.
+    - Stock: un UPDATE por producto con el total vendido; compras: INSERT
+      multi-fila.
+    """
+    errores: List[Dict[str, Any]] = []
+    validas: List[Tuple[int, schemas.CompraCreate]] = []
+    for indice, fila in enumerate(filas):
+        try:
+            validas.append((indice, schemas.CompraCreate.model_validate(fila)))
+        except ValidationError as e:
+            errores.append({"indice": indice, "error": "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())})
+
+    clientes = await _ids_existentes(db, Cliente.id, {c.cliente_id for _, c in validas})
+
+    stock: Dict[int, int] = {}
+    producto_ids = sorted({c.producto_id for _, c in validas})
+    for i in range(0, len(producto_ids), LOTE_IDS):
+        q = await db.execute(
+            select(Producto.id, Producto.cantidad)
+            .where(Producto.id.in_(producto_ids[i:i + LOTE_IDS]))
+            .order_by(Producto.id)
+            .with_for_update()
+        )
+        stock.update({pid: cantidad for pid, cantidad in q.all()})
+
+    aceptadas: List[Tuple[int, schemas.CompraCreate]] = []
+    vendido: Dict[int, int] = {}
+    for indice, compra in validas:
+        if compra.cantidad <= 0:
+            error = "La cantidad debe ser mayor que 0"
+        elif compra.cliente_id not in clientes:
+            error = "Cliente no encontrado"
+        elif compra.producto_id not in stock:
+            error = "Producto no encontrado"
+        elif stock[compra.producto_id] < compra.cantidad:
+            error = f"Stock insuficiente. Disponible: {stock[compra.producto_id]}"
+        else:
+            error = None
+
+        if error:
+            errores.append({"indice": indice, "error": error})
+            continue
+        stock[compra.producto_id] -= compra.cantidad
+        vendido[compra.producto_id] = vendido.get(compra.producto_id, 0) + compra.cantidad
+        aceptadas.append((indice, compra))
+
+    creadas: List[Dict[str, int]] = []
+    if aceptadas:
+        tabla = Producto.__table__
+        await db.execute(
+            update(tabla)
+            .where(tabla.c.id == bindparam("pid"))
+            .values(cantidad=tabla.c.cantidad - bindparam("vendido")),
+            [{"pid": pid, "vendido": total} for pid, total in vendido.items()],
+        )
+        for pid in vendido:
+            await _registrar_en_diario(db, "productos", pid, "update")
+
+        q = await db.execute(
+            insert(Compra).returning(Compra.id, sort_by_parameter_order=True),
+            [compra.model_dump() for _, compra in aceptadas],
+        )
+        creadas = [
+            {"indice": indice, "id": compra_id}
+            for (indice, _), compra_id in zip(aceptadas, q.scalars().all())
+        ]
+
+        # Cada compra suelta es una visita
+        por_cliente: Dict[int, List[float]] = {}
+        for _, compra in aceptadas:
+            suma = por_cliente.setdefault(compra.cliente_id, [0, 0.0])
+            suma[0] += 1
+            suma[1] += compra.total
+        ascendidos = [
+            await _sumar_a_segmento(db, cliente_id, visitas, monto)
+            for cliente_id, (visitas, monto) in sorted(por_cliente.items())
+        ]
+
+        await db.commit()
+        _registrar_cambio("compras", "productos", "rfm_clientes", *(("clientes", "usuarios") if any(ascendidos) else ()))
+
+        q = await db.execute(
+            select(Producto)
+            .where(Producto.id.in_(list(vendido)))
+            .execution_options(populate_existing=True)
+        )
+        categoria_de: Dict[int, Optional[int]] = {}
+        for producto in q.scalars().all():
+            catalogo.aplicar_producto(producto)
+            alertas_stock.aplicar_producto(producto)
+            categoria_de[producto.id] = producto.categoria_id
+        for creada, (_, compra) in zip(creadas, aceptadas):
+            sketches_ventas.registrar(
+                creada["id"], compra.cliente_id, compra.producto_id,
+                categoria_de.get(compra.producto_id), compra.cantidad, compra.total,
+            )
+
+    errores.sort(key=lambda e: e["indice"])
+    return {"creadas": creadas, "errores": errores}
+
+
+@cacheado("compras", "clientes", "productos", esquema=schemas.CompraRead)
 async def listar_compras(
     db: AsyncSession,
     cliente_id: Optional[int] = None,
@@ -589,11 +1078,56 @@ async def listar_compras(
     nombre_cliente: Optional[str] = None,
     nombre_producto: Optional[str] = None,
 ) -> List[Compra]:
-    stmt = select(Compra).options(
-        joinedload(Compra.cliente),
-        joinedload(Compra.producto),
+    stmt = _filtrar_compras(
+        select(Compra).options(
+            joinedload(Compra.cliente),
+            joinedload(Compra.producto),
+        ),
+        cliente_id=cliente_id,
+        producto_id=producto_id,
+        min_total=min_total,
+        max_total=max_total,
+        fecha_desde=fecha_desde,
+        fecha_hasta=fecha_hasta,
+        nombre_cliente=nombre_cliente,
+        nombre_producto=nombre_producto,
     )
+    q = await db.execute(stmt)
+    return q.scalars().all()
+
+
+def _como_fecha(valor: str) -> datetime:
+    try:
+        momento = datetime.fromisoformat(valor)
+    except ValueError:
+        raise HTTPException(400, f"Fecha inválida: {valor!r} (se espera AAAA-MM-DD o ISO 8601)")
+    return momento if momento.tzinfo else momento.replace(tzinfo=timezone.utc)
 
+
+def _filtrar_fechas(stmt, columna, desde: Optional[str], hasta: Optional[str]):
+    """Rango de fechas inclusivo; un `hasta` sin hora cubre todo ese día."""
+    if desde:
+        stmt = stmt.where(columna >= _como_fecha(desde))
+    if hasta:
+        fin = _como_fecha(hasta)
+        if len(hasta) == 10:  # AAAA-MM-DD
+            stmt = stmt.where(columna < fin + timedelta(days=1))
+        else:
+            stmt = stmt.where(columna <= fin)
+    return stmt
+
+
+def _filtrar_compras(
+    stmt,
+    cliente_id: Optional[int] = None,
+    producto_id: Optional[int] = None,
+    min_total: Optional[float] = None,
+    max_total: Optional[float] = None,
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+    nombre_cliente: Optional[str] = None,
+    nombre_producto: Optional[str] = None,
+):
     if cliente_id is not None:
         stmt = stmt.where(Compra.cliente_id == cliente_id)
     if producto_id is not None:
@@ -602,17 +1136,58 @@ async def listar_compras(
         stmt = stmt.where(Compra.total >= min_total)
     if max_total is not None:
         stmt = stmt.where(Compra.total <= max_total)
-    if fecha_desde:
-        stmt = stmt.where(Compra.fecha >= fecha_desde)
-    if fecha_hasta:
-        stmt = stmt.where(Compra.fecha <= fecha_hasta)
+    # Como datetime (no texto): así Postgres puede descartar particiones
+    stmt = _filtrar_fechas(stmt, Compra.fecha, fecha_desde, fecha_hasta)
     if nombre_cliente:
         stmt = stmt.where(Compra.cliente.has(Cliente.nombre.ilike(f"%{nombre_cliente}%")))
     if nombre_producto:
         stmt = stmt.where(Compra.producto.has(Producto.nombre.ilike(f"%{nombre_producto}%")))
+    return stmt
 
-    q = await db.execute(stmt)
-    return q.scalars().all()
+
+async def validador_compras(db: AsyncSession, **filtros) -> Tuple[Any, ...]:
+    """
+    Agregados baratos de las compras filtradas (count, ids, totales,
+    cantidades, precios, clientes y productos) más el último cambio de
+    productos en el diario, que van anidados. Las compras no pasan por el
+    diario: la ruta suma la versión de la tabla en este worker.
+    """
+    stmt = _filtrar_compras(
+        select(
+            func.count(Compra.id),
+            func.sum(Compra.id),
+            func.max(Compra.id),
+            func.sum(Compra.total),
+            func.sum(Compra.cantidad),
+            func.sum(Compra.precio_unitario_aplicado),
+            func.sum(Compra.cliente_id),
+            func.sum(Compra.producto_id),
+        ),
+        **filtros,
+    )
+    agregados = tuple((await db.execute(stmt)).one())
+    cambio_id, _ = await _ultimo_cambio(db, "productos")
+    return agregados + (cambio_id,)
+
+
+async def validador_compra(db: AsyncSession, compra_id: int) -> Tuple[Any, ...]:
+    q = await db.execute(
+        select(
+            Compra.id,
+            Compra.cliente_id,
+            Compra.producto_id,
+            Compra.cantidad,
+            Compra.precio_unitario_aplicado,
+            Compra.total,
+            Producto.actualizado_en,
+        )
+        .join(Producto, Producto.id == Compra.producto_id)
+        .where(Compra.id == compra_id)
+    )
+    fila = q.one_or_none()
+    if not fila:
+        raise HTTPException(404, "Compra no encontrada")
+    return tuple(fila)
 
 
 async def obtener_compra(db: AsyncSession, compra_id: int) -> Compra:
@@ -632,18 +1207,52 @@ async def obtener_compra(db: AsyncSession, compra_id: int) -> Compra:
 
 async def actualizar_compra(db: AsyncSession, compra_id: int, data: schemas.CompraUpdate) -> Compra:
     obj = await obtener_compra(db, compra_id)
+    producto = obj.producto
     
     # Si se cambió la cantidad, ajustar el stock del producto
     if data.cantidad is not None and data.cantidad != obj.cantidad:
         diff = obj.cantidad - data.cantidad
         obj.producto.cantidad += diff
     
+    total_anterior = obj.total
+    anterior = (obj.cliente_id, obj.producto_id, obj.cantidad)
+
     # Actualizar campos
     for key, value in data.model_dump(exclude_unset=True).items():
         setattr(obj, key, value)
-    
+    await _registrar_en_diario(db, "productos", producto.id, "update")
+
+    # Si es línea de una venta, la cabecera sigue sumando bien
+    if obj.venta_id is not None and obj.total != total_anterior:
+        await db.execute(
+            update(Venta)
+            .where(Venta.id == obj.venta_id)
+            .values(total=Venta.total + (obj.total - total_anterior))
+        )
+
+    # Segmentación: sale lo anterior y entra lo nuevo (puede cambiar de cliente)
+    ascendidos = []
+    if obj.cliente_id != anterior[0]:
+        suelta = int(obj.venta_id is None)
+        ascendidos.append(await _sumar_a_segmento(db, anterior[0], -suelta, -total_anterior, compra_nueva=False))
+        ascendidos.append(await _sumar_a_segmento(db, obj.cliente_id, suelta, obj.total, compra_nueva=False))
+    elif obj.total != total_anterior:
+        ascendidos.append(await _sumar_a_segmento(db, obj.cliente_id, 0, obj.total - total_anterior, compra_nueva=False))
+
     await db.commit()
+    _registrar_cambio("compras", "productos", "ventas", "rfm_clientes", *(("clientes", "usuarios") if any(ascendidos) else ()))
+    snapshot_ventas.anotar_compras(compra_id)
+    await db.refresh(producto)
+    catalogo.aplicar_producto(producto)
+    alertas_stock.aplicar_producto(producto)
     await db.refresh(obj)
+    # Sale la versión anterior y entra la nueva (puede cambiar de cliente o producto)
+    sketches_ventas.ajustar(anterior[0], anterior[1], -1, -anterior[2], -total_anterior)
+    nuevo_producto = await db.get(Producto, obj.producto_id)
+    sketches_ventas.registrar(
+        obj.id, obj.cliente_id, obj.producto_id,
+        nuevo_producto.categoria_id if nuevo_producto else None, obj.cantidad, obj.total,
+    )
     return obj
 
 
@@ -664,28 +1273,316 @@ async def borrar_compra(db: AsyncSession, compra_id: int) -> None:
     producto = obj.producto
     if producto:
         producto.cantidad += obj.cantidad
+        await _registrar_en_diario(db, "productos", producto.id, "update")
 
-    datos = {
-        "id": obj.id,
-        "cliente_id": obj.cliente_id,
-        "producto_id": obj.producto_id,
-        "cantidad": obj.cantidad,
-        "precio_unitario_aplicado": obj.precio_unitario_aplicado,
-        "total": obj.total,
-        "fecha": obj.fecha.isoformat() if obj.fecha else None,
-    }
-
-    await _registrar_eliminado(db, "compras", obj.id, datos)
+    auditoria.registrar(db, obj)
+    if obj.venta_id is not None:
+        await db.execute(
+            update(Venta).where(Venta.id == obj.venta_id).values(total=Venta.total - obj.total)
+        )
+    # Una compra suelta era una visita; la línea de una venta solo aporta monto
+    cambio_marca = await _sumar_a_segmento(
+        db, obj.cliente_id, -int(obj.venta_id is None), -obj.total, compra_nueva=False
+    )
     await db.delete(obj)
     await db.commit()
+    _registrar_cambio(
+        "compras", "productos", "ventas", "historial_eliminados", "rfm_clientes",
+        *(("clientes", "usuarios") if cambio_marca else ()),
+    )
+    snapshot_ventas.anotar_compras(compra_id)
+    sketches_ventas.ajustar(obj.cliente_id, obj.producto_id, -1, -obj.cantidad, -obj.total)
+    if producto:
+        await db.refresh(producto)
+        catalogo.aplicar_producto(producto)
+        alertas_stock.aplicar_producto(producto)
+
+
+# ======================================================
+# ======================= VENTAS =======================
+# ======================================================
+
+def _precio_para(producto: Producto, cliente: Cliente) -> float:
+    if cliente.tipo_cliente == "mayorista" and producto.valor_mayorista is not None:
+        return producto.valor_mayorista
+    return producto.valor_unitario
+
+
+async def crear_venta(db: AsyncSession, data: schemas.VentaCreate) -> Venta:
+    """
+    Crea la venta completa (cabecera + una Compra por línea) en una sola
+    transacción. Los productos se bloquean en orden de id para que dos
+    canastas con los mismos productos no se bloqueen mutuamente.
+    """
+    cliente = await obtener_cliente(db, data.cliente_id)
+
+    pedido: Dict[int, int] = {}
+    for linea in data.lineas:
+        pedido[linea.producto_id] = pedido.get(linea.producto_id, 0) + linea.cantidad
+
+    q = await db.execute(
+        select(Producto)
+        .where(Producto.id.in_(sorted(pedido)))
+        .order_by(Producto.id)
+        .with_for_update()
+    )
+    productos = {p.id: p for p in q.scalars().all()}
+
+    faltantes = sorted(set(pedido) - set(productos))
+    if faltantes:
+        raise HTTPException(404, f"Productos no encontrados: {faltantes}")
+
+    sin_stock = [
+        f"{productos[pid].nombre} (id {pid}): disponible {productos[pid].cantidad}, pedido {cantidad}"
+        for pid, cantidad in pedido.items()
+        if productos[pid].cantidad < cantidad
+    ]
+    if sin_stock:
+        raise HTTPException(400, "Stock insuficiente: " + "; ".join(sin_stock))
+
+    venta = Venta(cliente_id=cliente.id, total=0)
+    for linea in data.lineas:
+        producto = productos[linea.producto_id]
+        precio = linea.precio_unitario_aplicado
+        if precio is None:
+            precio = _precio_para(producto, cliente)
+        total = round(precio * linea.cantidad, 2)
+        venta.lineas.append(
+            Compra(
+                cliente_id=cliente.id,
+                producto_id=producto.id,
+                cantidad=linea.cantidad,
+                precio_unitario_aplicado=precio,
+                total=total,
+            )
+        )
+        venta.total += total
+
+    for pid in sorted(pedido):
+        productos[pid].cantidad -= pedido[pid]
+        await _registrar_en_diario(db, "productos", pid, "update")
+
+    db.add(venta)
+    ascendido = await _sumar_a_segmento(db, cliente.id, 1, venta.total)
+    await db.commit()
+    _registrar_cambio("ventas", "compras", "productos", "rfm_clientes", *(("clientes", "usuarios") if ascendido else ()))
+
+    for pid in sorted(pedido):
+        await db.refresh(productos[pid])
+        catalogo.aplicar_producto(productos[pid])
+        alertas_stock.aplicar_producto(productos[pid])
+    for linea in venta.lineas:
+        sketches_ventas.registrar(
+            linea.id, linea.cliente_id, linea.producto_id,
+            productos[linea.producto_id].categoria_id, linea.cantidad, linea.total,
+        )
+    return await obtener_venta(db, venta.id)
+
+
+async def obtener_venta(db: AsyncSession, venta_id: int) -> Venta:
+    q = await db.execute(
+        select(Venta)
+        .where(Venta.id == venta_id)
+        .options(selectinload(Venta.lineas))
+        .execution_options(populate_existing=True)
+    )
+    obj = q.scalar_one_or_none()
+    if not obj:
+        raise HTTPException(404, "Venta no encontrada")
+    return obj
+
+
+@cacheado("ventas", "compras", esquema=schemas.VentaRead)
+async def listar_ventas(
+    db: AsyncSession,
+    cliente_id: Optional[int] = None,
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+) -> List[Venta]:
+    stmt = select(Venta).options(selectinload(Venta.lineas)).order_by(Venta.id)
+    if cliente_id is not None:
+        stmt = stmt.where(Venta.cliente_id == cliente_id)
+    stmt = _filtrar_fechas(stmt, Venta.fecha, fecha_desde, fecha_hasta)
+    q = await db.execute(stmt)
+    return q.scalars().all()
 
 
 # ======================================================
 # ============= HISTORIAL ELIMINADOS ===================
 # ======================================================
 
-async def listar_historial(db: AsyncSession) -> List[HistorialEliminados]:
+async def listar_historial(
+    db: AsyncSession,
+    tabla: Optional[str] = None,
+    despues_de: Optional[int] = None,
+    limite: int = 50,
+) -> List[Dict[str, Any]]:
+    """
+    Para los /historial/eliminados obsoletos: una página de buscar_historial
+    (sin el cursor; el siguiente `despues_de` es el id de la última fila).
+    """
+    pagina = await buscar_historial(db, tabla=tabla, despues_de=despues_de, limite=limite)
+    return pagina["items"]
+
+
+_CLAVE_JSON = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _filtro_contiene(dialecto: str, contiene: Dict[str, Any]):
+    """
+    `datos` contiene todas las parejas clave/valor de `contiene`.
+    Postgres: datos @> '{...}' (índice GIN). SQLite: json_extract por clave,
+    escrito igual que los índices de models.py para que los use.
+    """
+    if dialecto == "postgresql":
+        return HistorialEliminados.datos.op("@>")(literal(contiene, JSONB))
+
+    condiciones = []
+    for clave, valor in contiene.items():
+        if not _CLAVE_JSON.match(clave):
+            raise HTTPException(400, f"Clave inválida en 'contiene': {clave!r}")
+        if isinstance(valor, (dict, list)):
+            raise HTTPException(400, f"En SQLite 'contiene' solo admite valores simples ({clave})")
+        # La ruta va literal (no como parámetro): si no, SQLite no reconoce el índice
+        extraido = func.json_extract(HistorialEliminados.datos, literal_column(f"'$.{clave}'"))
+        if valor is None:
+            condiciones.append(extraido.is_(None))
+        elif isinstance(valor, bool):
+            # json_extract devuelve 1/0 para true/false
+            condiciones.append(extraido == int(valor))
+        else:
+            condiciones.append(extraido == valor)
+    return and_(*condiciones)
+
+
+async def buscar_historial(
+    db: AsyncSession,
+    tabla: Optional[str] = None,
+    registro_id: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    contiene: Optional[Dict[str, Any]] = None,
+    despues_de: Optional[int] = None,
+    limite: int = 50,
+) -> Dict[str, Any]:
+    """
+    Historial paginado por keyset (id descendente): cada página pide las
+    filas con id < `despues_de`, así el costo no crece con el número de página.
+    Si hay segmentos archivados (retencion.py) que caen en el rango pedido,
+    también se buscan ahí y se mezclan por id.
+    """
+    stmt = select(HistorialEliminados).order_by(HistorialEliminados.id.desc())
+    if tabla:
+        stmt = stmt.where(HistorialEliminados.tabla == tabla)
+    if registro_id is not None:
+        stmt = stmt.where(HistorialEliminados.registro_id == registro_id)
+    if desde is not None:
+        stmt = stmt.where(HistorialEliminados.eliminado_en >= desde)
+    if hasta is not None:
+        stmt = stmt.where(HistorialEliminados.eliminado_en <= hasta)
+    if contiene:
+        stmt = stmt.where(_filtro_contiene(db.bind.dialect.name, contiene))
+    if despues_de is not None:
+        stmt = stmt.where(HistorialEliminados.id < despues_de)
+
+    # Una fila de más para saber si hay otra página. Tabla y archivo salen
+    # con el mismo formato (eliminado_en siempre en UTC con zona)
+    q = await db.execute(stmt.limit(limite + 1))
+    filas = [fila_a_dict(obj) for obj in q.scalars().all()]
+
+    archivo = archivo_historial.estado()
+    # Página llena con ids mayores que todo el archivo: nada archivado puede entrar
+    llena = len(filas) > limite and filas[-1]["id"] > archivo["id_max"]
+    if archivo["segmentos"] and not llena and (desde is None or _utc(desde) <= datetime.fromisoformat(archivo["hasta"])):
+        archivadas = await asyncio.to_thread(
+            archivo_historial.buscar,
+            tabla=tabla,
+            registro_id=registro_id,
+            desde=_utc(desde) if desde else None,
+            hasta=_utc(hasta) if hasta else None,
+            contiene=contiene,
+            antes_de=despues_de,
+            limite=limite + 1,
+        )
+        if archivadas:
+            # La tabla manda si una fila quedó en los dos lados
+            mezcla = {fila["id"]: fila for fila in archivadas}
+            mezcla.update((fila["id"], fila) for fila in filas)
+            filas = [mezcla[i] for i in sorted(mezcla, reverse=True)[:limite + 1]]
+
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    siguiente = filas[-1]["id"] if hay_mas else None
+    return {"items": filas, "siguiente": siguiente}
+
+# ======================================================
+# ============ SINCRONIZACIÓN (POS OFFLINE) ============
+# ======================================================
+
+TABLAS_SYNC = {
+    "productos": Producto,
+    "categorias": Categoria,
+    "clientes": Cliente,
+}
+
+# Un hueco en los ids del diario más joven que esto puede ser una transacción
+# que aún no confirma: el token no lo salta hasta que envejezca.
+SYNC_MARGEN_S = float(os.getenv("SYNC_MARGEN_S", "5"))
+
+
+def _utc(momento: datetime) -> datetime:
+    return momento if momento.tzinfo else momento.replace(tzinfo=timezone.utc)
+
+
+async def sincronizar(db: AsyncSession, desde: int = 0, limite: int = 1000) -> Dict[str, Any]:
+    """
+    Cambios de productos/categorías/clientes posteriores al token `desde`.
+    Con desde=0 (primera vez) devuelve una copia completa.
+    """
+    if desde <= 0:
+        return await _copia_completa(db)
+
     q = await db.execute(
-        select(HistorialEliminados).order_by(HistorialEliminados.eliminado_en.desc())
+        select(Cambio).where(Cambio.id > desde).order_by(Cambio.id).limit(limite + 1)
     )
-    return q.scalars().all()
\ No newline at end of file
+    cambios = q.scalars().all()
+    hay_mas = len(cambios) > limite
+    cambios = cambios[:limite]
+
+    # El token avanza mientras no haya un hueco reciente
+    token = desde
+    ahora = datetime.now(timezone.utc)
+    for cambio in cambios:
+        hueco = cambio.id != token + 1
+        if hueco and (ahora - _utc(cambio.creado_en)).total_seconds() < SYNC_MARGEN_S:
+            break
+        token = cambio.id
+
+    # Solo importa la última operación de cada registro
+    ultima: Dict[Tuple[str, int], str] = {}
+    for cambio in cambios:
+        ultima[(cambio.tabla, cambio.registro_id)] = cambio.operacion
+
+    resultado: Dict[str, Any] = {"token": token, "completo": False, "hay_mas": hay_mas}
+    for tabla, modelo in TABLAS_SYNC.items():
+        vivos = [rid for (t, rid), op in ultima.items() if t == tabla and op != "delete"]
+        eliminados = {rid for (t, rid), op in ultima.items() if t == tabla and op == "delete"}
+        filas = []
+        if vivos:
+            q = await db.execute(select(modelo).where(modelo.id.in_(vivos)).order_by(modelo.id))
+            filas = q.scalars().all()
+            # Borrado después de este lote: también es lápida
+            eliminados |= set(vivos) - {f.id for f in filas}
+        resultado[tabla] = {"upserts": filas, "eliminados": sorted(eliminados)}
+    return resultado
+
+
+async def _copia_completa(db: AsyncSession) -> Dict[str, Any]:
+    # El token se lee ANTES que las filas: lo que cambie mientras tanto se
+    # volverá a enviar en la siguiente sincronización (los upserts son idempotentes)
+    token = (await db.execute(select(func.max(Cambio.id)))).scalar() or 0
+    resultado: Dict[str, Any] = {"token": token, "completo": True, "hay_mas": False}
+    for tabla, modelo in TABLAS_SYNC.items():
+        q = await db.execute(select(modelo).order_by(modelo.id))
+        resultado[tabla] = {"upserts": q.scalars().all(), "eliminados": []}
+    return resultado
@@ -12,6 +12,8 @@ from sqlalchemy.orm import declarative_base
 from sqlalchemy.pool import NullPool
 from dotenv import load_dotenv
 
+from fallas import config_desde_entorno as fallas_desde_entorno, instalar_fallas
+
 # En local carga .env; en Render no pasa nada si no existe
 load_dotenv()
 
@@ -58,14 +60,41 @@ if not RAW_URL:
 else:
     ASYNC_URL = normalize_asyncpg_url(RAW_URL)
 
+# Pool: por defecto sin pool (NullPool). Con DB_POOL_SIZE se usa un pool
+# acotado, para que una base lenta no reciba conexiones sin límite.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "0"))
+# Timeout por sentencia (asyncpg command_timeout), en segundos
+TIMEOUT_S = float(os.getenv("DB_TIMEOUT_S", "0"))
+
+opciones_pool = (
+    {
+        "pool_size": POOL_SIZE,
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "0")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT_S", "5")),
+    }
+    if POOL_SIZE > 0
+    else {"poolclass": NullPool}
+)
+
+connect_args = {}
+if TIMEOUT_S > 0 and ASYNC_URL.startswith("postgresql+asyncpg"):
+    connect_args["command_timeout"] = TIMEOUT_S
+
 engine = create_async_engine(
     ASYNC_URL,
     echo=False,
     pool_pre_ping=True,
-    poolclass=NullPool,
+    connect_args=connect_args,
+    **opciones_pool,
     # ❌ sin connect_args={"ssl": True}
 )
 
+# 🧪 Solo pruebas: latencia / fallas inyectadas (DB_FALLAS="latencia_ms=20,...")
+_fallas = fallas_desde_entorno()
+if _fallas is not None:
+    instalar_fallas(engine, _fallas)
+    print("⚠ Inyección de fallas de BD activa (DB_FALLAS).")
+
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
     class_=AsyncSession,
@@ -0,0 +1,68 @@
+# esquema.py
+"""
+Ajustes de esquema que create_all no hace (solo crea tablas que faltan,
+no agrega columnas a las existentes). Cada paso es idempotente y se corre
+al arrancar, después de create_all.
+"""
+from __future__ import annotations
+
+import warnings
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import SAWarning
+
+from models import HistorialEliminados
+import particiones
+
+
+def _columnas(conn: Connection, tabla: str) -> set:
+    return {c["name"] for c in inspect(conn).get_columns(tabla)}
+
+
+def _agregar_venta_id(conn: Connection) -> bool:
+    """compras.venta_id: líneas de una venta (canasta)."""
+    if "venta_id" in _columnas(conn, "compras"):
+        return False
+    conn.execute(text("ALTER TABLE compras ADD COLUMN venta_id INTEGER REFERENCES ventas(id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_compras_venta_id ON compras (venta_id)"))
+    return True
+
+
+def _indices_historial(conn: Connection) -> bool:
+    """Índices de historial_eliminados (filtros, rango de fechas y búsqueda en datos)."""
+    # El inspector de SQLite no ve índices por expresión (y avisa de que los
+    # salta): se usa uno normal de la misma tanda como marca de "ya aplicado"
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", SAWarning)
+        existentes = {i["name"] for i in inspect(conn).get_indexes("historial_eliminados")}
+    if "ix_historial_tabla_registro" in existentes:
+        return False
+    for indice in HistorialEliminados.__table__.indexes:
+        # create() respeta ddl_if: el GIN solo en Postgres, los json_extract solo en SQLite
+        if indice.name not in existentes:
+            indice.create(conn)
+    return True
+
+
+def _indice_fecha_compras(conn: Connection) -> bool:
+    """compras.fecha indexada (filtros por rango de fechas)."""
+    if "ix_compras_fecha" in {i["name"] for i in inspect(conn).get_indexes("compras")}:
+        return False
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_compras_fecha ON compras (fecha)"))
+    return True
+
+
+PASOS: List[Tuple[str, Callable[[Connection], bool]]] = [
+    ("compras.venta_id", _agregar_venta_id),
+    ("historial_eliminados: índices", _indices_historial),
+    ("compras.fecha: índice", _indice_fecha_compras),
+    # Después de los pasos de compras: la conversión copia la tabla tal cual
+    ("compras: particiones por mes", particiones.preparar),
+]
+
+
+def asegurar_esquema(conn: Connection) -> List[str]:
+    """Aplica los pasos pendientes; devuelve los nombres de los aplicados."""
+    return [nombre for nombre, paso in PASOS if paso(conn)]
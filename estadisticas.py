@@ -0,0 +1,237 @@
+# estadisticas.py
+"""
+Estadísticas de ventas (compras) para reportes y gráficas.
+
+Cada consulta junta dos fuentes:
+- la tabla `compras` (meses recientes), agregada en SQL;
+- los meses archivados (archivo_compras.py), agregados con NumPy sobre
+  las vistas mmap de cada columna: no se copia ni se parsea nada.
+
+Los meses (`desde` / `hasta`) van como AAAA-MM y son inclusivos.
+
+Las variantes `_aprox` leen los sketches (sketches.py): no tocan las
+compras, cubren todo el historial y devuelven la cota de error de cada
+número.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import desc, distinct, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from archivo_compras import archivo_compras, np, rango_mes
+from cache_consultas import cacheado
+from models import Categoria, Cliente, Compra, Producto
+from sketches import sketches_ventas
+
+
+def _mes_sql(dialecto: str):
+    if dialecto == "postgresql":
+        return func.to_char(Compra.fecha, "YYYY-MM")
+    return func.strftime("%Y-%m", Compra.fecha)
+
+
+def _filtro_meses(stmt, desde: Optional[str], hasta: Optional[str]):
+    if desde:
+        stmt = stmt.where(Compra.fecha >= rango_mes(desde)[0])
+    if hasta:
+        stmt = stmt.where(Compra.fecha < rango_mes(hasta)[1])
+    return stmt
+
+
+def meses_archivados(desde: Optional[str] = None, hasta: Optional[str] = None) -> List[str]:
+    if not archivo_compras.disponible:
+        return []
+    return [
+        mes for mes in archivo_compras.meses()
+        if (not desde or mes >= desde) and (not hasta or mes <= hasta)
+    ]
+
+
+def _sumar_por(columna: str, meses: List[str]) -> Dict[int, Tuple[int, int, float]]:
+    """{id: (compras, unidades, total)} de los meses archivados, agrupando por `columna`."""
+    compras = unidades = totales = None
+    for mes in meses:
+        m = archivo_compras.abrir(mes)
+        if m is None or not m.filas:
+            continue
+        claves = m[columna]
+        largo = int(claves.max()) + 1
+        partes = (
+            np.bincount(claves, minlength=largo),
+            np.bincount(claves, weights=m["cantidad"], minlength=largo),
+            np.bincount(claves, weights=m["total"], minlength=largo),
+        )
+        if compras is None:
+            compras, unidades, totales = partes
+            continue
+        if largo > len(compras):
+            compras, unidades, totales = (np.pad(a, (0, largo - len(a))) for a in (compras, unidades, totales))
+        compras[:largo] += partes[0]
+        unidades[:largo] += partes[1]
+        totales[:largo] += partes[2]
+    if compras is None:
+        return {}
+    return {
+        int(i): (int(compras[i]), int(unidades[i]), float(totales[i]))
+        for i in np.flatnonzero(compras)
+    }
+
+
+async def _nombres(db: AsyncSession, clase, ids: List[int]) -> Dict[int, str]:
+    if not ids:
+        return {}
+    q = await db.execute(select(clase.id, clase.nombre).where(clase.id.in_(ids)))
+    return dict(q.all())
+
+
+# ======================================================
+# ==================== CONSULTAS =======================
+# ======================================================
+
+@cacheado("compras")
+async def ventas_por_mes(
+    db: AsyncSession,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    mes = _mes_sql(db.bind.dialect.name).label("mes")
+    q = await db.execute(
+        _filtro_meses(
+            select(mes, func.count(Compra.id), func.sum(Compra.cantidad), func.sum(Compra.total)),
+            desde, hasta,
+        ).group_by(mes)
+    )
+    por_mes: Dict[str, Dict[str, Any]] = {
+        m: {"mes": m, "compras": n, "unidades": int(u or 0), "total": float(t or 0), "archivado": False}
+        for m, n, u, t in q.all()
+    }
+    for m in meses_archivados(desde, hasta):
+        cols = archivo_compras.abrir(m)
+        if cols is None or not cols.filas:
+            continue
+        fila = por_mes.setdefault(m, {"mes": m, "compras": 0, "unidades": 0, "total": 0.0})
+        fila["compras"] += cols.filas
+        fila["unidades"] += int(cols["cantidad"].sum())
+        fila["total"] += float(cols["total"].sum())
+        fila["archivado"] = True
+    return [por_mes[m] for m in sorted(por_mes)]
+
+
+async def _ranking(
+    db: AsyncSession,
+    columna,
+    clase,
+    limite: int,
+    desde: Optional[str],
+    hasta: Optional[str],
+) -> List[Dict[str, Any]]:
+    q = await db.execute(
+        _filtro_meses(
+            select(columna, func.count(Compra.id), func.sum(Compra.cantidad), func.sum(Compra.total)),
+            desde, hasta,
+        ).group_by(columna)
+    )
+    acumulado = _sumar_por(columna.key, meses_archivados(desde, hasta))
+    for clave, n, u, t in q.all():
+        previo = acumulado.get(clave, (0, 0, 0.0))
+        acumulado[clave] = (previo[0] + n, previo[1] + int(u or 0), previo[2] + float(t or 0))
+
+    mejores = sorted(acumulado.items(), key=lambda par: par[1][2], reverse=True)[:limite]
+    nombres = await _nombres(db, clase, [i for i, _ in mejores])
+    return [
+        {"id": i, "nombre": nombres.get(i), "compras": n, "unidades": u, "total": t}
+        for i, (n, u, t) in mejores
+    ]
+
+
+@cacheado("compras", "productos")
+async def top_productos_vendidos(
+    db: AsyncSession,
+    limite: int = 10,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    return await _ranking(db, Compra.producto_id, Producto, limite, desde, hasta)
+
+
+@cacheado("compras", "clientes")
+async def top_clientes_compradores(
+    db: AsyncSession,
+    limite: int = 10,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    return await _ranking(db, Compra.cliente_id, Cliente, limite, desde, hasta)
+
+
+@cacheado("compras", "productos")
+async def compradores_distintos(
+    db: AsyncSession,
+    por: str = "producto",
+    id: Optional[int] = None,
+    limite: int = 20,
+) -> List[Dict[str, Any]]:
+    """Clientes distintos por producto o categoría (exacto: COUNT(DISTINCT), más los meses archivados)."""
+    clave = Compra.producto_id if por == "producto" else Producto.categoria_id
+    stmt = select(clave, Compra.cliente_id)
+    if por == "categoria":
+        stmt = stmt.join(Producto, Producto.id == Compra.producto_id)
+    if id is not None:
+        stmt = stmt.where(clave == id)
+    meses = meses_archivados()
+
+    if not meses:
+        cuenta = func.count(distinct(Compra.cliente_id)).label("clientes")
+        q = await db.execute(
+            stmt.with_only_columns(clave, cuenta).group_by(clave).order_by(desc(cuenta)).limit(limite)
+        )
+        pares = [(k, n) for k, n in q.all()]
+    else:
+        # Tabla y archivo pueden compartir clientes: se unen los pares (clave, cliente)
+        q = await db.execute(stmt.distinct())
+        filas = q.all()
+        claves = [np.array([f[0] for f in filas if f[0] is not None], dtype=np.int64)]
+        clientes = [np.array([f[1] for f in filas if f[0] is not None], dtype=np.int64)]
+        categoria_de = None
+        if por == "categoria":
+            categoria_de = dict((await db.execute(select(Producto.id, Producto.categoria_id))).all())
+        for mes in meses:
+            m = archivo_compras.abrir(mes)
+            if m is None or not m.filas:
+                continue
+            k = m["producto_id"].astype(np.int64)
+            if categoria_de is not None:
+                tabla = np.full(max(max(categoria_de, default=0), int(k.max())) + 1, -1, dtype=np.int64)
+                for pid, cid in categoria_de.items():
+                    tabla[pid] = -1 if cid is None else cid
+                k = tabla[k]
+            elegidas = k >= 0 if id is None else k == id
+            claves.append(k[elegidas])
+            clientes.append(m["cliente_id"][elegidas].astype(np.int64))
+        unicos = np.unique((np.concatenate(claves) << 32) | np.concatenate(clientes))
+        valores, cuentas = np.unique(unicos >> 32, return_counts=True)
+        orden = np.argsort(-cuentas, kind="stable")[:limite]
+        pares = [(int(valores[i]), int(cuentas[i])) for i in orden]
+
+    nombres = await _nombres(db, Producto if por == "producto" else Categoria, [k for k, _ in pares])
+    return [{"id": k, "nombre": nombres.get(k), "clientes": n} for k, n in pares]
+
+
+async def compradores_distintos_aprox(
+    db: AsyncSession,
+    por: str = "producto",
+    id: Optional[int] = None,
+    limite: int = 20,
+) -> List[Dict[str, Any]]:
+    filas = sketches_ventas.compradores_distintos(por, id, limite)
+    nombres = await _nombres(db, Producto if por == "producto" else Categoria, [f["id"] for f in filas])
+    return [{"id": f["id"], "nombre": nombres.get(f["id"]), **{k: v for k, v in f.items() if k != "id"}} for f in filas]
+
+
+async def mejores_aprox(db: AsyncSession, dimension: str, limite: int = 10) -> List[Dict[str, Any]]:
+    """Top por total desde Count-Min + heap (dimension: producto | cliente)."""
+    filas = sketches_ventas.mejores(dimension, limite)
+    nombres = await _nombres(db, Producto if dimension == "producto" else Cliente, [f["id"] for f in filas])
+    return [{"id": f["id"], "nombre": nombres.get(f["id"]), **{k: v for k, v in f.items() if k != "id"}} for f in filas]
@@ -0,0 +1,90 @@
+# estaticos.py
+"""
+Archivos estáticos con huella de contenido.
+
+scripts/build_static.py copia static/ a static/dist/ con un hash en el
+nombre (styles.3f9a1c2b.css), escribe los hermanos .gz/.br y un
+manifest.json. Las plantillas piden la URL con `asset('styles.css')`; como
+el nombre cambia con el contenido, esos archivos se sirven con
+`immutable` y el navegador no vuelve a preguntar por ellos.
+
+Sin build (desarrollo), asset() devuelve la ruta normal /static/...
+"""
+from __future__ import annotations
+
+import json
+import mimetypes
+import os
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from compresion import EXTENSIONES, elegir_codificacion
+
+DIRECTORIO = "static"
+DIST = "dist"
+MANIFIESTO = os.path.join(DIRECTORIO, DIST, "manifest.json")
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+
+# (mtime del manifiesto, contenido)
+_manifiesto: Tuple[float, Dict[str, str]] = (-1.0, {})
+
+
+def manifiesto() -> Dict[str, str]:
+    """Ruta original -> ruta con huella. Se relee si el build lo reescribe."""
+    global _manifiesto
+    try:
+        mtime = os.path.getmtime(MANIFIESTO)
+    except OSError:
+        return {}
+    if mtime != _manifiesto[0]:
+        with open(MANIFIESTO, encoding="utf-8") as f:
+            _manifiesto = (mtime, json.load(f))
+    return _manifiesto[1]
+
+
+def asset(ruta: str) -> str:
+    """URL pública de un archivo de static/ (con huella si existe el build)."""
+    ruta = ruta.lstrip("/")
+    con_huella: Optional[str] = manifiesto().get(ruta)
+    if con_huella:
+        return f"/static/{DIST}/{con_huella}"
+    return f"/static/{ruta}"
+
+
+class StaticPrecomprimidos(StaticFiles):
+    """
+    StaticFiles que, para static/dist/, sirve el .br/.gz ya generado si el
+    cliente lo acepta y marca la respuesta como inmutable.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        ruta = str(full_path)
+        if os.sep + DIST + os.sep not in ruta:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        request_headers = Headers(scope=scope)
+        disponibles = [c for c, ext in EXTENSIONES.items() if os.path.isfile(ruta + ext)]
+        codificacion = elegir_codificacion(request_headers.get("accept-encoding", ""), disponibles)
+
+        headers = {"Cache-Control": CACHE_INMUTABLE, "Vary": "Accept-Encoding"}
+        if codificacion != "identity":
+            headers["Content-Encoding"] = codificacion
+            ruta_servida = ruta + EXTENSIONES[codificacion]
+            stat_result = os.stat(ruta_servida)
+        else:
+            ruta_servida = ruta
+
+        media_type = mimetypes.guess_type(ruta)[0] or "application/octet-stream"
+        response = FileResponse(
+            ruta_servida,
+            status_code=status_code,
+            stat_result=stat_result,
+            media_type=media_type,
+            headers=headers,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
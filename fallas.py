@@ -0,0 +1,129 @@
+# fallas.py
+"""
+Inyección de fallas de base de datos para pruebas de latencia de cola.
+
+Envuelve un AsyncEngine (solo en modo prueba) para que cada sentencia sufra
+latencia y jitter configurables, y para simular caídas de conexión y
+timeouts de bloqueo. La espera es asíncrona: bloquea la corrutina que hace
+la consulta, no el event loop, igual que un Postgres lento.
+
+Se activa con DB_FALLAS, por ejemplo:
+    DB_FALLAS="latencia_ms=20,jitter_ms=40,p_conexion=0.01,p_lock=0.005,lock_timeout_ms=1000"
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.util import await_only
+
+SENTENCIAS_ESCRITURA = ("INSERT", "UPDATE", "DELETE")
+
+
+class ConfigFallas:
+    """Parámetros de la inyección. Las probabilidades van de 0 a 1."""
+
+    def __init__(
+        self,
+        latencia_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        p_conexion: float = 0.0,
+        p_lock: float = 0.0,
+        lock_timeout_ms: float = 1000.0,
+        semilla: Optional[int] = None,
+    ):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.p_conexion = p_conexion
+        self.p_lock = p_lock
+        self.lock_timeout_ms = lock_timeout_ms
+        self.rnd = random.Random(semilla)
+
+    @classmethod
+    def desde_texto(cls, texto: str) -> "ConfigFallas":
+        """Construye la configuración desde "clave=valor,clave=valor"."""
+        valores: Dict[str, float] = {}
+        for parte in texto.split(","):
+            parte = parte.strip()
+            if not parte:
+                continue
+            clave, _, valor = parte.partition("=")
+            valores[clave.strip()] = float(valor)
+        if "semilla" in valores:
+            valores["semilla"] = int(valores["semilla"])
+        return cls(**valores)
+
+    def retraso(self) -> float:
+        """Latencia a inyectar en segundos (base + jitter exponencial)."""
+        extra = self.rnd.expovariate(1 / self.jitter_ms) if self.jitter_ms > 0 else 0.0
+        return (self.latencia_ms + extra) / 1000
+
+
+class ContadoresFallas:
+    def __init__(self):
+        self.sentencias = 0
+        self.conexiones_fallidas = 0
+        self.locks_expirados = 0
+        self.latencia_inyectada_s = 0.0
+
+    def como_dict(self) -> Dict[str, float]:
+        return {
+            "sentencias": self.sentencias,
+            "conexiones_fallidas": self.conexiones_fallidas,
+            "locks_expirados": self.locks_expirados,
+            "latencia_inyectada_s": round(self.latencia_inyectada_s, 3),
+        }
+
+
+contadores = ContadoresFallas()
+
+
+def _dormir(segundos: float) -> None:
+    """
+    Espera sin bloquear el loop: los eventos de SQLAlchemy corren dentro del
+    greenlet del driver async, así que podemos esperar una corrutina.
+    """
+    if segundos > 0:
+        await_only(asyncio.sleep(segundos))
+
+
+def instalar_fallas(engine: AsyncEngine, config: ConfigFallas) -> None:
+    """Registra los eventos de inyección sobre `engine`."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "do_connect")
+    def _al_conectar(dialect, conn_rec, cargs, cparams):
+        if config.rnd.random() < config.p_conexion:
+            contadores.conexiones_fallidas += 1
+            raise OperationalError(
+                "connect", None, ConnectionError("falla inyectada: conexión rechazada")
+            )
+        # None => SQLAlchemy sigue con la conexión normal
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+        contadores.sentencias += 1
+
+        retraso = config.retraso()
+        contadores.latencia_inyectada_s += retraso
+        _dormir(retraso)
+
+        es_escritura = statement.lstrip().upper().startswith(SENTENCIAS_ESCRITURA) or "FOR UPDATE" in statement
+        if es_escritura and config.rnd.random() < config.p_lock:
+            contadores.locks_expirados += 1
+            _dormir(config.lock_timeout_ms / 1000)
+            raise OperationalError(
+                statement,
+                parameters,
+                TimeoutError("falla inyectada: canceling statement due to lock timeout"),
+            )
+
+
+def config_desde_entorno() -> Optional[ConfigFallas]:
+    texto = os.getenv("DB_FALLAS")
+    return ConfigFallas.desde_texto(texto) if texto else None
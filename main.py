@@ -1,23 +1,42 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 
 # Routers de la API
 from routers.router_usuario import router as usuarios_router
 from routers.router_producto import router as productos_router
 from routers.router_cliente import router as clientes_router
 from routers.router_compra import router as compras_router
+from routers.router_venta import router as ventas_router
 from routers.router_categoria import router as categorias_router
 from routers.router_historial import router as historial_router
-
-from database import engine, Base
-
-# 📂 Configuración de plantillas
-templates = Jinja2Templates(directory="templates")
-
+from routers.router_metricas import router as metricas_router
+from routers.router_sync import router as sync_router
+from routers.router_particiones import router as particiones_router
+from routers.router_estadisticas import router as estadisticas_router
+from routers.router_trabajos import router as trabajos_router
+from routers.router_stock import router as stock_router
+from routers.router_paginas import router as paginas_router, cache_paginas
+
+from database import engine, Base, AsyncSessionLocal
+from esquema import asegurar_esquema
+from catalogo import catalogo, ACTIVO as CATALOGO_ACTIVO, RESYNC_S as CATALOGO_RESYNC_S
+from auditoria import auditoria
+import alertas_stock
+import retencion
+import particiones
+import archivo_compras
+import sketches
+import trabajos
+import pronosticos
+import segmentacion
+from trafico import CapturaTraficoMiddleware, ruta_captura
+from admision import ControlAdmisionMiddleware, config_desde_entorno as admision_desde_entorno
+from cache_consultas import OmitirCacheMiddleware
+from estaticos import StaticPrecomprimidos
+from compresion import CompresionMiddleware, config_desde_entorno as compresion_desde_entorno
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -25,11 +44,205 @@ async def lifespan(app: FastAPI):
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            aplicados = await conn.run_sync(asegurar_esquema)
         print("✔ Tablas creadas correctamente.")
+        if aplicados:
+            print("✔ Esquema actualizado:", ", ".join(aplicados))
     except Exception as e:
         print("⚠ Error al crear tablas:", e)
+
+    # Páginas HTML: se renderizan y comprimen una sola vez
+    cache_paginas.precalentar()
+
+    # Catálogo de productos/categorías en memoria
+    tareas = []
+    if CATALOGO_ACTIVO:
+        try:
+            async with AsyncSessionLocal() as db:
+                await catalogo.cargar(db)
+            print(f"✔ Catálogo en memoria: {catalogo.estado()}")
+        except Exception as e:
+            print("⚠ Error al cargar el catálogo (se usará la BD):", e)
+        if CATALOGO_RESYNC_S > 0:
+            tareas.append(asyncio.create_task(_resincronizar_catalogo()))
+
+    # Alertas de stock bajo: umbrales y cantidades en memoria
+    if alertas_stock.ACTIVO:
+        try:
+            async with AsyncSessionLocal() as db:
+                await alertas_stock.alertas_stock.cargar(db)
+            print(f"✔ Alertas de stock: {len(alertas_stock.alertas_stock.bajo)} productos bajo su mínimo")
+        except Exception as e:
+            print("⚠ Error al cargar las alertas de stock:", e)
+        if alertas_stock.RESYNC_S > 0:
+            tareas.append(asyncio.create_task(_recargar_alertas_stock()))
+
+    # Historial de eliminados escrito por lotes (AUDITORIA_MODO=lote)
+    if auditoria.modo == "lote":
+        tareas.append(asyncio.create_task(auditoria.ejecutar()))
+        print(f"✔ Auditoría por lotes: {auditoria.lote} filas / {auditoria.intervalo_s}s")
+
+    # Particiones de compras de los próximos meses (solo Postgres)
+    if particiones.ACTIVO:
+        if engine.dialect.name == "postgresql":
+            tareas.append(asyncio.create_task(_asegurar_particiones()))
+        else:
+            print("⚠ COMPRAS_PARTICIONES solo aplica en Postgres; en SQLite se usa el índice de compras.fecha")
+
+    # Archivado de compras cortado a mitad: publicar o descartar lo pendiente
+    if archivo_compras.archivo_compras.disponible and archivo_compras.archivo_compras.pendientes():
+        try:
+            async with AsyncSessionLocal() as db:
+                publicados = await archivo_compras.recuperar(db)
+            print(f"✔ Archivo de compras recuperado: {publicados or 'nada que publicar'}")
+        except Exception as e:
+            print("⚠ Error al recuperar el archivo de compras:", e)
+
+    # Archivo del historial de eliminados más viejo que N días
+    if retencion.DIAS > 0:
+        tareas.append(asyncio.create_task(_aplicar_retencion()))
+        print(f"✔ Retención del historial: {retencion.DIAS} días -> {retencion.DIRECTORIO}")
+
+    # Sketches de ventas: del archivo (y lo que falte) o reconstruidos desde la BD
+    if sketches.ACTIVO:
+        guardados = await asyncio.to_thread(sketches.cargar)
+        if guardados is not None:
+            # Antes de atender: las ventas nuevas no deben contarse dos veces
+            try:
+                async with AsyncSessionLocal() as db:
+                    if await sketches.coincide(db, guardados):
+                        sketches.sketches_ventas.adoptar(guardados)
+                        sumadas = await sketches.ponerse_al_dia(db)
+                        print(f"✔ Sketches cargados (+{sumadas} ventas nuevas)")
+                    else:
+                        print("⚠ Los sketches guardados no coinciden con la base, se reconstruyen")
+                        guardados = None
+            except Exception as e:
+                print("⚠ Error al cargar los sketches:", e)
+        tareas.append(asyncio.create_task(_mantener_sketches(reconstruir=guardados is None)))
+
+    # Reportes pesados en un pool de procesos (tabla `trabajos`)
+    if trabajos.ACTIVO:
+        tareas.append(asyncio.create_task(trabajos.planificador.ejecutar()))
+        print(f"✔ Trabajos en segundo plano: {trabajos.planificador.procesos} procesos")
+
+    # Pronósticos de demanda: en memoria y recalculados cada noche
+    if pronosticos.ACTIVO:
+        tareas.append(asyncio.create_task(_mantener_pronosticos()))
+
+    # Segmentación RFM de clientes: cortes en memoria y cálculo nocturno
+    if segmentacion.ACTIVO:
+        tareas.append(asyncio.create_task(_mantener_segmentacion()))
+
     yield
-    # Shutdown: nada por ahora
+
+    # Shutdown
+    for tarea in tareas:
+        tarea.cancel()
+        with suppress(asyncio.CancelledError):
+            await tarea
+    # Lo que quede en la cola de auditoría no se pierde al apagar
+    await auditoria.vaciar()
+    if sketches.ACTIVO and sketches.sketches_ventas.sucio:
+        try:
+            async with AsyncSessionLocal() as db:
+                await sketches.sketches_ventas.guardar(db)
+        except Exception as e:
+            print("⚠ Error al guardar los sketches:", e)
+
+
+async def _recargar_alertas_stock():
+    """Recoge lo que otros workers cambiaron (solo publica las diferencias)."""
+    while True:
+        await asyncio.sleep(alertas_stock.RESYNC_S)
+        try:
+            async with AsyncSessionLocal() as db:
+                await alertas_stock.alertas_stock.cargar(db)
+        except Exception as e:
+            print("⚠ Error al recargar las alertas de stock:", e)
+
+
+async def _mantener_pronosticos():
+    """Recarga los pronósticos si hay un cálculo nuevo y encola el de esta noche si falta."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                if await pronosticos.pronosticos.recargar_si_cambio(db):
+                    print(f"✔ Pronósticos cargados: {len(pronosticos.pronosticos.filas)} productos")
+                if not await trabajos.hay_trabajo(db, "pronosticos", trabajos.ultima_programacion(pronosticos.HORA)):
+                    await trabajos.encolar(db, "pronosticos", {})
+        except Exception as e:
+            print("⚠ Error al mantener los pronósticos:", e)
+        await asyncio.sleep(pronosticos.SONDEO_S)
+
+
+async def _mantener_segmentacion():
+    """Toma los cortes del último cálculo completo y encola el de esta noche si falta."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                if await segmentacion.segmentacion.recargar_si_cambio(db):
+                    print(f"✔ Segmentación de clientes: cortes del {segmentacion.segmentacion.calculado_en}")
+                if not await trabajos.hay_trabajo(db, "segmentacion", trabajos.ultima_programacion(segmentacion.HORA)):
+                    await trabajos.encolar(db, "segmentacion", {})
+        except Exception as e:
+            print("⚠ Error al mantener la segmentación:", e)
+        await asyncio.sleep(segmentacion.SONDEO_S)
+
+
+async def _asegurar_particiones():
+    """Una vez al día: que siempre existan las particiones de los próximos meses."""
+    while True:
+        await asyncio.sleep(24 * 3600)
+        try:
+            async with engine.begin() as conn:
+                creadas = await conn.run_sync(particiones.asegurar_particiones)
+            if creadas:
+                print("✔ Particiones creadas:", ", ".join(creadas))
+        except Exception as e:
+            print("⚠ Error al crear particiones de compras:", e)
+
+
+async def _aplicar_retencion():
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                movidas = await retencion.aplicar_retencion(db)
+            if movidas:
+                print(f"✔ Historial archivado: {movidas} filas")
+        except Exception as e:
+            print("⚠ Error al archivar el historial:", e)
+        await asyncio.sleep(retencion.CADA_S)
+
+
+async def _mantener_sketches(reconstruir: bool):
+    """Sin archivo: reconstrucción en segundo plano. Después, guardado periódico."""
+    if reconstruir:
+        try:
+            async with AsyncSessionLocal() as db:
+                await sketches.reconstruir(db)
+            print(f"✔ Sketches reconstruidos: {sketches.sketches_ventas.estado()['ventas']} ventas")
+        except Exception as e:
+            print("⚠ Error al reconstruir los sketches:", e)
+    while True:
+        await asyncio.sleep(sketches.GUARDAR_S)
+        if sketches.sketches_ventas.sucio:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await sketches.sketches_ventas.guardar(db)
+            except Exception as e:
+                print("⚠ Error al guardar los sketches:", e)
+
+
+async def _resincronizar_catalogo():
+    """Recoge periódicamente lo que otros workers escribieron."""
+    while True:
+        await asyncio.sleep(CATALOGO_RESYNC_S)
+        try:
+            async with AsyncSessionLocal() as db:
+                await catalogo.verificar(db, reparar=True)
+        except Exception as e:
+            print("⚠ Error al resincronizar el catálogo:", e)
 
 
 app = FastAPI(
@@ -51,20 +264,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 📂 Archivos estáticos (CSS, JS, imágenes)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# 🗃 `Cache-Control: no-cache` salta la caché de consultas en esa petición
+app.add_middleware(OmitirCacheMiddleware)
+
+# 🗜 Compresión br/zstd/gzip de las respuestas de la API (COMPRESION_*)
+config_compresion = compresion_desde_entorno()
+if config_compresion:
+    app.add_middleware(CompresionMiddleware, **config_compresion)
+
+# 🚦 Control de admisión / timeout por petición (ADMISION_*)
+config_admision = admision_desde_entorno()
+if config_admision:
+    app.add_middleware(ControlAdmisionMiddleware, **config_admision)
+
+# 🎙 Captura de tráfico (opt-in con TRAFICO_CAPTURA=<ruta.jsonl>)
+# Se añade después para quedar por fuera y registrar también los 503.
+if ruta_captura():
+    app.add_middleware(CapturaTraficoMiddleware, ruta=ruta_captura())
+
+# 📂 Archivos estáticos (CSS, JS, imágenes); static/dist/ con huella y precomprimido
+app.mount("/static", StaticPrecomprimidos(directory="static"), name="static")
 
 
 # ==========================
 #   RUTAS BÁSICAS
 # ==========================
 
-@app.get("/", tags=["Home"])
-async def root(request: Request):
-    """Página de inicio."""
-    return templates.TemplateResponse("index.html", {"request": request})
-
-
 @app.get("/health", tags=["Health"])
 async def health():
     """Endpoint simple para verificar que la API está viva."""
@@ -72,124 +297,10 @@ async def health():
 
 
 # ==========================
-#   PÁGINAS HTML (Rutas Simplificadas)
+#   PÁGINAS HTML (tabla en routers/router_paginas.py)
 # ==========================
 
-# ---------- USUARIOS ----------
-
-@app.get("/usuarios", tags=["Pages"])
-async def usuarios_read_page(request: Request):
-    """Vista principal y listado de usuarios."""
-    return templates.TemplateResponse("usuarios/read.html", {"request": request})
-
-@app.get("/usuarios/create", tags=["Pages"])
-async def usuarios_create_page(request: Request):
-    return templates.TemplateResponse("usuarios/create.html", {"request": request})
-
-@app.get("/usuarios/update", tags=["Pages"])
-async def usuarios_update_page(request: Request):
-    return templates.TemplateResponse("usuarios/update.html", {"request": request})
-
-# ---------- PRODUCTOS ----------
-
-@app.get("/productos", tags=["Pages"])
-async def productos_read_page(request: Request):
-    """Vista principal y listado de productos."""
-    return templates.TemplateResponse("productos/read.html", {"request": request})
-
-@app.get("/productos/create", tags=["Pages"])
-async def productos_create_page(request: Request):
-    return templates.TemplateResponse("productos/create.html", {"request": request})
-
-@app.get("/productos/update", tags=["Pages"])
-async def productos_update_page(request: Request):
-    return templates.TemplateResponse("productos/update.html", {"request": request})
-
-@app.get("/productos/delete", tags=["Pages"])
-async def productos_delete_page(request: Request):
-    return templates.TemplateResponse("productos/delete.html", {"request": request})
-
-
-# ---------- CLIENTES ----------
-
-@app.get("/clientes", tags=["Pages"])
-async def clientes_read_page(request: Request):
-    """Vista principal y listado de clientes."""
-    return templates.TemplateResponse("clientes/read.html", {"request": request})
-
-@app.get("/clientes/create", tags=["Pages"])
-async def clientes_create_page(request: Request):
-    return templates.TemplateResponse("clientes/create.html", {"request": request})
-
-@app.get("/clientes/update", tags=["Pages"])
-async def clientes_update_page(request: Request):
-    return templates.TemplateResponse("clientes/update.html", {"request": request})
-
-@app.get("/clientes/delete", tags=["Pages"])
-async def clientes_delete_page(request: Request):
-    return templates.TemplateResponse("clientes/delete.html", {"request": request})
-
-
-# ---------- VENTAS (COMPRAS) ----------
-
-@app.get("/ventas", tags=["Pages"])
-async def ventas_read_page(request: Request):
-    """Vista principal y listado de ventas."""
-    return templates.TemplateResponse("ventas/read.html", {"request": request})
-
-@app.get("/ventas/create", tags=["Pages"])
-async def ventas_create_page(request: Request):
-    return templates.TemplateResponse("ventas/create.html", {"request": request})
-
-@app.get("/ventas/update", tags=["Pages"])
-async def ventas_update_page(request: Request):
-    return templates.TemplateResponse("ventas/update.html", {"request": request})
-
-@app.get("/ventas/delete", tags=["Pages"])
-async def ventas_delete_page(request: Request):
-    return templates.TemplateResponse("ventas/delete.html", {"request": request})
-
-
-# ---------- CATEGORÍAS ----------
-
-@app.get("/categorias", tags=["Pages"])
-async def categorias_read_page(request: Request):
-    """Vista principal y listado de categorías."""
-    return templates.TemplateResponse("categorias/read.html", {"request": request})
-
-@app.get("/categorias/create", tags=["Pages"])
-async def categorias_create_page(request: Request):
-    return templates.TemplateResponse("categorias/create.html", {"request": request})
-
-@app.get("/categorias/update", tags=["Pages"])
-async def categorias_update_page(request: Request):
-    return templates.TemplateResponse("categorias/update.html", {"request": request})
-
-@app.get("/categorias/delete", tags=["Pages"])
-async def categorias_delete_page(request: Request):
-    return templates.TemplateResponse("categorias/delete.html", {"request": request})
-
-
-# ---------- HISTORIAL, PLANIFICACIÓN, INFO PROYECTO ----------
-
-@app.get("/historial", tags=["Pages"])
-async def historial_page(request: Request):
-    return templates.TemplateResponse("historial.html", {"request": request})
-
-
-@app.get("/planning", tags=["Pages"])
-async def planning_page(request: Request):
-    return templates.TemplateResponse("planning.html", {"request": request})
-
-
-@app.get("/informacion_del_proyecto", tags=["Pages"])
-async def informacion_del_proyecto_page(request: Request):
-    return templates.TemplateResponse("informacion_del_proyecto.html", {"request": request})
-
-
-@app.get("/graficas", tags=["Pages"])
-async def graficas_page(request: Request):
-    return templates.TemplateResponse("graficas.html", {"request": request})
+app.include_router(paginas_router)
 
 
 # ==========================
@@ -200,5 +311,12 @@ app.include_router(usuarios_router)
 app.include_router(productos_router)
 app.include_router(clientes_router)
 app.include_router(compras_router)
+app.include_router(ventas_router)
 app.include_router(categorias_router)
-app.include_router(historial_router)
\ No newline at end of file
+app.include_router(historial_router)
+app.include_router(metricas_router)
+app.include_router(sync_router)
+app.include_router(particiones_router)
+app.include_router(estadisticas_router)
+app.include_router(trabajos_router)
+app.include_router(stock_router)
\ No newline at end of file
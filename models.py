@@ -6,9 +6,12 @@ from sqlalchemy import (
     Float,
     DateTime,
     ForeignKey,
+    JSON,
     Boolean,
     func,
     and_,
+    Index,
+    literal_column,
 )
 from sqlalchemy.orm import relationship, foreign
 from sqlalchemy.dialects.postgresql import JSONB
@@ -201,6 +204,8 @@ class Compra(Base):
 
     cliente_id = Column(Integer, ForeignKey("clientes.id"), nullable=False)
     producto_id = Column(Integer, ForeignKey("productos.id"), nullable=False)
+    # Venta (canasta) a la que pertenece esta línea; NULL en compras sueltas
+    venta_id = Column(Integer, ForeignKey("ventas.id"), nullable=True, index=True)
 
     cantidad = Column(Integer, nullable=False, default=1)
 
@@ -208,15 +213,19 @@ class Compra(Base):
     precio_unitario_aplicado = Column(Float, nullable=False)
     total = Column(Float, nullable=False)
 
+    # Indexada: los listados filtran por rango de fechas (y en Postgres
+    # puede ser la clave de partición, ver particiones.py)
     fecha = Column(
         DateTime(timezone=True),
         server_default=func.now(),
         nullable=False,
+        index=True,
     )
 
     # Relaciones
     cliente = relationship("Cliente", back_populates="compras")
     producto = relationship("Producto", back_populates="compras")
+    venta = relationship("Venta", back_populates="lineas")
     multimedia = relationship(
         "Multimedia",
         primaryjoin="and_(foreign(Multimedia.model_id)==Compra.id, Multimedia.model_type=='Compra')",
@@ -224,9 +233,34 @@ class Compra(Base):
     )
 
 
+# -----------------------------
+# MODELO: VENTA (cabecera de una canasta)
+# -----------------------------
+class Venta(Base):
+    __tablename__ = "ventas"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    cliente_id = Column(Integer, ForeignKey("clientes.id"), nullable=False, index=True)
+    total = Column(Float, nullable=False, default=0)
+
+    fecha = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+    # Relaciones: cada línea es una Compra, así /compras sigue viéndolas
+    cliente = relationship("Cliente")
+    lineas = relationship("Compra", back_populates="venta", order_by="Compra.id")
+
+
 # -----------------------------
 # HISTORIAL DE ELIMINADOS
 # -----------------------------
+# Claves de `datos` con índice propio en SQLite (en Postgres las cubre el GIN)
+CLAVES_HISTORIAL_SQLITE = ("nombre", "cedula", "cliente_id", "producto_id")
+
+
 class HistorialEliminados(Base):
     __tablename__ = "historial_eliminados"
 
@@ -236,11 +270,158 @@ class HistorialEliminados(Base):
     tabla = Column(String(50), nullable=False)
     # id del registro eliminado en esa tabla
     registro_id = Column(Integer, nullable=False)
-    # snapshot en JSONB (Postgres lo soporta sin problema)
-    datos = Column(JSONB, nullable=False, default=dict)
+    # snapshot en JSONB en Postgres; JSON plano en SQLite (desarrollo/benchmarks)
+    datos = Column(JSON().with_variant(JSONB, "postgresql"), nullable=False, default=dict)
 
     eliminado_en = Column(
         DateTime(timezone=True),
         server_default=func.now(),
         nullable=False,
     )
+
+    __table_args__ = (
+        Index("ix_historial_tabla_registro", "tabla", "registro_id"),
+        Index("ix_historial_eliminado_en", "eliminado_en"),
+        # Búsqueda dentro del snapshot: datos @> '{...}' usa este índice
+        Index(
+            "ix_historial_datos_gin",
+            "datos",
+            postgresql_using="gin",
+            postgresql_ops={"datos": "jsonb_path_ops"},
+        ).ddl_if(dialect="postgresql"),
+        # SQLite no tiene GIN: un índice por expresión para las claves más buscadas
+        *(
+            Index(
+                f"ix_historial_datos_{clave}",
+                func.json_extract(literal_column("datos"), literal_column(f"'$.{clave}'")),
+            ).ddl_if(dialect="sqlite")
+            for clave in CLAVES_HISTORIAL_SQLITE
+        ),
+    )
+
+
+# -----------------------------
+# DIARIO DE CAMBIOS (SINCRONIZACIÓN POS)
+# -----------------------------
+class Cambio(Base):
+    __tablename__ = "cambios"
+
+    # El id creciente es el token de sincronización
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+
+    tabla = Column(String(50), nullable=False)  # productos / categorias / clientes
+    registro_id = Column(Integer, nullable=False)
+    operacion = Column(String(10), nullable=False)  # insert / update / delete
+
+    creado_en = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+
+# -----------------------------
+# TRABAJOS EN SEGUNDO PLANO (REPORTES)
+# -----------------------------
+class Trabajo(Base):
+    __tablename__ = "trabajos"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+
+    tipo = Column(String(50), nullable=False)  # ver trabajos.REPORTES
+    parametros = Column(JSON, nullable=False, default=dict)
+    # pendiente / ejecutando / cancelando / terminado / error / cancelado
+    estado = Column(String(20), nullable=False, default="pendiente")
+    progreso = Column(Float, nullable=False, default=0)  # 0..1
+    mensaje = Column(String(500), nullable=True)
+    filas = Column(Integer, nullable=True)  # filas del resultado
+    archivo = Column(String(255), nullable=True)
+    intentos = Column(Integer, nullable=False, default=0)
+
+    creado_en = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+    iniciado_en = Column(DateTime(timezone=True), nullable=True)
+    # Latido del proceso que lo ejecuta (ver trabajos.ABANDONO_S)
+    actualizado_en = Column(DateTime(timezone=True), nullable=True)
+    terminado_en = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (Index("ix_trabajos_estado", "estado", "id"),)
+
+
+# -----------------------------
+# UMBRALES DE STOCK (ALERTAS DE REPOSICIÓN)
+# -----------------------------
+class UmbralStock(Base):
+    __tablename__ = "umbrales_stock"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+
+    # Uno de los dos: el del producto manda sobre el de su categoría
+    producto_id = Column(Integer, ForeignKey("productos.id", ondelete="CASCADE"), nullable=True, unique=True)
+    categoria_id = Column(Integer, ForeignKey("categorias.id", ondelete="CASCADE"), nullable=True, unique=True)
+
+    # Alerta cuando la cantidad queda en este valor o por debajo
+    minimo = Column(Integer, nullable=False)
+
+    actualizado_en = Column(
+        DateTime(timezone=True),
+        default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+
+# -----------------------------
+# PRONÓSTICOS DE DEMANDA (REPOSICIÓN)
+# -----------------------------
+class Pronostico(Base):
+    __tablename__ = "pronosticos"
+
+    # Una fila por producto; el cálculo nocturno reemplaza la tabla entera
+    producto_id = Column(Integer, ForeignKey("productos.id", ondelete="CASCADE"), primary_key=True)
+    calculado_en = Column(DateTime(timezone=True), nullable=False)
+    dias = Column(Integer, nullable=False)  # días de historia usados
+    unidades = Column(Integer, nullable=False, default=0)  # vendidas en esos días
+
+    # Unidades por día
+    promedio_7 = Column(Float, nullable=False, default=0)
+    promedio_28 = Column(Float, nullable=False, default=0)
+    demanda_diaria = Column(Float, nullable=False, default=0)  # suavizado exponencial
+    desvio = Column(Float, nullable=False, default=0)
+    # Factor de cada día de la semana (lunes..domingo), promedio 1
+    estacionalidad = Column(JSON, nullable=False, default=list)
+
+    punto_reorden = Column(Float, nullable=False, default=0)
+    stock_objetivo = Column(Float, nullable=False, default=0)
+
+
+# -----------------------------
+# SEGMENTACIÓN RFM DE CLIENTES
+# -----------------------------
+class RfmCliente(Base):
+    __tablename__ = "rfm_clientes"
+
+    # La recalcula entera el trabajo `segmentacion`; cada venta la mantiene al día
+    cliente_id = Column(Integer, ForeignKey("clientes.id", ondelete="CASCADE"), primary_key=True)
+
+    ultima_compra = Column(DateTime(timezone=True), nullable=True)
+    visitas = Column(Integer, nullable=False, default=0)  # ventas + compras sueltas
+    monto = Column(Float, nullable=False, default=0)
+
+    # Puntajes 1..5 (quintiles entre los clientes con compras); 0 = sin compras
+    recencia = Column(Integer, nullable=False, default=0)
+    frecuencia = Column(Integer, nullable=False, default=0)
+    monetario = Column(Integer, nullable=False, default=0)
+    segmento = Column(String(20), nullable=False, default="sin_compras", index=True)
+    # Del último cálculo completo (NULL en los creados después)
+    calculado_en = Column(DateTime(timezone=True), nullable=True)
+
+    actualizado_en = Column(
+        DateTime(timezone=True),
+        default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
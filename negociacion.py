@@ -0,0 +1,142 @@
+# negociacion.py
+"""
+Negociación de formato para los routers de la API (terminales POS).
+
+- `Accept: application/msgpack` -> la respuesta va en MessagePack.
+- `Accept: ...; layout=columnar` (msgpack o json) -> las listas de objetos
+  van como {"columnas": [...], "filas": [[...], ...]} en lugar de repetir
+  las claves en cada fila.
+- `Content-Type: application/msgpack` en el cuerpo de la petición se acepta
+  igual que JSON (solo rutas con cuerpo JSON; los formularios no cambian).
+
+Los errores (HTTPException, validación) siguen saliendo en JSON.
+msgpack es opcional: sin él todo se responde en JSON y un cuerpo msgpack
+devuelve 415.
+"""
+from __future__ import annotations
+
+from contextvars import ContextVar
+from typing import Any, Callable, Coroutine, List, NamedTuple
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+MSGPACK = "application/msgpack"
+TIPOS_MSGPACK = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+
+
+class Formato(NamedTuple):
+    msgpack: bool = False
+    columnar: bool = False
+
+
+_formato: ContextVar[Formato] = ContextVar("formato_respuesta", default=Formato())
+
+
+def formato_de(accept: str) -> Formato:
+    """Lee Accept; msgpack solo si el cliente lo pide explícitamente."""
+    usar_msgpack = False
+    en_columnas = False
+    for parte in accept.lower().split(","):
+        tipo, *parametros = (p.strip() for p in parte.split(";"))
+        if tipo in TIPOS_MSGPACK and msgpack is not None:
+            usar_msgpack = True
+        elif tipo not in ("application/json", "*/*"):
+            continue
+        if "layout=columnar" in parametros:
+            en_columnas = True
+        if usar_msgpack:
+            break
+    return Formato(usar_msgpack, en_columnas)
+
+
+def columnar(contenido: Any) -> Any:
+    """Lista de dicts con las mismas claves -> una cabecera + filas de valores."""
+    if not isinstance(contenido, list) or not contenido or not all(isinstance(f, dict) for f in contenido):
+        return contenido
+    columnas: List[str] = list(contenido[0])
+    if any(len(fila) != len(columnas) for fila in contenido):
+        return contenido
+    try:
+        filas = [[fila[c] for c in columnas] for fila in contenido]
+    except KeyError:
+        return contenido
+    return {"columnas": columnas, "filas": filas}
+
+
+def _empaquetar(contenido: Any) -> bytes:
+    return msgpack.packb(contenido, use_bin_type=True)
+
+
+# ======================================================
+# ================== RESPUESTA =========================
+# ======================================================
+
+class RespuestaNegociada(JSONResponse):
+    """JSONResponse que cambia a msgpack/columnar según el Accept de la petición."""
+
+    def __init__(self, content: Any, *args, **kwargs):
+        self._formato_actual = _formato.get()
+        if self._formato_actual.msgpack:
+            self.media_type = MSGPACK
+        super().__init__(content, *args, **kwargs)
+        # El mismo URL puede responder JSON o msgpack
+        self.headers.setdefault("vary", "Accept")
+
+    def render(self, content: Any) -> bytes:
+        formato = self._formato_actual
+        if formato.columnar:
+            content = columnar(content)
+        if formato.msgpack:
+            return _empaquetar(content)
+        return super().render(content)
+
+
+# ======================================================
+# =================== PETICIÓN =========================
+# ======================================================
+
+class _PeticionMsgpack(Request):
+    """Request cuyo cuerpo msgpack se presenta a FastAPI como JSON ya decodificado."""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            try:
+                self._json = msgpack.unpackb(await self.body(), raw=False)
+            except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError):
+                raise HTTPException(status_code=400, detail="Cuerpo msgpack inválido")
+        return self._json
+
+
+def _como_json(request: Request) -> Request:
+    headers = [
+        (clave, b"application/json" if clave == b"content-type" else valor)
+        for clave, valor in request.scope["headers"]
+    ]
+    return _PeticionMsgpack({**request.scope, "headers": headers}, request.receive)
+
+
+class RutaNegociada(APIRoute):
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        original = super().get_route_handler()
+
+        async def handler(request: Request) -> Response:
+            tipo = request.headers.get("content-type", "").split(";")[0].strip().lower()
+            if tipo in TIPOS_MSGPACK:
+                if msgpack is None:
+                    raise HTTPException(status_code=415, detail="msgpack no está disponible en este servidor")
+                request = _como_json(request)
+
+            token = _formato.set(formato_de(request.headers.get("accept", "")))
+            try:
+                return await original(request)
+            finally:
+                _formato.reset(token)
+
+        return handler
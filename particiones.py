@@ -0,0 +1,214 @@
+# particiones.py
+"""
+Particiones mensuales de `compras` por `fecha` (Postgres).
+
+Con COMPRAS_PARTICIONES=1 y Postgres, al arrancar:
+
+- Si `compras` todavía es una tabla normal, se convierte a tabla
+  particionada (PARTITION BY RANGE (fecha)), con una partición por mes de
+  los datos existentes y una `compras_default` para lo que no caiga en
+  ninguna. Los datos se copian y la tabla vieja se borra, todo en una
+  transacción.
+- Se crean las particiones del mes actual y de los
+  COMPRAS_PARTICIONES_FUTURAS meses siguientes (por defecto 3). Una tarea
+  diaria las mantiene al día.
+
+Las consultas con filtro de fecha (listar_compras) solo leen las
+particiones del rango. Un mes viejo se puede separar
+(`separar_particion`): queda como tabla suelta para archivarla (pg_dump) y
+deja de verse en /compras.
+
+SQLite no tiene particiones. Ahí la API es la misma, pero:
+- `asegurar_particiones` no hace nada;
+- `listar_particiones` agrupa por mes con el índice de `fecha`;
+- `separar_particion` mueve las filas del mes a una tabla compras_AAAA_MM.
+
+Todas las funciones reciben una Connection síncrona (conn.run_sync), igual
+que esquema.py.
+"""
+from __future__ import annotations
+
+import os
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from models import Compra
+
+ACTIVO = os.getenv("COMPRAS_PARTICIONES", "0") == "1"
+MESES_FUTUROS = int(os.getenv("COMPRAS_PARTICIONES_FUTURAS", "3"))
+
+TABLA = "compras"
+DEFAULT = "compras_default"
+
+
+def _mes(momento: date) -> date:
+    return date(momento.year, momento.month, 1)
+
+
+def _siguiente(mes: date) -> date:
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+
+def _parsear_mes(texto: str) -> date:
+    """'2024-01' -> date(2024, 1, 1)."""
+    try:
+        return datetime.strptime(texto, "%Y-%m").date()
+    except ValueError:
+        raise ValueError(f"Mes inválido: {texto!r} (se espera AAAA-MM)")
+
+
+def nombre_particion(mes: date) -> str:
+    return f"{TABLA}_{mes:%Y_%m}"
+
+
+def _es_postgres(conn: Connection) -> bool:
+    return conn.dialect.name == "postgresql"
+
+
+def esta_particionada(conn: Connection) -> bool:
+    if not _es_postgres(conn):
+        return False
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = :t AND relkind IN ('r', 'p')"),
+        {"t": TABLA},
+    ).scalar()
+    return relkind == "p"
+
+
+def _crear_particion(conn: Connection, mes: date) -> str:
+    nombre = nombre_particion(mes)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {nombre} PARTITION OF {TABLA} "
+        f"FOR VALUES FROM ('{mes.isoformat()}') TO ('{_siguiente(mes).isoformat()}')"
+    ))
+    return nombre
+
+
+# ======================================================
+# ==================== CONVERSIÓN ======================
+# ======================================================
+
+def convertir(conn: Connection) -> bool:
+    """Pasa `compras` a tabla particionada por mes. False si no aplica o ya estaba."""
+    if not ACTIVO or not _es_postgres(conn) or esta_particionada(conn):
+        return False
+
+    vieja = f"{TABLA}_sin_particionar"
+    secuencia = conn.execute(text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": TABLA}).scalar()
+    conn.execute(text(f"ALTER TABLE {TABLA} RENAME TO {vieja}"))
+    conn.execute(text(f"ALTER TABLE {vieja} RENAME CONSTRAINT {TABLA}_pkey TO {vieja}_pkey"))
+
+    # La clave primaria tiene que incluir la columna de partición
+    conn.execute(text(
+        f"CREATE TABLE {TABLA} (LIKE {vieja} INCLUDING DEFAULTS, PRIMARY KEY (id, fecha)) "
+        f"PARTITION BY RANGE (fecha)"
+    ))
+    for fk in Compra.__table__.foreign_keys:
+        conn.execute(text(
+            f"ALTER TABLE {TABLA} ADD FOREIGN KEY ({fk.parent.name}) "
+            f"REFERENCES {fk.column.table.name} ({fk.column.name})"
+        ))
+    if secuencia:
+        # Si no, borrar la tabla vieja se lleva la secuencia de ids
+        conn.execute(text(f"ALTER SEQUENCE {secuencia} OWNED BY {TABLA}.id"))
+
+    rango = conn.execute(text(f"SELECT min(fecha), max(fecha) FROM {vieja}")).one()
+    hoy = datetime.now(timezone.utc).date()
+    mes = _mes(rango[0].date() if rango[0] else hoy)
+    ultimo = _mes(max(rango[1].date() if rango[1] else hoy, hoy))
+    while mes <= ultimo:
+        _crear_particion(conn, mes)
+        mes = _siguiente(mes)
+    conn.execute(text(f"CREATE TABLE {DEFAULT} PARTITION OF {TABLA} DEFAULT"))
+
+    conn.execute(text(f"INSERT INTO {TABLA} SELECT * FROM {vieja}"))
+    conn.execute(text(f"DROP TABLE {vieja}"))
+    # Índices en la tabla padre: Postgres los crea en cada partición
+    for indice in Compra.__table__.indexes:
+        indice.create(conn)
+    return True
+
+
+# ======================================================
+# ============ MANTENIMIENTO Y CONSULTA ================
+# ======================================================
+
+def asegurar_particiones(conn: Connection, meses_futuros: int = MESES_FUTUROS) -> List[str]:
+    """Crea las particiones que falten del mes actual en adelante; devuelve las nuevas."""
+    if not esta_particionada(conn):
+        return []
+    existentes = {p["nombre"] for p in listar_particiones(conn)}
+    mes = _mes(datetime.now(timezone.utc).date())
+    creadas = []
+    for _ in range(meses_futuros + 1):
+        if nombre_particion(mes) not in existentes:
+            creadas.append(_crear_particion(conn, mes))
+        mes = _siguiente(mes)
+    return creadas
+
+
+def listar_particiones(conn: Connection) -> List[Dict[str, Any]]:
+    if esta_particionada(conn):
+        filas = conn.execute(text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint "
+            "FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :t ORDER BY c.relname"
+        ), {"t": TABLA}).all()
+        # reltuples es la estimación del último ANALYZE (-1 si nunca se analizó)
+        return [{"nombre": n, "rango": rango, "filas_estimadas": max(filas, 0)} for n, rango, filas in filas]
+
+    if _es_postgres(conn):
+        return []
+    # SQLite: meses "virtuales" + los meses ya separados
+    filas = conn.execute(text(
+        f"SELECT strftime('%Y-%m', fecha) AS mes, count(*) FROM {TABLA} GROUP BY mes ORDER BY mes"
+    )).all()
+    separadas = conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB :patron ORDER BY name"
+    ), {"patron": f"{TABLA}_[0-9][0-9][0-9][0-9]_[0-9][0-9]"}).scalars().all()
+    return [
+        {"nombre": nombre_particion(_parsear_mes(mes)), "mes": mes, "filas": n, "separada": False}
+        for mes, n in filas
+    ] + [{"nombre": nombre, "mes": nombre[-7:].replace("_", "-"), "separada": True} for nombre in separadas]
+
+
+def separar_particion(conn: Connection, mes_texto: str) -> Dict[str, Any]:
+    """
+    Saca un mes ya cerrado de `compras` y lo deja como tabla suelta
+    (compras_AAAA_MM) para archivarla o borrarla después.
+    """
+    mes = _parsear_mes(mes_texto)
+    if mes >= _mes(datetime.now(timezone.utc).date()):
+        raise ValueError("Solo se pueden separar meses ya cerrados")
+    nombre = nombre_particion(mes)
+
+    if esta_particionada(conn):
+        if nombre not in {p["nombre"] for p in listar_particiones(conn)}:
+            raise LookupError(f"No existe la partición {nombre}")
+        conn.execute(text(f"ALTER TABLE {TABLA} DETACH PARTITION {nombre}"))
+        return {"tabla": nombre, "modo": "detach"}
+
+    # Sin particiones: se copian las filas del mes a su tabla y se borran
+    desde, hasta = mes.isoformat(), _siguiente(mes).isoformat()
+    existe = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n" if not _es_postgres(conn)
+        else "SELECT 1 FROM pg_class WHERE relname = :n"
+    ), {"n": nombre}).scalar()
+    if existe:
+        raise LookupError(f"{nombre} ya fue separada")
+    filtro = f"fecha >= '{desde}' AND fecha < '{hasta}'"
+    conn.execute(text(f"CREATE TABLE {nombre} AS SELECT * FROM {TABLA} WHERE {filtro}"))
+    movidas = conn.execute(text(f"DELETE FROM {TABLA} WHERE {filtro}")).rowcount
+    return {"tabla": nombre, "modo": "copia", "filas": movidas}
+
+
+def preparar(conn: Connection) -> bool:
+    """Paso de esquema.py: conversión (una vez) + particiones futuras."""
+    convertida = convertir(conn)
+    creadas = asegurar_particiones(conn)
+    return convertida or bool(creadas)
@@ -0,0 +1,311 @@
+# pronosticos.py
+"""
+Pronóstico de demanda por producto y sugerencias de reposición.
+
+El cálculo es un trabajo más (tipo `pronosticos`, ver trabajos.py) y corre
+en el pool de procesos. Cada noche, pasada PRONOSTICOS_HORA (UTC), algún
+worker lo encola:
+
+- arma una matriz producto x día con las unidades vendidas en los últimos
+  `dias` días cerrados, de la tabla y del archivo, con un solo bincount;
+- sobre la matriz entera, todos los productos a la vez, calcula los
+  promedios móviles de 7 y 28 días, el factor de cada día de la semana, el
+  suavizado exponencial del nivel desestacionalizado y el desvío del error
+  de un paso;
+- reemplaza la tabla `pronosticos` (una fila por producto) y deja también
+  el CSV del trabajo.
+
+Cada worker tiene las filas en memoria y las recarga cuando cambia la
+fecha del cálculo: lo mira en cada consulta de reposición (una fila) y en
+el sondeo de fondo. Los días de stock y la cantidad a pedir dependen del
+stock de ese momento, así que se calculan al consultar: un acceso al dict y
+a lo sumo 7 pasos, sin importar cuántas ventas haya.
+
+Reposición (con plazo de entrega P y cobertura C en días):
+    seguridad     = z · desvío · √P
+    punto_reorden = demanda · P + seguridad
+    objetivo      = demanda · (P + C) + seguridad
+    sugerido      = objetivo - stock, si stock <= punto_reorden
+
+Variables de entorno:
+    PRONOSTICOS                  0 = no se calcula ni se carga
+    PRONOSTICOS_HORA             hora UTC del cálculo nocturno (por defecto 3)
+    PRONOSTICOS_DIAS             días de historia (por defecto 90)
+    PRONOSTICOS_ALFA             suavizado exponencial, 0..1 (por defecto 0.3)
+    PRONOSTICOS_PLAZO_DIAS       plazo de entrega del proveedor (por defecto 7)
+    PRONOSTICOS_COBERTURA_DIAS   días que debe cubrir cada pedido (por defecto 14)
+    PRONOSTICOS_Z                factor de nivel de servicio (por defecto 1.65, ~95 %)
+    PRONOSTICOS_SONDEO_S         cada cuánto se mira si hay cálculo nuevo (por defecto 300)
+"""
+from __future__ import annotations
+
+import csv
+import math
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, cast, delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from archivo_compras import archivo_compras, np
+from models import Compra, Producto, Pronostico
+
+ACTIVO = os.getenv("PRONOSTICOS", "1") != "0"
+HORA = int(os.getenv("PRONOSTICOS_HORA", "3"))
+DIAS = int(os.getenv("PRONOSTICOS_DIAS", "90"))
+ALFA = float(os.getenv("PRONOSTICOS_ALFA", "0.3"))
+PLAZO_DIAS = float(os.getenv("PRONOSTICOS_PLAZO_DIAS", "7"))
+COBERTURA_DIAS = float(os.getenv("PRONOSTICOS_COBERTURA_DIAS", "14"))
+Z = float(os.getenv("PRONOSTICOS_Z", "1.65"))
+SONDEO_S = float(os.getenv("PRONOSTICOS_SONDEO_S", "300"))
+
+LOTE = 50_000
+# Con pocas ventas el factor de cada día se acerca a 1: con este total de
+# unidades en la ventana, la mitad del efecto medido
+UNIDADES_ESTACIONALIDAD = 28
+
+DIAS_SEMANA = ("lun", "mar", "mie", "jue", "vie", "sab", "dom")
+
+
+def _ahora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _dia_semana(dias_epoch):
+    """Días desde 1970-01-01 (jueves) -> 0 = lunes ... 6 = domingo."""
+    return (dias_epoch + 3) % 7
+
+
+# ======================================================
+# =============== CÁLCULO (PROCESO HIJO) ===============
+# ======================================================
+
+def validar(parametros: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        dias = int(parametros.get("dias", DIAS))
+        alfa = float(parametros.get("alfa", ALFA))
+    except (TypeError, ValueError):
+        raise ValueError("'dias' y 'alfa' deben ser números")
+    if not 28 <= dias <= 730:
+        raise ValueError("'dias' debe estar entre 28 y 730")
+    if not 0 < alfa <= 1:
+        raise ValueError("'alfa' debe estar en (0, 1]")
+    return {"dias": dias, "alfa": alfa}
+
+
+def modelar(demanda, primer_dia: int, alfa: float) -> Dict[str, Any]:
+    """
+    `demanda`: unidades por producto (filas) y día (columnas), la columna 0
+    es `primer_dia` (días epoch). Todo vectorizado sobre los productos; el
+    único bucle es sobre los días.
+    """
+    n, dias = demanda.shape
+    semana = _dia_semana(np.arange(primer_dia, primer_dia + dias))
+    unidades = demanda.sum(axis=1)
+    media = unidades / dias
+
+    # Factor de cada día de la semana: su promedio sobre el promedio general
+    por_dia = np.stack([demanda[:, semana == d].mean(axis=1) for d in range(7)], axis=1)
+    crudo = np.divide(por_dia, media[:, None], out=np.ones((n, 7)), where=media[:, None] > 0)
+    peso = (unidades / (unidades + UNIDADES_ESTACIONALIDAD))[:, None]
+    factores = 1 + (crudo - 1) * peso
+    factores /= factores.mean(axis=1, keepdims=True)
+
+    # Suavizado exponencial del nivel (demanda diaria sin el efecto del día)
+    desestacionalizada = demanda / factores[:, semana]
+    nivel = desestacionalizada[:, :7].mean(axis=1)
+    errores = np.zeros(n)
+    for t in range(7, dias):
+        errores += (demanda[:, t] - nivel * factores[:, semana[t]]) ** 2
+        nivel += alfa * (desestacionalizada[:, t] - nivel)
+    desvio = np.sqrt(errores / (dias - 7))
+
+    seguridad = Z * desvio * math.sqrt(PLAZO_DIAS)
+    return {
+        "unidades": unidades,
+        "promedio_7": demanda[:, -7:].mean(axis=1),
+        "promedio_28": demanda[:, -28:].mean(axis=1),
+        "factores": factores,
+        "nivel": nivel,
+        "desvio": desvio,
+        "punto_reorden": nivel * PLAZO_DIAS + seguridad,
+        "objetivo": nivel * (PLAZO_DIAS + COBERTURA_DIAS) + seguridad,
+    }
+
+
+async def calcular(db: AsyncSession, parametros: Dict[str, Any], ruta: str, avance) -> int:
+    """Generador del trabajo `pronosticos` (ver trabajos.REPORTES)."""
+    if np is None:
+        raise RuntimeError("Los pronósticos necesitan NumPy")
+    dias, alfa = parametros["dias"], parametros["alfa"]
+    calculado_en = _ahora()
+    # Solo días completos: hoy queda afuera
+    hoy = int(calculado_en.timestamp()) // 86400
+    primer_dia = hoy - dias
+    desde = datetime.fromtimestamp(primer_dia * 86400, timezone.utc)
+    hasta = datetime.fromtimestamp(hoy * 86400, timezone.utc)
+    en_ventana = (Compra.fecha >= desde, Compra.fecha < hasta)
+
+    productos = (await db.execute(select(Producto.id, Producto.nombre).order_by(Producto.id))).all()
+    largo = (productos[-1][0] + 1) if productos else 1
+    demanda = np.zeros(largo * dias)
+
+    def acumular(ids, epochs, cantidad):
+        dia = epochs // 86400 - primer_dia
+        # Fuera de la ventana o de productos que ya no existen
+        ok = (dia >= 0) & (dia < dias) & (ids < largo)
+        demanda[:] += np.bincount(ids[ok] * dias + dia[ok], weights=cantidad[ok], minlength=largo * dias)
+
+    meses = [
+        m for m in (archivo_compras.meses() if archivo_compras.disponible else [])
+        if desde.strftime("%Y-%m") <= m <= hasta.strftime("%Y-%m")
+    ]
+    primero, ultimo = (await db.execute(select(func.min(Compra.id), func.max(Compra.id)).where(*en_ventana))).one()
+    pasos = len(meses) + max(0, ((ultimo or -1) - (primero or 0)) // LOTE + 1)
+    hechos = 0
+    for mes in meses:
+        m = archivo_compras.abrir(mes)
+        if m is not None and m.filas:
+            acumular(m["producto_id"].astype(np.int64), m["fecha"].astype(np.int64), m["cantidad"])
+        hechos += 1
+        await avance(hechos, pasos + 1)
+
+    # Por tramos de id, como los reportes (en SQLite una lectura larga bloquea las escrituras)
+    epoch = cast(func.extract("epoch", Compra.fecha), Integer)
+    for inicio in range(primero or 0, (ultimo or -1) + 1, LOTE):
+        q = await db.execute(
+            select(Compra.producto_id, epoch, Compra.cantidad)
+            .where(Compra.id >= inicio, Compra.id < inicio + LOTE, *en_ventana)
+        )
+        lote = q.all()
+        await db.commit()
+        if lote:
+            a = np.array(lote, dtype=np.int64)
+            acumular(a[:, 0], a[:, 1], a[:, 2].astype(np.float64))
+        hechos += 1
+        await avance(hechos, pasos + 1)
+
+    ids = np.array([p[0] for p in productos], dtype=np.int64)
+    r = modelar(demanda.reshape(largo, dias)[ids], primer_dia, alfa)
+
+    filas = [
+        {
+            "producto_id": int(ids[i]),
+            "calculado_en": calculado_en,
+            "dias": dias,
+            "unidades": int(r["unidades"][i]),
+            "promedio_7": round(float(r["promedio_7"][i]), 4),
+            "promedio_28": round(float(r["promedio_28"][i]), 4),
+            "demanda_diaria": round(float(r["nivel"][i]), 4),
+            "desvio": round(float(r["desvio"][i]), 4),
+            "estacionalidad": [round(float(f), 4) for f in r["factores"][i]],
+            "punto_reorden": round(float(r["punto_reorden"][i]), 2),
+            "stock_objetivo": round(float(r["objetivo"][i]), 2),
+        }
+        for i in range(len(ids))
+    ]
+    # Todo en una transacción: los workers ven el cálculo anterior o el nuevo entero
+    await db.execute(delete(Pronostico))
+    for i in range(0, len(filas), 1000):
+        await db.execute(insert(Pronostico), filas[i:i + 1000])
+    await db.commit()
+
+    nombres = dict(productos)
+    with open(ruta, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f)
+        escritor.writerow([
+            "producto_id", "nombre", "unidades", "promedio_7", "promedio_28", "demanda_diaria",
+            "desvio", *DIAS_SEMANA, "punto_reorden", "stock_objetivo",
+        ])
+        for fila in filas:
+            escritor.writerow([
+                fila["producto_id"], nombres.get(fila["producto_id"]), fila["unidades"],
+                fila["promedio_7"], fila["promedio_28"], fila["demanda_diaria"], fila["desvio"],
+                *fila["estacionalidad"], fila["punto_reorden"], fila["stock_objetivo"],
+            ])
+    return len(filas)
+
+
+# ======================================================
+# ============ CONSULTAS (EN CADA WORKER) ==============
+# ======================================================
+
+class Pronosticos:
+    def __init__(self):
+        self.listo = False
+        self.calculado_en: Optional[datetime] = None
+        self.filas: Dict[int, Dict[str, Any]] = {}
+        self.cargas = 0
+
+    async def cargar(self, db: AsyncSession) -> None:
+        q = await db.execute(select(Pronostico))
+        self.filas = {
+            p.producto_id: {c.key: getattr(p, c.key) for c in Pronostico.__table__.columns}
+            for p in q.scalars().all()
+        }
+        self.calculado_en = max((f["calculado_en"] for f in self.filas.values()), default=None)
+        self.listo = True
+        self.cargas += 1
+
+    async def recargar_si_cambio(self, db: AsyncSession) -> bool:
+        """Lee una sola fila; solo recarga si hubo un cálculo nuevo."""
+        # La tabla se reemplaza entera en cada cálculo: todas las filas tienen la misma fecha
+        ultimo = await db.scalar(select(Pronostico.calculado_en).limit(1))
+        if self.listo and ultimo == self.calculado_en:
+            return False
+        await self.cargar(db)
+        return True
+
+    def reposicion(self, producto_id: int, cantidad: int, hoy: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Pronóstico del producto con días de stock y cantidad a pedir según `cantidad`."""
+        fila = self.filas.get(producto_id)
+        if fila is None:
+            return None
+        demanda = fila["demanda_diaria"]
+        factores = fila["estacionalidad"]
+        hoy = int(_ahora().timestamp()) // 86400 if hoy is None else hoy
+
+        dias_restantes = None
+        if demanda > 0:
+            # Semanas enteras de una vez y el resto día por día (factor de cada día)
+            semanal = demanda * sum(factores)
+            semanas, resto = divmod(max(cantidad, 0), semanal)
+            dias_restantes = semanas * 7
+            dia = _dia_semana(hoy)
+            for k in range(7):
+                del_dia = demanda * factores[(dia + k) % 7]
+                if resto < del_dia:
+                    dias_restantes += k + resto / del_dia
+                    break
+                resto -= del_dia
+            dias_restantes = round(dias_restantes, 1)
+
+        sugerido = 0
+        if demanda > 0 and cantidad <= fila["punto_reorden"]:
+            sugerido = max(0, math.ceil(fila["stock_objetivo"] - cantidad))
+        return {**fila, "cantidad": cantidad, "dias_restantes": dias_restantes, "sugerido": sugerido}
+
+    def a_reponer(self, productos: Iterable[Tuple[int, Optional[int], int]], categoria_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """De (id, categoria_id, cantidad), los que hay que pedir: los que se acaban antes primero."""
+        hoy = int(_ahora().timestamp()) // 86400
+        resultado = []
+        for producto_id, categoria, cantidad in productos:
+            if categoria_id is not None and categoria != categoria_id:
+                continue
+            r = self.reposicion(producto_id, cantidad, hoy)
+            if r is not None and r["sugerido"] > 0:
+                resultado.append(r)
+        return sorted(resultado, key=lambda r: (r["dias_restantes"], r["producto_id"]))
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "activo": ACTIVO,
+            "listo": self.listo,
+            "productos": len(self.filas),
+            "calculado_en": self.calculado_en,
+            "cargas": self.cargas,
+        }
+
+
+pronosticos = Pronosticos()
@@ -0,0 +1,318 @@
+# retencion.py
+"""
+Retención y archivo de historial_eliminados.
+
+Las filas con más de HISTORIAL_RETENCION_DIAS días salen de la tabla y
+pasan a segmentos de archivo en disco:
+
+- Cada lote archivado es un segmento nuevo e inmutable (nunca se
+  reescribe): <id_min>-<id_max>.ndjson.z dentro de HISTORIAL_ARCHIVO_DIR.
+- Un segmento son bloques de NDJSON comprimidos con zlib, uno detrás de
+  otro. El índice (indice.json) guarda por bloque su posición, rango de ids,
+  rango de fechas, tablas y rango de registro_id por tabla, así una
+  búsqueda solo descomprime los bloques que pueden tener resultados.
+- Primero se escribe el segmento y el índice (os.replace, atómico) y
+  después se borran las filas de la tabla en la misma tanda. Si algo falla
+  entre medio, la fila queda en los dos lados y la lectura descarta el
+  duplicado por id.
+
+`compactar()` junta los segmentos chicos en uno solo.
+
+La retención debe correr en un solo proceso (el índice no tiene lock entre
+procesos); las lecturas sí pueden venir de cualquier worker.
+
+Variables de entorno:
+    HISTORIAL_RETENCION_DIAS     0 = desactivada (por defecto)
+    HISTORIAL_RETENCION_CADA_S   cada cuánto corre la tarea (por defecto 86400)
+    HISTORIAL_RETENCION_LOTE     filas por segmento / DELETE (por defecto 5000)
+    HISTORIAL_ARCHIVO_DIR        carpeta de los segmentos (por defecto archivo/historial)
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache_consultas import marcar_cambio
+from models import HistorialEliminados
+
+DIAS = int(os.getenv("HISTORIAL_RETENCION_DIAS", "0"))
+CADA_S = float(os.getenv("HISTORIAL_RETENCION_CADA_S", "86400"))
+LOTE = int(os.getenv("HISTORIAL_RETENCION_LOTE", "5000"))
+DIRECTORIO = os.getenv("HISTORIAL_ARCHIVO_DIR", os.path.join("archivo", "historial"))
+
+# Filas por bloque comprimido dentro de un segmento
+BLOQUE_FILAS = 1000
+# Segmentos por debajo de este tamaño se juntan al compactar
+SEGMENTO_MIN_BYTES = 1024 * 1024
+
+
+def _utc(momento: datetime) -> datetime:
+    return momento if momento.tzinfo else momento.replace(tzinfo=timezone.utc)
+
+
+def _fecha(texto: str) -> datetime:
+    return _utc(datetime.fromisoformat(texto))
+
+
+def fila_a_dict(obj: HistorialEliminados) -> Dict[str, Any]:
+    return {
+        "id": obj.id,
+        "tabla": obj.tabla,
+        "registro_id": obj.registro_id,
+        "datos": obj.datos,
+        "eliminado_en": _utc(obj.eliminado_en).isoformat(),
+    }
+
+
+def _coincide(
+    fila: Dict[str, Any],
+    tabla: Optional[str],
+    registro_id: Optional[int],
+    desde: Optional[datetime],
+    hasta: Optional[datetime],
+    contiene: Optional[Dict[str, Any]],
+    antes_de: Optional[int],
+) -> bool:
+    """Los mismos filtros que crud.buscar_historial, sobre una fila archivada."""
+    if antes_de is not None and fila["id"] >= antes_de:
+        return False
+    if tabla and fila["tabla"] != tabla:
+        return False
+    if registro_id is not None and fila["registro_id"] != registro_id:
+        return False
+    if desde is not None or hasta is not None:
+        momento = _fecha(fila["eliminado_en"])
+        if desde is not None and momento < desde:
+            return False
+        if hasta is not None and momento > hasta:
+            return False
+    if contiene:
+        datos = fila["datos"] or {}
+        return all(clave in datos and datos[clave] == valor for clave, valor in contiene.items())
+    return True
+
+
+def _registro_en_bloque(bloque: Dict[str, Any], tabla: Optional[str], registro_id: int) -> bool:
+    """Según el índice, ¿puede el bloque tener ese registro_id (en esa tabla)?"""
+    registros = bloque.get("registros")
+    if registros is None:
+        # Índice de antes de guardar los rangos: hay que leer el bloque
+        return True
+    rangos = [registros[tabla]] if tabla else list(registros.values())
+    return any(minimo <= registro_id <= maximo for minimo, maximo in rangos)
+
+
+# ======================================================
+# ===================== ARCHIVO ========================
+# ======================================================
+
+class ArchivoHistorial:
+    def __init__(self, directorio: str = DIRECTORIO, bloque_filas: int = BLOQUE_FILAS):
+        self.directorio = directorio
+        self.bloque_filas = bloque_filas
+        # (mtime del índice, contenido)
+        self._indice: Tuple[float, Dict[str, Any]] = (-1.0, {"segmentos": []})
+
+    @property
+    def ruta_indice(self) -> str:
+        return os.path.join(self.directorio, "indice.json")
+
+    def indice(self) -> Dict[str, Any]:
+        """Se relee si otro proceso lo reescribió."""
+        try:
+            mtime = os.path.getmtime(self.ruta_indice)
+        except OSError:
+            return {"segmentos": []}
+        if mtime != self._indice[0]:
+            with open(self.ruta_indice, encoding="utf-8") as f:
+                self._indice = (mtime, json.load(f))
+        return self._indice[1]
+
+    def _guardar_indice(self, indice: Dict[str, Any]) -> None:
+        temporal = self.ruta_indice + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(indice, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.ruta_indice)
+
+    # ---------- escritura ----------
+
+    def _escribir_archivo(self, filas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Escribe un segmento nuevo con `filas` (ordenadas por id) y devuelve su entrada de índice."""
+        os.makedirs(self.directorio, exist_ok=True)
+        nombre = f"{filas[0]['id']:012d}-{filas[-1]['id']:012d}.ndjson.z"
+        ruta = os.path.join(self.directorio, nombre)
+
+        bloques = []
+        posicion = 0
+        with open(ruta + ".tmp", "wb") as f:
+            for i in range(0, len(filas), self.bloque_filas):
+                parte = filas[i:i + self.bloque_filas]
+                ndjson = "".join(json.dumps(fila, ensure_ascii=False) + "\n" for fila in parte)
+                comprimido = zlib.compress(ndjson.encode("utf-8"), 9)
+                f.write(comprimido)
+                fechas = [fila["eliminado_en"] for fila in parte]
+                registros: Dict[str, List[int]] = {}
+                for fila in parte:
+                    rango = registros.setdefault(fila["tabla"], [fila["registro_id"], fila["registro_id"]])
+                    rango[0] = min(rango[0], fila["registro_id"])
+                    rango[1] = max(rango[1], fila["registro_id"])
+                bloques.append({
+                    "offset": posicion,
+                    "bytes": len(comprimido),
+                    "filas": len(parte),
+                    "id_min": parte[0]["id"],
+                    "id_max": parte[-1]["id"],
+                    "desde": min(fechas),
+                    "hasta": max(fechas),
+                    "tablas": sorted(registros),
+                    # Por tabla, [registro_id mínimo, máximo]
+                    "registros": registros,
+                })
+                posicion += len(comprimido)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(ruta + ".tmp", ruta)
+        return {"archivo": nombre, "bytes": posicion, "filas": len(filas), "bloques": bloques}
+
+    def agregar_segmento(self, filas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        segmento = self._escribir_archivo(sorted(filas, key=lambda fila: fila["id"]))
+        indice = self.indice()
+        self._guardar_indice({"segmentos": indice["segmentos"] + [segmento]})
+        return segmento
+
+    def compactar(self, min_bytes: int = SEGMENTO_MIN_BYTES) -> int:
+        """Junta en uno los segmentos menores a `min_bytes`; devuelve cuántos juntó."""
+        indice = self.indice()
+        chicos = [s for s in indice["segmentos"] if s["bytes"] < min_bytes]
+        if len(chicos) < 2:
+            return 0
+        filas: Dict[int, Dict[str, Any]] = {}
+        for segmento in chicos:
+            for bloque in segmento["bloques"]:
+                for fila in self._leer_bloque(segmento["archivo"], bloque):
+                    filas[fila["id"]] = fila  # de paso quita duplicados
+        nuevo = self._escribir_archivo([filas[i] for i in sorted(filas)])
+        nombres = {s["archivo"] for s in chicos}
+        restantes = [s for s in indice["segmentos"] if s["archivo"] not in nombres]
+        self._guardar_indice({"segmentos": restantes + [nuevo]})
+        for nombre in nombres - {nuevo["archivo"]}:
+            os.remove(os.path.join(self.directorio, nombre))
+        return len(chicos)
+
+    # ---------- lectura ----------
+
+    def _leer_bloque(self, archivo: str, bloque: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        with open(os.path.join(self.directorio, archivo), "rb") as f:
+            f.seek(bloque["offset"])
+            ndjson = zlib.decompress(f.read(bloque["bytes"])).decode("utf-8")
+        for linea in ndjson.splitlines():
+            yield json.loads(linea)
+
+    def buscar(
+        self,
+        tabla: Optional[str] = None,
+        registro_id: Optional[int] = None,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        contiene: Optional[Dict[str, Any]] = None,
+        antes_de: Optional[int] = None,
+        limite: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """
+        Hasta `limite` filas archivadas (id descendente) que cumplen los
+        filtros. Con el índice se saltan los bloques que no pueden coincidir
+        y se deja de leer cuando ningún bloque restante puede mejorar el
+        resultado.
+        """
+        candidatos = []
+        for segmento in self.indice()["segmentos"]:
+            for bloque in segmento["bloques"]:
+                if antes_de is not None and bloque["id_min"] >= antes_de:
+                    continue
+                if tabla and tabla not in bloque["tablas"]:
+                    continue
+                if registro_id is not None and not _registro_en_bloque(bloque, tabla, registro_id):
+                    continue
+                if desde is not None and _fecha(bloque["hasta"]) < desde:
+                    continue
+                if hasta is not None and _fecha(bloque["desde"]) > hasta:
+                    continue
+                candidatos.append((segmento["archivo"], bloque))
+        candidatos.sort(key=lambda c: c[1]["id_max"], reverse=True)
+
+        encontradas: Dict[int, Dict[str, Any]] = {}
+        for archivo, bloque in candidatos:
+            if len(encontradas) >= limite and bloque["id_max"] < sorted(encontradas, reverse=True)[limite - 1]:
+                break
+            for fila in self._leer_bloque(archivo, bloque):
+                if _coincide(fila, tabla, registro_id, desde, hasta, contiene, antes_de):
+                    encontradas[fila["id"]] = fila
+        return [encontradas[i] for i in sorted(encontradas, reverse=True)[:limite]]
+
+    def estado(self) -> Dict[str, Any]:
+        segmentos = self.indice()["segmentos"]
+        bloques = [b for s in segmentos for b in s["bloques"]]
+        return {
+            "directorio": self.directorio,
+            "segmentos": len(segmentos),
+            "filas": sum(s["filas"] for s in segmentos),
+            "bytes": sum(s["bytes"] for s in segmentos),
+            "desde": min((b["desde"] for b in bloques), default=None),
+            "hasta": max((b["hasta"] for b in bloques), default=None),
+            "id_max": max((b["id_max"] for b in bloques), default=0),
+        }
+
+
+archivo_historial = ArchivoHistorial()
+
+
+# ======================================================
+# ==================== RETENCIÓN =======================
+# ======================================================
+
+_en_curso = asyncio.Lock()
+
+
+async def aplicar_retencion(
+    db: AsyncSession,
+    dias: int = DIAS,
+    lote: int = LOTE,
+    al_avanzar: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Archiva y borra de la tabla las filas con más de `dias` días, de a
+    `lote` filas (un segmento y un DELETE por lote). Devuelve cuántas movió.
+    """
+    corte = datetime.now(timezone.utc) - timedelta(days=dias)
+    movidas = 0
+    async with _en_curso:
+        while True:
+            q = await db.execute(
+                select(HistorialEliminados)
+                .where(HistorialEliminados.eliminado_en < corte)
+                .order_by(HistorialEliminados.id)
+                .limit(lote)
+            )
+            filas = [fila_a_dict(obj) for obj in q.scalars().all()]
+            if not filas:
+                break
+            # Primero el archivo (durable), después el DELETE
+            await asyncio.to_thread(archivo_historial.agregar_segmento, filas)
+            await db.execute(delete(HistorialEliminados).where(HistorialEliminados.id.in_([f["id"] for f in filas])))
+            await db.commit()
+            marcar_cambio("historial_eliminados")
+            movidas += len(filas)
+            if al_avanzar is not None:
+                al_avanzar(movidas)
+            if len(filas) < lote:
+                break
+    return movidas
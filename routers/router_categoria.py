@@ -6,6 +6,7 @@ from fastapi import (
     HTTPException,
     Query,
     status,
+    Request,
     Response,
     UploadFile,
     File,
@@ -16,18 +17,57 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
 import schemas
 import crud
+from catalogo import catalogo
+from condicional import CACHE_CATALOGO, condicional
 from utils import upload_image_to_supabase
+from negociacion import RespuestaNegociada, RutaNegociada
 
-router = APIRouter(prefix="/api/categorias", tags=["Categorias"])
+router = APIRouter(
+    prefix="/api/categorias",
+    tags=["Categorias"],
+    route_class=RutaNegociada,
+    default_response_class=RespuestaNegociada,
+)
 
 
 @router.get("/", response_model=List[schemas.CategoriaRead])
 async def listar_categorias(
+    request: Request,
+    response: Response,
     nombre: Optional[str] = None,
     codigo: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
 ):
-    return await crud.listar_categorias(db, nombre=nombre, codigo=codigo)
+    # Servido desde el catálogo en memoria; la BD solo si no está cargado
+    if catalogo.listo:
+        no_modificado = condicional(
+            request, response, catalogo.validador(), catalogo.ultima_modificacion_categorias, CACHE_CATALOGO
+        )
+        return no_modificado or catalogo.listar_categorias(nombre=nombre, codigo=codigo)
+
+    validador = await crud.validador_categorias(db, nombre=nombre, codigo=codigo)
+    no_modificado = condicional(request, response, validador, validador[-1], CACHE_CATALOGO)
+    return no_modificado or await crud.listar_categorias(db, nombre=nombre, codigo=codigo)
+
+
+@router.get("/{categoria_id}", response_model=schemas.CategoriaRead)
+async def obtener_categoria(
+    categoria_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+):
+    if catalogo.listo:
+        categoria = catalogo.obtener_categoria(categoria_id)
+        if not categoria:
+            raise HTTPException(status_code=404, detail="Categoría no encontrada")
+        validador = (categoria.id, categoria.actualizado_en)
+        no_modificado = condicional(request, response, validador, categoria.actualizado_en, CACHE_CATALOGO)
+        return no_modificado or categoria
+
+    validador = await crud.validador_categoria(db, categoria_id)
+    no_modificado = condicional(request, response, validador, validador[1], CACHE_CATALOGO)
+    return no_modificado or await crud.obtener_categoria(db, categoria_id)
 
 
 @router.post(
@@ -94,14 +134,6 @@ async def eliminar_categoria(
     categoria_id: int,
     db: AsyncSession = Depends(get_db),
 ):
-    categoria = await crud.obtener_categoria(db, categoria_id)
-
-    await crud._registrar_eliminado(
-        db,
-        "categorias",
-        categoria.id,
-        {"nombre": categoria.nombre},
-    )
     await crud.borrar_categoria(db, categoria_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -109,11 +141,15 @@ async def eliminar_categoria(
 @router.get(
     "/historial/eliminados",
     response_model=List[schemas.HistorialEliminadoRead],
+    deprecated=True,
 )
 async def historial_categorias_eliminadas(
+    despues_de: Optional[int] = Query(None, description="id de la última fila recibida"),
+    limite: int = Query(50, ge=1, le=500),
     db: AsyncSession = Depends(get_db),
 ):
-    return await crud.listar_historial(db)
+    """Obsoleto: usar GET /api/historial/. Página de `limite` filas, la más nueva primero."""
+    return await crud.listar_historial(db, despues_de=despues_de, limite=limite)
 
 
 # ==========================
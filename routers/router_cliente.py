@@ -7,8 +7,15 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
 import schemas
 import crud
+import trabajos
+from negociacion import RespuestaNegociada, RutaNegociada
 
-router = APIRouter(prefix="/api/clientes", tags=["Clientes"])
+router = APIRouter(
+    prefix="/api/clientes",
+    tags=["Clientes"],
+    route_class=RutaNegociada,
+    default_response_class=RespuestaNegociada,
+)
 
 @router.get("/", response_model=List[schemas.ClienteRead])
 async def listar_clientes(
@@ -16,9 +23,24 @@ async def listar_clientes(
     cedula: Optional[str] = None,
     tipo_cliente: Optional[str] = None,
     cliente_frecuente: Optional[bool] = None,
+    segmento: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
 ):
-    return await crud.listar_clientes(db, nombre=nombre, cedula=cedula, tipo_cliente=tipo_cliente, cliente_frecuente=cliente_frecuente)
+    return await crud.listar_clientes(db, nombre=nombre, cedula=cedula, tipo_cliente=tipo_cliente, cliente_frecuente=cliente_frecuente, segmento=segmento)
+
+@router.get("/segmentos", response_model=schemas.ResumenSegmentos)
+async def resumen_segmentos(db: AsyncSession = Depends(get_db)):
+    """Clientes por segmento RFM y frecuentes / no frecuentes."""
+    return await crud.resumen_segmentos(db)
+
+@router.post("/segmentos/recalcular", response_model=schemas.TrabajoRead, status_code=status.HTTP_202_ACCEPTED)
+async def recalcular_segmentos(db: AsyncSession = Depends(get_db)):
+    """Encola la segmentación completa sin esperar a la noche; se sigue en /api/trabajos/{id}."""
+    return await trabajos.encolar(db, "segmentacion", {})
+
+@router.get("/{cliente_id}/rfm", response_model=schemas.RfmClienteRead)
+async def obtener_rfm(cliente_id: int, db: AsyncSession = Depends(get_db)):
+    return await crud.obtener_rfm(db, cliente_id)
 
 @router.post("/", response_model=schemas.ClienteRead, status_code=status.HTTP_201_CREATED)
 async def crear_cliente(payload: schemas.ClienteCreate, db: AsyncSession = Depends(get_db)):
@@ -33,6 +55,11 @@ async def eliminar_cliente(cliente_id: int, db: AsyncSession = Depends(get_db)):
     await crud.borrar_cliente(db, cliente_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
-@router.get("/historial/eliminados", response_model=List[schemas.HistorialEliminadoRead])
-async def historial_clientes_eliminados(db: AsyncSession = Depends(get_db)):
-    return await crud.listar_historial(db)
+@router.get("/historial/eliminados", response_model=List[schemas.HistorialEliminadoRead], deprecated=True)
+async def historial_clientes_eliminados(
+    despues_de: Optional[int] = Query(None, description="id de la última fila recibida"),
+    limite: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    """Obsoleto: usar GET /api/historial/. Página de `limite` filas, la más nueva primero."""
+    return await crud.listar_historial(db, despues_de=despues_de, limite=limite)
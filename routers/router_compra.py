@@ -1,17 +1,30 @@
-from typing import List, Optional
+import os
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
 import schemas
 import crud
+from cache_consultas import generacion, version_de
+from condicional import condicional
+from negociacion import RespuestaNegociada, RutaNegociada
 
-router = APIRouter(prefix="/compras", tags=["Compras"])
+router = APIRouter(
+    prefix="/compras",
+    tags=["Compras"],
+    route_class=RutaNegociada,
+    default_response_class=RespuestaNegociada,
+)
+
+COMPRAS_BULK_MAX = int(os.getenv("COMPRAS_BULK_MAX", "10000"))
 
 @router.get("/", response_model=List[schemas.CompraRead])
 async def listar_compras(
+    request: Request,
+    response: Response,
     cliente_id: Optional[int] = None,
     producto_id: Optional[int] = None,
     min_total: Optional[float] = None,
@@ -22,8 +35,7 @@ async def listar_compras(
     nombre_producto: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
 ):
-    return await crud.listar_compras(
-        db,
+    filtros = dict(
         cliente_id=cliente_id,
         producto_id=producto_id,
         min_total=min_total,
@@ -33,14 +45,43 @@ async def listar_compras(
         nombre_cliente=nombre_cliente,
         nombre_producto=nombre_producto,
     )
+    # Los clientes anidados no tienen actualizado_en y las compras no pasan
+    # por el diario: sus versiones en memoria completan el validador
+    validador = await crud.validador_compras(db, **filtros) + (generacion, version_de("compras", "clientes"))
+    no_modificado = condicional(request, response, validador)
+    return no_modificado or await crud.listar_compras(db, **filtros)
 
 @router.post("/", response_model=schemas.CompraRead, status_code=status.HTTP_201_CREATED)
 async def crear_compra(payload: schemas.CompraCreate, db: AsyncSession = Depends(get_db)):
     return await crud.crear_compra(db, payload)
 
+@router.post("/bulk", response_model=schemas.CompraBulkResultado)
+async def crear_compras_bulk(
+    payload: List[Dict[str, Any]] = Body(..., description="ventas con el mismo formato que POST /compras"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Registra un lote de ventas (p. ej. las que un terminal guardó sin
+    conexión) en una sola transacción. Las filas que fallan se reportan en
+    `errores` con su posición; el resto se guarda igual.
+    """
+    if len(payload) > COMPRAS_BULK_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Máximo {COMPRAS_BULK_MAX} ventas por lote",
+        )
+    return await crud.crear_compras_bulk(db, payload)
+
 @router.get("/{compra_id}", response_model=schemas.CompraRead)
-async def obtener_compra(compra_id: int, db: AsyncSession = Depends(get_db)):
-    return await crud.obtener_compra(db, compra_id)
+async def obtener_compra(
+    compra_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+):
+    validador = await crud.validador_compra(db, compra_id) + (generacion, version_de("clientes"))
+    no_modificado = condicional(request, response, validador)
+    return no_modificado or await crud.obtener_compra(db, compra_id)
 
 @router.put("/{compra_id}", response_model=schemas.CompraRead)
 async def actualizar_compra(compra_id: int, payload: schemas.CompraUpdate, db: AsyncSession = Depends(get_db)):
@@ -48,25 +89,14 @@ async def actualizar_compra(compra_id: int, payload: schemas.CompraUpdate, db: A
 
 @router.delete("/{compra_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def eliminar_compra(compra_id: int, db: AsyncSession = Depends(get_db)):
-    compra = await crud.obtener_compra(db, compra_id)
-    descripcion = f"Compra eliminada id={compra.id}"
-
-    await crud._registrar_eliminado(
-        db,
-        "compras",
-        compra.id,
-        {
-            "cliente_id": compra.cliente_id,
-            "producto_id": compra.producto_id,
-            "cantidad": compra.cantidad,
-            "precio_unitario_aplicado": compra.precio_unitario_aplicado,
-            "total": compra.total,
-            "fecha": compra.fecha.isoformat() if compra.fecha else None,
-        },
-    )
     await crud.borrar_compra(db, compra_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
-@router.get("/historial/eliminados", response_model=List[schemas.HistorialEliminadoRead])
-async def historial_compras_eliminadas(db: AsyncSession = Depends(get_db)):
-    return await crud.listar_historial(db)
+@router.get("/historial/eliminados", response_model=List[schemas.HistorialEliminadoRead], deprecated=True)
+async def historial_compras_eliminadas(
+    despues_de: Optional[int] = Query(None, description="id de la última fila recibida"),
+    limite: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    """Obsoleto: usar GET /api/historial/. Página de `limite` filas, la más nueva primero."""
+    return await crud.listar_historial(db, despues_de=despues_de, limite=limite)
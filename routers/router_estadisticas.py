@@ -0,0 +1,183 @@
+import asyncio
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db
+import analitica
+import archivo_compras
+import estadisticas
+import sketches
+from negociacion import RespuestaNegociada, RutaNegociada
+
+router = APIRouter(
+    prefix="/api/stats",
+    tags=["Estadísticas"],
+    route_class=RutaNegociada,
+    default_response_class=RespuestaNegociada,
+)
+
+# Una instancia de Query por parámetro: si `desde` y `hasta` comparten la
+# misma, FastAPI lee los dos del mismo nombre.
+def _mes():
+    return Query(None, pattern=r"^\d{4}-\d{2}$", description="AAAA-MM (inclusivo)")
+
+
+def _periodo():
+    return Query(None, pattern=r"^\d{4}-\d{2}(-\d{2})?$", description="AAAA-MM o AAAA-MM-DD (inclusivo)")
+
+
+def filtros_analitica(
+    desde: Optional[str] = _periodo(),
+    hasta: Optional[str] = _periodo(),
+    categoria_id: Optional[int] = None,
+    cliente_id: Optional[int] = None,
+    producto_id: Optional[int] = None,
+    tipo_cliente: Optional[str] = None,
+) -> dict:
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "categoria_id": categoria_id,
+        "cliente_id": cliente_id,
+        "producto_id": producto_id,
+        "tipo_cliente": tipo_cliente,
+    }
+
+
+async def _snapshot(db: AsyncSession) -> analitica.SnapshotVentas:
+    if not analitica.ACTIVO:
+        raise HTTPException(503, "Motor de análisis desactivado (ANALITICA=0 o falta NumPy)")
+    await analitica.snapshot_ventas.refrescar(db)
+    return analitica.snapshot_ventas
+
+
+@router.get("/ventas-por-mes")
+async def ventas_por_mes(
+    desde: Optional[str] = _mes(),
+    hasta: Optional[str] = _mes(),
+    db: AsyncSession = Depends(get_db),
+):
+    """Compras, unidades y total por mes (tabla + meses archivados)."""
+    return await estadisticas.ventas_por_mes(db, desde=desde, hasta=hasta)
+
+
+APROX = Query(False, description="responder desde los sketches (aproximado, con cota de error)")
+
+
+def _validar_aprox(desde: Optional[str] = None, hasta: Optional[str] = None) -> None:
+    if not sketches.ACTIVO:
+        raise HTTPException(503, "Sketches desactivados (SKETCHES=0)")
+    if desde or hasta:
+        raise HTTPException(400, "approx=true cubre todo el historial: no admite desde/hasta")
+
+
+@router.get("/top-productos")
+async def top_productos(
+    limite: int = Query(10, ge=1, le=100),
+    desde: Optional[str] = _mes(),
+    hasta: Optional[str] = _mes(),
+    approx: bool = APROX,
+    db: AsyncSession = Depends(get_db),
+):
+    if approx:
+        _validar_aprox(desde, hasta)
+        return await estadisticas.mejores_aprox(db, "producto", limite)
+    return await estadisticas.top_productos_vendidos(db, limite=limite, desde=desde, hasta=hasta)
+
+
+@router.get("/top-clientes")
+async def top_clientes(
+    limite: int = Query(10, ge=1, le=100),
+    desde: Optional[str] = _mes(),
+    hasta: Optional[str] = _mes(),
+    approx: bool = APROX,
+    db: AsyncSession = Depends(get_db),
+):
+    if approx:
+        _validar_aprox(desde, hasta)
+        return await estadisticas.mejores_aprox(db, "cliente", limite)
+    return await estadisticas.top_clientes_compradores(db, limite=limite, desde=desde, hasta=hasta)
+
+
+@router.get("/compradores-distintos")
+async def compradores_distintos(
+    por: str = Query("producto", pattern="^(producto|categoria)$"),
+    id: Optional[int] = Query(None, description="un solo producto / categoría"),
+    limite: int = Query(20, ge=1, le=1000),
+    approx: bool = APROX,
+    db: AsyncSession = Depends(get_db),
+):
+    """Clientes distintos que compraron cada producto o categoría."""
+    if approx:
+        _validar_aprox()
+        return await estadisticas.compradores_distintos_aprox(db, por, id, limite)
+    return await estadisticas.compradores_distintos(db, por=por, id=id, limite=limite)
+
+
+@router.get("/consulta")
+async def consulta(
+    por: List[str] = Query([], description=f"dimensiones: {', '.join(analitica.DIMENSIONES)}"),
+    medidas: List[str] = Query(["total", "unidades", "compras"], description=", ".join(analitica.MEDIDAS)),
+    orden: Optional[str] = Query(None, description="medida para ordenar (descendente)"),
+    limite: Optional[int] = Query(None, ge=1, le=10_000),
+    filtros: dict = Depends(filtros_analitica),
+    db: AsyncSession = Depends(get_db),
+):
+    """Agrupa las ventas por las dimensiones pedidas (ej. ?por=categoria&por=mes)."""
+    snapshot = await _snapshot(db)
+    try:
+        return snapshot.agrupar(por, medidas, filtros, orden=orden, limite=limite)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+@router.get("/pivote")
+async def pivote(
+    filas: str = Query(..., description=", ".join(analitica.DIMENSIONES)),
+    columnas: str = Query(..., description=", ".join(analitica.DIMENSIONES)),
+    medida: str = Query("total", description=", ".join(analitica.MEDIDAS)),
+    filtros: dict = Depends(filtros_analitica),
+    db: AsyncSession = Depends(get_db),
+):
+    """Tabla cruzada, ej. ?filas=tipo_cliente&columnas=mes&medida=total."""
+    snapshot = await _snapshot(db)
+    try:
+        return snapshot.pivotar(filas, columnas, medida, filtros)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+@router.get("/archivo")
+async def estado_archivo():
+    """Meses de compras en el archivo columnar."""
+    return await asyncio.to_thread(archivo_compras.archivo_compras.estado)
+
+
+@router.post("/archivo/{mes}")
+async def archivar_mes(mes: str, db: AsyncSession = Depends(get_db)):
+    """Pasa un mes cerrado (AAAA-MM) de compras al archivo y lo borra de la tabla."""
+    try:
+        return await archivo_compras.archivar_mes(db, mes)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except RuntimeError as e:
+        raise HTTPException(503, str(e))
+
+
+@router.get("/sketches")
+async def estado_sketches():
+    """Tamaño, cotas de error y última venta vista de los sketches."""
+    return sketches.sketches_ventas.estado()
+
+
+@router.post("/sketches/reconstruir")
+async def reconstruir_sketches(db: AsyncSession = Depends(get_db)):
+    """Recalcula los sketches desde las compras (tabla + archivo) y los guarda."""
+    _validar_aprox()
+    if sketches.sketches_ventas.estado()["reconstruyendo"]:
+        raise HTTPException(409, "Ya hay una reconstrucción en curso")
+    vigente = await sketches.reconstruir(db)
+    await vigente.guardar(db)
+    return vigente.estado()
@@ -1,23 +1,93 @@
+import asyncio
+import json
+from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
-from models import HistorialEliminados
 import schemas
+import crud
+import retencion
+from negociacion import RespuestaNegociada, RutaNegociada
 
-router = APIRouter(prefix="/api/historial", tags=["Historial"])
-
-@router.get("/eliminados", response_model=List[schemas.HistorialEliminadoRead])
-async def listar_eliminados(tabla: Optional[str] = None, db: AsyncSession = Depends(get_db)):
-    stmt = select(HistorialEliminados).order_by(HistorialEliminados.eliminado_en.desc())
-    
-    if tabla:
-        stmt = stmt.where(HistorialEliminados.tabla == tabla)
-    
-    res = await db.execute(stmt)
-    return res.scalars().all()
+router = APIRouter(
+    prefix="/api/historial",
+    tags=["Historial"],
+    route_class=RutaNegociada,
+    default_response_class=RespuestaNegociada,
+)
+
+
+@router.get("/", response_model=schemas.HistorialPagina)
+async def buscar_historial(
+    tabla: Optional[str] = None,
+    registro_id: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    contiene: Optional[str] = Query(
+        None,
+        description='JSON con claves/valores que debe tener el snapshot, ej. {"nombre": "Lápiz"}',
+    ),
+    despues_de: Optional[int] = Query(None, description="cursor `siguiente` de la página anterior"),
+    limite: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    """Historial de eliminados con filtros, búsqueda en `datos` y paginación por cursor."""
+    filtro = None
+    if contiene:
+        try:
+            filtro = json.loads(contiene)
+        except ValueError:
+            raise HTTPException(400, "'contiene' debe ser un objeto JSON")
+        if not isinstance(filtro, dict):
+            raise HTTPException(400, "'contiene' debe ser un objeto JSON")
+    return await crud.buscar_historial(
+        db,
+        tabla=tabla,
+        registro_id=registro_id,
+        desde=desde,
+        hasta=hasta,
+        contiene=filtro,
+        despues_de=despues_de,
+        limite=limite,
+    )
+
+
+@router.get("/archivo")
+async def estado_archivo():
+    """Segmentos archivados por la retención (filas, bytes, rango de fechas)."""
+    return retencion.archivo_historial.estado()
+
+
+@router.post("/archivar")
+async def archivar(
+    dias: Optional[int] = Query(retencion.DIAS or None, ge=1, description="archiva lo que tenga más de estos días"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Corre la retención ahora (la misma que hace la tarea periódica)."""
+    if dias is None:
+        raise HTTPException(400, "Falta 'dias' (HISTORIAL_RETENCION_DIAS no está configurado)")
+    movidas = await retencion.aplicar_retencion(db, dias=dias)
+    return {"archivadas": movidas, "archivo": retencion.archivo_historial.estado()}
+
+
+@router.post("/archivo/compactar")
+async def compactar_archivo():
+    """Junta los segmentos chicos en uno solo."""
+    unidos = await asyncio.to_thread(retencion.archivo_historial.compactar)
+    return {"segmentos_unidos": unidos, "archivo": retencion.archivo_historial.estado()}
+
+
+@router.get("/eliminados", response_model=List[schemas.HistorialEliminadoRead], deprecated=True)
+async def listar_eliminados(
+    tabla: Optional[str] = None,
+    despues_de: Optional[int] = Query(None, description="id de la última fila recibida"),
+    limite: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    """Obsoleto: usar GET /api/historial/. Página de `limite` filas, la más nueva primero."""
+    return await crud.listar_historial(db, tabla=tabla, despues_de=despues_de, limite=limite)
 
 
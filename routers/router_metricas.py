@@ -0,0 +1,49 @@
+from fastapi import APIRouter
+
+import admision
+from alertas_stock import alertas_stock
+from analitica import snapshot_ventas
+from auditoria import auditoria
+import cache_consultas
+import compresion
+from catalogo import catalogo
+from fallas import contadores as contadores_fallas
+from pronosticos import pronosticos
+from segmentacion import segmentacion
+from sketches import sketches_ventas
+from trabajos import planificador
+from routers.router_paginas import cache_paginas
+from negociacion import RespuestaNegociada, RutaNegociada
+
+router = APIRouter(
+    prefix="/api/metricas",
+    tags=["Metricas"],
+    route_class=RutaNegociada,
+    default_response_class=RespuestaNegociada,
+)
+
+
+@router.get("/")
+async def metricas():
+    """Métricas en memoria de este worker (cachés, admisión, fallas, páginas, compresión, auditoría, analítica, sketches, trabajos, alertas de stock, pronósticos, segmentación)."""
+    return {
+        "cache_consultas": cache_consultas.estado(),
+        "catalogo": catalogo.estado(),
+        "admision": admision.metricas,
+        "fallas_bd": contadores_fallas.como_dict(),
+        "paginas": cache_paginas.estado(),
+        "compresion": compresion.estado(),
+        "auditoria": auditoria.estado(),
+        "analitica": snapshot_ventas.estado(),
+        "sketches": sketches_ventas.estado(),
+        "trabajos": planificador.estado(),
+        "alertas_stock": alertas_stock.estado(),
+        "pronosticos": pronosticos.estado(),
+        "segmentacion": segmentacion.estado(),
+    }
+
+
+@router.post("/cache/vaciar")
+async def vaciar_cache():
+    cache_consultas.cache.vaciar()
+    return {"ok": True}
@@ -0,0 +1,206 @@
+# routers/router_paginas.py
+"""
+Páginas HTML servidas desde una caché de bytes precomprimidos.
+
+Las plantillas no dependen de la petición (solo de sí mismas y de los
+{% include %}), así que cada una se renderiza una sola vez al arrancar y
+se guarda en identity/gzip/brotli con un ETag fuerte por variante. Servir
+una página es elegir la variante según Accept-Encoding: sin Jinja ni
+compresión por petición.
+
+Variables de entorno:
+    PAGINAS_RECARGAR=1   (desarrollo) re-renderiza si cambia algún archivo
+                         de templates/
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.templating import Jinja2Templates
+from jinja2 import TemplateNotFound
+
+from compresion import elegir_codificacion, precomprimir
+from estaticos import MANIFIESTO, asset
+
+DIRECTORIO = "templates"
+RECARGAR = os.getenv("PAGINAS_RECARGAR", "0") == "1"
+
+templates = Jinja2Templates(directory=DIRECTORIO)
+# URLs de static/ con huella de contenido (scripts/build_static.py)
+templates.env.globals["asset"] = asset
+
+
+class Pagina(NamedTuple):
+    ruta: str
+    plantilla: str
+    nombre: str
+    tag: str = "Pages"
+
+
+# ======================================================
+# ================ TABLA DE PÁGINAS ====================
+# ======================================================
+
+PAGINAS: List[Pagina] = [
+    Pagina("/", "index.html", "root", "Home"),
+    # ---------- USUARIOS ----------
+    Pagina("/usuarios", "usuarios/read.html", "usuarios_read_page"),
+    Pagina("/usuarios/create", "usuarios/create.html", "usuarios_create_page"),
+    Pagina("/usuarios/update", "usuarios/update.html", "usuarios_update_page"),
+    # ---------- PRODUCTOS ----------
+    Pagina("/productos", "productos/read.html", "productos_read_page"),
+    Pagina("/productos/create", "productos/create.html", "productos_create_page"),
+    Pagina("/productos/update", "productos/update.html", "productos_update_page"),
+    Pagina("/productos/delete", "productos/delete.html", "productos_delete_page"),
+    # ---------- CLIENTES ----------
+    Pagina("/clientes", "clientes/read.html", "clientes_read_page"),
+    Pagina("/clientes/create", "clientes/create.html", "clientes_create_page"),
+    Pagina("/clientes/update", "clientes/update.html", "clientes_update_page"),
+    Pagina("/clientes/delete", "clientes/delete.html", "clientes_delete_page"),
+    # ---------- VENTAS (COMPRAS) ----------
+    Pagina("/ventas", "ventas/read.html", "ventas_read_page"),
+    Pagina("/ventas/create", "ventas/create.html", "ventas_create_page"),
+    Pagina("/ventas/update", "ventas/update.html", "ventas_update_page"),
+    Pagina("/ventas/delete", "ventas/delete.html", "ventas_delete_page"),
+    # ---------- CATEGORÍAS ----------
+    Pagina("/categorias", "categorias/read.html", "categorias_read_page"),
+    Pagina("/categorias/create", "categorias/create.html", "categorias_create_page"),
+    Pagina("/categorias/update", "categorias/update.html", "categorias_update_page"),
+    Pagina("/categorias/delete", "categorias/delete.html", "categorias_delete_page"),
+    # ---------- HISTORIAL, PLANIFICACIÓN, INFO PROYECTO ----------
+    Pagina("/historial", "historial.html", "historial_page"),
+    Pagina("/planning", "planning.html", "planning_page"),
+    Pagina("/informacion_del_proyecto", "informacion_del_proyecto.html", "informacion_del_proyecto_page"),
+    Pagina("/graficas", "graficas.html", "graficas_page"),
+]
+
+
+# ======================================================
+# =================== CACHÉ ============================
+# ======================================================
+
+class Variante(NamedTuple):
+    cuerpo: bytes
+    etag: str
+
+
+def _etag(cuerpo: bytes) -> str:
+    return '"' + hashlib.blake2b(cuerpo, digest_size=16).hexdigest() + '"'
+
+
+def _variantes(html: bytes) -> Dict[str, Variante]:
+    # ETag fuerte distinto por codificación: son bytes distintos
+    return {codificacion: Variante(cuerpo, _etag(cuerpo)) for codificacion, cuerpo in precomprimir(html).items()}
+
+
+def _version_plantillas() -> float:
+    """Mtime más reciente de templates/ (cubre los includes) y del manifiesto de estáticos."""
+    ultima = os.path.getmtime(MANIFIESTO) if os.path.exists(MANIFIESTO) else 0.0
+    for carpeta, _, archivos in os.walk(DIRECTORIO):
+        for archivo in archivos:
+            ultima = max(ultima, os.path.getmtime(os.path.join(carpeta, archivo)))
+    return ultima
+
+
+class CachePaginas:
+    def __init__(self, paginas: List[Pagina]):
+        self.paginas = paginas
+        self._cache: Dict[str, Optional[Dict[str, Variante]]] = {}
+        self._version = 0.0
+        self.metricas = {"renderizadas": 0, "servidas": 0, "no_modificadas": 0}
+
+    def renderizar(self, plantilla: str) -> Optional[Dict[str, Variante]]:
+        """None si la plantilla no existe (la ruta responde 404)."""
+        try:
+            html = templates.get_template(plantilla).render().encode("utf-8")
+        except TemplateNotFound:
+            return None
+        self.metricas["renderizadas"] += 1
+        return _variantes(html)
+
+    def precalentar(self) -> None:
+        self._version = _version_plantillas()
+        self._cache = {p.plantilla: self.renderizar(p.plantilla) for p in self.paginas}
+        faltantes = [plantilla for plantilla, v in self._cache.items() if v is None]
+        print(f"✔ Páginas precomprimidas: {len(self._cache) - len(faltantes)}")
+        if faltantes:
+            print("⚠ Plantillas inexistentes (responderán 404):", ", ".join(faltantes))
+
+    def obtener(self, plantilla: str) -> Optional[Dict[str, Variante]]:
+        if RECARGAR and _version_plantillas() != self._version:
+            # El entorno de Jinja también cachea: se limpia para ver los cambios
+            templates.env.cache.clear()
+            self.precalentar()
+        if plantilla not in self._cache:
+            self._cache[plantilla] = self.renderizar(plantilla)
+        return self._cache[plantilla]
+
+    def estado(self) -> Dict[str, object]:
+        return {
+            **self.metricas,
+            "paginas": sum(1 for v in self._cache.values() if v),
+            "bytes": {
+                codificacion: sum(len(v[codificacion].cuerpo) for v in self._cache.values() if v and codificacion in v)
+                for codificacion in ("identity", "gzip", "br")
+            },
+        }
+
+
+cache_paginas = CachePaginas(PAGINAS)
+
+
+# ======================================================
+# ================ NEGOCIACIÓN =========================
+# ======================================================
+
+def responder_pagina(request: Request, variantes: Optional[Dict[str, Variante]]) -> Response:
+    if variantes is None:
+        raise HTTPException(status_code=404, detail="Página no encontrada")
+
+    codificacion = elegir_codificacion(request.headers.get("accept-encoding", ""), variantes)
+    variante = variantes[codificacion]
+    headers = {
+        "ETag": variante.etag,
+        "Vary": "Accept-Encoding",
+        # Revalida siempre: un 304 cuesta casi nada y los cambios se ven al instante
+        "Cache-Control": "no-cache",
+    }
+    if codificacion != "identity":
+        headers["Content-Encoding"] = codificacion
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if variante.etag in (e.strip() for e in if_none_match.split(",")) or if_none_match.strip() == "*":
+        cache_paginas.metricas["no_modificadas"] += 1
+        return Response(status_code=304, headers=headers)
+
+    cache_paginas.metricas["servidas"] += 1
+    return Response(content=variante.cuerpo, media_type="text/html; charset=utf-8", headers=headers)
+
+
+# ======================================================
+# =================== RUTAS ============================
+# ======================================================
+
+router = APIRouter()
+
+
+def _vista(pagina: Pagina):
+    async def vista(request: Request):
+        return responder_pagina(request, cache_paginas.obtener(pagina.plantilla))
+
+    vista.__name__ = pagina.nombre
+    return vista
+
+
+for _pagina in PAGINAS:
+    router.add_api_route(
+        _pagina.ruta,
+        _vista(_pagina),
+        methods=["GET", "HEAD"],
+        name=_pagina.nombre,
+        tags=[_pagina.tag],
+        response_class=Response,
+    )
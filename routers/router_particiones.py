@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException
+
+from database import engine
+from cache_consultas import marcar_cambio
+import particiones
+from analitica import snapshot_ventas
+from negociacion import RespuestaNegociada, RutaNegociada
+
+router = APIRouter(
+    prefix="/api/particiones",
+    tags=["Particiones"],
+    route_class=RutaNegociada,
+    default_response_class=RespuestaNegociada,
+)
+
+
+@router.get("/")
+async def listar_particiones():
+    """Particiones mensuales de compras (en SQLite: conteo por mes)."""
+    async with engine.connect() as conn:
+        return {
+            "particionada": await conn.run_sync(particiones.esta_particionada),
+            "particiones": await conn.run_sync(particiones.listar_particiones),
+        }
+
+
+@router.post("/asegurar")
+async def asegurar_particiones():
+    """Crea ya las particiones del mes actual y los siguientes (lo mismo que la tarea diaria)."""
+    async with engine.begin() as conn:
+        return {"creadas": await conn.run_sync(particiones.asegurar_particiones)}
+
+
+@router.post("/{mes}/separar")
+async def separar_particion(mes: str):
+    """Saca un mes cerrado (AAAA-MM) de compras y lo deja como tabla suelta para archivar."""
+    try:
+        async with engine.begin() as conn:
+            resultado = await conn.run_sync(particiones.separar_particion, mes)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except LookupError as e:
+        raise HTTPException(404, str(e))
+    marcar_cambio("compras", "ventas")
+    # Las filas del mes salen de compras sin pasar por crud
+    snapshot_ventas.invalidar()
+    return resultado
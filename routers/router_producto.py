@@ -1,24 +1,69 @@
 from typing import List, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status, Response, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request, Response, UploadFile, File, Form
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
 import schemas
 import crud
+from catalogo import catalogo
+from condicional import CACHE_CATALOGO, condicional
 from utils import upload_image_to_supabase
+from negociacion import RespuestaNegociada, RutaNegociada
 
-router = APIRouter(prefix="/api/productos", tags=["Productos"])
+router = APIRouter(
+    prefix="/api/productos",
+    tags=["Productos"],
+    route_class=RutaNegociada,
+    default_response_class=RespuestaNegociada,
+)
 
 @router.get("/", response_model=List[schemas.ProductoRead])
 async def listar_productos(
+    request: Request,
+    response: Response,
     nombre: Optional[str] = None,
     stock_min: Optional[int] = None,
     categoria_id: Optional[int] = None,
     db: AsyncSession = Depends(get_db),
 ):
-    return await crud.listar_productos(db, nombre=nombre, stock_min=stock_min, categoria_id=categoria_id)
+    filtros = dict(nombre=nombre, stock_min=stock_min, categoria_id=categoria_id)
+
+    # Servido desde el catálogo en memoria; la BD solo si no está cargado
+    if catalogo.listo:
+        no_modificado = condicional(
+            request, response, catalogo.validador(), catalogo.ultima_modificacion_productos, CACHE_CATALOGO
+        )
+        return no_modificado or catalogo.listar_productos(**filtros)
+
+    validador = await crud.validador_productos(db, **filtros)
+    no_modificado = condicional(request, response, validador, validador[-1], CACHE_CATALOGO)
+    return no_modificado or await crud.listar_productos(db, **filtros)
+
+@router.get("/catalogo/verificar")
+async def verificar_catalogo(reparar: bool = False, db: AsyncSession = Depends(get_db)):
+    """Compara el catálogo en memoria de este worker con la base de datos."""
+    return await catalogo.verificar(db, reparar=reparar)
+
+@router.get("/{producto_id}", response_model=schemas.ProductoRead)
+async def obtener_producto(
+    producto_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+):
+    if catalogo.listo:
+        producto = catalogo.obtener_producto(producto_id)
+        if not producto:
+            raise HTTPException(status_code=404, detail="Producto no encontrado")
+        validador = (producto.id, producto.cantidad, producto.actualizado_en)
+        no_modificado = condicional(request, response, validador, producto.actualizado_en, CACHE_CATALOGO)
+        return no_modificado or producto
+
+    validador = await crud.validador_producto(db, producto_id)
+    no_modificado = condicional(request, response, validador, validador[2], CACHE_CATALOGO)
+    return no_modificado or await crud.obtener_producto(db, producto_id)
 
 @router.post("/", response_model=schemas.ProductoRead, status_code=status.HTTP_201_CREATED)
 async def crear_producto(
@@ -90,17 +135,17 @@ async def actualizar_producto(
 
 @router.delete("/{producto_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def eliminar_producto(producto_id: int, db: AsyncSession = Depends(get_db)):
-    producto = await crud.obtener_producto(db, producto_id)
-
-    descripcion = f"Producto '{producto.nombre}' eliminado"
-
-    await crud._registrar_eliminado(db, "productos", producto.id, {"nombre": producto.nombre})
     await crud.borrar_producto(db, producto_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
-@router.get("/historial/eliminados", response_model=List[schemas.HistorialEliminadoRead])
-async def historial_productos_eliminados(db: AsyncSession = Depends(get_db)):
-    return await crud.listar_historial(db)
+@router.get("/historial/eliminados", response_model=List[schemas.HistorialEliminadoRead], deprecated=True)
+async def historial_productos_eliminados(
+    despues_de: Optional[int] = Query(None, description="id de la última fila recibida"),
+    limite: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    """Obsoleto: usar GET /api/historial/. Página de `limite` filas, la más nueva primero."""
+    return await crud.listar_historial(db, despues_de=despues_de, limite=limite)
 
 
 # ==========================
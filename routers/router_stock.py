@@ -0,0 +1,130 @@
+import json
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db
+import schemas
+import crud
+import trabajos
+from alertas_stock import alertas_stock
+from negociacion import RespuestaNegociada, RutaNegociada
+
+router = APIRouter(
+    prefix="/api/stock",
+    tags=["Stock"],
+    route_class=RutaNegociada,
+    default_response_class=RespuestaNegociada,
+)
+
+
+def _motor():
+    if not alertas_stock.listo:
+        raise HTTPException(503, "Alertas de stock desactivadas o sin cargar (ALERTAS_STOCK)")
+    return alertas_stock
+
+
+# ==========================
+#   UMBRALES
+# ==========================
+
+@router.get("/umbrales", response_model=List[schemas.UmbralStockRead])
+async def listar_umbrales(db: AsyncSession = Depends(get_db)):
+    return await crud.listar_umbrales_stock(db)
+
+
+@router.put("/umbrales/producto/{producto_id}", response_model=schemas.UmbralStockRead)
+async def fijar_umbral_producto(producto_id: int, data: schemas.UmbralStockSet, db: AsyncSession = Depends(get_db)):
+    return await crud.fijar_umbral_stock(db, data.minimo, producto_id=producto_id)
+
+
+@router.put("/umbrales/categoria/{categoria_id}", response_model=schemas.UmbralStockRead)
+async def fijar_umbral_categoria(categoria_id: int, data: schemas.UmbralStockSet, db: AsyncSession = Depends(get_db)):
+    """Mínimo para todos los productos de la categoría que no tengan uno propio."""
+    return await crud.fijar_umbral_stock(db, data.minimo, categoria_id=categoria_id)
+
+
+@router.delete("/umbrales/producto/{producto_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def borrar_umbral_producto(producto_id: int, db: AsyncSession = Depends(get_db)):
+    await crud.borrar_umbral_stock(db, producto_id=producto_id)
+
+
+@router.delete("/umbrales/categoria/{categoria_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def borrar_umbral_categoria(categoria_id: int, db: AsyncSession = Depends(get_db)):
+    await crud.borrar_umbral_stock(db, categoria_id=categoria_id)
+
+
+# ==========================
+#   ALERTAS
+# ==========================
+
+@router.get("/alertas", response_model=List[schemas.AlertaStock])
+async def listar_alertas(categoria_id: Optional[int] = None):
+    """Productos en su mínimo o por debajo, los más faltantes primero (desde memoria)."""
+    return _motor().listar(categoria_id)
+
+
+def _sse(motor, evento_id: int, tipo: str, datos) -> str:
+    return f"id: {motor.id_evento(evento_id)}\nevent: {tipo}\ndata: {json.dumps(jsonable_encoder(datos))}\n\n"
+
+
+@router.get("/alertas/stream")
+async def stream_alertas(last_event_id: Optional[str] = Header(None)):
+    """
+    Server-Sent Events: `estado` (lista completa) al conectar y después
+    bajo / actualizado / repuesto / quitado. Con Last-Event-ID solo se
+    reciben los que faltaron, si el id es de este arranque y sigue en el
+    buffer; si no, llega de nuevo el `estado`.
+    """
+    motor = _motor()
+    despues_de = motor.reanudar(last_event_id)
+
+    async def eventos():
+        nonlocal despues_de
+        yield "retry: 3000\n\n"
+        if despues_de is None:
+            despues_de = motor.ultimo_evento
+            yield _sse(motor, despues_de, "estado", motor.listar())
+        async for evento in motor.suscribir(despues_de):
+            if evento is None:
+                yield ": latido\n\n"
+            else:
+                yield _sse(motor, *evento)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ==========================
+#   PRONÓSTICOS Y REPOSICIÓN
+# ==========================
+
+@router.get("/reposicion", response_model=List[schemas.Reposicion])
+async def listar_reposicion(
+    categoria_id: Optional[int] = None,
+    limite: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """Productos en su punto de reorden con la cantidad sugerida, los que se acaban antes primero."""
+    return await crud.listar_reposicion(db, categoria_id=categoria_id, limite=limite)
+
+
+@router.get("/reposicion/{producto_id}", response_model=schemas.Reposicion)
+async def obtener_reposicion(producto_id: int, db: AsyncSession = Depends(get_db)):
+    """Demanda pronosticada, días de stock y cantidad a pedir según el stock actual."""
+    return await crud.obtener_reposicion(db, producto_id)
+
+
+@router.post("/pronosticos/recalcular", response_model=schemas.TrabajoRead, status_code=202)
+async def recalcular_pronosticos(datos: schemas.PronosticoRecalcular, db: AsyncSession = Depends(get_db)):
+    """Encola el cálculo sin esperar a la noche; se sigue en /api/trabajos/{id}."""
+    try:
+        return await trabajos.encolar(db, "pronosticos", datos.model_dump(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
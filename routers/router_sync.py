@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db
+import schemas
+import crud
+from negociacion import RespuestaNegociada, RutaNegociada
+
+router = APIRouter(
+    prefix="/api/sync",
+    tags=["Sincronizacion"],
+    route_class=RutaNegociada,
+    default_response_class=RespuestaNegociada,
+)
+
+
+@router.get("/", response_model=schemas.SyncRespuesta)
+async def sincronizar(
+    desde: int = Query(0, alias="since", ge=0, description="token de la sincronización anterior (0 = copia completa)"),
+    limite: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Cambios de productos, categorías y clientes desde `since`: filas nuevas o
+    modificadas (upserts) e ids borrados (eliminados), más el token para la
+    próxima llamada.
+    """
+    return await crud.sincronizar(db, desde=desde, limite=limite)
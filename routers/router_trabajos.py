@@ -0,0 +1,80 @@
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db
+from models import Trabajo
+import schemas
+import trabajos
+from negociacion import RespuestaNegociada, RutaNegociada
+
+router = APIRouter(
+    prefix="/api/trabajos",
+    tags=["Trabajos"],
+    route_class=RutaNegociada,
+    default_response_class=RespuestaNegociada,
+)
+
+
+async def _trabajo(db: AsyncSession, trabajo_id: int) -> Trabajo:
+    trabajo = await db.get(Trabajo, trabajo_id)
+    if trabajo is None:
+        raise HTTPException(404, "Trabajo no encontrado")
+    return trabajo
+
+
+@router.get("/tipos")
+async def tipos():
+    """Reportes que se pueden pedir y sus parámetros."""
+    return {tipo: descripcion for tipo, (descripcion, _, _) in trabajos.REPORTES.items()}
+
+
+@router.post("/", response_model=schemas.TrabajoRead, status_code=202)
+async def crear_trabajo(datos: schemas.TrabajoCreate, db: AsyncSession = Depends(get_db)):
+    """Encola un reporte; se consulta con GET /api/trabajos/{id} y se baja de /descarga."""
+    try:
+        return await trabajos.encolar(db, datos.tipo, datos.parametros)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+@router.get("/", response_model=List[schemas.TrabajoRead])
+async def listar_trabajos(
+    estado: Optional[str] = None,
+    limite: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    return await trabajos.listar(db, estado=estado, limite=limite)
+
+
+@router.get("/{trabajo_id}", response_model=schemas.TrabajoRead)
+async def obtener_trabajo(trabajo_id: int, db: AsyncSession = Depends(get_db)):
+    return await _trabajo(db, trabajo_id)
+
+
+@router.get("/{trabajo_id}/descarga")
+async def descargar_resultado(trabajo_id: int, db: AsyncSession = Depends(get_db)):
+    trabajo = await _trabajo(db, trabajo_id)
+    if trabajo.estado != trabajos.TERMINADO:
+        raise HTTPException(409, f"El trabajo está {trabajo.estado}")
+    if not trabajo.archivo or not os.path.exists(trabajo.archivo):
+        raise HTTPException(410, "El resultado ya no está disponible")
+    anio = trabajo.parametros.get("anio", "")
+    return FileResponse(
+        trabajo.archivo,
+        media_type="text/csv; charset=utf-8",
+        filename=f"{trabajo.tipo}_{anio}_{trabajo.id}.csv",
+    )
+
+
+@router.post("/{trabajo_id}/cancelar", response_model=schemas.TrabajoRead)
+async def cancelar_trabajo(trabajo_id: int, db: AsyncSession = Depends(get_db)):
+    trabajo = await trabajos.cancelar(db, trabajo_id)
+    if trabajo is None:
+        raise HTTPException(404, "Trabajo no encontrado")
+    if trabajo.estado in (trabajos.TERMINADO, trabajos.ERROR):
+        raise HTTPException(409, f"El trabajo ya está {trabajo.estado}")
+    return trabajo
@@ -7,8 +7,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
 import schemas
 import crud
+from negociacion import RespuestaNegociada, RutaNegociada
 
-router = APIRouter(prefix="/api/usuarios", tags=["Usuarios"])
+router = APIRouter(
+    prefix="/api/usuarios",
+    tags=["Usuarios"],
+    route_class=RutaNegociada,
+    default_response_class=RespuestaNegociada,
+)
 
 @router.get("/", response_model=List[schemas.UsuarioRead])
 async def listar_usuarios(
@@ -36,14 +42,14 @@ async def actualizar_usuario(usuario_id: int, payload: schemas.UsuarioUpdate, db
 
 @router.delete("/{usuario_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def borrar_usuario(usuario_id: int, db: AsyncSession = Depends(get_db)):
-    usuario = await crud.obtener_usuario(db, usuario_id)
-
-    descripcion = f"Usuario {usuario.nombre} eliminado"
-
-    await crud._registrar_eliminado(db, "usuarios", usuario.id, {"nombre": usuario.nombre})
     await crud.borrar_usuario(db, usuario_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
-@router.get("/historial/eliminados", response_model=List[schemas.HistorialEliminadoRead])
-async def historial_usuarios_eliminados(db: AsyncSession = Depends(get_db)):
-    return await crud.listar_historial(db)
+@router.get("/historial/eliminados", response_model=List[schemas.HistorialEliminadoRead], deprecated=True)
+async def historial_usuarios_eliminados(
+    despues_de: Optional[int] = Query(None, description="id de la última fila recibida"),
+    limite: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    """Obsoleto: usar GET /api/historial/. Página de `limite` filas, la más nueva primero."""
+    return await crud.listar_historial(db, despues_de=despues_de, limite=limite)
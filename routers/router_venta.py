@@ -0,0 +1,37 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db
+import schemas
+import crud
+from negociacion import RespuestaNegociada, RutaNegociada
+
+router = APIRouter(
+    prefix="/api/ventas",
+    tags=["Ventas"],
+    route_class=RutaNegociada,
+    default_response_class=RespuestaNegociada,
+)
+
+
+@router.post("/", response_model=schemas.VentaRead, status_code=status.HTTP_201_CREATED)
+async def crear_venta(payload: schemas.VentaCreate, db: AsyncSession = Depends(get_db)):
+    """Canasta completa en una sola petición y una sola transacción."""
+    return await crud.crear_venta(db, payload)
+
+
+@router.get("/", response_model=List[schemas.VentaRead])
+async def listar_ventas(
+    cliente_id: Optional[int] = None,
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    return await crud.listar_ventas(db, cliente_id=cliente_id, fecha_desde=fecha_desde, fecha_hasta=fecha_hasta)
+
+
+@router.get("/{venta_id}", response_model=schemas.VentaRead)
+async def obtener_venta(venta_id: int, db: AsyncSession = Depends(get_db)):
+    return await crud.obtener_venta(db, venta_id)
@@ -1,5 +1,5 @@
 # schemas.py
-from pydantic import BaseModel, EmailStr, ConfigDict
+from pydantic import BaseModel, EmailStr, ConfigDict, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -45,7 +45,7 @@ class UsuarioBase(BaseModel):
     rol: str                       # "administrador" / "cliente"
     cedula: str                    # única
     tipo: Optional[str] = None     # mayorista / minorista
-    cliente_frecuente: bool = False
+    cliente_frecuente: bool = False  # derivado (segmentacion.py); manual solo con SEGMENTACION=0
 
 
 class UsuarioCreate(UsuarioBase):
@@ -77,7 +77,7 @@ class ClienteBase(BaseModel):
     nombre: str
     cedula: str
     tipo_cliente: Optional[str] = None    # mayorista / minorista
-    cliente_frecuente: bool = False
+    cliente_frecuente: bool = False       # derivado (segmentacion.py); manual solo con SEGMENTACION=0
     telefono: Optional[str] = None
     direccion: Optional[str] = None
     usuario_id: Optional[int] = None
@@ -193,12 +193,63 @@ class CompraUpdate(BaseModel):
 class CompraRead(CompraBase):
     id: int
     fecha: datetime
+    venta_id: Optional[int] = None
     cliente: Optional["ClienteRead"] = None
     producto: Optional["ProductoRead"] = None
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class CompraBulkCreada(BaseModel):
+    indice: int  # posición en el lote enviado
+    id: int
+
+
+class CompraBulkError(BaseModel):
+    indice: int
+    error: str
+
+
+class CompraBulkResultado(BaseModel):
+    creadas: List[CompraBulkCreada]
+    errores: List[CompraBulkError]
+
+
+# ==========================
+# --------- VENTA ----------
+# ==========================
+class VentaLineaCreate(BaseModel):
+    producto_id: int
+    cantidad: int = Field(gt=0)
+    # Si no viene, se usa el precio del producto (mayorista si aplica)
+    precio_unitario_aplicado: Optional[float] = None
+
+
+class VentaCreate(BaseModel):
+    cliente_id: int
+    lineas: List[VentaLineaCreate] = Field(min_length=1)
+
+
+class VentaLineaRead(BaseModel):
+    id: int
+    producto_id: int
+    cantidad: int
+    precio_unitario_aplicado: float
+    total: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class VentaRead(BaseModel):
+    id: int
+    cliente_id: int
+    total: float
+    fecha: datetime
+    lineas: List[VentaLineaRead] = []
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 # ==========================
 # ---- HISTORIAL DELETE ----
 # ==========================
@@ -210,3 +261,143 @@ class HistorialEliminadoRead(BaseModel):
     eliminado_en: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class HistorialPagina(BaseModel):
+    items: List[HistorialEliminadoRead]
+    # Cursor para la página siguiente (`despues_de`); None si no hay más
+    siguiente: Optional[int] = None
+
+
+# ==========================
+# ---- SINCRONIZACIÓN POS --
+# ==========================
+class SyncProductos(BaseModel):
+    upserts: List[ProductoRead] = []
+    eliminados: List[int] = []
+
+
+class SyncCategorias(BaseModel):
+    upserts: List[CategoriaRead] = []
+    eliminados: List[int] = []
+
+
+class SyncClientes(BaseModel):
+    upserts: List[ClienteRead] = []
+    eliminados: List[int] = []
+
+
+class SyncRespuesta(BaseModel):
+    token: int
+    # True: es una copia completa, el cliente debe reemplazar su réplica
+    completo: bool
+    # True: quedan más cambios, volver a pedir con el token nuevo
+    hay_mas: bool
+    productos: SyncProductos
+    categorias: SyncCategorias
+    clientes: SyncClientes
+
+
+# ==========================
+# ------- TRABAJOS ---------
+# ==========================
+class TrabajoCreate(BaseModel):
+    tipo: str  # ver GET /api/trabajos/tipos
+    parametros: dict = {}
+
+
+class TrabajoRead(BaseModel):
+    id: int
+    tipo: str
+    parametros: dict
+    estado: str
+    progreso: float
+    mensaje: Optional[str] = None
+    filas: Optional[int] = None
+    intentos: int
+    creado_en: datetime
+    iniciado_en: Optional[datetime] = None
+    terminado_en: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+# ==========================
+# ---- ALERTAS DE STOCK ----
+# ==========================
+class UmbralStockSet(BaseModel):
+    minimo: int = Field(ge=0)
+
+
+class UmbralStockRead(BaseModel):
+    id: int
+    producto_id: Optional[int] = None
+    categoria_id: Optional[int] = None
+    minimo: int
+    actualizado_en: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class AlertaStock(BaseModel):
+    producto_id: int
+    nombre: Optional[str] = None
+    categoria_id: Optional[int] = None
+    cantidad: int
+    minimo: int
+    # "producto" o "categoria": de dónde sale el umbral
+    origen: str
+    desde: datetime
+
+
+# ==========================
+# ---- PRONÓSTICOS ---------
+# ==========================
+class PronosticoRecalcular(BaseModel):
+    dias: Optional[int] = None  # por defecto PRONOSTICOS_DIAS
+    alfa: Optional[float] = None  # por defecto PRONOSTICOS_ALFA
+
+
+class Reposicion(BaseModel):
+    producto_id: int
+    nombre: Optional[str] = None
+    categoria_id: Optional[int] = None
+    cantidad: int
+    # Unidades por día
+    demanda_diaria: float
+    promedio_7: float
+    promedio_28: float
+    desvio: float
+    estacionalidad: List[float]  # lunes..domingo
+    punto_reorden: float
+    stock_objetivo: float
+    # None: sin ventas en la ventana
+    dias_restantes: Optional[float] = None
+    sugerido: int
+    unidades: int
+    dias: int
+    calculado_en: datetime
+
+
+# ==========================
+# ---- SEGMENTACIÓN RFM ----
+# ==========================
+class RfmClienteRead(BaseModel):
+    cliente_id: int
+    ultima_compra: Optional[datetime] = None
+    visitas: int
+    monto: float
+    recencia: int
+    frecuencia: int
+    monetario: int
+    segmento: str
+    actualizado_en: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ResumenSegmentos(BaseModel):
+    segmentos: dict  # segmento -> clientes
+    frecuentes: int
+    no_frecuentes: int
+    calculado_en: Optional[datetime] = None  # último cálculo completo
@@ -0,0 +1,74 @@
+# scripts/archivar_compras.py
+"""
+Pasa los meses cerrados de compras al archivo columnar (archivo_compras.py)
+y los borra de la tabla.
+
+Uso:
+    python -m scripts.archivar_compras --mes 2024-01
+    python -m scripts.archivar_compras --meses-atras 12   # todo lo anterior a hace 12 meses
+    python -m scripts.archivar_compras --listar
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timezone
+from typing import List
+
+from sqlalchemy import func, select
+
+from archivo_compras import archivar_mes, archivo_compras
+from database import AsyncSessionLocal
+from models import Compra
+
+
+def _mes_menos(meses: int) -> str:
+    hoy = datetime.now(timezone.utc)
+    total = hoy.year * 12 + hoy.month - 1 - meses
+    return f"{total // 12:04d}-{total % 12 + 1:02d}"
+
+
+async def meses_con_compras(antes_de: str) -> List[str]:
+    """Meses (AAAA-MM) que todavía tienen compras en la tabla, anteriores a `antes_de`."""
+    async with AsyncSessionLocal() as db:
+        primera = (await db.execute(select(func.min(Compra.fecha)))).scalar()
+    if primera is None:
+        return []
+    meses, total = [], primera.year * 12 + primera.month - 1
+    while f"{total // 12:04d}-{total % 12 + 1:02d}" < antes_de:
+        meses.append(f"{total // 12:04d}-{total % 12 + 1:02d}")
+        total += 1
+    return meses
+
+
+async def principal(args) -> int:
+    if args.listar:
+        for mes in archivo_compras.estado()["meses"]:
+            print(f"{mes['mes']}  {mes['filas']:>9} filas  {mes['total']:>14.2f}")
+        return 0
+
+    meses = [args.mes] if args.mes else await meses_con_compras(_mes_menos(args.meses_atras))
+    for mes in meses:
+        async with AsyncSessionLocal() as db:
+            try:
+                resultado = await archivar_mes(db, mes)
+            except (ValueError, RuntimeError) as e:
+                print(f"⚠ {mes}: {e}")
+                return 1
+        if resultado["archivadas"]:
+            print(f"✔ {mes}: {resultado['archivadas']} compras archivadas ({resultado['filas_mes']} en el mes)")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument("--mes", help="mes cerrado AAAA-MM")
+    grupo.add_argument("--meses-atras", type=int, help="archiva todo lo anterior a hace N meses")
+    grupo.add_argument("--listar", action="store_true", help="muestra los meses ya archivados")
+    sys.exit(asyncio.run(principal(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
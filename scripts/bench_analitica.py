@@ -0,0 +1,241 @@
+# scripts/bench_analitica.py
+"""
+Benchmark del motor de análisis (analitica.py) contra el camino SQL.
+
+Siembra una base SQLite desechable con N compras (10 millones por defecto)
+y corre las mismas preguntas por las dos vías:
+
+- ventas por categoría y mes (JOIN con productos + GROUP BY);
+- tabla tipo de cliente x mes (JOIN con clientes + GROUP BY);
+- top 10 clientes de un trimestre (filtro por fecha + GROUP BY + ORDER BY).
+
+Comprueba que den lo mismo y reporta el mejor tiempo de cada una, más lo que
+cuesta la foto: carga completa, memoria y un refresco incremental tras
+insertar compras nuevas.
+
+Uso:
+    python -m scripts.bench_analitica
+    python -m scripts.bench_analitica --filas 1000000 --repeticiones 5
+    python -m scripts.bench_analitica --min-aceleracion 5   # falla si no es 5x más rápido
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import desc, func, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from scripts.bench_comun import crear_motor, ruta_temporal, sembrar
+
+# Sin meses archivados de la instalación real en la foto
+os.environ.setdefault("COMPRAS_ARCHIVO_DIR", ruta_temporal("archivo_compras_vacio"))
+
+LOTE_COMPRAS = 200_000
+DIAS = 730
+
+
+async def agregar_compras(motor: AsyncEngine, desde_id: int, cantidad: int, dimensiones: int, semilla: int = 11) -> None:
+    """Compras sintéticas con ids a partir de `desde_id` (generadas con NumPy, insertadas por lotes)."""
+    import numpy as np
+
+    rnd = np.random.default_rng(semilla + desde_id)
+    ahora = int(time.time())
+    sql = (
+        "INSERT INTO compras (id, cliente_id, producto_id, cantidad, precio_unitario_aplicado, total, fecha) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)"
+    )
+    async with motor.begin() as conn:
+        for inicio in range(0, cantidad, LOTE_COMPRAS):
+            n = min(LOTE_COMPRAS, cantidad - inicio)
+            ids = np.arange(desde_id + inicio, desde_id + inicio + n)
+            cantidades = rnd.integers(1, 11, n)
+            precios = np.round(rnd.uniform(500, 50_000, n), 2)
+            fechas = np.datetime_as_string(
+                (ahora - rnd.integers(0, DIAS * 86400, n)).astype("datetime64[s]"), unit="s"
+            )
+            filas = zip(
+                ids.tolist(),
+                rnd.integers(1, dimensiones + 1, n).tolist(),
+                rnd.integers(1, dimensiones + 1, n).tolist(),
+                cantidades.tolist(),
+                precios.tolist(),
+                np.round(precios * cantidades, 2).tolist(),
+                np.char.replace(fechas, "T", " ").tolist(),
+            )
+            await conn.exec_driver_sql(sql, list(filas))
+
+
+# ======================================================
+# ===================== PREGUNTAS ======================
+# ======================================================
+
+def _trimestre() -> Tuple[str, str]:
+    import numpy as np
+
+    hasta = np.datetime64("today", "M") - 1
+    return str(hasta - 2), str(hasta)
+
+
+async def sql_categoria_mes(db: AsyncSession) -> Dict[Tuple, Tuple[int, float]]:
+    from estadisticas import _mes_sql
+    from models import Compra, Producto
+
+    mes = _mes_sql(db.bind.dialect.name)
+    q = await db.execute(
+        select(Producto.categoria_id, mes, func.count(), func.sum(Compra.total))
+        .join(Producto, Producto.id == Compra.producto_id)
+        .group_by(Producto.categoria_id, mes)
+    )
+    return {(c, m): (n, t) for c, m, n, t in q.all()}
+
+
+async def sql_tipo_mes(db: AsyncSession) -> Dict[Tuple, Tuple[int, float]]:
+    from estadisticas import _mes_sql
+    from models import Cliente, Compra
+
+    mes = _mes_sql(db.bind.dialect.name)
+    q = await db.execute(
+        select(Cliente.tipo_cliente, mes, func.count(), func.sum(Compra.total))
+        .join(Cliente, Cliente.id == Compra.cliente_id)
+        .group_by(Cliente.tipo_cliente, mes)
+    )
+    return {(t, m): (n, s) for t, m, n, s in q.all()}
+
+
+async def sql_top_clientes(db: AsyncSession) -> Dict[Tuple, Tuple[int, float]]:
+    from archivo_compras import rango_mes
+    from models import Compra
+
+    desde, hasta = _trimestre()
+    total = func.sum(Compra.total).label("total")
+    q = await db.execute(
+        select(Compra.cliente_id, func.count(), total)
+        .where(Compra.fecha >= rango_mes(desde)[0], Compra.fecha < rango_mes(hasta)[1])
+        .group_by(Compra.cliente_id)
+        .order_by(desc(total))
+        .limit(10)
+    )
+    return {(c,): (n, t) for c, n, t in q.all()}
+
+
+def _desde_motor(filas: List[Dict[str, Any]], dimensiones: Tuple[str, ...]) -> Dict[Tuple, Tuple[int, float]]:
+    return {tuple(f[d] for d in dimensiones): (f["compras"], f["total"]) for f in filas}
+
+
+def preguntas_motor(snapshot) -> Dict[str, Callable[[], Dict[Tuple, Tuple[int, float]]]]:
+    desde, hasta = _trimestre()
+    return {
+        "categoria_mes": lambda: _desde_motor(snapshot.agrupar(("categoria", "mes"), ("compras", "total")), ("categoria", "mes")),
+        "tipo_mes": lambda: _desde_motor(snapshot.agrupar(("tipo_cliente", "mes"), ("compras", "total")), ("tipo_cliente", "mes")),
+        "top_clientes": lambda: _desde_motor(
+            snapshot.agrupar(("cliente",), ("compras", "total"), {"desde": desde, "hasta": hasta}, orden="total", limite=10),
+            ("cliente",),
+        ),
+    }
+
+
+PREGUNTAS_SQL: Dict[str, Callable[[AsyncSession], Awaitable[Dict[Tuple, Tuple[int, float]]]]] = {
+    "categoria_mes": sql_categoria_mes,
+    "tipo_mes": sql_tipo_mes,
+    "top_clientes": sql_top_clientes,
+}
+
+
+def _iguales(a: Dict[Tuple, Tuple[int, float]], b: Dict[Tuple, Tuple[int, float]]) -> bool:
+    if a.keys() != b.keys():
+        return False
+    return all(a[k][0] == b[k][0] and math.isclose(a[k][1], b[k][1], rel_tol=1e-6) for k in a)
+
+
+# ======================================================
+# ===================== MEDICIÓN =======================
+# ======================================================
+
+async def medir(ruta_db: str, filas: int, repeticiones: int, nuevas: int, dimensiones: int) -> Dict[str, Any]:
+    from analitica import SnapshotVentas
+
+    motor = crear_motor(ruta_db)
+    sesiones = async_sessionmaker(bind=motor, class_=AsyncSession, expire_on_commit=False)
+    resultado: Dict[str, Any] = {"filas": filas, "preguntas": {}}
+
+    async with sesiones() as db:
+        snapshot = SnapshotVentas()
+        t0 = time.perf_counter()
+        await snapshot.cargar(db)
+        resultado["carga_s"] = round(time.perf_counter() - t0, 2)
+        resultado["memoria_mb"] = round(snapshot.estado()["bytes"] / 1e6, 1)
+
+        motor_preguntas = preguntas_motor(snapshot)
+        for nombre, pregunta_sql in PREGUNTAS_SQL.items():
+            tiempos_sql, tiempos_motor = [], []
+            for _ in range(repeticiones):
+                t0 = time.perf_counter()
+                esperado = await pregunta_sql(db)
+                tiempos_sql.append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                obtenido = motor_preguntas[nombre]()
+                tiempos_motor.append(time.perf_counter() - t0)
+            resultado["preguntas"][nombre] = {
+                "sql_ms": round(min(tiempos_sql) * 1000, 1),
+                "motor_ms": round(min(tiempos_motor) * 1000, 1),
+                "aceleracion": round(min(tiempos_sql) / max(min(tiempos_motor), 1e-9), 1),
+                "iguales": _iguales(esperado, obtenido),
+            }
+
+    # Refresco incremental: compras nuevas insertadas "por otro lado"
+    await agregar_compras(motor, snapshot.ultimo_id + 1, nuevas, dimensiones, semilla=99)
+    async with sesiones() as db:
+        t0 = time.perf_counter()
+        await snapshot.refrescar(db)
+        resultado["refresco_incremental"] = {
+            "nuevas": nuevas,
+            "ms": round((time.perf_counter() - t0) * 1000, 1),
+            "filas_foto": snapshot.n,
+        }
+    await motor.dispose()
+    return resultado
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Motor de análisis NumPy vs GROUP BY en SQL")
+    parser.add_argument("--filas", type=int, default=10_000_000, help="compras en la base")
+    parser.add_argument("--dimensiones", type=int, default=10_000, help="clientes y productos")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--nuevas", type=int, default=1_000, help="compras para el refresco incremental")
+    parser.add_argument("--min-aceleracion", type=float, help="falla si alguna pregunta no es al menos Nx más rápida")
+    args = parser.parse_args(argv)
+
+    # La base se siembra una vez por tamaño; el refresco le agrega filas, así que se rehace si cambió
+    ruta_db = ruta_temporal(f"analitica_{args.filas}_{args.dimensiones}.db")
+    if os.path.exists(ruta_db):
+        os.remove(ruta_db)
+    motor = crear_motor(ruta_db)
+    t0 = time.perf_counter()
+    asyncio.run(sembrar(motor, args.dimensiones))
+    if args.filas > args.dimensiones:
+        asyncio.run(agregar_compras(motor, args.dimensiones + 1, args.filas - args.dimensiones, args.dimensiones))
+    print(f"✔ Base sembrada en {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+
+    resultado = asyncio.run(medir(ruta_db, args.filas, args.repeticiones, args.nuevas, args.dimensiones))
+    print(json.dumps(resultado, indent=2))
+
+    errores = []
+    for nombre, pregunta in resultado["preguntas"].items():
+        if not pregunta["iguales"]:
+            errores.append(f"{nombre}: el motor y SQL no dan lo mismo")
+        if args.min_aceleracion is not None and pregunta["aceleracion"] < args.min_aceleracion:
+            errores.append(f"{nombre}: {pregunta['aceleracion']}x < {args.min_aceleracion}x")
+    for error in errores:
+        print(f"✖ {error}", file=sys.stderr)
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# scripts/bench_comun.py
+"""
+Utilidades compartidas por los benchmarks: base SQLite desechable con datos
+sintéticos y un cliente HTTP en proceso que usa esa base en lugar de la real.
+"""
+from __future__ import annotations
+
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
+
+import httpx
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from database import Base, get_db
+from models import Categoria, Cliente, Compra, Producto
+
+LOTE = 20_000
+
+
+def crear_motor(ruta_db: str) -> AsyncEngine:
+    return create_async_engine(f"sqlite+aiosqlite:///{ruta_db}", poolclass=NullPool)
+
+
+async def sembrar(
+    motor: AsyncEngine,
+    filas: int,
+    categorias: int = 20,
+    semilla: int = 7,
+) -> None:
+    """
+    Crea el esquema y lo llena con `filas` clientes, productos y compras.
+    Usa INSERT multi-fila por lotes; no pasa por crud.py.
+    """
+    rnd = random.Random(semilla)
+    ahora = datetime.now(timezone.utc)
+
+    async with motor.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+        await conn.execute(
+            insert(Categoria),
+            [
+                {"id": i, "nombre": f"Categoria {i}", "codigo": f"C{i:03d}", "actualizado_en": ahora}
+                for i in range(1, categorias + 1)
+            ],
+        )
+
+        for inicio in range(0, filas, LOTE):
+            fin = min(filas, inicio + LOTE)
+            await conn.execute(
+                insert(Producto),
+                [
+                    {
+                        "id": i,
+                        "nombre": f"Producto {i}",
+                        "descripcion": "Producto sintético de benchmark",
+                        "cantidad": rnd.randint(0, 500),
+                        "valor_unitario": round(rnd.uniform(500, 50_000), 2),
+                        "valor_mayorista": round(rnd.uniform(400, 40_000), 2),
+                        "categoria_id": rnd.randint(1, categorias),
+                        "actualizado_en": ahora,
+                    }
+                    for i in range(inicio + 1, fin + 1)
+                ],
+            )
+            await conn.execute(
+                insert(Cliente),
+                [
+                    {
+                        "id": i,
+                        "nombre": f"Cliente {i}",
+                        "cedula": f"{10_000_000 + i}",
+                        "tipo_cliente": "mayorista" if i % 5 == 0 else "minorista",
+                        "cliente_frecuente": i % 7 == 0,
+                        "telefono": "3000000000",
+                        "direccion": "Calle 1 # 2-3",
+                    }
+                    for i in range(inicio + 1, fin + 1)
+                ],
+            )
+            compras = []
+            for i in range(inicio + 1, fin + 1):
+                cantidad = rnd.randint(1, 10)
+                precio = round(rnd.uniform(500, 50_000), 2)
+                compras.append(
+                    {
+                        "id": i,
+                        "cliente_id": rnd.randint(1, filas),
+                        "producto_id": rnd.randint(1, filas),
+                        "cantidad": cantidad,
+                        "precio_unitario_aplicado": precio,
+                        "total": round(precio * cantidad, 2),
+                        "fecha": ahora - timedelta(minutes=rnd.randint(0, 60 * 24 * 730)),
+                    }
+                )
+            await conn.execute(insert(Compra), compras)
+
+
+def cliente_en_proceso(motor: AsyncEngine, app=None) -> httpx.AsyncClient:
+    """
+    Cliente httpx contra la app en proceso, con `get_db` apuntando a `motor`.
+    """
+    if app is None:
+        from main import app
+
+    sesiones = async_sessionmaker(bind=motor, class_=AsyncSession, expire_on_commit=False)
+
+    async def get_db_bench() -> AsyncIterator[AsyncSession]:
+        async with sesiones() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = get_db_bench
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+
+
+def ruta_temporal(nombre: str, directorio: Optional[str] = None) -> str:
+    directorio = directorio or os.getenv("BENCH_DIR", ".bench")
+    os.makedirs(directorio, exist_ok=True)
+    return os.path.join(directorio, nombre)
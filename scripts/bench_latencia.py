@@ -0,0 +1,153 @@
+# scripts/bench_latencia.py
+"""
+Benchmark de latencia de cola con fallas de base de datos inyectadas.
+
+Genera carga de lazo abierto (N peticiones/s, lleguen o no las respuestas)
+contra la app en proceso, primero con la base "sana" y luego con la
+latencia/fallas de fallas.py. Reporta p50/p95/p99, códigos de respuesta y
+cuántas peticiones llegaron a estar en vuelo a la vez, para comprobar que
+los timeouts, el pool y el control de admisión mantienen el servicio
+respondiendo en lugar de acumular corrutinas.
+
+Uso:
+    python -m scripts.bench_latencia --fallas "latencia_ms=50,jitter_ms=100,p_lock=0.01"
+    python -m scripts.bench_latencia --admision 32 --timeout 2 --p99-max-ms 2500
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from scripts.bench_comun import cliente_en_proceso, crear_motor, ruta_temporal, sembrar
+from scripts.replay_trafico import percentil
+
+
+def _peticion_aleatoria(rnd: random.Random, filas: int) -> str:
+    r = rnd.random()
+    if r < 0.5:
+        return f"/api/productos/?categoria_id={rnd.randint(1, 20)}"
+    if r < 0.8:
+        return f"/compras/{rnd.randint(1, filas)}"
+    return "/api/categorias/"
+
+
+async def escenario(
+    nombre: str,
+    ruta_db: str,
+    filas: int,
+    tasa: float,
+    duracion_s: float,
+    fallas: Optional[str],
+) -> Dict[str, Any]:
+    import admision
+    from fallas import ConfigFallas, contadores, instalar_fallas
+
+    motor = crear_motor(ruta_db)
+    if fallas:
+        instalar_fallas(motor, ConfigFallas.desde_texto(fallas))
+
+    rnd = random.Random(11)
+    latencias: List[float] = []
+    estados: Counter = Counter()
+    en_vuelo = 0
+    en_vuelo_max = 0
+    tareas_max = 0
+    admision_antes = dict(admision.metricas)
+    fallas_antes = contadores.como_dict()
+
+    async with cliente_en_proceso(motor) as cliente:
+
+        async def una(url: str) -> None:
+            nonlocal en_vuelo, en_vuelo_max
+            en_vuelo += 1
+            en_vuelo_max = max(en_vuelo_max, en_vuelo)
+            t0 = time.perf_counter()
+            try:
+                resp = await cliente.get(url)
+                estados[resp.status_code] += 1
+            except Exception as e:  # la falla inyectada puede subir como excepción
+                estados[type(e).__name__] += 1
+            finally:
+                latencias.append((time.perf_counter() - t0) * 1000)
+                en_vuelo -= 1
+
+        tareas = []
+        inicio = time.perf_counter()
+        n = int(tasa * duracion_s)
+        for i in range(n):
+            objetivo = i / tasa
+            espera = objetivo - (time.perf_counter() - inicio)
+            if espera > 0:
+                await asyncio.sleep(espera)
+            tareas.append(asyncio.create_task(una(_peticion_aleatoria(rnd, filas))))
+            tareas_max = max(tareas_max, len(asyncio.all_tasks()))
+        await asyncio.gather(*tareas)
+        total = time.perf_counter() - inicio
+
+    await motor.dispose()
+    fallas_despues = contadores.como_dict()
+
+    return {
+        "escenario": nombre,
+        "peticiones": n,
+        "duracion_s": round(total, 2),
+        "estados": {str(k): v for k, v in estados.items()},
+        "p50_ms": round(percentil(latencias, 50), 1),
+        "p95_ms": round(percentil(latencias, 95), 1),
+        "p99_ms": round(percentil(latencias, 99), 1),
+        "max_ms": round(max(latencias, default=0.0), 1),
+        "en_vuelo_max": en_vuelo_max,
+        "tareas_asyncio_max": tareas_max,
+        "admision": {k: admision.metricas[k] - admision_antes.get(k, 0) for k in ("rechazadas", "timeouts")},
+        "fallas": {k: round(fallas_despues[k] - fallas_antes[k], 3) for k in fallas_despues},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Latencia de cola con fallas de BD inyectadas")
+    parser.add_argument("--filas", type=int, default=5_000)
+    parser.add_argument("--tasa", type=float, default=100.0, help="peticiones por segundo")
+    parser.add_argument("--duracion", type=float, default=10.0, help="segundos por escenario")
+    parser.add_argument("--fallas", default="latencia_ms=50,jitter_ms=100,p_conexion=0.01,p_lock=0.01")
+    parser.add_argument("--admision", type=int, default=0, help="ADMISION_MAX_CONCURRENTES")
+    parser.add_argument("--timeout", type=float, default=0.0, help="ADMISION_TIMEOUT_S")
+    parser.add_argument("--p99-max-ms", type=float, help="falla si el p99 con fallas lo supera")
+    parser.add_argument("--en-vuelo-max", type=int, help="falla si se acumulan más peticiones en vuelo")
+    args = parser.parse_args(argv)
+
+    # El middleware se configura al importar main, así que va antes del import
+    if args.admision:
+        os.environ["ADMISION_MAX_CONCURRENTES"] = str(args.admision)
+    if args.timeout:
+        os.environ["ADMISION_TIMEOUT_S"] = str(args.timeout)
+
+    ruta_db = ruta_temporal(f"latencia_{args.filas}.db")
+    if not os.path.exists(ruta_db):
+        asyncio.run(sembrar(crear_motor(ruta_db), args.filas))
+
+    resultados = [
+        asyncio.run(escenario("base", ruta_db, args.filas, args.tasa, args.duracion, None)),
+        asyncio.run(escenario("fallas", ruta_db, args.filas, args.tasa, args.duracion, args.fallas)),
+    ]
+    print(json.dumps(resultados, indent=2))
+
+    con_fallas = resultados[1]
+    errores = []
+    if args.p99_max_ms is not None and con_fallas["p99_ms"] > args.p99_max_ms:
+        errores.append(f"p99 {con_fallas['p99_ms']} ms > {args.p99_max_ms} ms")
+    if args.en_vuelo_max is not None and con_fallas["en_vuelo_max"] > args.en_vuelo_max:
+        errores.append(f"en vuelo {con_fallas['en_vuelo_max']} > {args.en_vuelo_max}")
+    for error in errores:
+        print(f"✖ {error}", file=sys.stderr)
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+# scripts/bench_memoria.py
+"""
+Suite de regresión de memoria para respuestas grandes.
+
+Para cada tamaño de tabla siembra una base SQLite desechable y mide, por
+endpoint y en un subproceso aislado:
+  - pico de memoria Python (tracemalloc) durante la petición
+  - pico de RSS del proceso (muestreado cada pocos ms)
+
+Las dos peticiones medidas van con `Cache-Control: no-cache` y con la
+caché de consultas vacía: se mide la consulta completa, no un acierto.
+
+Los resultados se comparan con los presupuestos de
+scripts/presupuestos_memoria.json: lo observado más un 10 % para
+tracemalloc (casi determinista) y un 15 % para el RSS (entre corridas
+varía hasta ~7 % por el allocator y el muestreo). Si alguno se supera, el proceso termina con
+código 1, así las mejoras (paginación, streaming, esquemas ligeros) no se
+pierden en silencio.
+
+Uso:
+    python -m scripts.bench_memoria                       # 10k, 100k y 1M filas
+    python -m scripts.bench_memoria --filas 10000 100000
+    python -m scripts.bench_memoria --actualizar-presupuestos
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from cache_consultas import cache
+from scripts.bench_comun import cliente_en_proceso, crear_motor, ruta_temporal, sembrar
+
+ENDPOINTS = [
+    "/compras/",
+    "/api/productos/",
+    "/api/clientes/",
+]
+
+FILAS_POR_DEFECTO = [10_000, 100_000, 1_000_000]
+
+RUTA_PRESUPUESTOS = os.path.join(os.path.dirname(__file__), "presupuestos_memoria.json")
+
+# Holgura aplicada al escribir presupuestos nuevos a partir de una medición
+MARGEN = {"tracemalloc_mb": 1.10, "rss_mb": 1.15}
+
+# Sin caché de consultas (OmitirCacheMiddleware)
+SIN_CACHE = {"Cache-Control": "no-cache"}
+
+MB = 1024 * 1024
+
+
+# ======================================================
+# ================== MUESTREO RSS ======================
+# ======================================================
+
+def _lector_rss() -> Optional[Callable[[], int]]:
+    """Devuelve una función que lee el RSS actual en bytes, si hay forma."""
+    try:
+        import psutil  # opcional; necesario en Windows
+
+        proceso = psutil.Process()
+        return lambda: proceso.memory_info().rss
+    except ImportError:
+        pass
+
+    if os.path.exists("/proc/self/statm"):
+        pagina = os.sysconf("SC_PAGE_SIZE")
+
+        def leer() -> int:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * pagina
+
+        return leer
+
+    return None
+
+
+class MuestreadorRSS:
+    """Hilo que guarda el RSS máximo observado mientras está activo."""
+
+    def __init__(self, intervalo: float = 0.005):
+        self.intervalo = intervalo
+        self.leer = _lector_rss()
+        self.base = self.pico = self.leer() if self.leer else 0
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+
+    def __enter__(self) -> "MuestreadorRSS":
+        if self.leer:
+            self._hilo.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._parar.set()
+        if self.leer:
+            self._hilo.join()
+            self.pico = max(self.pico, self.leer())
+
+    def _bucle(self) -> None:
+        while not self._parar.wait(self.intervalo):
+            self.pico = max(self.pico, self.leer())
+
+
+# ======================================================
+# ================ MEDICIÓN (subproceso) ===============
+# ======================================================
+
+async def _medir(ruta_db: str, endpoint: str) -> Dict[str, float]:
+    motor = crear_motor(ruta_db)
+    async with cliente_en_proceso(motor) as cliente:
+        # Calentamiento con una petición trivial: imports, rutas, conexiones
+        await cliente.get("/health")
+        cache.vaciar()
+        gc.collect()
+
+        with MuestreadorRSS() as rss:
+            t0 = time.perf_counter()
+            resp = await cliente.get(endpoint, headers=SIN_CACHE)
+            duracion = time.perf_counter() - t0
+        resp.raise_for_status()
+        tamano = len(resp.content)
+        del resp
+        cache.vaciar()
+        gc.collect()
+
+        tracemalloc.start()
+        resp = await cliente.get(endpoint, headers=SIN_CACHE)
+        _, pico_py = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resp.raise_for_status()
+    await motor.dispose()
+
+    return {
+        "tracemalloc_mb": round(pico_py / MB, 2),
+        "rss_mb": round((rss.pico - rss.base) / MB, 2),
+        "respuesta_mb": round(tamano / MB, 2),
+        "duracion_s": round(duracion, 3),
+    }
+
+
+def medir_aislado(ruta_db: str, endpoint: str) -> Dict[str, float]:
+    """Mide un endpoint en un proceso nuevo para que el RSS no se contamine."""
+    salida = subprocess.run(
+        [sys.executable, "-m", "scripts.bench_memoria", "--medir", endpoint, "--db", ruta_db],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+# ======================================================
+# ==================== PRESUPUESTOS ====================
+# ======================================================
+
+def cargar_presupuestos() -> Dict[str, Dict[str, Dict[str, float]]]:
+    if not os.path.exists(RUTA_PRESUPUESTOS):
+        return {}
+    with open(RUTA_PRESUPUESTOS, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def comparar(
+    resultados: Dict[str, Dict[str, Dict[str, float]]],
+    presupuestos: Dict[str, Dict[str, Dict[str, float]]],
+) -> List[str]:
+    fallos = []
+    for endpoint, por_filas in resultados.items():
+        for filas, medida in por_filas.items():
+            limite = presupuestos.get(endpoint, {}).get(filas)
+            if not limite:
+                continue
+            for metrica in ("tracemalloc_mb", "rss_mb"):
+                if metrica in limite and medida[metrica] > limite[metrica]:
+                    fallos.append(
+                        f"{endpoint} @ {filas} filas: {metrica}={medida[metrica]} > {limite[metrica]}"
+                    )
+    return fallos
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Regresión de memoria por endpoint")
+    parser.add_argument("--filas", type=int, nargs="+", default=FILAS_POR_DEFECTO)
+    parser.add_argument("--endpoint", action="append", help="Endpoint a medir (repetible)")
+    parser.add_argument("--actualizar-presupuestos", action="store_true")
+    # Modo interno: medir un endpoint contra una base ya sembrada
+    parser.add_argument("--medir", help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.medir:
+        print(json.dumps(asyncio.run(_medir(args.db, args.medir))))
+        return 0
+
+    endpoints = args.endpoint or ENDPOINTS
+    resultados: Dict[str, Dict[str, Dict[str, float]]] = {e: {} for e in endpoints}
+
+    for filas in args.filas:
+        ruta_db = ruta_temporal(f"memoria_{filas}.db")
+        if not os.path.exists(ruta_db):
+            print(f"Sembrando {filas} filas en {ruta_db} ...", file=sys.stderr)
+            motor = crear_motor(ruta_db)
+            asyncio.run(sembrar(motor, filas))
+        for endpoint in endpoints:
+            medida = medir_aislado(ruta_db, endpoint)
+            resultados[endpoint][str(filas)] = medida
+            print(f"{endpoint:<20} {filas:>9} filas  {medida}", file=sys.stderr)
+
+    presupuestos = cargar_presupuestos()
+
+    if args.actualizar_presupuestos:
+        for endpoint, por_filas in resultados.items():
+            for filas, medida in por_filas.items():
+                presupuestos.setdefault(endpoint, {})[filas] = {
+                    metrica: round(medida[metrica] * margen, 1) for metrica, margen in MARGEN.items()
+                }
+        with open(RUTA_PRESUPUESTOS, "w", encoding="utf-8") as f:
+            json.dump(presupuestos, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Presupuestos actualizados en {RUTA_PRESUPUESTOS}", file=sys.stderr)
+        return 0
+
+    print(json.dumps(resultados, indent=2))
+    fallos = comparar(resultados, presupuestos)
+    for fallo in fallos:
+        print(f"✖ {fallo}", file=sys.stderr)
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
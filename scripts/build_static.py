@@ -0,0 +1,112 @@
+# scripts/build_static.py
+"""
+Build de archivos estáticos: huella de contenido + precompresión.
+
+Copia cada archivo de static/ (salvo static/dist/) a
+static/dist/<ruta>.<hash>.<ext>, escribe al lado sus versiones .gz y .br
+(solo para tipos de texto y si realmente ahorran bytes) y genera
+static/dist/manifest.json, que usa estaticos.asset() desde las plantillas.
+
+Uso:
+    python -m scripts.build_static
+    python -m scripts.build_static --verificar   # falla si el build está desactualizado
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from typing import Dict, List, Optional
+
+from compresion import COMPRIMIBLES, EXTENSIONES, precomprimir
+from estaticos import DIRECTORIO, DIST, MANIFIESTO
+
+
+def huella(datos: bytes) -> str:
+    return hashlib.blake2b(datos, digest_size=4).hexdigest()
+
+
+def con_huella(ruta: str, datos: bytes) -> str:
+    base, ext = os.path.splitext(ruta)
+    return f"{base}.{huella(datos)}{ext}"
+
+
+def fuentes(directorio: str = DIRECTORIO) -> List[str]:
+    """Rutas relativas (con /) de todo static/ salvo el propio dist/."""
+    rutas = []
+    for carpeta, subcarpetas, archivos in os.walk(directorio):
+        if carpeta == directorio and DIST in subcarpetas:
+            subcarpetas.remove(DIST)
+        for archivo in archivos:
+            completa = os.path.join(carpeta, archivo)
+            rutas.append(os.path.relpath(completa, directorio).replace(os.sep, "/"))
+    return sorted(rutas)
+
+
+def calcular_manifiesto(directorio: str = DIRECTORIO) -> Dict[str, str]:
+    resultado = {}
+    for ruta in fuentes(directorio):
+        with open(os.path.join(directorio, ruta), "rb") as f:
+            resultado[ruta] = con_huella(ruta, f.read())
+    return resultado
+
+
+def construir(directorio: str = DIRECTORIO) -> Dict[str, str]:
+    destino = os.path.join(directorio, DIST)
+    # Se regenera completo: así no quedan huellas viejas
+    shutil.rmtree(destino, ignore_errors=True)
+    os.makedirs(destino)
+
+    manifiesto = {}
+    for ruta in fuentes(directorio):
+        with open(os.path.join(directorio, ruta), "rb") as f:
+            datos = f.read()
+        nombre = con_huella(ruta, datos)
+        manifiesto[ruta] = nombre
+
+        salida = os.path.join(destino, *nombre.split("/"))
+        os.makedirs(os.path.dirname(salida), exist_ok=True)
+        with open(salida, "wb") as f:
+            f.write(datos)
+
+        if not ruta.endswith(COMPRIMIBLES):
+            continue
+        variantes = precomprimir(datos)
+        for codificacion, comprimido in variantes.items():
+            if codificacion == "identity" or len(comprimido) >= len(datos):
+                continue
+            with open(salida + EXTENSIONES[codificacion], "wb") as f:
+                f.write(comprimido)
+        print(f"✔ {ruta} -> {DIST}/{nombre} {({c: len(b) for c, b in variantes.items()})}")
+
+    with open(os.path.join(destino, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, indent=2, sort_keys=True)
+    return manifiesto
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Huella de contenido y precompresión de static/")
+    parser.add_argument("--verificar", action="store_true", help="solo comprueba que el build esté al día")
+    args = parser.parse_args(argv)
+
+    if args.verificar:
+        try:
+            with open(MANIFIESTO, encoding="utf-8") as f:
+                actual = json.load(f)
+        except OSError:
+            actual = None
+        if actual != calcular_manifiesto():
+            print("✖ static/dist está desactualizado: ejecuta python -m scripts.build_static", file=sys.stderr)
+            return 1
+        print("✔ static/dist al día")
+        return 0
+
+    construir()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+# scripts/replay_trafico.py
+"""
+Reproduce un archivo de tráfico capturado (ver trafico.py) contra una
+instancia de prueba, respetando los tiempos originales o acelerándolos.
+
+Uso:
+    python -m scripts.replay_trafico trafico.jsonl --base-url http://127.0.0.1:8000
+    python -m scripts.replay_trafico trafico.jsonl --velocidad 10      # 10x más rápido
+    python -m scripts.replay_trafico trafico.jsonl --velocidad 0       # sin esperas
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from trafico import MARCADOR
+
+
+def leer_trafico(ruta: str, solo: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    registros = []
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            reg = json.loads(linea)
+            if solo and not any(reg["path"].startswith(p) for p in solo):
+                continue
+            registros.append(reg)
+    registros.sort(key=lambda r: r["ts"])
+    return registros
+
+
+def _rellenar(valor: Any, secuencia: int, clave: Optional[str] = None) -> Any:
+    """
+    Sustituye los marcadores de campos saneados por valores sintéticos
+    únicos, para no chocar con validaciones de unicidad (cédula, correo).
+    """
+    if isinstance(valor, dict):
+        return {k: _rellenar(v, secuencia, k) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_rellenar(v, secuencia) for v in valor]
+    if valor == MARCADOR:
+        if clave == "correo":
+            return f"replay{secuencia}@example.com"
+        return f"r{secuencia}"
+    return valor
+
+
+def construir_peticion(reg: Dict[str, Any], secuencia: int) -> Dict[str, Any]:
+    peticion: Dict[str, Any] = {
+        "method": reg["metodo"],
+        "url": reg["path"],
+        "params": [(k, f"replay-{secuencia}" if v == MARCADOR else v) for k, v in reg.get("query", [])],
+    }
+    if "cuerpo" in reg:
+        cuerpo = _rellenar(reg["cuerpo"], secuencia)
+        if (reg.get("content_type") or "").startswith("application/json"):
+            peticion["json"] = cuerpo
+        else:
+            peticion["data"] = cuerpo
+    return peticion
+
+
+def percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[k]
+
+
+async def reproducir(
+    registros: List[Dict[str, Any]],
+    base_url: str,
+    velocidad: float = 1.0,
+    concurrencia: int = 50,
+    timeout: float = 30.0,
+) -> Dict[str, Any]:
+    """
+    Lanza cada petición en su instante relativo original dividido por
+    `velocidad` (0 = lo antes posible). Devuelve un resumen por ruta.
+    """
+    limite = asyncio.Semaphore(concurrencia)
+    latencias: Dict[str, List[float]] = defaultdict(list)
+    estados: Counter = Counter()
+    retraso_inicio: List[float] = []
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as cliente:
+        t0_original = registros[0]["ts"] if registros else 0.0
+        t0 = time.perf_counter()
+
+        async def lanzar(secuencia: int, reg: Dict[str, Any]) -> None:
+            objetivo = 0.0 if velocidad <= 0 else (reg["ts"] - t0_original) / velocidad
+            espera = objetivo - (time.perf_counter() - t0)
+            if espera > 0:
+                await asyncio.sleep(espera)
+            async with limite:
+                retraso_inicio.append(max(0.0, (time.perf_counter() - t0) - objetivo))
+                inicio = time.perf_counter()
+                try:
+                    resp = await cliente.request(**construir_peticion(reg, secuencia))
+                    estados[resp.status_code] += 1
+                except httpx.HTTPError as e:
+                    estados[type(e).__name__] += 1
+                latencias[f"{reg['metodo']} {reg.get('ruta') or reg['path']}"].append(
+                    (time.perf_counter() - inicio) * 1000
+                )
+
+        await asyncio.gather(*(lanzar(i, reg) for i, reg in enumerate(registros)))
+        total = time.perf_counter() - t0
+
+    return {
+        "peticiones": len(registros),
+        "duracion_s": round(total, 3),
+        "estados": dict(estados),
+        "retraso_inicio_p99_ms": round(percentil(retraso_inicio, 99) * 1000, 2),
+        "rutas": {
+            ruta: {
+                "n": len(v),
+                "p50_ms": round(percentil(v, 50), 2),
+                "p95_ms": round(percentil(v, 95), 2),
+                "p99_ms": round(percentil(v, 99), 2),
+            }
+            for ruta, v in sorted(latencias.items())
+        },
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Reproduce tráfico capturado contra una instancia de prueba")
+    parser.add_argument("archivo", help="JSONL generado por CapturaTraficoMiddleware")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--velocidad", type=float, default=1.0, help="1 = ritmo original, 10 = 10x, 0 = sin esperas")
+    parser.add_argument("--concurrencia", type=int, default=50)
+    parser.add_argument("--solo", action="append", help="Prefijo de path a reproducir (repetible)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args(argv)
+
+    registros = leer_trafico(args.archivo, args.solo)
+    resumen = asyncio.run(
+        reproducir(registros, args.base_url, args.velocidad, args.concurrencia, args.timeout)
+    )
+    print(json.dumps(resumen, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+# segmentacion.py
+"""
+Segmentación RFM de clientes (recencia, frecuencia, monto), que reemplaza el
+cliente_frecuente cargado a mano.
+
+El cálculo completo es un trabajo (tipo `segmentacion`, ver trabajos.py) y
+corre en el pool de procesos cada noche, pasada SEGMENTACION_HORA (UTC):
+
+- una pasada de agregación por cliente: compras (tabla por tramos de id y
+  archivo) y cabeceras de venta. Una visita es una venta o una compra
+  suelta;
+- puntajes 1..5 por quintiles entre los clientes con compras, y segmento
+  con las reglas de SEGMENTOS;
+- reemplaza la tabla `rfm_clientes` y actualiza en bloque
+  clientes.cliente_frecuente (solo los que cambian, con su entrada en el
+  diario) y usuarios.cliente_frecuente (el de sus clientes).
+
+Entre cálculos, cada venta suma su visita y su monto a la fila del cliente
+en la misma transacción (y editarla o borrarla los resta). Al vender, la
+recencia pasa a 5. La frecuencia y el monto se puntúan con los cortes del
+último cálculo (cada worker los tiene en memoria) y cliente_frecuente sigue
+al segmento en los dos sentidos. Bajar por el tiempo sin comprar lo recoge
+el cálculo nocturno.
+
+Variables de entorno:
+    SEGMENTACION            0 = no se calcula y cliente_frecuente vuelve a ser manual
+    SEGMENTACION_HORA       hora UTC del cálculo nocturno (por defecto 4)
+    SEGMENTACION_SONDEO_S   cada cuánto se mira si hay cálculo nuevo (por defecto 300)
+"""
+from __future__ import annotations
+
+import csv
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, case, cast, delete, exists, func, insert, select, update, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from archivo_compras import archivo_compras, np
+from cache_consultas import marcar_cambio
+from models import Cambio, Cliente, Compra, RfmCliente, Usuario, Venta
+
+ACTIVO = os.getenv("SEGMENTACION", "1") != "0" and np is not None
+HORA = int(os.getenv("SEGMENTACION_HORA", "4"))
+SONDEO_S = float(os.getenv("SEGMENTACION_SONDEO_S", "300"))
+
+LOTE = 50_000
+QUINTILES = (0.2, 0.4, 0.6, 0.8)
+
+# En orden: gana la primera regla que se cumple (r, f, m son puntajes 1..5)
+SEGMENTOS: Tuple[Tuple[str, Any], ...] = (
+    ("campeon", lambda r, f, m: (r >= 4) & (f >= 4) & (m >= 4)),
+    ("leal", lambda r, f, m: (r >= 3) & (f >= 4)),
+    ("en_riesgo", lambda r, f, m: (r <= 2) & (f >= 3)),
+    ("nuevo", lambda r, f, m: (r >= 4) & (f <= 2)),
+    ("perdido", lambda r, f, m: r <= 2),
+)
+OTRO = "ocasional"
+SIN_COMPRAS = "sin_compras"
+# Segmentos que cuentan como cliente_frecuente
+FRECUENTES = ("campeon", "leal")
+
+
+def _ahora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _no_negativo(expr):
+    return case((expr < 0, 0), else_=expr)
+
+
+def cortes(valores) -> Optional[List[float]]:
+    if not len(valores):
+        return None
+    return [float(c) for c in np.quantile(valores, QUINTILES)]
+
+
+def puntaje(valor, cortes_: List[float]):
+    """1..5: cuántos cortes quedan por debajo, más uno (un empate no sube)."""
+    return 1 + np.searchsorted(cortes_, valor, side="left")
+
+
+def segmentos(r, f, m):
+    """Arreglos de puntajes -> arreglo de nombres de segmento."""
+    r, f, m = np.asarray(r), np.asarray(f), np.asarray(m)
+    return np.select([regla(r, f, m) for _, regla in SEGMENTOS], [n for n, _ in SEGMENTOS], default=OTRO)
+
+
+# ======================================================
+# =============== CÁLCULO (PROCESO HIJO) ===============
+# ======================================================
+
+def validar(parametros: Dict[str, Any]) -> Dict[str, Any]:
+    return {}
+
+
+async def calcular(db: AsyncSession, parametros: Dict[str, Any], ruta: str, avance) -> int:
+    """Generador del trabajo `segmentacion` (ver trabajos.REPORTES)."""
+    if np is None:
+        raise RuntimeError("La segmentación necesita NumPy")
+    calculado_en = _ahora()
+    epoch = cast(func.extract("epoch", Compra.fecha), Integer)
+
+    clientes = (await db.execute(
+        select(Cliente.id, Cliente.cliente_frecuente).order_by(Cliente.id)
+    )).all()
+    largo = (clientes[-1][0] + 1) if clientes else 1
+    ultima = np.full(largo, -1, dtype=np.int64)
+    visitas = np.zeros(largo, dtype=np.int64)
+    monto = np.zeros(largo)
+
+    def acumular(ids, n_visitas, total, fecha_max):
+        ok = ids < largo  # clientes que ya no existen
+        ids = ids[ok]
+        visitas[:] += np.bincount(ids, weights=n_visitas[ok], minlength=largo).astype(np.int64)
+        monto[:] += np.bincount(ids, weights=total[ok], minlength=largo)
+        np.maximum.at(ultima, ids, fecha_max[ok])
+
+    # Cabeceras de venta: una visita cada una (se conservan aunque sus líneas se archiven)
+    q = await db.execute(
+        select(Venta.cliente_id, func.count(), func.max(cast(func.extract("epoch", Venta.fecha), Integer)))
+        .group_by(Venta.cliente_id)
+    )
+    filas = q.all()
+    await db.commit()
+    if filas:
+        a = np.array(filas, dtype=np.int64)
+        acumular(a[:, 0], a[:, 1], np.zeros(len(a)), a[:, 2])
+
+    meses = archivo_compras.meses() if archivo_compras.disponible else []
+    primero, ultimo = (await db.execute(select(func.min(Compra.id), func.max(Compra.id)))).one()
+    pasos = len(meses) + max(0, ((ultimo or -1) - (primero or 0)) // LOTE + 1)
+    hechos = 0
+    for mes in meses:
+        m = archivo_compras.abrir(mes)
+        if m is not None and m.filas:
+            ids = m["cliente_id"].astype(np.int64)
+            acumular(ids, (m["venta_id"] < 0).astype(np.int64), m["total"], m["fecha"].astype(np.int64))
+        hechos += 1
+        await avance(hechos, pasos + 1)
+
+    # Agregado por cliente de cada tramo de id; los tramos se suman
+    suelta = func.sum(case((Compra.venta_id.is_(None), 1), else_=0))
+    for inicio in range(primero or 0, (ultimo or -1) + 1, LOTE):
+        q = await db.execute(
+            select(Compra.cliente_id, suelta, func.sum(Compra.total), func.max(epoch))
+            .where(Compra.id >= inicio, Compra.id < inicio + LOTE)
+            .group_by(Compra.cliente_id)
+        )
+        filas = q.all()
+        await db.commit()
+        if filas:
+            a = np.array(filas, dtype=np.float64)
+            acumular(a[:, 0].astype(np.int64), a[:, 1], a[:, 2], a[:, 3].astype(np.int64))
+        hechos += 1
+        await avance(hechos, pasos + 1)
+
+    ids = np.array([c[0] for c in clientes], dtype=np.int64)
+    antes = np.array([bool(c[1]) for c in clientes], dtype=bool)
+    ultima, visitas, monto = ultima[ids], visitas[ids], monto[ids]
+    con = visitas > 0
+    dias = (int(calculado_en.timestamp()) - ultima) / 86400
+
+    r = np.zeros(len(ids), dtype=np.int64)
+    f = np.zeros(len(ids), dtype=np.int64)
+    m = np.zeros(len(ids), dtype=np.int64)
+    if con.any():
+        r[con] = 6 - puntaje(dias[con], cortes(dias[con]))  # menos días, más puntaje
+        f[con] = puntaje(visitas[con], cortes(visitas[con]))
+        m[con] = puntaje(monto[con], cortes(monto[con]))
+    segmento = np.where(con, segmentos(r, f, m), SIN_COMPRAS)
+    frecuente = np.isin(segmento, FRECUENTES)
+
+    filas = [
+        {
+            "cliente_id": int(ids[i]),
+            "ultima_compra": datetime.fromtimestamp(int(ultima[i]), timezone.utc) if con[i] else None,
+            "visitas": int(visitas[i]),
+            "monto": round(float(monto[i]), 2),
+            "recencia": int(r[i]),
+            "frecuencia": int(f[i]),
+            "monetario": int(m[i]),
+            "segmento": str(segmento[i]),
+            "calculado_en": calculado_en,
+            "actualizado_en": calculado_en,
+        }
+        for i in range(len(ids))
+    ]
+    cambiados = [(int(ids[i]), bool(frecuente[i])) for i in np.flatnonzero(frecuente != antes)]
+
+    # Una transacción: tabla nueva, marcas de los clientes que cambian y sus usuarios
+    await db.execute(delete(RfmCliente))
+    for i in range(0, len(filas), 1000):
+        await db.execute(insert(RfmCliente), filas[i:i + 1000])
+    if cambiados:
+        tabla = Cliente.__table__
+        await db.execute(
+            update(tabla).where(tabla.c.id == bindparam("cid")).values(cliente_frecuente=bindparam("frecuente")),
+            [{"cid": cid, "frecuente": valor} for cid, valor in cambiados],
+        )
+        # Diario de sincronización: los POS ven el cambio de cliente_frecuente
+        await db.execute(
+            insert(Cambio),
+            [{"tabla": "clientes", "registro_id": cid, "operacion": "update"} for cid, _ in cambiados],
+        )
+    await db.execute(
+        update(Usuario)
+        .where(exists().where(Cliente.usuario_id == Usuario.id))
+        .values(cliente_frecuente=exists().where(Cliente.usuario_id == Usuario.id, Cliente.cliente_frecuente.is_(True)))
+    )
+    await db.commit()
+
+    with open(ruta, "w", newline="", encoding="utf-8") as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow([
+            "cliente_id", "ultima_compra", "visitas", "monto", "recencia", "frecuencia", "monetario",
+            "segmento", "cliente_frecuente",
+        ])
+        for fila, es_frecuente in zip(filas, frecuente.tolist()):
+            escritor.writerow([
+                fila["cliente_id"], fila["ultima_compra"], fila["visitas"], fila["monto"], fila["recencia"],
+                fila["frecuencia"], fila["monetario"], fila["segmento"], es_frecuente,
+            ])
+    return len(filas)
+
+
+# ======================================================
+# ========== INCREMENTAL (EN CADA WORKER) ==============
+# ======================================================
+
+class Segmentacion:
+    def __init__(self):
+        self.calculado_en: Optional[datetime] = None
+        # Cortes de frecuencia y monto del último cálculo (None: todavía no hubo)
+        self.cortes_frecuencia: Optional[List[float]] = None
+        self.cortes_monto: Optional[List[float]] = None
+        self.ventas = 0
+        self.ascendidos = 0
+        self.descendidos = 0
+
+    async def recargar_si_cambio(self, db: AsyncSession) -> bool:
+        """Si hubo un cálculo completo nuevo, toma sus cortes e invalida las listas de clientes."""
+        ultimo = await db.scalar(select(func.max(RfmCliente.calculado_en)))
+        if ultimo is None or ultimo == self.calculado_en:
+            return False
+        q = await db.execute(
+            select(RfmCliente.visitas, RfmCliente.monto)
+            .where(RfmCliente.calculado_en == ultimo, RfmCliente.visitas > 0)
+        )
+        a = np.array(q.all(), dtype=np.float64).reshape(-1, 2)
+        self.cortes_frecuencia, self.cortes_monto = cortes(a[:, 0]), cortes(a[:, 1])
+        self.calculado_en = ultimo
+        marcar_cambio("clientes", "usuarios", "rfm_clientes")
+        return True
+
+    async def sumar(
+        self, db: AsyncSession, cliente_id: int, visitas: int, monto: float, compra_nueva: bool = True
+    ) -> Optional[bool]:
+        """
+        Aplica a la fila del cliente el cambio de una venta, dentro de la
+        transacción de la venta: positivo al venderse, negativo al editarla o
+        borrarla (`compra_nueva=False`: no toca la última compra ni la
+        recencia). Devuelve si ahora es frecuente, None si no hay con qué
+        puntuarlo (sin fila o sin cálculo previo).
+        """
+        if not ACTIVO:
+            return None
+        self.ventas += 1
+        valores = {
+            "visitas": _no_negativo(RfmCliente.visitas + visitas),
+            "monto": _no_negativo(RfmCliente.monto + monto),
+        }
+        if compra_nueva:
+            valores.update(ultima_compra=_ahora(), recencia=5)
+        r = await db.execute(
+            update(RfmCliente)
+            .where(RfmCliente.cliente_id == cliente_id)
+            .values(**valores)
+            .returning(RfmCliente.visitas, RfmCliente.monto, RfmCliente.recencia)
+        )
+        fila = r.one_or_none()
+        if fila is None or self.cortes_frecuencia is None:
+            return None
+        if fila.visitas <= 0:
+            f = m = 0
+            segmento = SIN_COMPRAS
+        else:
+            f = int(puntaje(fila.visitas, self.cortes_frecuencia))
+            m = int(puntaje(fila.monto, self.cortes_monto))
+            segmento = str(segmentos(fila.recencia, f, m))
+        await db.execute(
+            update(RfmCliente)
+            .where(RfmCliente.cliente_id == cliente_id)
+            .values(frecuencia=f, monetario=m, segmento=segmento)
+        )
+        return segmento in FRECUENTES
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "activo": ACTIVO,
+            "calculado_en": self.calculado_en,
+            "cortes_frecuencia": self.cortes_frecuencia,
+            "cortes_monto": self.cortes_monto,
+            "ventas": self.ventas,
+            "ascendidos": self.ascendidos,
+            "descendidos": self.descendidos,
+        }
+
+
+segmentacion = Segmentacion()
@@ -0,0 +1,595 @@
+# sketches.py
+"""
+Estadísticas aproximadas de ventas con sketches (memoria fija, O(1) por venta).
+
+- HyperLogLog: clientes distintos por producto, por categoría y en total.
+  Error estándar relativo 1.04 / sqrt(2^p) (p = SKETCHES_HLL_P).
+- Count-Min + heap: compras, unidades y total por producto y por cliente, y
+  los K más vendidos / mejores compradores por total. Cada estimado es una
+  cota superior: real <= estimado <= real + epsilon * N con probabilidad
+  1 - delta (N = suma de todos los pesos de ese sketch).
+
+crud.py los actualiza después de cada commit que crea, edita o borra
+compras. HyperLogLog no sabe restar: un borrado no baja los "distintos"
+hasta la próxima reconstrucción (`reconstruir`, también vía
+POST /api/stats/sketches/reconstruir).
+
+Se guardan cada SKETCHES_GUARDAR_S segundos (y al apagar) en un archivo
+JSON comprimido, junto con una huella de la tabla `compras` hasta el último
+id visto (filas, id máximo, unidades y total). Al arrancar se cargan de ahí
+si la huella coincide con la base; si no coincide (ediciones o borrados que
+no llegaron al archivo, una base restaurada, un archivado) o no hay
+archivo, se reconstruyen desde la base en segundo plano. Como la retención, lo debe
+escribir un solo proceso: con varios workers cada uno tiene sus propios
+sketches.
+
+Variables de entorno:
+    SKETCHES=0            desactiva los sketches
+    SKETCHES_ARCHIVO      ruta del archivo (por defecto archivo/sketches.json.z)
+    SKETCHES_GUARDAR_S    cada cuánto se guardan (por defecto 60)
+    SKETCHES_HLL_P        precisión de HyperLogLog, 4..16 (por defecto 11: ~2.3 %)
+    SKETCHES_EPSILON      error relativo de Count-Min (por defecto 0.001)
+    SKETCHES_DELTA        probabilidad de pasarse de ese error (por defecto 0.01)
+    SKETCHES_TOP_K        candidatos guardados en el heap (por defecto 100)
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import heapq
+import json
+import math
+import os
+import zlib
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Compra, Producto
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+ACTIVO = os.getenv("SKETCHES", "1") != "0"
+ARCHIVO = os.getenv("SKETCHES_ARCHIVO", os.path.join("archivo", "sketches.json.z"))
+GUARDAR_S = float(os.getenv("SKETCHES_GUARDAR_S", "60"))
+HLL_P = int(os.getenv("SKETCHES_HLL_P", "11"))
+EPSILON = float(os.getenv("SKETCHES_EPSILON", "0.001"))
+DELTA = float(os.getenv("SKETCHES_DELTA", "0.01"))
+TOP_K = int(os.getenv("SKETCHES_TOP_K", "100"))
+
+FORMATO = 2
+LOTE = 50_000
+_M64 = (1 << 64) - 1
+
+
+def _mezclar(x: int) -> int:
+    """splitmix64: hash de 64 bits rápido y bien distribuido para enteros."""
+    x = (x + 0x9E3779B97F4A7C15) & _M64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _M64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _M64
+    return x ^ (x >> 31)
+
+
+def _mezclar_np(x):
+    """_mezclar sobre un arreglo uint64 (la multiplicación da la vuelta igual que & _M64)."""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _largo_bits_np(x):
+    """int.bit_length() sobre un arreglo uint64."""
+    largo = np.zeros(x.shape, dtype=np.int64)
+    for corrimiento in (32, 16, 8, 4, 2, 1):
+        grande = x >= (np.uint64(1) << np.uint64(corrimiento))
+        largo[grande] += corrimiento
+        x = np.where(grande, x >> np.uint64(corrimiento), x)
+    return largo + (x > 0)
+
+
+def _b64(datos: bytes) -> str:
+    return base64.b64encode(datos).decode("ascii")
+
+
+# ======================================================
+# =================== HYPERLOGLOG ======================
+# ======================================================
+
+class HyperLogLog:
+    __slots__ = ("p", "m", "registros")
+
+    def __init__(self, p: int = HLL_P, registros: Optional[bytearray] = None):
+        if not 4 <= p <= 16:
+            raise ValueError("La precisión de HyperLogLog va de 4 a 16")
+        self.p = p
+        self.m = 1 << p
+        self.registros = registros if registros is not None else bytearray(self.m)
+
+    def agregar(self, valor: int) -> None:
+        h = _mezclar(valor)
+        indice = h >> (64 - self.p)
+        resto = h & ((1 << (64 - self.p)) - 1)
+        rango = (64 - self.p) - resto.bit_length() + 1
+        if rango > self.registros[indice]:
+            self.registros[indice] = rango
+
+    def rangos_np(self, valores):
+        """(índice, rango) de cada valor, vectorizado."""
+        h = _mezclar_np(valores.astype(np.uint64))
+        resto = h & np.uint64((1 << (64 - self.p)) - 1)
+        return (h >> np.uint64(64 - self.p)).astype(np.int64), ((64 - self.p) - _largo_bits_np(resto) + 1).astype(np.uint8)
+
+    def unir(self, otro: "HyperLogLog") -> None:
+        self.registros = bytearray(map(max, self.registros, otro.registros))
+
+    def estimar(self) -> float:
+        m = self.m
+        alfa = 0.7213 / (1 + 1.079 / m) if m >= 128 else {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        if np is not None:
+            suma = float(np.ldexp(1.0, -np.frombuffer(self.registros, dtype=np.uint8).astype(np.int64)).sum())
+        else:
+            suma = sum(2.0 ** -r for r in self.registros)
+        estimado = alfa * m * m / suma
+        ceros = self.registros.count(0)
+        if estimado <= 2.5 * m and ceros:
+            # Rango chico: conteo lineal
+            return m * math.log(m / ceros)
+        return estimado
+
+    @property
+    def error_relativo(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+
+# ======================================================
+# ================ COUNT-MIN + HEAP ====================
+# ======================================================
+
+class CountMin:
+    def __init__(self, epsilon: float = EPSILON, delta: float = DELTA):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.ancho = math.ceil(math.e / epsilon)
+        self.filas = [array("d", bytes(8 * self.ancho)) for _ in range(math.ceil(math.log(1 / delta)))]
+        # Semillas fijas: los mismos índices después de guardar y cargar
+        self._semillas = [_mezclar(i + 1) for i in range(len(self.filas))]
+        self.total = 0.0
+
+    def _indices(self, clave: int):
+        h = _mezclar(clave)
+        return [(_mezclar(h ^ s) % self.ancho) for s in self._semillas]
+
+    def agregar(self, clave: int, peso: float = 1.0) -> float:
+        """Suma `peso` (puede ser negativo al borrar) y devuelve el nuevo estimado."""
+        self.total += peso
+        estimado = math.inf
+        for fila, i in zip(self.filas, self._indices(clave)):
+            fila[i] += peso
+            estimado = min(estimado, fila[i])
+        return estimado
+
+    def estimar(self, clave: int) -> float:
+        return min(fila[i] for fila, i in zip(self.filas, self._indices(clave)))
+
+    def indices_np(self, claves):
+        h = _mezclar_np(claves.astype(np.uint64))
+        return [(_mezclar_np(h ^ np.uint64(s)) % np.uint64(self.ancho)).astype(np.int64) for s in self._semillas]
+
+    def agregar_np(self, indices, pesos) -> None:
+        self.total += float(pesos.sum())
+        for fila, i in zip(self.filas, indices):
+            # Vista sobre el array('d'): se suma en el lugar
+            np.frombuffer(fila, dtype=np.float64)[:] += np.bincount(i, weights=pesos, minlength=self.ancho)
+
+    def estimar_np(self, indices):
+        return np.min([np.frombuffer(fila, dtype=np.float64)[i] for fila, i in zip(self.filas, indices)], axis=0)
+
+    @property
+    def error_max(self) -> float:
+        return self.epsilon * max(self.total, 0.0)
+
+
+class TopK:
+    """Los `k` candidatos de mayor estimado; heap de mínimos con entradas viejas descartadas al vuelo."""
+
+    def __init__(self, k: int = TOP_K):
+        self.k = k
+        self.estimados: Dict[int, float] = {}
+        self._heap: List[Tuple[float, int]] = []
+
+    def ofrecer(self, clave: int, estimado: float) -> None:
+        if clave in self.estimados or len(self.estimados) < self.k:
+            self.estimados[clave] = estimado
+        else:
+            minimo, clave_minima = self._minimo()
+            if estimado <= minimo:
+                return
+            del self.estimados[clave_minima]
+            heapq.heappop(self._heap)
+            self.estimados[clave] = estimado
+        heapq.heappush(self._heap, (estimado, clave))
+        if len(self._heap) > 4 * self.k:
+            self._heap = [(v, c) for c, v in self.estimados.items()]
+            heapq.heapify(self._heap)
+
+    def _minimo(self) -> Tuple[float, int]:
+        while True:
+            estimado, clave = self._heap[0]
+            if self.estimados.get(clave) == estimado:
+                return estimado, clave
+            heapq.heappop(self._heap)
+
+    def mejores(self, limite: int) -> List[Tuple[int, float]]:
+        return sorted(self.estimados.items(), key=lambda par: par[1], reverse=True)[:limite]
+
+
+# ======================================================
+# ================ SKETCHES DE VENTAS ==================
+# ======================================================
+
+MEDIDAS = ("compras", "unidades", "total")
+DIMENSIONES = ("producto", "cliente")
+
+
+class SketchesVentas:
+    def __init__(self, p: int = HLL_P, epsilon: float = EPSILON, delta: float = DELTA, k: int = TOP_K):
+        self.p, self.epsilon, self.delta, self.k = p, epsilon, delta, k
+        self.distintos: Dict[str, Dict[int, HyperLogLog]] = {"producto": {}, "categoria": {}}
+        self.clientes = HyperLogLog(p)
+        self.cm = {d: {m: CountMin(epsilon, delta) for m in MEDIDAS} for d in DIMENSIONES}
+        self.top = {d: TopK(k) for d in DIMENSIONES}
+        self.sucio = False
+        self.ultimo_id = 0
+        # Huella de `compras` hasta ultimo_id al guardar (ver `huella`)
+        self.huella: Optional[List[float]] = None
+        # Eventos que llegan mientras se reconstruye (se reaplican sobre la nueva)
+        self._durante: Optional[List[Tuple]] = None
+
+    # ---------- actualización ----------
+
+    def registrar(
+        self,
+        compra_id: int,
+        cliente_id: int,
+        producto_id: int,
+        categoria_id: Optional[int],
+        cantidad: int,
+        total: float,
+    ) -> None:
+        """Una venta nueva (después del commit)."""
+        if not ACTIVO:
+            return
+        if self._durante is not None:
+            self._durante.append(("registrar", compra_id, cliente_id, producto_id, categoria_id, cantidad, total))
+        self._hll("producto", producto_id).agregar(cliente_id)
+        if categoria_id is not None:
+            self._hll("categoria", categoria_id).agregar(cliente_id)
+        self.clientes.agregar(cliente_id)
+        self._sumar(cliente_id, producto_id, 1, cantidad, total)
+        self.ultimo_id = max(self.ultimo_id, compra_id)
+
+    def registrar_lote(self, compra_ids, clientes, productos, categorias, cantidades, totales) -> None:
+        """Lo mismo que `registrar` para muchas ventas a la vez (arreglos NumPy; categoría -1 = sin categoría)."""
+        if not len(compra_ids):
+            return
+        for por, claves, valores in (
+            ("producto", productos, clientes),
+            ("categoria", categorias[categorias >= 0], clientes[categorias >= 0]),
+        ):
+            if not len(claves):
+                continue
+            unicas, fila = np.unique(claves, return_inverse=True)
+            indice, rango = self.clientes.rangos_np(valores)
+            registros = np.zeros((len(unicas), 1 << self.p), dtype=np.uint8)
+            np.maximum.at(registros, (fila, indice), rango)
+            for clave, nuevos in zip(unicas.tolist(), registros):
+                hll = self._hll(por, clave)
+                hll.registros = bytearray(np.maximum(np.frombuffer(hll.registros, dtype=np.uint8), nuevos).tobytes())
+        indice, rango = self.clientes.rangos_np(clientes)
+        registros = np.frombuffer(self.clientes.registros, dtype=np.uint8).copy()
+        np.maximum.at(registros, indice, rango)
+        self.clientes.registros = bytearray(registros.tobytes())
+
+        pesos = {"compras": np.ones(len(compra_ids)), "unidades": cantidades.astype(np.float64), "total": totales.astype(np.float64)}
+        for dimension, claves in (("producto", productos), ("cliente", clientes)):
+            cm = self.cm[dimension]
+            indices = cm["total"].indices_np(claves)  # mismas semillas y ancho en las tres medidas
+            for medida, peso in pesos.items():
+                cm[medida].agregar_np(indices, peso)
+            # Candidatos: los del lote y los que ya estaban arriba (los estimados solo crecen)
+            top = self.top[dimension]
+            candidatos = np.union1d(claves, np.fromiter(top.estimados, dtype=np.int64, count=len(top.estimados)))
+            estimados = cm["total"].estimar_np(cm["total"].indices_np(candidatos))
+            mejores = np.argsort(-estimados, kind="stable")[: top.k]
+            top.estimados = dict(zip(candidatos[mejores].tolist(), estimados[mejores].tolist()))
+            top._heap = [(v, c) for c, v in top.estimados.items()]
+            heapq.heapify(top._heap)
+        self.ultimo_id = max(self.ultimo_id, int(compra_ids.max()))
+        self.sucio = True
+
+    def ajustar(self, cliente_id: int, producto_id: int, compras: int, cantidad: int, total: float) -> None:
+        """Edición o borrado: diferencias (negativas al borrar). Los distintos no bajan."""
+        if not ACTIVO:
+            return
+        if self._durante is not None:
+            self._durante.append(("ajustar", cliente_id, producto_id, compras, cantidad, total))
+        self._sumar(cliente_id, producto_id, compras, cantidad, total)
+
+    def _hll(self, por: str, clave: int) -> HyperLogLog:
+        hll = self.distintos[por].get(clave)
+        if hll is None:
+            hll = self.distintos[por][clave] = HyperLogLog(self.p)
+        return hll
+
+    def _sumar(self, cliente_id: int, producto_id: int, compras: int, cantidad: int, total: float) -> None:
+        for dimension, clave in (("producto", producto_id), ("cliente", cliente_id)):
+            cm = self.cm[dimension]
+            if compras:
+                cm["compras"].agregar(clave, compras)
+            if cantidad:
+                cm["unidades"].agregar(clave, cantidad)
+            self.top[dimension].ofrecer(clave, cm["total"].agregar(clave, total))
+        self.sucio = True
+
+    # ---------- consultas ----------
+
+    def mejores(self, dimension: str, limite: int) -> List[Dict[str, Any]]:
+        """Los de mayor total estimado, con la cota de error de cada medida."""
+        cm = self.cm[dimension]
+        errores = {m: round(cm[m].error_max, 2) for m in MEDIDAS}
+        return [
+            {
+                "id": clave,
+                "compras": round(cm["compras"].estimar(clave)),
+                "unidades": round(cm["unidades"].estimar(clave)),
+                "total": round(cm["total"].estimar(clave), 2),
+                "error_compras": errores["compras"],
+                "error_unidades": errores["unidades"],
+                "error_total": errores["total"],
+                "confianza": 1 - self.delta,
+            }
+            for clave, _ in self.top[dimension].mejores(limite)
+        ]
+
+    def compradores_distintos(self, por: str, clave: Optional[int] = None, limite: int = 20) -> List[Dict[str, Any]]:
+        """Clientes distintos por producto o categoría; intervalo de ~95 % (2 errores estándar)."""
+        if clave is not None:
+            hll = self.distintos[por].get(clave)
+            pares = [(clave, hll.estimar() if hll else 0.0)]
+        else:
+            pares = sorted(((c, h.estimar()) for c, h in self.distintos[por].items()), key=lambda par: par[1], reverse=True)[:limite]
+        error = 1.04 / math.sqrt(1 << self.p)
+        return [
+            {
+                "id": c,
+                "clientes": round(estimado),
+                "error_relativo": round(error, 4),
+                "intervalo": [max(0, math.floor(estimado * (1 - 2 * error))), math.ceil(estimado * (1 + 2 * error))],
+            }
+            for c, estimado in pares
+        ]
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "activo": ACTIVO,
+            "ultimo_id": self.ultimo_id,
+            "productos": len(self.distintos["producto"]),
+            "categorias": len(self.distintos["categoria"]),
+            "clientes_distintos": round(self.clientes.estimar()),
+            "ventas": round(self.cm["producto"]["compras"].total),
+            "hll_error_relativo": round(1.04 / math.sqrt(1 << self.p), 4),
+            "cm_epsilon": self.epsilon,
+            "cm_delta": self.delta,
+            "bytes": (
+                (len(self.distintos["producto"]) + len(self.distintos["categoria"]) + 1) * (1 << self.p)
+                + sum(8 * len(f) for d in self.cm.values() for cm in d.values() for f in cm.filas)
+            ),
+            "reconstruyendo": self._durante is not None,
+        }
+
+    # ---------- persistencia ----------
+
+    def adoptar(self, otro: "SketchesVentas") -> None:
+        """Toma el estado de `otro` (carga o reconstrucción) conservando este objeto."""
+        self.__dict__.update(otro.__dict__)
+
+    def a_dict(self) -> Dict[str, Any]:
+        return {
+            "formato": FORMATO,
+            "p": self.p,
+            "epsilon": self.epsilon,
+            "delta": self.delta,
+            "k": self.k,
+            "ultimo_id": self.ultimo_id,
+            "huella": self.huella,
+            "distintos": {
+                por: {str(c): _b64(h.registros) for c, h in hlls.items()}
+                for por, hlls in self.distintos.items()
+            },
+            "clientes": _b64(self.clientes.registros),
+            "cm": {
+                d: {m: {"total": cm.total, "filas": [_b64(f.tobytes()) for f in cm.filas]} for m, cm in medidas.items()}
+                for d, medidas in self.cm.items()
+            },
+            "top": {d: list(top.estimados.items()) for d, top in self.top.items()},
+        }
+
+    @classmethod
+    def desde_dict(cls, datos: Dict[str, Any]) -> "SketchesVentas":
+        if datos.get("formato") != FORMATO:
+            raise ValueError("Formato de sketches desconocido")
+        nuevo = cls(datos["p"], datos["epsilon"], datos["delta"], datos["k"])
+        nuevo.ultimo_id = datos["ultimo_id"]
+        nuevo.huella = datos["huella"]
+        for por, hlls in datos["distintos"].items():
+            nuevo.distintos[por] = {
+                int(c): HyperLogLog(nuevo.p, bytearray(base64.b64decode(r))) for c, r in hlls.items()
+            }
+        nuevo.clientes = HyperLogLog(nuevo.p, bytearray(base64.b64decode(datos["clientes"])))
+        for d, medidas in datos["cm"].items():
+            for m, guardado in medidas.items():
+                cm = nuevo.cm[d][m]
+                cm.total = guardado["total"]
+                for fila, texto in zip(cm.filas, guardado["filas"]):
+                    fila[:] = array("d", base64.b64decode(texto))
+        for d, pares in datos["top"].items():
+            for clave, estimado in pares:
+                nuevo.top[d].ofrecer(int(clave), estimado)
+        return nuevo
+
+    async def guardar(self, db: AsyncSession, ruta: str = ARCHIVO) -> None:
+        """
+        La foto se toma en el loop (nadie la modifica a la vez); comprimir y
+        escribir va en un hilo. La huella se toma después de la foto: si algo
+        cambia en medio, al cargar no coincide y se reconstruye.
+        """
+        self.sucio = False
+        try:
+            datos = self.a_dict()
+            datos["huella"] = await huella(db, datos["ultimo_id"])
+            await asyncio.to_thread(_escribir, ruta, datos)
+        except Exception:
+            self.sucio = True
+            raise
+
+
+def _escribir(ruta: str, datos: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    comprimido = zlib.compress(json.dumps(datos).encode("utf-8"), 6)
+    with open(ruta + ".tmp", "wb") as f:
+        f.write(comprimido)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(ruta + ".tmp", ruta)
+
+
+def cargar(ruta: str = ARCHIVO) -> Optional[SketchesVentas]:
+    """Los sketches guardados, o None si no hay archivo o no es compatible con la configuración."""
+    try:
+        with open(ruta, "rb") as f:
+            nuevo = SketchesVentas.desde_dict(json.loads(zlib.decompress(f.read())))
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, zlib.error) as e:
+        print("⚠ Sketches guardados ilegibles, se reconstruyen:", e)
+        return None
+    if (nuevo.p, nuevo.epsilon, nuevo.delta, nuevo.k) != (HLL_P, EPSILON, DELTA, TOP_K):
+        print("⚠ Cambió la configuración de los sketches, se reconstruyen")
+        return None
+    return nuevo
+
+
+async def huella(db: AsyncSession, hasta_id: int) -> List[float]:
+    """Filas, id máximo, unidades y total de `compras` con id <= hasta_id."""
+    fila = (await db.execute(
+        select(
+            func.count(Compra.id),
+            func.coalesce(func.max(Compra.id), 0),
+            func.coalesce(func.sum(Compra.cantidad), 0),
+            func.coalesce(func.sum(Compra.total), 0),
+        ).where(Compra.id <= hasta_id)
+    )).one()
+    return [int(fila[0]), int(fila[1]), int(fila[2]), round(float(fila[3]), 2)]
+
+
+async def coincide(db: AsyncSession, guardados: SketchesVentas) -> bool:
+    """True si la base sigue como estaba cuando se guardaron `guardados`."""
+    return guardados.huella == await huella(db, guardados.ultimo_id)
+
+
+# ======================================================
+# ================== RECONSTRUCCIÓN ====================
+# ======================================================
+
+sketches_ventas = SketchesVentas()
+
+
+def _registrar_filas(destino: SketchesVentas, filas, categorias: Dict[int, Optional[int]]) -> None:
+    """filas: (id, cliente_id, producto_id, cantidad, total)."""
+    if np is None:
+        for compra_id, cliente_id, producto_id, cantidad, total in filas:
+            destino.registrar(compra_id, cliente_id, producto_id, categorias.get(producto_id), cantidad, total)
+        return
+    ids, clientes, productos, cantidades, totales = (np.asarray(c) for c in zip(*filas))
+    _registrar_columnas(destino, ids, clientes, productos, cantidades, totales, categorias)
+
+
+def _registrar_columnas(destino, ids, clientes, productos, cantidades, totales, categorias) -> None:
+    tabla = np.full(max(max(categorias, default=0), int(productos.max())) + 1, -1, dtype=np.int64)
+    for pid, cid in categorias.items():
+        if cid is not None:
+            tabla[pid] = cid
+    destino.registrar_lote(
+        ids.astype(np.int64), clientes.astype(np.int64), productos.astype(np.int64),
+        tabla[productos], cantidades, totales,
+    )
+
+
+async def reconstruir(db: AsyncSession) -> SketchesVentas:
+    """
+    Recalcula todo desde las compras (tabla + meses archivados). Con NumPy
+    cada lote se procesa vectorizado; entre lotes se cede el loop.
+    """
+    from archivo_compras import archivo_compras
+
+    vigente = sketches_ventas
+    vigente._durante = []
+    try:
+        nuevo = SketchesVentas()
+        categorias = dict((await db.execute(select(Producto.id, Producto.categoria_id))).all())
+        tope = (await db.execute(select(func.max(Compra.id)))).scalar() or 0
+
+        for mes in archivo_compras.meses() if archivo_compras.disponible else []:
+            m = archivo_compras.abrir(mes)
+            for i in range(0, m.filas if m else 0, LOTE):
+                partes = [m[c][i:i + LOTE] for c in ("id", "cliente_id", "producto_id", "cantidad", "total")]
+                _registrar_columnas(nuevo, *partes, categorias)
+                await asyncio.sleep(0)
+
+        resultado = await db.stream(
+            select(Compra.id, Compra.cliente_id, Compra.producto_id, Compra.cantidad, Compra.total)
+            .where(Compra.id <= tope)
+            .execution_options(yield_per=LOTE)
+        )
+        async for lote in resultado.partitions(LOTE if np is not None else 1000):
+            _registrar_filas(nuevo, lote, categorias)
+            await asyncio.sleep(0)
+
+        # Lo que pasó mientras tanto: ventas nuevas (id > tope) y ajustes
+        for evento in vigente._durante:
+            if evento[0] == "registrar" and evento[1] > tope:
+                nuevo.registrar(*evento[1:])
+            elif evento[0] == "ajustar":
+                nuevo.ajustar(*evento[1:])
+    finally:
+        vigente._durante = None
+    # Se reemplaza el contenido, no el objeto: los módulos que lo importaron siguen viéndolo
+    vigente.adoptar(nuevo)
+    vigente.sucio = True
+    return vigente
+
+
+async def ponerse_al_dia(db: AsyncSession) -> int:
+    """
+    Tras cargar del archivo: suma las ventas con id mayor al último visto.
+    Se corre al arrancar, antes de atender peticiones. Devuelve cuántas sumó.
+    """
+    categorias = dict((await db.execute(select(Producto.id, Producto.categoria_id))).all())
+    resultado = await db.stream(
+        select(Compra.id, Compra.cliente_id, Compra.producto_id, Compra.cantidad, Compra.total)
+        .where(Compra.id > sketches_ventas.ultimo_id)
+        .order_by(Compra.id)
+        .execution_options(yield_per=LOTE)
+    )
+    sumadas = 0
+    async for lote in resultado.partitions(LOTE if np is not None else 1000):
+        _registrar_filas(sketches_ventas, lote, categorias)
+        sumadas += len(lote)
+        await asyncio.sleep(0)
+    return sumadas
@@ -0,0 +1,46 @@
+"""
+Arranca la app contra una SQLite nueva en una carpeta temporal (test.db,
+archivo/ y los sketches quedan ahí, sin tocar los del repo).
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CARPETA = tempfile.mkdtemp(prefix="tests-")
+
+for nombre in ("templates", "static"):
+    os.symlink(os.path.join(RAIZ, nombre), os.path.join(CARPETA, nombre))
+sys.path.insert(0, RAIZ)
+# Antes de importar nada: SQLAlchemy fija la ruta absoluta de ./test.db al
+# crear el engine, y algunos tests importan modelos al recolectarse
+os.chdir(CARPETA)
+
+os.environ.pop("DATABASE_URL", None)
+os.environ.setdefault("SUPABASE_URL", "https://x.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.x")
+os.environ.setdefault("PRONOSTICOS", "0")
+# Sin planificador de fondo: los tests corren los trabajos en línea, así un
+# cálculo completo no se cruza con lo que el test está midiendo
+os.environ.setdefault("TRABAJOS", "0")
+
+# Los modelos usan JSONB (Postgres); en SQLite se guarda como JSON
+from sqlalchemy.dialects.postgresql import JSONB  # noqa: E402
+from sqlalchemy.ext.compiler import compiles  # noqa: E402
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_en_sqlite(tipo, compilador, **kw):
+    return "JSON"
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as c:
+        yield c
@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+from alertas_stock import AlertasStock
+
+
+def _motor(eventos=100):
+    motor = AlertasStock(eventos=eventos)
+    motor.listo = True
+    motor.fijar_umbral(categoria_id=1, minimo=5)
+    return motor
+
+
+def _stock(motor, producto_id, cantidad):
+    motor.aplicar_producto(SimpleNamespace(id=producto_id, nombre=f"p{producto_id}", categoria_id=1, cantidad=cantidad))
+
+
+def _repetidos(motor, despues_de):
+    """Lo que `suscribir` repite del buffer antes de esperar eventos nuevos."""
+    async def leer():
+        flujo = motor.suscribir(despues_de, latido_s=0.01)
+        vistos = []
+        async for evento in flujo:
+            if evento is None:
+                break
+            vistos.append(evento)
+        await flujo.aclose()
+        return vistos
+
+    return asyncio.run(leer())
+
+
+def test_umbrales_producto_y_categoria():
+    motor = _motor()
+    _stock(motor, 1, 3)
+    _stock(motor, 1, 2)
+    _stock(motor, 1, 9)
+    assert [tipo for _, tipo, _ in motor._eventos] == ["bajo", "actualizado", "repuesto"]
+
+    # El umbral del producto manda sobre el de la categoría
+    motor.fijar_umbral(producto_id=1, minimo=10)
+    assert motor.listar()[0]["origen"] == "producto"
+    motor.fijar_umbral(producto_id=1)
+    assert motor.listar() == []
+
+
+def test_reanudar_dentro_del_buffer_repite_lo_perdido():
+    motor = _motor()
+    _stock(motor, 1, 3)
+    visto = motor.id_evento(motor.ultimo_evento)
+    _stock(motor, 2, 1)
+    _stock(motor, 3, 0)
+
+    despues_de = motor.reanudar(visto)
+    assert despues_de == 1
+    assert [datos["producto_id"] for _, _, datos in _repetidos(motor, despues_de)] == [2, 3]
+    # Al día: nada que repetir, pero no hace falta el estado
+    assert motor.reanudar(motor.id_evento(motor.ultimo_evento)) == motor.ultimo_evento
+
+
+def test_reanudar_fuera_del_buffer_pide_estado():
+    motor = _motor(eventos=2)
+    _stock(motor, 1, 3)
+    visto = motor.id_evento(motor.ultimo_evento)
+    for producto_id in (2, 3, 4):
+        _stock(motor, producto_id, 1)
+    assert motor.reanudar(visto) is None
+
+
+def test_reanudar_id_desconocido_o_futuro_pide_estado():
+    motor = _motor()
+    _stock(motor, 1, 3)
+    otro = _motor()  # otro worker u otro arranque: otra época
+    for _ in range(5):
+        _stock(otro, 9, 1)
+        _stock(otro, 9, 8)
+
+    assert motor.reanudar(otro.id_evento(otro.ultimo_evento)) is None
+    assert motor.reanudar(motor.id_evento(motor.ultimo_evento + 5)) is None
+    assert motor.reanudar("42") is None
+    assert motor.reanudar(None) is None
+    assert motor.reanudar("basura") is None
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime, timezone
+
+from sqlalchemy import func, insert, select
+
+from cache_consultas import marcar_cambio
+
+
+def _preparar(client):
+    if client.get("/api/productos/1").status_code != 200:
+        client.post("/api/categorias/", data={"nombre": "General"})
+        client.post("/api/productos/", data={"nombre": "Pan", "cantidad": 1000, "valor_unitario": 5, "categoria_id": 1})
+    if client.get("/api/clientes/1").status_code != 200:
+        client.post("/api/clientes/", json={"nombre": "Cliente", "cedula": "arch-1"})
+
+
+def _vender(compra_id: int):
+    """Inserta una compra con un id dado, como si la confirmara otro worker."""
+    from database import AsyncSessionLocal
+    from models import Compra
+
+    async def vender():
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(Compra).values(
+                id=compra_id, cliente_id=1, producto_id=1, cantidad=1, precio_unitario_aplicado=5,
+                total=5, fecha=datetime(2021, 3, 1, 12, tzinfo=timezone.utc),
+            ))
+            await db.commit()
+
+    asyncio.run(vender())
+    marcar_cambio("compras")
+
+
+def _max_id():
+    from database import AsyncSessionLocal
+    from models import Compra
+
+    async def maximo():
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(select(func.max(Compra.id)))).scalar() or 0
+
+    return asyncio.run(maximo())
+
+
+def _compras_de_pan(client):
+    filas = client.get("/api/stats/consulta", params={"por": "producto", "producto_id": 1}).json()
+    return filas[0]["compras"] if filas else 0
+
+
+def test_compra_que_confirma_tarde_entra_sin_duplicar(client):
+    from analitica import snapshot_ventas
+
+    _preparar(client)
+    base = _max_id() + 100
+    antes = _compras_de_pan(client)
+
+    _vender(base + 10)
+    assert _compras_de_pan(client) == antes + 1
+    assert snapshot_ventas.estado()["huecos"] > 0
+
+    # Id menor que el último visto: en Postgres puede confirmar después
+    _vender(base + 5)
+    assert _compras_de_pan(client) == antes + 2
+    assert _compras_de_pan(client) == antes + 2
+    ids = snapshot_ventas.col("id")
+    assert (ids[1:] > ids[:-1]).all()
+
+
+def test_una_venta_no_recarga_las_dimensiones(client):
+    from analitica import snapshot_ventas
+
+    _preparar(client)
+    _compras_de_pan(client)
+    recargas = snapshot_ventas.metricas["dimensiones"]
+
+    _vender(_max_id() + 1)
+    _compras_de_pan(client)
+    assert snapshot_ventas.metricas["dimensiones"] == recargas
+
+    # Guardar el producto sin cambiar nombre ni categoría tampoco
+    producto = client.get("/api/productos/1").json()
+    nombre = producto["nombre"]
+    campos = {c: producto[c] for c in ("cantidad", "valor_unitario", "categoria_id")}
+    client.put("/api/productos/1", data={**campos, "nombre": nombre})
+    _compras_de_pan(client)
+    assert snapshot_ventas.metricas["dimensiones"] == recargas
+
+    # Renombrar el producto sí
+    assert client.put("/api/productos/1", data={**campos, "nombre": nombre + " integral"}).status_code == 200
+    filas = client.get("/api/stats/consulta", params={"por": "producto", "producto_id": 1}).json()
+    assert snapshot_ventas.metricas["dimensiones"] == recargas + 1
+    assert filas[0]["producto_nombre"] == nombre + " integral"
+    client.put("/api/productos/1", data={**campos, "nombre": nombre})
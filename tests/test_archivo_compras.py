@@ -0,0 +1,105 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from cache_consultas import marcar_cambio
+
+
+def _preparar(client):
+    if client.get("/api/productos/1").status_code != 200:
+        client.post("/api/categorias/", data={"nombre": "General"})
+        client.post("/api/productos/", data={"nombre": "Pan", "cantidad": 1000, "valor_unitario": 5, "categoria_id": 1})
+    if client.get("/api/clientes/1").status_code != 200:
+        client.post("/api/clientes/", json={"nombre": "Cliente", "cedula": "arch-1"})
+
+
+def _sembrar(mes: int, filas: int):
+    from database import AsyncSessionLocal
+    from models import Compra, Multimedia
+
+    async def sembrar():
+        async with AsyncSessionLocal() as db:
+            ids = []
+            for dia in range(1, filas + 1):
+                r = await db.execute(insert(Compra).values(
+                    cliente_id=1, producto_id=1, cantidad=dia, precio_unitario_aplicado=2.5,
+                    total=2.5 * dia, fecha=datetime(2020, mes, dia, 12, tzinfo=timezone.utc),
+                ).returning(Compra.id))
+                ids.append(r.scalar())
+            await db.execute(insert(Multimedia).values(
+                url="https://x/recibo.png", media_type="image", model_type="Compra", model_id=ids[0],
+            ))
+            await db.commit()
+
+    asyncio.run(sembrar())
+    # Escritura por fuera de crud: se invalida la caché a mano
+    marcar_cambio("compras", "multimedia")
+
+
+def _estadisticas(client):
+    meses = client.get("/api/stats/ventas-por-mes", params={"desde": "2020-01", "hasta": "2020-12"}).json()
+    return (
+        # `archivado` dice de dónde salió el mes; los números no deben cambiar
+        [{k: v for k, v in m.items() if k != "archivado"} for m in meses],
+        client.get("/api/stats/top-productos").json(),
+        client.get("/api/stats/top-clientes").json(),
+    )
+
+
+def _contar(modelo, *condiciones):
+    from database import AsyncSessionLocal
+
+    async def contar():
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(select(func.count()).select_from(modelo).where(*condiciones))).scalar()
+
+    return asyncio.run(contar())
+
+
+def test_archivar_no_cambia_las_estadisticas(client):
+    from models import Multimedia
+
+    _preparar(client)
+    _sembrar(3, 5)
+    antes = _estadisticas(client)
+    assert antes[0][0]["mes"] == "2020-03" and antes[0][0]["compras"] == 5
+
+    r = client.post("/api/stats/archivo/2020-03")
+    assert r.status_code == 200, r.text
+    assert r.json()["archivadas"] == 5
+    assert _estadisticas(client) == antes
+    # La multimedia de esas compras pasa al archivo del mes
+    assert _contar(Multimedia, Multimedia.model_type == "Compra") == 0
+    import archivo_compras
+    assert len(archivo_compras.archivo_compras.multimedia("2020-03")) == 1
+
+
+def test_corte_entre_commit_y_publicar_se_recupera(client, monkeypatch):
+    import archivo_compras
+    from database import AsyncSessionLocal
+
+    _preparar(client)
+    _sembrar(4, 3)
+    antes = _estadisticas(client)
+
+    def cortar(mes):
+        raise OSError("corte simulado")
+
+    monkeypatch.setattr(archivo_compras.archivo_compras, "publicar", cortar)
+    with pytest.raises(OSError):
+        client.post("/api/stats/archivo/2020-04")
+    monkeypatch.undo()
+    assert archivo_compras.archivo_compras.pendientes() == ["2020-04"]
+    assert "2020-04" not in archivo_compras.archivo_compras.meses()
+
+    async def recuperar():
+        async with AsyncSessionLocal() as db:
+            return await archivo_compras.recuperar(db)
+
+    assert asyncio.run(recuperar()) == ["2020-04"]
+    assert archivo_compras.archivo_compras.pendientes() == []
+    assert _estadisticas(client) == antes
+    assert os.path.isdir(os.path.join(archivo_compras.archivo_compras.directorio, "2020-04"))
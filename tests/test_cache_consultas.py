@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+from pydantic import BaseModel, ConfigDict
+
+from cache_consultas import cacheado, marcar_cambio
+
+
+class Fila(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    nombre: str
+
+
+def test_guarda_filas_validadas_y_no_instancias_orm():
+    llamadas = []
+
+    @cacheado("prueba_filas", esquema=Fila)
+    async def listar_prueba(db, nombre=None):
+        llamadas.append(nombre)
+        return [SimpleNamespace(id=1, nombre="a", _sesion=object())]
+
+    primera = asyncio.run(listar_prueba(None))
+    segunda = asyncio.run(listar_prueba(None))
+    assert len(llamadas) == 1
+    assert primera == segunda == [Fila(id=1, nombre="a")]
+    assert all(isinstance(f, Fila) for f in segunda)
+
+    marcar_cambio("prueba_filas")
+    asyncio.run(listar_prueba(None))
+    assert len(llamadas) == 2
+
+
+def test_resumen_dict_sale_igual_de_la_cache():
+    @cacheado("prueba_resumen")
+    async def resumen_prueba(db):
+        return {"a": 1, "b": [2]}
+
+    assert asyncio.run(resumen_prueba(None)) == asyncio.run(resumen_prueba(None)) == {"a": 1, "b": [2]}
+
+
+def test_modificar_un_acierto_no_toca_la_entrada():
+    @cacheado("prueba_copias", esquema=Fila)
+    async def listar_copias(db):
+        return [SimpleNamespace(id=1, nombre="a")]
+
+    # Tanto lo que sale de la consulta como lo que sale de la caché
+    asyncio.run(listar_copias(None))[0].nombre = "cambiado"
+    acierto = asyncio.run(listar_copias(None))
+    assert acierto[0].nombre == "a"
+    acierto[0].nombre = "otra vez"
+    assert asyncio.run(listar_copias(None))[0].nombre == "a"
@@ -0,0 +1,91 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from catalogo import Catalogo
+
+
+def _producto(i: int, cantidad: int, valor: float = 10.0):
+    return SimpleNamespace(
+        id=i, nombre=f"P{i}", descripcion=None, cantidad=cantidad, valor_unitario=valor,
+        valor_mayorista=None, categoria_id=1, imagen_url=None,
+        creado_en=datetime(2024, 1, 1, tzinfo=timezone.utc), actualizado_en=datetime(2024, 1, 1, tzinfo=timezone.utc),
+    )
+
+
+class _BaseFalsa:
+    """Devuelve categorías y productos fijos; `durante` corre entre las dos lecturas."""
+
+    def __init__(self, productos, durante):
+        self.respuestas = [[], productos]
+        self.durante = durante
+
+    async def execute(self, stmt):
+        filas = self.respuestas.pop(0)
+        if not self.respuestas:
+            self.durante()
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: filas))
+
+
+def test_reparar_no_pisa_lo_escrito_durante_la_verificacion():
+    catalogo = Catalogo()
+    catalogo.listo = True
+    catalogo.aplicar_producto(_producto(1, cantidad=5))
+    catalogo.aplicar_producto(_producto(2, cantidad=5))
+
+    # La base tiene el 1 con stock 5 y un 3 que la memoria no conoce; mientras
+    # se lee, crud.py aplica una venta del 1 y borra el 2
+    def escrituras():
+        catalogo.aplicar_producto(_producto(1, cantidad=4))
+        catalogo.quitar_producto(2)
+
+    db = _BaseFalsa([_producto(1, cantidad=5), _producto(2, cantidad=5), _producto(3, cantidad=7)], escrituras)
+    informe = asyncio.run(catalogo.verificar(db, reparar=True))
+
+    assert informe["reparado"]
+    assert informe["productos"]["faltantes"] == [3]
+    assert informe["omitidos"]["producto"] == [1, 2]
+    assert catalogo.obtener_producto(1).cantidad == 4
+    assert catalogo.obtener_producto(2) is None
+    assert catalogo.obtener_producto(3).cantidad == 7
+    assert [p.id for p in catalogo.listar_productos(stock_max=4)] == [1]
+    assert catalogo._escrito_en == {}
+
+
+def test_filtros_de_rango_iguales_al_sql(client):
+    import crud
+    from cache_consultas import sin_cache
+    from catalogo import catalogo
+    from database import AsyncSessionLocal
+
+    categoria = client.post("/api/categorias/", data={"nombre": "Rangos"}).json()["id"]
+    for i, (valor, cantidad) in enumerate([(1.5, 0), (5, 3), (5, 10), (9.99, 10), (10, 25), (20, 3)]):
+        r = client.post("/api/productos/", data={
+            "nombre": f"Rango {i}", "cantidad": cantidad, "valor_unitario": valor, "categoria_id": categoria,
+        })
+        assert r.status_code == 201, r.text
+    assert catalogo.listo
+
+    casos = [
+        {},
+        {"precio_min": 5},
+        {"precio_max": 5},
+        {"precio_min": 5, "precio_max": 10},
+        {"precio_min": 9.995},
+        {"precio_min": 20, "precio_max": 1},
+        {"stock_min": 3},
+        {"stock_max": 3},
+        {"stock_min": 3, "stock_max": 10},
+        {"stock_min": 11, "stock_max": 24},
+        {"precio_max": 10, "stock_min": 10},
+        {"precio_min": 5, "stock_max": 3, "nombre": "rango"},
+    ]
+
+    async def desde_sql(filtros):
+        with sin_cache():
+            async with AsyncSessionLocal() as db:
+                return [p.id for p in await crud.listar_productos(db, categoria_id=categoria, **filtros)]
+
+    for filtros in casos:
+        en_memoria = [p.id for p in catalogo.listar_productos(categoria_id=categoria, **filtros)]
+        assert en_memoria == sorted(asyncio.run(desde_sql(filtros))), filtros
@@ -0,0 +1,52 @@
+import asyncio
+
+
+def _preparar(client):
+    if client.get("/api/productos/1").status_code != 200:
+        client.post("/api/categorias/", data={"nombre": "General"})
+        client.post("/api/productos/", data={"nombre": "Pan", "cantidad": 1000, "valor_unitario": 5, "categoria_id": 1})
+    if client.get("/api/clientes/1").status_code != 200:
+        client.post("/api/clientes/", json={"nombre": "Cliente", "cedula": "cond-1"})
+
+
+def test_etag_de_compras_cambia_con_el_precio(client):
+    _preparar(client)
+    r = client.post("/compras/", json={
+        "cliente_id": 1, "producto_id": 1, "cantidad": 2,
+        "precio_unitario_aplicado": 5, "total": 10,
+    })
+    compra_id = r.json()["id"]
+    etag = client.get("/compras/").headers["etag"]
+    assert client.get("/compras/", headers={"If-None-Match": etag}).status_code == 304
+
+    assert client.put(f"/compras/{compra_id}", json={"precio_unitario_aplicado": 4.5}).status_code == 200
+    assert client.get("/compras/", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_validador_de_productos_ve_borrados(client):
+    import crud
+    from database import AsyncSessionLocal
+
+    _preparar(client)
+    nuevo = client.post("/api/productos/", data={"nombre": "Efímero", "cantidad": 1, "valor_unitario": 1, "categoria_id": 1})
+    assert nuevo.status_code == 201, nuevo.text
+
+    async def validador():
+        async with AsyncSessionLocal() as db:
+            return await crud.validador_productos(db)
+
+    antes = asyncio.run(validador())
+    assert client.delete(f"/api/productos/{nuevo.json()['id']}").status_code in (200, 204)
+    despues = asyncio.run(validador())
+    assert despues != antes
+    assert despues[-1] is not None
+
+
+def test_last_modified_no_sale_en_el_segundo_en_curso():
+    from datetime import datetime, timedelta, timezone
+
+    from condicional import cabeceras
+
+    ahora = datetime.now(timezone.utc)
+    assert "Last-Modified" not in cabeceras('W/"x"', ahora + timedelta(seconds=1), "no-cache")
+    assert "Last-Modified" in cabeceras('W/"x"', ahora - timedelta(seconds=2), "no-cache")
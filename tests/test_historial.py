@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert
+
+TABLA = "prueba_historial"
+
+
+def _fila(i: int, registro_id: int, dias: int = 0):
+    momento = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(days=dias)
+    return {"id": i, "tabla": TABLA, "registro_id": registro_id, "datos": {"n": i}, "eliminado_en": momento.isoformat()}
+
+
+def _preparar():
+    """Tres filas en la tabla (ids altos) y un segmento archivado con ids menores."""
+    from cache_consultas import marcar_cambio
+    from database import AsyncSessionLocal
+    from models import HistorialEliminados
+    from retencion import archivo_historial
+
+    async def sembrar():
+        async with AsyncSessionLocal() as db:
+            for i in (2_000_001, 2_000_002, 2_000_003):
+                await db.execute(insert(HistorialEliminados).values(
+                    id=i, tabla=TABLA, registro_id=i, datos={"n": i}, eliminado_en=datetime(2025, 1, 1),
+                ))
+            await db.commit()
+
+    if any(s["archivo"].startswith("000001000001-") for s in archivo_historial.indice()["segmentos"]):
+        return
+    asyncio.run(sembrar())
+    archivo_historial.agregar_segmento([_fila(1_000_000 + i, registro_id=i, dias=i) for i in range(1, 2501)])
+    marcar_cambio("historial_eliminados")
+
+
+def test_historial_salta_el_archivo_y_bloques_que_no_pueden_coincidir(client, monkeypatch):
+    from retencion import archivo_historial
+
+    _preparar()
+
+    leidos = []
+    original = archivo_historial._leer_bloque
+    monkeypatch.setattr(archivo_historial, "_leer_bloque", lambda a, b: leidos.append(b) or original(a, b))
+
+    # Página llena solo con filas de la tabla: ni se abre el archivo
+    pagina = client.get("/api/historial/", params={"tabla": TABLA, "limite": 2}).json()
+    assert [f["id"] for f in pagina["items"]] == [2_000_003, 2_000_002]
+    assert leidos == []
+
+    # Se mezcla con el archivo y eliminado_en sale igual de los dos lados
+    pagina = client.get("/api/historial/", params={"tabla": TABLA, "limite": 5}).json()
+    ids = [f["id"] for f in pagina["items"]]
+    assert ids == [2_000_003, 2_000_002, 2_000_001, 1_002_500, 1_002_499]
+    formatos = {f["eliminado_en"][19:] for f in pagina["items"]}
+    assert len(formatos) == 1, formatos
+
+    # registro_id: solo se lee el bloque cuyo rango lo contiene
+    leidos.clear()
+    pagina = client.get("/api/historial/", params={"tabla": TABLA, "registro_id": 1500}).json()
+    assert [f["id"] for f in pagina["items"]] == [1_001_500]
+    assert len(leidos) == 1
+
+
+def test_eliminados_obsoleto_pagina_por_id(client):
+    _preparar()
+    primera = client.get("/api/historial/eliminados", params={"tabla": TABLA, "limite": 2}).json()
+    assert [f["id"] for f in primera] == [2_000_003, 2_000_002]
+    segunda = client.get(
+        "/api/historial/eliminados", params={"tabla": TABLA, "limite": 2, "despues_de": primera[-1]["id"]}
+    ).json()
+    assert [f["id"] for f in segunda] == [2_000_001, 1_002_500]
+    assert len(client.get("/api/productos/historial/eliminados", params={"limite": 3}).json()) == 3
@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from sqlalchemy import delete, insert
+
+import pronosticos
+from pronosticos import Pronosticos, modelar
+
+# 2024-01-01 fue lunes
+LUNES = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()) // 86400
+
+
+def test_demanda_constante_da_punto_de_reorden_sin_seguridad():
+    r = modelar(np.full((1, 56), 4.0), LUNES, alfa=0.3)
+    assert r["factores"][0] == pytest.approx([1.0] * 7)
+    assert r["nivel"][0] == pytest.approx(4.0)
+    assert r["desvio"][0] == pytest.approx(0.0)
+    assert r["punto_reorden"][0] == pytest.approx(4.0 * pronosticos.PLAZO_DIAS)
+    assert r["objetivo"][0] == pytest.approx(4.0 * (pronosticos.PLAZO_DIAS + pronosticos.COBERTURA_DIAS))
+
+
+def test_estacionalidad_semanal_y_desvio():
+    # 10 unidades los sábados, 2 el resto: semana de 22
+    semana = np.array([2, 2, 2, 2, 2, 10, 2], dtype=float)
+    r = modelar(np.tile(semana, 8)[None, :], LUNES, alfa=0.3)
+    factores = r["factores"][0]
+    assert factores.mean() == pytest.approx(1.0)
+    assert factores.argmax() == 5
+    # Con pocas unidades el factor se acerca a 1: aquí pesa 176 / (176 + 28)
+    crudo = semana / semana.mean()
+    esperado = 1 + (crudo - 1) * 176 / (176 + pronosticos.UNIDADES_ESTACIONALIDAD)
+    assert factores == pytest.approx(esperado / esperado.mean())
+    assert r["nivel"][0] == pytest.approx(22 / 7, rel=0.05)
+    seguridad = pronosticos.Z * r["desvio"][0] * np.sqrt(pronosticos.PLAZO_DIAS)
+    assert r["punto_reorden"][0] == pytest.approx(r["nivel"][0] * pronosticos.PLAZO_DIAS + seguridad)
+
+
+def test_reposicion_dias_restantes_y_sugerido():
+    motor = Pronosticos()
+    motor.filas[1] = {
+        "producto_id": 1, "demanda_diaria": 4.0, "estacionalidad": [1.0] * 7,
+        "punto_reorden": 28.0, "stock_objetivo": 84.0,
+    }
+    bajo = motor.reposicion(1, 20, hoy=LUNES)
+    assert (bajo["dias_restantes"], bajo["sugerido"]) == (5.0, 64)
+    alto = motor.reposicion(1, 40, hoy=LUNES)
+    assert (alto["dias_restantes"], alto["sugerido"]) == (10.0, 0)
+    assert motor.reposicion(2, 10) is None
+
+
+def test_reposicion_recarga_un_calculo_nuevo(client, monkeypatch):
+    import crud
+    from database import AsyncSessionLocal
+    from models import Pronostico
+
+    if client.get("/api/productos/1").status_code != 200:
+        client.post("/api/categorias/", data={"nombre": "General"})
+        client.post("/api/productos/", data={"nombre": "Pan", "cantidad": 1000, "valor_unitario": 5, "categoria_id": 1})
+
+    async def guardar(demanda=None):
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Pronostico))
+            if demanda is not None:
+                await db.execute(insert(Pronostico).values(
+                    producto_id=1, calculado_en=datetime.now(timezone.utc), dias=56, unidades=0,
+                    promedio_7=demanda, promedio_28=demanda, demanda_diaria=demanda, desvio=0,
+                    estacionalidad=[1.0] * 7, punto_reorden=demanda * 7, stock_objetivo=demanda * 21,
+                ))
+            await db.commit()
+
+    monkeypatch.setattr(crud, "PRONOSTICOS_ACTIVO", True)
+    monkeypatch.setattr(crud.pronosticos, "listo", False)
+    monkeypatch.setattr(crud.pronosticos, "filas", {})
+    monkeypatch.setattr(crud.pronosticos, "calculado_en", None)
+    try:
+        # Sin esperar al sondeo de fondo: la consulta carga lo que dejó el trabajo
+        asyncio.run(guardar(4.0))
+        assert client.get("/api/stock/reposicion/1").json()["demanda_diaria"] == 4.0
+        asyncio.run(guardar(6.0))
+        assert client.get("/api/stock/reposicion/1").json()["demanda_diaria"] == 6.0
+    finally:
+        asyncio.run(guardar())
@@ -0,0 +1,52 @@
+def _cliente_con_compras(client, cedula, totales):
+    cliente = client.post("/api/clientes/", json={"nombre": "Cliente RFM", "cedula": cedula}).json()
+    ids = []
+    for total in totales:
+        r = client.post("/compras/", json={
+            "cliente_id": cliente["id"], "producto_id": 1, "cantidad": 1,
+            "precio_unitario_aplicado": total, "total": total,
+        })
+        assert r.status_code == 201, r.text
+        ids.append(r.json()["id"])
+    return cliente["id"], ids
+
+
+def _preparar_catalogo(client):
+    if client.get("/api/productos/1").status_code == 200:
+        return
+    client.post("/api/categorias/", data={"nombre": "General"})
+    client.post("/api/productos/", data={"nombre": "Pan", "cantidad": 1000, "valor_unitario": 5, "categoria_id": 1})
+
+
+def test_resumen_segmentos_dos_veces(client):
+    primera = client.get("/api/clientes/segmentos")
+    segunda = client.get("/api/clientes/segmentos")
+    assert primera.status_code == 200
+    assert segunda.status_code == 200
+    assert segunda.json() == primera.json()
+
+
+def test_borrar_y_editar_compra_restan_del_rfm(client):
+    _preparar_catalogo(client)
+    cliente_id, compras = _cliente_con_compras(client, "rfm-1", [5.0, 3.5, 5.0])
+    rfm = client.get(f"/api/clientes/{cliente_id}/rfm").json()
+    assert (rfm["visitas"], rfm["monto"]) == (3, 13.5)
+
+    assert client.delete(f"/compras/{compras[0]}").status_code in (200, 204)
+    rfm = client.get(f"/api/clientes/{cliente_id}/rfm").json()
+    assert (rfm["visitas"], rfm["monto"]) == (2, 8.5)
+
+    r = client.put(f"/compras/{compras[1]}", json={"total": 1.5})
+    assert r.status_code == 200, r.text
+    rfm = client.get(f"/api/clientes/{cliente_id}/rfm").json()
+    assert (rfm["visitas"], rfm["monto"]) == (2, 6.5)
+
+
+def test_cliente_frecuente_no_se_marca_a_mano(client):
+    r = client.post("/api/clientes/", json={"nombre": "Manual", "cedula": "rfm-manual", "cliente_frecuente": True})
+    assert r.status_code == 422, r.text
+    cliente = client.post("/api/clientes/", json={"nombre": "Manual", "cedula": "rfm-manual"}).json()
+    assert client.put(f"/api/clientes/{cliente['id']}", json={"cliente_frecuente": True}).status_code == 422
+    r = client.put(f"/api/clientes/{cliente['id']}", json={"telefono": "300"})
+    assert r.status_code == 200, r.text
+    assert r.json()["cliente_frecuente"] is False
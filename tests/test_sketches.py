@@ -0,0 +1,40 @@
+import asyncio
+
+from sqlalchemy import update
+
+
+def _comprar(client, total):
+    r = client.post("/compras/", json={
+        "cliente_id": 1, "producto_id": 1, "cantidad": 1,
+        "precio_unitario_aplicado": total, "total": total,
+    })
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def test_huella_detecta_cambios_fuera_del_archivo(client, tmp_path):
+    import sketches
+    from database import AsyncSessionLocal
+    from models import Compra
+
+    if client.get("/api/productos/1").status_code != 200:
+        client.post("/api/categorias/", data={"nombre": "General"})
+        client.post("/api/productos/", data={"nombre": "Pan", "cantidad": 1000, "valor_unitario": 5, "categoria_id": 1})
+    if client.get("/api/clientes/1").status_code != 200:
+        client.post("/api/clientes/", json={"nombre": "Cliente", "cedula": "sk-1"})
+    compra_id = _comprar(client, 5.0)
+    ruta = str(tmp_path / "sketches.json.z")
+
+    async def guardar_y_cargar(cambio=None):
+        async with AsyncSessionLocal() as db:
+            await sketches.sketches_ventas.guardar(db, ruta)
+            if cambio is not None:
+                await db.execute(cambio)
+                await db.commit()
+            return await sketches.coincide(db, sketches.cargar(ruta))
+
+    assert asyncio.run(guardar_y_cargar())
+    # Una edición que el archivo no vio (p. ej. antes de una caída)
+    assert not asyncio.run(guardar_y_cargar(
+        update(Compra).where(Compra.id == compra_id).values(cantidad=Compra.cantidad + 1)
+    ))
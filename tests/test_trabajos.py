@@ -0,0 +1,54 @@
+import asyncio
+import csv
+import io
+
+
+def _correr_pendientes():
+    """Lo que hace el planificador, pero en línea en vez de en el pool de procesos."""
+    import trabajos
+
+    async def correr():
+        estados = {}
+        while (trabajo_id := await trabajos.planificador._tomar()) is not None:
+            estados[trabajo_id] = await trabajos._ejecutar(trabajo_id)
+        return estados
+
+    return asyncio.run(correr())
+
+
+def test_reporte_de_pendiente_a_terminado_y_descarga(client):
+    r = client.post("/api/trabajos/", json={"tipo": "ventas_anuales_productos", "parametros": {"anio": 2021}})
+    assert r.status_code == 202, r.text
+    trabajo = r.json()
+    assert trabajo["estado"] == "pendiente"
+    assert client.get(f"/api/trabajos/{trabajo['id']}/descarga").status_code == 409
+
+    assert _correr_pendientes()[trabajo["id"]] == "terminado"
+    trabajo = client.get(f"/api/trabajos/{trabajo['id']}").json()
+    assert (trabajo["estado"], trabajo["progreso"]) == ("terminado", 1.0)
+
+    r = client.get(f"/api/trabajos/{trabajo['id']}/descarga")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    filas = list(csv.reader(io.StringIO(r.text)))
+    assert filas[0][:2] == ["id", "nombre"]
+    assert len(filas) - 1 == trabajo["filas"]
+
+
+def test_trabajo_que_falla_queda_en_error(client, monkeypatch):
+    import trabajos
+
+    async def fallar(db, parametros, ruta, avance):
+        await avance(1, 2)
+        raise RuntimeError("sin datos")
+
+    descripcion, validar, _ = trabajos.REPORTES["ventas_anuales_clientes"]
+    monkeypatch.setitem(trabajos.REPORTES, "ventas_anuales_clientes", (descripcion, validar, fallar))
+
+    trabajo = client.post("/api/trabajos/", json={"tipo": "ventas_anuales_clientes", "parametros": {"anio": 2021}}).json()
+    assert _correr_pendientes()[trabajo["id"]] == "error"
+    trabajo = client.get(f"/api/trabajos/{trabajo['id']}").json()
+    assert trabajo["estado"] == "error"
+    assert trabajo["mensaje"] == "RuntimeError: sin datos"
+    assert client.get(f"/api/trabajos/{trabajo['id']}/descarga").status_code == 409
+    assert client.post(f"/api/trabajos/{trabajo['id']}/cancelar").status_code == 409
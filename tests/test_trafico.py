@@ -0,0 +1,24 @@
+from trafico import MARCADOR, sanear, sanear_query
+
+
+def test_sanear_oculta_datos_personales():
+    cuerpo = {
+        "nombre": "Ana Pérez",
+        "cedula": "123",
+        "correo": "ana@x.com",
+        "telefono": "555",
+        "direccion": "Calle 1",
+        "contrasena": "secreta",
+        "cantidad": 3,
+        "lineas": [{"producto_id": 1, "nombre": "Ana"}],
+    }
+    saneado = sanear(cuerpo)
+    for campo in ("nombre", "cedula", "correo", "telefono", "direccion", "contrasena"):
+        assert saneado[campo] == MARCADOR
+    assert saneado["cantidad"] == 3
+    assert saneado["lineas"] == [{"producto_id": 1, "nombre": MARCADOR}]
+
+
+def test_sanear_query_oculta_nombres():
+    pares = dict(sanear_query(b"nombre=Ana&nombre_cliente=Ana&cliente_id=4"))
+    assert pares == {"nombre": MARCADOR, "nombre_cliente": MARCADOR, "cliente_id": "4"}
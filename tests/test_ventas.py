@@ -0,0 +1,21 @@
+from datetime import datetime, timedelta, timezone
+
+
+def test_listar_ventas_filtra_por_dia_completo(client):
+    if client.get("/api/productos/1").status_code != 200:
+        client.post("/api/categorias/", data={"nombre": "General"})
+        client.post("/api/productos/", data={"nombre": "Pan", "cantidad": 1000, "valor_unitario": 5, "categoria_id": 1})
+    if client.get("/api/clientes/1").status_code != 200:
+        client.post("/api/clientes/", json={"nombre": "Cliente", "cedula": "ven-1"})
+    r = client.post("/api/ventas/", json={"cliente_id": 1, "lineas": [{"producto_id": 1, "cantidad": 1}]})
+    assert r.status_code == 201, r.text
+    venta_id = r.json()["id"]
+
+    hoy = datetime.now(timezone.utc).date()
+    manana = (hoy + timedelta(days=1)).isoformat()
+    ids = lambda **q: [v["id"] for v in client.get("/api/ventas/", params=q).json()]
+
+    # Un `hasta` sin hora incluye todo el día
+    assert venta_id in ids(fecha_desde=hoy.isoformat(), fecha_hasta=hoy.isoformat())
+    assert venta_id not in ids(fecha_desde=manana)
+    assert client.get("/api/ventas/", params={"fecha_desde": "ayer"}).status_code == 400
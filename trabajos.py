@@ -0,0 +1,553 @@
+# trabajos.py
+"""
+Trabajos en segundo plano: reportes pesados fuera del camino de la petición.
+
+- La tabla `trabajos` es la cola y el estado de cada uno:
+  pendiente -> ejecutando -> terminado / error / cancelado. Sobrevive a los
+  reinicios y la ven todos los workers.
+- Cada worker corre un planificador asyncio que toma trabajos pendientes (el
+  UPDATE condicionado evita que dos workers tomen el mismo) y los manda a un
+  ProcessPoolExecutor: el cálculo no compite con el loop ni con el GIL.
+- El proceso hijo abre su propia conexión a la base. Escribe el progreso en
+  la fila (que sirve también de latido) y en cada lote mira si le pidieron
+  cancelar.
+- El resultado queda en TRABAJOS_DIR/<id>.csv (se escribe aparte y se
+  renombra al terminar) y se descarga por la API.
+
+Si un worker muere con trabajos en curso, sin latido por más de
+TRABAJOS_ABANDONO_S vuelven a la cola (hasta MAX_INTENTOS veces). Al apagar
+un worker, sus trabajos vuelven a pendiente y el hijo se corta en el
+siguiente lote.
+
+Variables de entorno:
+    TRABAJOS                  0 = este worker no ejecuta trabajos (sí los encola)
+    TRABAJOS_PROCESOS         procesos del pool (por defecto 2)
+    TRABAJOS_DIR              carpeta de resultados (por defecto archivo/reportes)
+    TRABAJOS_SONDEO_S         cada cuánto se mira la cola (por defecto 2)
+    TRABAJOS_ABANDONO_S       sin latido por más de esto, se reencola (por defecto 600)
+    TRABAJOS_RETENCION_DIAS   se borran los trabajos terminados más viejos (por defecto 7)
+"""
+from __future__ import annotations
+
+import asyncio
+import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from archivo_compras import archivo_compras, np, rango_mes
+from database import AsyncSessionLocal, engine
+from models import Categoria, Cliente, Compra, Producto, Trabajo
+import pronosticos
+import segmentacion
+
+ACTIVO = os.getenv("TRABAJOS", "1") != "0"
+PROCESOS = int(os.getenv("TRABAJOS_PROCESOS", "2"))
+DIRECTORIO = os.getenv("TRABAJOS_DIR", os.path.join("archivo", "reportes"))
+SONDEO_S = float(os.getenv("TRABAJOS_SONDEO_S", "2"))
+ABANDONO_S = float(os.getenv("TRABAJOS_ABANDONO_S", "600"))
+RETENCION_DIAS = float(os.getenv("TRABAJOS_RETENCION_DIAS", "7"))
+
+MAX_INTENTOS = 3
+LOTE = 50_000
+
+PENDIENTE = "pendiente"
+EJECUTANDO = "ejecutando"
+CANCELANDO = "cancelando"
+TERMINADO = "terminado"
+ERROR = "error"
+CANCELADO = "cancelado"
+FINALES = (TERMINADO, ERROR, CANCELADO)
+
+MESES = ("ene", "feb", "mar", "abr", "may", "jun", "jul", "ago", "sep", "oct", "nov", "dic")
+
+
+class Cancelado(Exception):
+    """Pidieron cancelar el trabajo."""
+
+
+class Interrumpido(Exception):
+    """El trabajo dejó de ser de este proceso (apagado del worker o reencolado)."""
+
+
+def _ahora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def ultima_programacion(hora: int, ahora: Optional[datetime] = None) -> datetime:
+    """Última vez que se cumplió la `hora` (UTC) diaria: para los trabajos nocturnos."""
+    ahora = ahora or _ahora()
+    programado = ahora.replace(hour=hora, minute=0, second=0, microsecond=0)
+    if programado > ahora:
+        programado -= timedelta(days=1)
+    return programado
+
+
+def ruta_resultado(trabajo_id: int) -> str:
+    return os.path.join(DIRECTORIO, f"{trabajo_id}.csv")
+
+
+# ======================================================
+# ====================== AVANCE ========================
+# ======================================================
+
+class Avance:
+    """
+    Progreso del trabajo en su fila. Cada llamada es un UPDATE condicionado a
+    que siga `ejecutando`: si no lo está, es que lo cancelaron o se lo
+    quitaron a este proceso. Usa su propia sesión: el commit no debe cortar
+    la lectura en curso del reporte.
+    """
+
+    def __init__(self, db: AsyncSession, trabajo_id: int):
+        self.db = db
+        self.trabajo_id = trabajo_id
+
+    async def __call__(self, hechas: float, total: float) -> None:
+        progreso = min(hechas / total, 1.0) if total else 0.0
+        r = await self.db.execute(
+            update(Trabajo)
+            .where(Trabajo.id == self.trabajo_id, Trabajo.estado == EJECUTANDO)
+            .values(progreso=round(progreso, 4), actualizado_en=_ahora())
+        )
+        await self.db.commit()
+        if r.rowcount == 1:
+            return
+        estado = await self.db.scalar(select(Trabajo.estado).where(Trabajo.id == self.trabajo_id))
+        if estado == CANCELANDO:
+            raise Cancelado()
+        raise Interrumpido()
+
+
+# ======================================================
+# ===================== REPORTES =======================
+# ======================================================
+
+def _validar_anio(parametros: Dict[str, Any]) -> Dict[str, Any]:
+    anio = parametros.get("anio", _ahora().year)
+    try:
+        anio = int(anio)
+    except (TypeError, ValueError):
+        raise ValueError("'anio' debe ser un número")
+    if not 2000 <= anio <= 2100:
+        raise ValueError("'anio' fuera de rango")
+    return {"anio": anio}
+
+
+async def _ventas_anuales(db: AsyncSession, parametros: Dict[str, Any], ruta: str, avance: Avance, por: str) -> int:
+    """Compras, unidades y total por mes de cada cliente / producto en un año (tabla + archivo)."""
+    if np is None:
+        raise RuntimeError("Los reportes necesitan NumPy")
+    anio = parametros["anio"]
+    desde, hasta = rango_mes(f"{anio}-01")[0], rango_mes(f"{anio}-12")[1]
+    columna = Compra.cliente_id if por == "cliente" else Compra.producto_id
+    clase = Cliente if por == "cliente" else Producto
+    en_anio = (Compra.fecha >= desde, Compra.fecha < hasta)
+
+    meses = [
+        m for m in (archivo_compras.meses() if archivo_compras.disponible else [])
+        if m.startswith(f"{anio}-")
+    ]
+    archivadas = sum(m.filas for m in map(archivo_compras.abrir, meses) if m is not None)
+    total_filas = (await db.scalar(select(func.count()).select_from(Compra).where(*en_anio)) or 0) + archivadas
+    largo = (await db.scalar(select(func.max(clase.id))) or 0) + 1
+
+    # Matriz densa id x mes; ids de filas huérfanas (más altos que el máximo actual) la agrandan
+    totales = np.zeros((largo, 12))
+    compras = np.zeros(largo, dtype=np.int64)
+    unidades = np.zeros(largo, dtype=np.int64)
+
+    def acumular(ids, mes, cantidad, total):
+        nonlocal totales, compras, unidades
+        tope = int(ids.max()) + 1
+        if tope > len(compras):
+            totales = np.pad(totales, ((0, tope - len(compras)), (0, 0)))
+            compras, unidades = (np.pad(a, (0, tope - len(a))) for a in (compras, unidades))
+        n = len(compras)
+        totales += np.bincount(ids * 12 + mes, weights=total, minlength=n * 12).reshape(n, 12)
+        compras += np.bincount(ids, minlength=n)
+        unidades += np.bincount(ids, weights=cantidad, minlength=n).astype(np.int64)
+
+    hechas = 0
+    for mes in meses:
+        m = archivo_compras.abrir(mes)
+        if m is None or not m.filas:
+            continue
+        ids = m[columna.key].astype(np.int64)
+        acumular(ids, np.full(m.filas, int(mes[5:]) - 1), m["cantidad"], m["total"])
+        hechas += m.filas
+        await avance(hechas, total_filas)
+
+    # Por tramos de id y no con un cursor abierto: en SQLite una lectura
+    # larga bloquea toda escritura, incluido el progreso
+    primero, ultimo = (await db.execute(select(func.min(Compra.id), func.max(Compra.id)).where(*en_anio))).one()
+    for inicio in range(primero or 0, (ultimo or -1) + 1, LOTE):
+        q = await db.execute(
+            select(columna, func.extract("month", Compra.fecha), Compra.cantidad, Compra.total)
+            .where(Compra.id >= inicio, Compra.id < inicio + LOTE, *en_anio)
+        )
+        lote = q.all()
+        await db.commit()
+        if lote:
+            a = np.array(lote, dtype=np.float64)
+            acumular(a[:, 0].astype(np.int64), a[:, 1].astype(np.int64) - 1, a[:, 2], a[:, 3])
+            hechas += len(lote)
+        await avance(hechas, total_filas)
+
+    # Detalle de los que compraron, de a 1000 (límite de parámetros de SQLite)
+    elegidos = np.flatnonzero(compras)
+    anual = totales.sum(axis=1)
+    elegidos = elegidos[np.argsort(-anual[elegidos], kind="stable")]
+    if por == "cliente":
+        extra_cols = ("cedula", "tipo_cliente")
+        consulta = select(Cliente.id, Cliente.nombre, Cliente.cedula, Cliente.tipo_cliente)
+    else:
+        extra_cols = ("categoria",)
+        consulta = select(Producto.id, Producto.nombre, Categoria.nombre).outerjoin(
+            Categoria, Categoria.id == Producto.categoria_id
+        )
+    detalle: Dict[int, tuple] = {}
+    lista = elegidos.tolist()
+    for i in range(0, len(lista), 1000):
+        q = await db.execute(consulta.where(clase.id.in_(lista[i:i + 1000])))
+        detalle.update((fila[0], tuple(fila[1:])) for fila in q.all())
+
+    with open(ruta, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["id", "nombre", *extra_cols, *MESES, "total", "compras", "unidades"])
+        for i in lista:
+            datos = detalle.get(i, (None,) * (1 + len(extra_cols)))
+            escritor.writerow([
+                i, *datos,
+                *(round(float(v), 2) for v in totales[i]),
+                round(float(anual[i]), 2), int(compras[i]), int(unidades[i]),
+            ])
+    return len(lista)
+
+
+async def _ventas_anuales_clientes(db, parametros, ruta, avance) -> int:
+    return await _ventas_anuales(db, parametros, ruta, avance, "cliente")
+
+
+async def _ventas_anuales_productos(db, parametros, ruta, avance) -> int:
+    return await _ventas_anuales(db, parametros, ruta, avance, "producto")
+
+
+# tipo -> (descripción, validar parámetros, generar: (db, parámetros, ruta, avance) -> filas)
+REPORTES: Dict[str, tuple] = {
+    "ventas_anuales_clientes": (
+        "Ventas de un año por cliente y mes (CSV). Parámetros: anio",
+        _validar_anio,
+        _ventas_anuales_clientes,
+    ),
+    "ventas_anuales_productos": (
+        "Ventas de un año por producto y mes (CSV). Parámetros: anio",
+        _validar_anio,
+        _ventas_anuales_productos,
+    ),
+    # Además del CSV, reemplaza la tabla `pronosticos` (ver pronosticos.py)
+    "pronosticos": (
+        "Demanda por producto y reposición sugerida (tabla pronosticos + CSV). Parámetros: dias, alfa",
+        pronosticos.validar,
+        pronosticos.calcular,
+    ),
+    # Reemplaza `rfm_clientes` y marca cliente_frecuente (ver segmentacion.py)
+    "segmentacion": (
+        "Segmentación RFM de clientes y cliente_frecuente (tabla rfm_clientes + CSV). Sin parámetros",
+        segmentacion.validar,
+        segmentacion.calcular,
+    ),
+}
+
+
+def validar(tipo: str, parametros: Dict[str, Any]) -> Dict[str, Any]:
+    if tipo not in REPORTES:
+        raise ValueError(f"Tipo de trabajo desconocido: {tipo!r} (válidos: {', '.join(REPORTES)})")
+    return REPORTES[tipo][1](parametros or {})
+
+
+# ======================================================
+# ================= PROCESO HIJO =======================
+# ======================================================
+
+def ejecutar_en_proceso(trabajo_id: int) -> str:
+    """Punto de entrada en el proceso del pool. Devuelve el estado final."""
+    return asyncio.run(_ejecutar(trabajo_id))
+
+
+async def _ejecutar(trabajo_id: int) -> str:
+    os.makedirs(DIRECTORIO, exist_ok=True)
+    ruta = ruta_resultado(trabajo_id)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        async with AsyncSessionLocal() as db, AsyncSessionLocal() as control:
+            trabajo = await control.get(Trabajo, trabajo_id)
+            if trabajo is None or trabajo.estado != EJECUTANDO:
+                return "omitido"
+            generar = REPORTES[trabajo.tipo][2]
+            try:
+                filas = await generar(db, trabajo.parametros, temporal, Avance(control, trabajo_id))
+                os.replace(temporal, ruta)
+                valores = {"estado": TERMINADO, "progreso": 1.0, "filas": filas, "archivo": ruta, "mensaje": None}
+            except Cancelado:
+                valores = {"estado": CANCELADO, "mensaje": "Cancelado a pedido"}
+            except Interrumpido:
+                return "interrumpido"
+            except Exception as e:
+                await control.rollback()
+                valores = {"estado": ERROR, "mensaje": f"{type(e).__name__}: {e}"[:500]}
+            await control.execute(
+                update(Trabajo)
+                .where(Trabajo.id == trabajo_id, Trabajo.estado.in_((EJECUTANDO, CANCELANDO)))
+                .values(**valores, terminado_en=_ahora(), actualizado_en=_ahora())
+            )
+            await control.commit()
+            return valores["estado"]
+    finally:
+        with suppress(FileNotFoundError):
+            os.remove(temporal)
+        # Las conexiones quedan atadas a este loop; el proceso se reutiliza con otro
+        await engine.dispose()
+
+
+# ======================================================
+# ================= API (en el worker) =================
+# ======================================================
+
+async def encolar(db: AsyncSession, tipo: str, parametros: Dict[str, Any]) -> Trabajo:
+    """Valida y deja el trabajo pendiente. ValueError si el tipo o los parámetros no sirven."""
+    trabajo = Trabajo(tipo=tipo, parametros=validar(tipo, parametros), estado=PENDIENTE, progreso=0, intentos=0)
+    db.add(trabajo)
+    await db.commit()
+    await db.refresh(trabajo)
+    planificador.avisar()
+    return trabajo
+
+
+async def cancelar(db: AsyncSession, trabajo_id: int) -> Optional[Trabajo]:
+    """Pendiente: se cancela ya. En curso: queda `cancelando` hasta el próximo lote del hijo."""
+    for desde, hacia in ((PENDIENTE, CANCELADO), (EJECUTANDO, CANCELANDO)):
+        valores = {"estado": hacia}
+        if hacia == CANCELADO:
+            valores.update(terminado_en=_ahora(), mensaje="Cancelado a pedido")
+        r = await db.execute(
+            update(Trabajo).where(Trabajo.id == trabajo_id, Trabajo.estado == desde).values(**valores)
+        )
+        if r.rowcount:
+            break
+    await db.commit()
+    trabajo = await db.get(Trabajo, trabajo_id)
+    if trabajo is not None:
+        await db.refresh(trabajo)
+    return trabajo
+
+
+async def hay_trabajo(db: AsyncSession, tipo: str, desde: datetime) -> bool:
+    """¿Hay uno de ese tipo encolado desde `desde`, o todavía sin terminar?"""
+    return await db.scalar(
+        select(func.count()).select_from(Trabajo).where(
+            Trabajo.tipo == tipo,
+            (Trabajo.creado_en >= desde) | Trabajo.estado.notin_(FINALES),
+        )
+    ) > 0
+
+
+async def listar(db: AsyncSession, estado: Optional[str] = None, limite: int = 50) -> List[Trabajo]:
+    stmt = select(Trabajo).order_by(Trabajo.id.desc()).limit(limite)
+    if estado:
+        stmt = stmt.where(Trabajo.estado == estado)
+    return list((await db.execute(stmt)).scalars().all())
+
+
+# ======================================================
+# =================== PLANIFICADOR =====================
+# ======================================================
+
+class PlanificadorTrabajos:
+    def __init__(self, procesos: int = PROCESOS):
+        self.procesos = max(1, procesos)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._en_curso: Dict[int, asyncio.Future] = {}
+        self._despertar: Optional[asyncio.Event] = None
+        self._pendientes: set = set()  # tareas sueltas (evita que las junte el GC)
+        self.terminados = 0
+        self.fallidos = 0
+
+    def avisar(self) -> None:
+        """Hay trabajo nuevo: no esperar al próximo sondeo."""
+        if self._despertar is not None:
+            self._despertar.set()
+
+    def _nuevo_pool(self) -> ProcessPoolExecutor:
+        # spawn: el hijo no hereda el loop ni las conexiones abiertas del worker
+        return ProcessPoolExecutor(self.procesos, mp_context=multiprocessing.get_context("spawn"))
+
+    async def ejecutar(self) -> None:
+        """Tarea de fondo del worker (ver main.py). Al cancelarla devuelve sus trabajos a la cola."""
+        self._pool = self._nuevo_pool()
+        self._despertar = asyncio.Event()
+        self._en_curso.clear()
+        ultima_limpieza = 0.0
+        try:
+            while True:
+                try:
+                    await self._rescatar_abandonados()
+                    while len(self._en_curso) < self.procesos:
+                        trabajo_id = await self._tomar()
+                        if trabajo_id is None:
+                            break
+                        self._lanzar(trabajo_id)
+                    if time.monotonic() - ultima_limpieza > 3600:
+                        ultima_limpieza = time.monotonic()
+                        await self._limpiar()
+                except Exception as e:
+                    print("⚠ Error en el planificador de trabajos:", e)
+                self._despertar.clear()
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._despertar.wait(), SONDEO_S)
+        finally:
+            await self._detener()
+
+    async def _tomar(self) -> Optional[int]:
+        async with AsyncSessionLocal() as db:
+            for _ in range(5):
+                candidato = await db.scalar(
+                    select(Trabajo.id).where(Trabajo.estado == PENDIENTE).order_by(Trabajo.id).limit(1)
+                )
+                if candidato is None:
+                    return None
+                ahora = _ahora()
+                r = await db.execute(
+                    update(Trabajo)
+                    .where(Trabajo.id == candidato, Trabajo.estado == PENDIENTE)
+                    .values(
+                        estado=EJECUTANDO,
+                        iniciado_en=ahora,
+                        actualizado_en=ahora,
+                        intentos=Trabajo.intentos + 1,
+                    )
+                )
+                await db.commit()
+                if r.rowcount == 1:
+                    return candidato
+                # Lo tomó otro worker: probar con el siguiente
+        return None
+
+    def _lanzar(self, trabajo_id: int) -> None:
+        futuro = asyncio.get_running_loop().run_in_executor(self._pool, ejecutar_en_proceso, trabajo_id)
+        self._en_curso[trabajo_id] = futuro
+        futuro.add_done_callback(lambda f, i=trabajo_id: self._al_terminar(i, f))
+
+    def _al_terminar(self, trabajo_id: int, futuro: asyncio.Future) -> None:
+        if self._en_curso.get(trabajo_id) is not futuro:
+            return  # de una corrida anterior del planificador
+        del self._en_curso[trabajo_id]
+        self.avisar()
+        if futuro.cancelled():
+            return
+        error = futuro.exception()
+        if error is None:
+            if futuro.result() == TERMINADO:
+                self.terminados += 1
+            elif futuro.result() == ERROR:
+                self.fallidos += 1
+            return
+        # El hijo murió sin poder anotar nada (p. ej. sin memoria)
+        self.fallidos += 1
+        if isinstance(error, BrokenProcessPool) and self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._nuevo_pool()
+        tarea = asyncio.ensure_future(self._marcar_error(trabajo_id, f"{type(error).__name__}: {error}"))
+        self._pendientes.add(tarea)
+        tarea.add_done_callback(self._pendientes.discard)
+
+    async def _marcar_error(self, trabajo_id: int, mensaje: str) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Trabajo)
+                .where(Trabajo.id == trabajo_id, Trabajo.estado.in_((EJECUTANDO, CANCELANDO)))
+                .values(estado=ERROR, mensaje=mensaje[:500], terminado_en=_ahora())
+            )
+            await db.commit()
+
+    async def _rescatar_abandonados(self) -> None:
+        """Trabajos sin latido (su worker murió): a la cola otra vez, o error tras MAX_INTENTOS."""
+        limite = _ahora() - timedelta(seconds=ABANDONO_S)
+        huerfanos = (
+            Trabajo.estado.in_((EJECUTANDO, CANCELANDO)),
+            Trabajo.actualizado_en < limite,
+            Trabajo.id.notin_(list(self._en_curso)),
+        )
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Trabajo)
+                .where(*huerfanos, Trabajo.estado == CANCELANDO)
+                .values(estado=CANCELADO, terminado_en=_ahora())
+            )
+            await db.execute(
+                update(Trabajo)
+                .where(*huerfanos, Trabajo.intentos >= MAX_INTENTOS)
+                .values(estado=ERROR, mensaje="Abandonado: sin latido tras varios intentos", terminado_en=_ahora())
+            )
+            r = await db.execute(update(Trabajo).where(*huerfanos).values(estado=PENDIENTE, progreso=0))
+            await db.commit()
+        if r.rowcount:
+            print(f"⚠ Trabajos abandonados reencolados: {r.rowcount}")
+
+    async def _limpiar(self) -> None:
+        """Borra los trabajos terminados hace más de RETENCION_DIAS, con su archivo."""
+        limite = _ahora() - timedelta(days=RETENCION_DIAS)
+        async with AsyncSessionLocal() as db:
+            viejos = (await db.execute(
+                select(Trabajo.id).where(Trabajo.estado.in_(FINALES), Trabajo.terminado_en < limite)
+            )).scalars().all()
+            if not viejos:
+                return
+            for trabajo_id in viejos:
+                with suppress(FileNotFoundError):
+                    os.remove(ruta_resultado(trabajo_id))
+            await db.execute(delete(Trabajo).where(Trabajo.id.in_(viejos)))
+            await db.commit()
+
+    async def _detener(self) -> None:
+        if self._en_curso:
+            # El hijo ve que ya no está `ejecutando` y se corta; otro worker (o este al volver) lo retoma
+            try:
+                async with AsyncSessionLocal() as db:
+                    ids = list(self._en_curso)
+                    await db.execute(
+                        update(Trabajo)
+                        .where(Trabajo.id.in_(ids), Trabajo.estado == EJECUTANDO)
+                        .values(estado=PENDIENTE, progreso=0)
+                    )
+                    await db.execute(
+                        update(Trabajo)
+                        .where(Trabajo.id.in_(ids), Trabajo.estado == CANCELANDO)
+                        .values(estado=CANCELADO, terminado_en=_ahora())
+                    )
+                    await db.commit()
+            except Exception as e:
+                print("⚠ Error al devolver trabajos a la cola:", e)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "activo": ACTIVO and self._pool is not None,
+            "procesos": self.procesos,
+            "en_curso": sorted(self._en_curso),
+            "terminados": self.terminados,
+            "fallidos": self.fallidos,
+        }
+
+
+planificador = PlanificadorTrabajos()
@@ -0,0 +1,219 @@
+# trafico.py
+"""
+Captura opcional de tráfico HTTP a un archivo JSONL de solo anexado.
+
+Cada línea describe una petición ya saneada: método, ruta (plantilla y
+path real), query params, "forma" del cuerpo y tiempos. El archivo se puede
+reproducir contra otra instancia con `python -m scripts.replay_trafico`.
+
+Se activa con la variable de entorno TRAFICO_CAPTURA=<ruta.jsonl>.
+"""
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+# Campos que nunca se guardan en claro (se reemplazan por un marcador)
+CAMPOS_SENSIBLES = {
+    "contrasena",
+    "password",
+    "correo",
+    "email",
+    "nombre",
+    "nombre_cliente",
+    "cedula",
+    "telefono",
+    "direccion",
+    "token",
+    "authorization",
+}
+
+MARCADOR = "***"
+
+# Solo inspeccionamos los primeros bytes del cuerpo para sacar su forma
+MAX_CUERPO_BYTES = 64 * 1024
+
+
+# ======================================================
+# ===================== SANEADO ========================
+# ======================================================
+
+def forma_de(valor: Any) -> Any:
+    """
+    Devuelve la "forma" de un valor JSON: mismos dicts/listas pero con el
+    nombre del tipo en lugar de cada valor escalar.
+    """
+    if isinstance(valor, dict):
+        return {k: forma_de(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        # Una lista se resume con la forma de su primer elemento y su largo
+        return {"lista": forma_de(valor[0]) if valor else None, "largo": len(valor)}
+    if valor is None:
+        return "null"
+    return type(valor).__name__
+
+
+def sanear(valor: Any, clave: Optional[str] = None) -> Any:
+    """
+    Copia un valor JSON ocultando los campos sensibles. Números y booleanos
+    se conservan (ids, cantidades) para que el replay sea realista.
+    """
+    if clave is not None and clave.lower() in CAMPOS_SENSIBLES:
+        return MARCADOR
+    if isinstance(valor, dict):
+        return {k: sanear(v, k) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [sanear(v) for v in valor]
+    return valor
+
+
+def sanear_query(query_string: bytes) -> List[Tuple[str, str]]:
+    pares = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+    return [(k, MARCADOR if k.lower() in CAMPOS_SENSIBLES else v) for k, v in pares]
+
+
+# ======================================================
+# ================ ESCRITOR JSONL ======================
+# ======================================================
+
+class EscritorJSONL:
+    """
+    Anexa líneas a un archivo desde un hilo propio, para que el event loop
+    nunca espere al disco.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._cola: "queue.SimpleQueue[Optional[str]]" = queue.SimpleQueue()
+        self._hilo = threading.Thread(target=self._bucle, name="trafico-jsonl", daemon=True)
+        self._hilo.start()
+
+    def escribir(self, registro: Dict[str, Any]) -> None:
+        self._cola.put(json.dumps(registro, ensure_ascii=False, default=str))
+
+    def cerrar(self) -> None:
+        self._cola.put(None)
+        self._hilo.join(timeout=5)
+
+    def _bucle(self) -> None:
+        with open(self.ruta, "a", encoding="utf-8") as f:
+            while True:
+                linea = self._cola.get()
+                if linea is None:
+                    break
+                f.write(linea + "\n")
+                # Vaciamos cuando la cola queda vacía: ráfagas en un solo write
+                try:
+                    while True:
+                        linea = self._cola.get_nowait()
+                        if linea is None:
+                            f.flush()
+                            return
+                        f.write(linea + "\n")
+                except queue.Empty:
+                    pass
+                f.flush()
+
+
+# ======================================================
+# ==================== MIDDLEWARE ======================
+# ======================================================
+
+class CapturaTraficoMiddleware:
+    """
+    Middleware ASGI que registra cada petición HTTP en un JSONL.
+
+    El cuerpo se lee a medida que la app lo consume (no se vuelve a leer),
+    así que la captura no cambia el comportamiento de los endpoints.
+    """
+
+    def __init__(self, app, ruta: str, excluir: Tuple[str, ...] = ("/static", "/docs", "/redoc", "/openapi.json")):
+        self.app = app
+        self.excluir = excluir
+        self.escritor = EscritorJSONL(ruta)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.excluir):
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.time()
+        t0 = time.perf_counter()
+        cuerpo = bytearray()
+        largo_cuerpo = 0
+        estado = {"status": None}
+
+        async def receive_capturado():
+            nonlocal largo_cuerpo
+            mensaje = await receive()
+            if mensaje["type"] == "http.request":
+                trozo = mensaje.get("body", b"")
+                largo_cuerpo += len(trozo)
+                if len(cuerpo) < MAX_CUERPO_BYTES:
+                    cuerpo.extend(trozo[: MAX_CUERPO_BYTES - len(cuerpo)])
+            return mensaje
+
+        async def send_capturado(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["status"] = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive_capturado, send_capturado)
+        finally:
+            self.escritor.escribir(
+                self._registro(scope, inicio, time.perf_counter() - t0, estado["status"], bytes(cuerpo), largo_cuerpo)
+            )
+
+    @staticmethod
+    def _registro(
+        scope,
+        inicio: float,
+        duracion: float,
+        status: Optional[int],
+        cuerpo: bytes,
+        largo_cuerpo: int,
+    ) -> Dict[str, Any]:
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        content_type = headers.get("content-type", "")
+        route = scope.get("route")
+
+        registro: Dict[str, Any] = {
+            "ts": round(inicio, 6),
+            "metodo": scope["method"],
+            "ruta": getattr(route, "path", None),
+            "path": scope["path"],
+            "query": sanear_query(scope.get("query_string", b"")),
+            "status": status,
+            "duracion_ms": round(duracion * 1000, 3),
+            "content_type": content_type or None,
+            "cuerpo_bytes": largo_cuerpo,
+        }
+
+        if cuerpo and content_type.startswith("application/json"):
+            try:
+                datos = json.loads(cuerpo)
+            except ValueError:
+                registro["cuerpo_forma"] = "json_invalido"
+            else:
+                registro["cuerpo_forma"] = forma_de(datos)
+                registro["cuerpo"] = sanear(datos)
+        elif cuerpo and content_type.startswith("application/x-www-form-urlencoded"):
+            campos = dict(parse_qsl(cuerpo.decode("latin-1"), keep_blank_values=True))
+            registro["cuerpo_forma"] = {k: "str" for k in campos}
+            registro["cuerpo"] = sanear(campos)
+        elif largo_cuerpo:
+            # multipart (imágenes) u otros: solo dejamos constancia del tipo
+            registro["cuerpo_forma"] = content_type.split(";")[0] or "bytes"
+
+        return registro
+
+
+def ruta_captura() -> Optional[str]:
+    """Ruta del JSONL de captura, o None si la captura está desactivada."""
+    return os.getenv("TRAFICO_CAPTURA") or None